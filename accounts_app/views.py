@@ -2,7 +2,9 @@ from django.contrib.auth.decorators import login_required
 from django.contrib.auth import logout as auth_logout, authenticate, login
 from django.contrib.auth.forms import UserCreationForm
 from django.shortcuts import render, redirect
-from django.http import HttpResponseRedirect
+from django.http import HttpResponseRedirect, JsonResponse
+from django.views.decorators.cache import never_cache
+from django.views.decorators.http import require_GET
 from django.urls import reverse
 
 @login_required(login_url='login')
@@ -27,3 +29,13 @@ def logout_view(request):
     response = redirect("login")
     response.delete_cookie("sessionid")
     return response
+
+
+@never_cache
+@require_GET
+def session_keepalive(request):
+    # Pinged by session-timeout.js on user activity; SessionRefreshMiddleware
+    # pushes the session expiry forward (at most once per refresh interval).
+    if not request.user.is_authenticated:
+        return JsonResponse({"authenticated": False}, status=401)
+    return JsonResponse({"authenticated": True, "idle_timeout": request.session.get_idle_timeout()})
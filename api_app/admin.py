@@ -0,0 +1,29 @@
+from django.contrib import admin
+
+from .models import ChargeHistorySync, ChargeSession, ChargerIndexEntry, RevokedApiToken
+
+
+@admin.register(ChargeSession)
+class ChargeSessionAdmin(admin.ModelAdmin):
+    list_display = ("charger_id", "start_time", "id_tag", "session_key", "fetched_at")
+    list_filter = ("id_tag",)
+    search_fields = ("charger_id", "session_key")
+
+
+@admin.register(ChargeHistorySync)
+class ChargeHistorySyncAdmin(admin.ModelAdmin):
+    list_display = ("charger_id", "synced_from", "synced_until", "last_sync_at")
+    search_fields = ("charger_id",)
+
+
+@admin.register(RevokedApiToken)
+class RevokedApiTokenAdmin(admin.ModelAdmin):
+    list_display = ("username", "jti", "revoked_at", "expires_at")
+    search_fields = ("username", "jti")
+
+
+@admin.register(ChargerIndexEntry)
+class ChargerIndexEntryAdmin(admin.ModelAdmin):
+    list_display = ("serial_number", "charger_id", "removed", "refreshed_at")
+    list_filter = ("removed",)
+    search_fields = ("serial_number", "charger_id")
@@ -0,0 +1,17 @@
+from django.apps import AppConfig
+from django.conf import settings
+from django.core.signals import request_started
+
+
+class ApiAppConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'api_app'
+
+    def ready(self):
+        # Pinned chargers are polled without viewers: start each worker's
+        # poller on its first request (not here, so management commands and
+        # a preforking server's master process start no thread).
+        if settings.CLOUDSTATUS_WATCH_CHARGERS:
+            from .services import status_watch
+
+            request_started.connect(status_watch.start_pinned)
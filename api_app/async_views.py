@@ -0,0 +1,367 @@
+"""
+Async versions of the EV Advisor proxies in `views.py`, for ASGI deployments.
+
+Same URLs, responses and error mapping as the sync views; they await
+`AsyncEVAdvisorClient` instead of blocking a worker thread on upstream.
+Enabled by `EXTERNAL_API_ASYNC_VIEWS=true` (see urls.py); serve with an
+ASGI server such as `uvicorn api_app.asgi:application`.
+"""
+
+import asyncio
+import logging
+import math
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
+
+from .services import archive_cache, charger_index, history_analytics, status_watch
+from .services.ev_advisor import EVAdvisorClient
+from .services.ev_advisor_async import AsyncEVAdvisorClient
+from .services.fanout import Outcome
+from .services.resilience import UpstreamUnavailable
+from .views import (
+    _EXPORT_CONTENT_TYPES,
+    _SNAPSHOT_PARTS,
+    _apply_headers,
+    _cached_archive_response,
+    _charge_history,
+    _charge_history_analytics_response,
+    _charge_history_bytes_response,
+    _charge_history_export,
+    _charge_history_response,
+    _SSE_RETRY_MS,
+    _conditional_json,
+    _event_stream_response,
+    _loaded_index,
+    _ocpp_messages,
+    _ocpp_query_params,
+    _record_in_index,
+    _passes_through_history,
+    _plan_ocpp_download,
+    _slice_chunk,
+    _snapshot_response,
+    _unavailable_response,
+    _watched_status,
+)
+
+log = logging.getLogger(__name__)
+
+
+async def _astream_upstream(upstream, chunk_size: int, start: int = 0, end=None):
+    """Async twin of views._stream_upstream; always closes the upstream response."""
+    try:
+        pos = 0
+        async for chunk in upstream.content.iter_chunked(chunk_size):
+            piece = _slice_chunk(chunk, pos, start, end)
+            if piece:
+                yield piece
+            pos += len(chunk)
+            if end is not None and pos > end:
+                break
+    finally:
+        # Returns the connection to the pool if the body was fully read,
+        # otherwise closes it.
+        upstream.release()
+
+
+async def _aiter_sync(iterator):
+    """Iterate a blocking iterator (DB cursor, upstream windows) from a worker thread, one item at a time."""
+    iterator = iter(iterator)
+    done = object()
+    pull = sync_to_async(next, thread_sensitive=True)
+    while True:
+        item = await pull(iterator, done)
+        if item is done:
+            break
+        yield item
+
+
+#OCPP LOGS LATEST
+@require_GET
+async def charger_ocpp_logs_latest(request, charger_id: str):
+    range_header = request.headers.get("Range")
+    if_range = request.headers.get("If-Range")
+
+    client = AsyncEVAdvisorClient.shared()
+    cached = None
+    try:
+        if settings.OCPP_ARCHIVE_CACHE_ENABLED:
+            # Disk cache and its (rare) upstream refresh are blocking: off the event loop.
+            cached = await sync_to_async(archive_cache.cache().open, thread_sensitive=False)(
+                EVAdvisorClient.shared(), str(charger_id)
+            )
+        else:
+            upstream = await client.download_latest_ocpp_logs(str(charger_id), range_header=range_header, if_range=if_range)
+    except ValueError as ve:
+        return JsonResponse({"error": str(ve)}, status=400)
+    except PermissionError as pe:
+        return JsonResponse({"error": str(pe)}, status=403)
+    except FileNotFoundError as nf:
+        return JsonResponse({"error": str(nf)}, status=404)
+    except UpstreamUnavailable as ua:
+        return _unavailable_response(ua)
+    except RuntimeError as re:
+        return JsonResponse({"error": str(re)}, status=502)
+    if cached is not None:
+        resp = _cached_archive_response(request, *cached, charger_id)
+        if resp.streaming:
+            # Django would read a sync file iterator into memory under ASGI; pull it chunk by chunk.
+            resp.streaming_content = _aiter_sync(resp.streaming_content)
+        return resp
+
+    try:
+        plan = _plan_ocpp_download(upstream.status, upstream.headers, range_header, if_range, charger_id)
+        if plan["status"] == 416:
+            upstream.release()
+            return _apply_headers(HttpResponse(status=416), plan["headers"])
+
+        resp = StreamingHttpResponse(
+            _astream_upstream(upstream, settings.EXTERNAL_API_STREAM_CHUNK_SIZE, plan["start"], plan["end"]),
+            status=plan["status"],
+            content_type=plan["content_type"],
+        )
+    except Exception:
+        upstream.release()
+        raise
+    return _apply_headers(resp, plan["headers"])
+
+
+@require_GET
+async def charger_ocpp_messages(request, charger_id: str):
+    try:
+        query = _ocpp_query_params(request.GET)
+    except ValueError as ve:
+        return JsonResponse({"error": str(ve)}, status=400)
+    refresh = request.GET.get("refresh") in ("1", "true")
+    try:
+        # Download, indexing and mmap reads are blocking file work: off the event loop.
+        body = await sync_to_async(_ocpp_messages, thread_sensitive=False)(
+            EVAdvisorClient.shared(), str(charger_id), query, refresh
+        )
+    except ValueError as ve:
+        return JsonResponse({"error": str(ve)}, status=400)
+    except PermissionError as pe:
+        return JsonResponse({"error": str(pe)}, status=403)
+    except FileNotFoundError as nf:
+        return JsonResponse({"error": str(nf)}, status=404)
+    except UpstreamUnavailable as ua:
+        return _unavailable_response(ua)
+    except RuntimeError as re:
+        return JsonResponse({"error": str(re)}, status=502)
+    return JsonResponse(body, status=200)
+
+
+#Charge history
+@require_GET
+async def charger_charge_history(request, charger_id: str):
+    start_date = request.GET.get("startDate", "")
+    end_date = request.GET.get("endDate", "")
+    id_tag = request.GET.get("idTag", None)
+    window = request.GET.get("window") or None
+    envelope = request.GET.get("envelope") in ("1", "true")
+    fmt = request.GET.get("format")
+    if fmt and fmt not in _EXPORT_CONTENT_TYPES:
+        return JsonResponse({"error": "format must be ndjson or csv"}, status=400)
+
+    try:
+        if fmt:
+            resp = await sync_to_async(_charge_history_export)(
+                request, str(charger_id), start_date, end_date, id_tag, window, fmt
+            )
+            # Django would drain a sync iterator into a list under ASGI; pull it chunk by chunk instead.
+            resp.streaming_content = _aiter_sync(resp.streaming_content)
+            return resp
+        if _passes_through_history(start_date, end_date, window, envelope):
+            client = AsyncEVAdvisorClient.shared()
+            body = await client.get_charge_history_raw(str(charger_id), start_date, end_date, id_tag)
+            return _charge_history_bytes_response(request, body)
+        if settings.EXTERNAL_API_HISTORY_STORE_ENABLED and window is None:
+            # The store is ORM-bound: run it (and its sync client) in a worker thread.
+            result = await sync_to_async(_charge_history)(str(charger_id), start_date, end_date, id_tag, window)
+        else:
+            client = AsyncEVAdvisorClient.shared()
+            result = await client.get_charge_history_windowed(str(charger_id), start_date, end_date, id_tag, window=window)
+        return _charge_history_response(result, envelope)
+    except ValueError as ve:
+        return JsonResponse({"error": str(ve)}, status=400)
+    except PermissionError as pe:
+        return JsonResponse({"error": str(pe)}, status=403)
+    except FileNotFoundError as nf:
+        return JsonResponse({"error": str(nf)}, status=404)
+    except UpstreamUnavailable as ua:
+        return _unavailable_response(ua)
+    except RuntimeError as re:
+        return JsonResponse({"error": str(re)}, status=502)
+
+
+@require_GET
+async def charger_charge_history_analytics(request, charger_id: str):
+    start_date = request.GET.get("startDate", "")
+    end_date = request.GET.get("endDate", "")
+    id_tag = request.GET.get("idTag", None)
+    window = request.GET.get("window") or None
+    try:
+        groups = history_analytics.parse_groups(request.GET.get("groupBy"))
+        if settings.EXTERNAL_API_HISTORY_STORE_ENABLED and window is None:
+            result = await sync_to_async(_charge_history)(str(charger_id), start_date, end_date, id_tag, window)
+        else:
+            client = AsyncEVAdvisorClient.shared()
+            result = await client.get_charge_history_windowed(str(charger_id), start_date, end_date, id_tag, window=window)
+    except ValueError as ve:
+        return JsonResponse({"error": str(ve)}, status=400)
+    except PermissionError as pe:
+        return JsonResponse({"error": str(pe)}, status=403)
+    except FileNotFoundError as nf:
+        return JsonResponse({"error": str(nf)}, status=404)
+    except UpstreamUnavailable as ua:
+        return _unavailable_response(ua)
+    except RuntimeError as re:
+        return JsonResponse({"error": str(re)}, status=502)
+    # CPU-bound on large ranges: off the event loop.
+    return await sync_to_async(_charge_history_analytics_response, thread_sensitive=False)(str(charger_id), result, groups)
+
+
+#Cloud Status
+@require_GET
+async def charger_cloudstatus(request, charger_id: str):
+    client = AsyncEVAdvisorClient.shared()
+    try:
+        rep = _watched_status(str(charger_id)) or await client.get_cloud_status(str(charger_id), tagged=True)
+        return _conditional_json(request, rep)
+    except ValueError as ve:
+        return JsonResponse({"error": str(ve)}, status=400)
+    except PermissionError as pe:
+        return JsonResponse({"error": str(pe)}, status=403)
+    except FileNotFoundError as nf:
+        return JsonResponse({"error": str(nf)}, status=404)
+    except UpstreamUnavailable as ua:
+        return _unavailable_response(ua)
+    except RuntimeError as re:
+        return JsonResponse({"error": str(re)}, status=502)
+
+
+async def _astatus_events(watcher, sub):
+    """Async twin of views._status_events; the generator is closed when the client disconnects."""
+    deadline = time.monotonic() + settings.CLOUDSTATUS_STREAM_MAX_AGE
+    try:
+        yield f"retry: {_SSE_RETRY_MS}\n\n".encode()
+        while (remaining := deadline - time.monotonic()) > 0:
+            event = await sub.aget(timeout=min(settings.CLOUDSTATUS_STREAM_KEEPALIVE, remaining))
+            if sub.overflowed:
+                event = watcher.resync(sub)
+            yield event.sse() if event is not None else b": keepalive\n\n"
+    finally:
+        watcher.unsubscribe(sub)
+
+
+@require_GET
+async def charger_cloudstatus_stream(request, charger_id: str):
+    """Server-sent cloud status events (see views.charger_cloudstatus_stream); holds no thread while idle."""
+    watcher = status_watch.watcher()
+    try:
+        sub = watcher.subscribe(str(charger_id), loop=asyncio.get_running_loop())
+    except status_watch.WatchListFull as full:
+        resp = JsonResponse({"error": str(full)}, status=503)
+        resp["Retry-After"] = str(math.ceil(settings.CLOUDSTATUS_STREAM_MAX_AGE))
+        return resp
+    return _event_stream_response(_astatus_events(watcher, sub))
+
+
+@require_GET
+async def charger_capabilities(request, charger_id: str):
+    client = AsyncEVAdvisorClient.shared()
+    try:
+        rep = await client.get_capabilities(str(charger_id), tagged=True)
+        return _conditional_json(request, rep)
+    except ValueError as ve:
+        return JsonResponse({"error": str(ve)}, status=400)
+    except PermissionError as pe:
+        return JsonResponse({"error": str(pe)}, status=403)
+    except UpstreamUnavailable as ua:
+        return _unavailable_response(ua)
+    except RuntimeError as re:
+        return JsonResponse({"error": str(re)}, status=502)
+
+
+async def _aloaded_index():
+    """views._loaded_index without a thread hop unless a reload (a query) is due."""
+    if not settings.CHARGER_INDEX_ENABLED:
+        return None
+    index = charger_index.index()
+    return await sync_to_async(_loaded_index)() if index.stale() else index
+
+
+@require_GET
+async def charger_by_id(request, charger_id: str):
+    # auser(): request.user would hit the session/DB synchronously.
+    user = await request.auser()
+    log.info("charger_by_id: user=%s charger_id=%s", user.get_username(), charger_id)
+
+    client = AsyncEVAdvisorClient.shared()
+    try:
+        rep = await client.get_charger_by_id(charger_id, tagged=True)
+        index = await _aloaded_index()
+        if index is not None and index.needs_record(rep.value):
+            await sync_to_async(_record_in_index)("record_charger", rep.value)
+        return _conditional_json(request, rep)
+    except ValueError as ve:
+        return JsonResponse({"error": str(ve)}, status=400)
+    except PermissionError as pe:
+        return JsonResponse({"error": str(pe)}, status=403)
+    except FileNotFoundError as nf:
+        return JsonResponse({"error": str(nf)}, status=404)
+    except UpstreamUnavailable as ua:
+        return _unavailable_response(ua)
+    except RuntimeError as re:
+        return JsonResponse({"error": str(re)}, status=502)
+
+
+@require_GET
+async def charger_lookup_by_serial(request, serial: str):
+    user = await request.auser()
+    log.info("charger_lookup_by_serial: user=%s serial=%s", user.get_username(), serial)
+
+    client = AsyncEVAdvisorClient.shared()
+    try:
+        index = await _aloaded_index()
+        rep = index.exact(serial) if index is not None else None
+        if rep is None:
+            rep = await client.get_chargers_by_serial(serial, tagged=True)
+            await sync_to_async(_record_in_index)("record_serial", serial, rep.value)
+        return _conditional_json(request, rep)
+    except ValueError as ve:
+        return JsonResponse({"error": str(ve)}, status=400)
+    except PermissionError as pe:
+        return JsonResponse({"error": str(pe)}, status=403)
+    except FileNotFoundError as nf:
+        return JsonResponse({"error": str(nf)}, status=404)
+    except UpstreamUnavailable as ua:
+        return _unavailable_response(ua)
+    except RuntimeError as re:
+        return JsonResponse({"error": str(re)}, status=502)
+
+
+#Snapshot
+@require_GET
+async def charger_snapshot(request, charger_id: str):
+    client = AsyncEVAdvisorClient.shared()
+    cid = str(charger_id)
+    calls = {
+        "info": client.get_charger_by_id,
+        "capabilities": client.get_capabilities,
+        "cloudStatus": client.get_cloud_status,
+    }
+
+    async def timed(index: int, part: str) -> Outcome:
+        t0 = time.perf_counter()
+        try:
+            value = await calls[part](cid)
+        except Exception as exc:
+            return Outcome(index, part, error=exc, elapsed_ms=(time.perf_counter() - t0) * 1000)
+        return Outcome(index, part, value=value, elapsed_ms=(time.perf_counter() - t0) * 1000)
+
+    outcomes = await asyncio.gather(*(timed(i, p) for i, p in enumerate(_SNAPSHOT_PARTS)))
+    return _snapshot_response(cid, outcomes)
@@ -0,0 +1,44 @@
+"""
+Issue or revoke API bearer tokens (see services/api_tokens.py).
+
+    python manage.py api_token issue <username> [--days 30]
+    python manage.py api_token revoke <token>
+
+Tokens are not stored; keep the printed value. Revocation reaches every
+worker within API_TOKEN_REVOCATION_REFRESH seconds.
+"""
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from ...services import api_tokens
+
+
+class Command(BaseCommand):
+    help = "Issue or revoke signed bearer tokens for the /api/ routes."
+
+    def add_arguments(self, parser):
+        sub = parser.add_subparsers(dest="action", required=True)
+        issue = sub.add_parser("issue", help="print a new token for a user")
+        issue.add_argument("username")
+        issue.add_argument("--days", type=float, default=None, help="validity; default API_TOKEN_TTL")
+        revoke = sub.add_parser("revoke", help="reject a token from now on")
+        revoke.add_argument("token")
+
+    def handle(self, *args, **options):
+        if options["action"] == "issue":
+            User = get_user_model()
+            try:
+                user = User.objects.get_by_natural_key(options["username"])
+            except User.DoesNotExist:
+                raise CommandError(f"No such user: {options['username']}")
+            if not user.is_active:
+                raise CommandError(f"User {user.get_username()} is inactive")
+            ttl = options["days"] * 86400 if options["days"] is not None else None
+            self.stdout.write(api_tokens.issue(user, ttl=ttl))
+        else:
+            try:
+                user = api_tokens.revoke(options["token"])
+            except api_tokens.InvalidToken as exc:
+                raise CommandError(f"Not a valid token: {exc}")
+            self.stdout.write(self.style.SUCCESS(f"Revoked token {user.token_id} of {user.username}"))
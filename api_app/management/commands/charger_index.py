@@ -0,0 +1,72 @@
+"""
+Fill and refresh the local serial -> chargerId index (see services/charger_index.py).
+
+    python manage.py charger_index add <serial> [<serial> ...] [--file serials.txt]
+    python manage.py charger_index refresh [--older-than 43200] [--limit 1000]
+
+`add` looks serials up upstream and indexes them. `refresh` re-asks
+upstream for the serials confirmed longest ago (run it from cron so exact
+lookups keep being answered locally); serials upstream no longer knows are
+dropped from the index.
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ...services.charger_index import ChargerIndex
+from ...services.ev_advisor import EVAdvisorClient
+from ...services.fanout import fan_out
+
+
+class Command(BaseCommand):
+    help = "Index charger serials from EV Advisor, or refresh the oldest indexed ones."
+
+    def add_arguments(self, parser):
+        sub = parser.add_subparsers(dest="action", required=True)
+        add = sub.add_parser("add", help="look up serials upstream and index them")
+        add.add_argument("serials", nargs="*")
+        add.add_argument("--file", help="file with one serial per line")
+        refresh = sub.add_parser("refresh", help="re-check the serials confirmed longest ago")
+        refresh.add_argument("--older-than", type=float, default=None,
+                             help="seconds since last confirmed; default half of CHARGER_INDEX_MAX_AGE")
+        refresh.add_argument("--limit", type=int, default=1000, help="serials per run")
+        for p in (add, refresh):
+            p.add_argument("--concurrency", type=int, default=4, help="upstream lookups in flight")
+
+    def handle(self, *args, **options):
+        index = ChargerIndex.from_settings()
+        if options["action"] == "add":
+            serials = list(options["serials"])
+            if options["file"]:
+                try:
+                    with open(options["file"], encoding="utf-8") as fh:
+                        serials += [line.strip() for line in fh if line.strip() and not line.startswith("#")]
+                except OSError as exc:
+                    raise CommandError(f"Cannot read {options['file']}: {exc}")
+            if not serials:
+                raise CommandError("Give serials as arguments or with --file")
+        else:
+            older_than = options["older_than"]
+            if older_than is None:
+                older_than = settings.CHARGER_INDEX_MAX_AGE / 2
+            serials = index.oldest_serials(older_than, max(1, options["limit"]))
+
+        client = EVAdvisorClient.from_settings()
+        outcomes = fan_out(client.get_chargers_by_serial, serials, max(1, options["concurrency"]))
+        indexed = dropped = failed = 0
+        for o in outcomes:
+            if o.ok:
+                index.record_serial(o.item, o.value)
+                indexed += 1
+            elif isinstance(o.error, FileNotFoundError):
+                index.record_serial(o.item, [])  # unknown upstream: drop its mappings
+                dropped += 1
+            else:
+                failed += 1
+                self.stderr.write(f"{o.item}: {o.error}")
+
+        summary = f"Indexed {indexed}, dropped {dropped}, failed {failed} of {len(serials)} serials"
+        if failed:
+            self.stderr.write(summary)
+        else:
+            self.stdout.write(self.style.SUCCESS(summary))
@@ -0,0 +1,66 @@
+"""
+Backfill / incrementally sync the local charge-history store.
+
+    python manage.py sync_charge_history <chargerId> [<chargerId> ...]
+    python manage.py sync_charge_history --file chargers.txt --since 2024-01-01 --concurrency 4
+
+Only spans not yet mirrored are fetched (see services/history_store.py), so
+running it periodically (e.g. from cron) keeps the store current cheaply.
+"""
+
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from ...services.charge_history import parse_bound
+from ...services.ev_advisor import EVAdvisorClient
+from ...services.history_store import ChargeHistoryStore
+
+
+class Command(BaseCommand):
+    help = "Backfill and sync charge history from EV Advisor into the local database."
+
+    def add_arguments(self, parser):
+        parser.add_argument("charger_ids", nargs="*", help="chargerIds to sync")
+        parser.add_argument("--file", help="file with one chargerId per line")
+        parser.add_argument("--since", default=None, help="start of the backfill (ISO date); default 365 days ago")
+        parser.add_argument("--concurrency", type=int, default=4, help="upstream fetches in flight")
+
+    def handle(self, *args, **options):
+        charger_ids = list(options["charger_ids"])
+        if options["file"]:
+            try:
+                with open(options["file"], encoding="utf-8") as fh:
+                    charger_ids += [line.strip() for line in fh if line.strip() and not line.startswith("#")]
+            except OSError as exc:
+                raise CommandError(f"Cannot read {options['file']}: {exc}")
+        if not charger_ids:
+            raise CommandError("Give chargerIds as arguments or with --file")
+
+        now = timezone.now()
+        try:
+            since = parse_bound(options["since"])[0] if options["since"] else now - timedelta(days=365)
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        store = ChargeHistoryStore(EVAdvisorClient.from_settings())
+        try:
+            reports = store.sync_many(charger_ids, since, now, concurrency=max(1, options["concurrency"]))
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        failed = 0
+        for cid, report in reports.items():
+            if report.partial:
+                failed += 1
+                detail = "; ".join(f"{w[0]}..{w[1]}: {exc}" for w, exc in report.failures)
+                self.stderr.write(f"{cid}: {report.fetched} sessions, failed windows: {detail}")
+            else:
+                self.stdout.write(f"{cid}: {report.fetched} sessions fetched")
+
+        summary = f"Synced {len(reports) - failed}/{len(reports)} chargers"
+        if failed:
+            self.stderr.write(summary)
+        else:
+            self.stdout.write(self.style.SUCCESS(summary))
@@ -0,0 +1,282 @@
+"""
+Request-level middleware for api_app.
+
+ProxyMetricsMiddleware records latency (to response headers) and status per
+proxy view in `proxy_request_seconds`, and counts the bytes of streamed
+responses in `proxy_streamed_bytes_total` as they are sent. Only requests
+routed to an `/api/` view are measured. Works under WSGI and ASGI.
+
+SessionRefreshMiddleware replaces SESSION_SAVE_EVERY_REQUEST: it asks the
+session to refresh its expiry (at most once per SESSION_REFRESH_INTERVAL, see
+api_app/sessions.py) and never touches sessions on SESSION_NO_WRITE_PATHS,
+so API traffic does not write to the sessions table.
+
+ApiTokenAuthMiddleware authenticates `/api/` requests carrying
+"Authorization: Bearer <token>" (services/api_tokens.py) without a database
+round-trip, and with API_AUTH_REQUIRED rejects unauthenticated ones.
+
+RateLimitMiddleware answers `/api/` requests over their client's rate (per
+API token, per user, or per address for anonymous calls; see
+services/admission.py) with a 429 and Retry-After before any view work.
+
+UpstreamDeadlineMiddleware gives each `/api/` request EXTERNAL_API_DEADLINE
+seconds for all its EV Advisor calls (services/resilience.py deadline()). A
+client that will not wait that long can say so with "X-Request-Timeout:
+<seconds>"; the header only ever shortens the budget.
+"""
+
+import math
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.http import JsonResponse
+
+from .services import admission, api_tokens, metrics, resilience
+
+
+def _count_bytes(content, view: str):
+    for chunk in content:
+        metrics.PROXY_BYTES.inc(len(chunk), view=view)
+        yield chunk
+
+
+async def _acount_bytes(content, view: str):
+    async for chunk in content:
+        metrics.PROXY_BYTES.inc(len(chunk), view=view)
+        yield chunk
+
+
+class ProxyMetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        t0 = time.perf_counter()
+        response = self.get_response(request)
+        return self._record(request, response, t0)
+
+    async def __acall__(self, request):
+        t0 = time.perf_counter()
+        response = await self.get_response(request)
+        return self._record(request, response, t0)
+
+    def _record(self, request, response, t0: float):
+        match = getattr(request, "resolver_match", None)
+        if match is None or not request.path.startswith("/api/"):
+            return response
+        view = match.url_name or match.view_name
+        metrics.PROXY_REQUESTS.observe(
+            time.perf_counter() - t0, view=view, method=request.method, status=response.status_code,
+        )
+        if getattr(response, "file_to_stream", None) is not None:
+            # Wrapping would stop the server from using sendfile(); the length is known.
+            metrics.PROXY_BYTES.inc(int(response.get("Content-Length") or 0), view=view)
+        elif response.streaming:
+            if response.is_async:
+                response.streaming_content = _acount_bytes(response.streaming_content, view)
+            else:
+                response.streaming_content = _count_bytes(response.streaming_content, view)
+        return response
+
+
+def _refreshes_session(request) -> bool:
+    return hasattr(request, "session") and not request.path.startswith(tuple(settings.SESSION_NO_WRITE_PATHS))
+
+
+def _touch_session(request) -> None:
+    touch = getattr(request.session, "touch", None)
+    if touch is not None:
+        touch()
+
+
+class SessionRefreshMiddleware:
+    """Place directly after SessionMiddleware, so its save sees the refresh."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.get_response(request)
+        if _refreshes_session(request):
+            _touch_session(request)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        if _refreshes_session(request):
+            # Loading a session may hit the database.
+            await sync_to_async(_touch_session)(request)
+        return response
+
+
+def _bearer_token(request):
+    scheme, _, token = request.META.get("HTTP_AUTHORIZATION", "").partition(" ")
+    return token.strip() if scheme.lower() == "bearer" and token.strip() else None
+
+
+def _unauthorized(detail: str, error: str = "") -> JsonResponse:
+    resp = JsonResponse({"error": "Unauthorized", "detail": detail}, status=401)
+    resp["WWW-Authenticate"] = f'Bearer error="{error}"' if error else "Bearer"
+    return resp
+
+
+class ApiTokenAuthMiddleware:
+    """
+    Place after AuthenticationMiddleware. A valid bearer token replaces
+    request.user with a TokenUser (and, not being a cookie, exempts the
+    request from CSRF checks); an invalid one is always a 401. Requests
+    without a token fall back to the browser session.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if request.path.startswith("/api/"):
+            token = _bearer_token(request)
+            if token is not None:
+                verifier = api_tokens.verifier()
+                if verifier.revocations_stale():
+                    verifier.refresh_revocations()
+                denied = self._authenticate(request, verifier, token)
+                if denied is not None:
+                    return denied
+            elif settings.API_AUTH_REQUIRED and not request.user.is_authenticated:
+                return _unauthorized("Authentication credentials were not provided.")
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        if request.path.startswith("/api/"):
+            token = _bearer_token(request)
+            if token is not None:
+                verifier = api_tokens.verifier()
+                if verifier.revocations_stale():
+                    await sync_to_async(verifier.refresh_revocations)()
+                denied = self._authenticate(request, verifier, token)
+                if denied is not None:
+                    return denied
+            elif settings.API_AUTH_REQUIRED and not (await request.auser()).is_authenticated:
+                return _unauthorized("Authentication credentials were not provided.")
+        return await self.get_response(request)
+
+    @staticmethod
+    def _authenticate(request, verifier, token: str):
+        try:
+            user = verifier.verify(token)
+        except api_tokens.InvalidToken as exc:
+            return _unauthorized(str(exc), error="invalid_token")
+        request.user = user
+        request._dont_enforce_csrf_checks = True
+        return None
+
+
+def _client_address(request) -> str:
+    """REMOTE_ADDR, or the last address the trusted proxy wrote to API_CLIENT_IP_HEADER."""
+    if settings.API_CLIENT_IP_HEADER:
+        forwarded = request.META.get(settings.API_CLIENT_IP_HEADER, "").rsplit(",", 1)[-1].strip()
+        if forwarded:
+            return forwarded
+    return request.META.get("REMOTE_ADDR", "")
+
+
+def _rate_limited(request, user):
+    refused = admission.buckets().take(admission.rate_limits(user, _client_address(request)))
+    if refused is None:
+        return None
+    (scope, _), wait = refused
+    metrics.RATE_LIMITED.inc(scope=scope)
+    resp = JsonResponse({"error": "Too many requests"}, status=429)
+    resp["Retry-After"] = str(max(1, math.ceil(wait)))
+    return resp
+
+
+class RateLimitMiddleware:
+    """Place after ApiTokenAuthMiddleware, so token requests are counted against their token and user."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if request.path.startswith("/api/"):
+            limited = _rate_limited(request, request.user)
+            if limited is not None:
+                return limited
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        if request.path.startswith("/api/"):
+            # A bearer token has already replaced request.user; otherwise the session says who it is.
+            user = request.user if _bearer_token(request) is not None else await request.auser()
+            limited = _rate_limited(request, user)
+            if limited is not None:
+                return limited
+        return await self.get_response(request)
+
+
+def _request_budget(request):
+    budget = settings.EXTERNAL_API_DEADLINE or None
+    try:
+        asked = float(request.META.get("HTTP_X_REQUEST_TIMEOUT", ""))
+    except ValueError:
+        return budget
+    if math.isfinite(asked) and asked > 0:
+        budget = asked if budget is None else min(budget, asked)
+    return budget
+
+
+class UpstreamDeadlineMiddleware:
+    """
+    Streamed bodies (downloads, exports) are produced after the view returns,
+    so only the calls made before the response starts are bounded.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not request.path.startswith("/api/"):
+            return self.get_response(request)
+        with resilience.deadline(_request_budget(request)):
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        if not request.path.startswith("/api/"):
+            return await self.get_response(request)
+        with resilience.deadline(_request_budget(request)):
+            return await self.get_response(request)
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-16 21:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChargeHistorySync',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('charger_id', models.CharField(max_length=64, unique=True)),
+                ('synced_from', models.DateTimeField()),
+                ('synced_until', models.DateTimeField()),
+                ('last_sync_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ChargeSession',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('charger_id', models.CharField(max_length=64)),
+                ('session_key', models.CharField(max_length=128)),
+                ('start_time', models.DateTimeField()),
+                ('id_tag', models.CharField(blank=True, default='', max_length=64)),
+                ('data', models.JSONField()),
+                ('fetched_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['charger_id', 'start_time'], name='charge_session_start_idx')],
+                'constraints': [models.UniqueConstraint(fields=('charger_id', 'session_key'), name='uniq_charge_session')],
+            },
+        ),
+    ]
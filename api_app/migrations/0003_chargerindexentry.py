@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_app', '0002_revokedapitoken'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChargerIndexEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('serial_number', models.CharField(max_length=64)),
+                ('charger_id', models.CharField(max_length=64)),
+                ('data', models.JSONField()),
+                ('removed', models.BooleanField(default=False)),
+                ('refreshed_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField(auto_now=True, db_index=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['refreshed_at'], name='charger_index_refreshed_idx')],
+                'constraints': [models.UniqueConstraint(fields=('serial_number', 'charger_id'), name='uniq_charger_index_entry')],
+            },
+        ),
+    ]
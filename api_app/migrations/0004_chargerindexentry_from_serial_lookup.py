@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_app', '0003_chargerindexentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chargerindexentry',
+            name='from_serial_lookup',
+            field=models.BooleanField(default=False),
+        ),
+    ]
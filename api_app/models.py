@@ -0,0 +1,90 @@
+from django.db import models
+
+
+class ChargeSession(models.Model):
+    """
+    Local copy of one EV Advisor charge-history record.
+
+    Ended charges never change, so once stored they are served from here
+    instead of upstream (see services/history_store.py).
+    """
+
+    charger_id = models.CharField(max_length=64)
+    # Upstream identity of the session (e.g. "transactionId:123"), unique per charger.
+    session_key = models.CharField(max_length=128)
+    start_time = models.DateTimeField()
+    id_tag = models.CharField(max_length=64, blank=True, default="")
+    data = models.JSONField()  # record exactly as returned upstream
+    fetched_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["charger_id", "session_key"], name="uniq_charge_session"),
+        ]
+        indexes = [
+            models.Index(fields=["charger_id", "start_time"], name="charge_session_start_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.charger_id} {self.session_key} @ {self.start_time:%Y-%m-%d %H:%M}"
+
+
+class ChargeHistorySync(models.Model):
+    """
+    Time span of a charger's history already mirrored in ChargeSession.
+
+    Everything that started in [synced_from, synced_until) is stored locally
+    and final; only ranges outside it are fetched upstream.
+    """
+
+    charger_id = models.CharField(max_length=64, unique=True)
+    synced_from = models.DateTimeField()
+    synced_until = models.DateTimeField()
+    last_sync_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.charger_id}: {self.synced_from:%Y-%m-%d} .. {self.synced_until:%Y-%m-%d %H:%M}"
+
+
+class RevokedApiToken(models.Model):
+    """
+    An API bearer token that must no longer be accepted (see
+    services/api_tokens.py). Rows are only needed until the token's own
+    expiry and may be deleted afterwards.
+    """
+
+    jti = models.CharField(max_length=32, unique=True)
+    username = models.CharField(max_length=150, blank=True, default="")
+    expires_at = models.DateTimeField()
+    revoked_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.username} {self.jti} (revoked {self.revoked_at:%Y-%m-%d %H:%M})"
+
+
+class ChargerIndexEntry(models.Model):
+    """
+    One serial -> chargerId mapping seen upstream (see
+    services/charger_index.py). Every worker keeps the rows in memory for
+    exact and prefix lookups and reloads the ones updated since its last
+    load. Rows are marked `removed`, not deleted, so that reload sees it.
+    """
+
+    serial_number = models.CharField(max_length=64)  # upper-cased; `data` keeps upstream's spelling
+    charger_id = models.CharField(max_length=64)
+    data = models.JSONField()  # charger record exactly as returned upstream
+    removed = models.BooleanField(default=False)
+    from_serial_lookup = models.BooleanField(default=False)  # answers exact lookups; by-id rows only feed search
+    refreshed_at = models.DateTimeField()  # when upstream last confirmed the mapping
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["serial_number", "charger_id"], name="uniq_charger_index_entry"),
+        ]
+        indexes = [
+            models.Index(fields=["refreshed_at"], name="charger_index_refreshed_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.serial_number} -> {self.charger_id}"
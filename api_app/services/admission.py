@@ -0,0 +1,385 @@
+"""
+Admission control: how much work this service accepts, and from whom.
+
+Responsibility:
+- ConcurrencyLimiter: caps EV Advisor calls in flight, per worker process
+  and (with HostSlots) across all workers on the host. Callers over the cap
+  wait in a bounded FIFO queue for a short, bounded time; beyond that they
+  fail at once with UpstreamSaturated (views answer 503 + Retry-After), so a
+  burst is refused quickly instead of piling up behind blocked threads and
+  getting the whole service throttled upstream.
+- TokenBuckets: per-client request rates (users, API tokens, anonymous
+  addresses) for RateLimitMiddleware, which answers 429 + Retry-After.
+
+Both clients take one limiter slot per upstream HTTP request (hedges
+included, retries' backoff excluded), for as long as it takes to receive
+the response (headers only, for streamed downloads). Threads and event
+loops of a process share one limiter and one queue.
+
+Rate buckets live in each worker's memory (no shared-store write per
+request), so the configured rates are per worker process.
+
+Usage:
+    with admission.limiter().slot():
+        resp = session.get(...)
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from pathlib import Path
+from typing import Any, AsyncIterator, BinaryIO, Deque, Dict, Hashable, Iterator, List, Optional, Sequence, Tuple
+
+from django.conf import settings
+
+from . import metrics, resilience
+from .resilience import UpstreamUnavailable
+
+try:  # not on Windows: there, only the per-worker cap applies
+    import fcntl
+except ImportError:  # pragma: no cover - depends on the platform
+    fcntl = None
+
+# How often a caller waiting for a host-wide slot looks again.
+_HOST_POLL_SECONDS = 0.01
+
+
+class UpstreamSaturated(UpstreamUnavailable):
+    """Too many upstream calls in flight and the wait queue is full (or took too long); views answer 503."""
+
+
+class HostSlots:
+    """
+    `limit` lock files in `directory`; holding an exclusive flock on one is
+    holding one of the host's upstream slots. The kernel drops the lock if
+    the process dies, so a crashed worker never leaks slots.
+    """
+
+    def __init__(self, directory, limit: int) -> None:
+        self.directory = Path(directory)
+        self.limit = limit
+        self._lock = threading.Lock()
+        self._free: List[BinaryIO] = []  # this process's unheld slot files
+        self._pid: Optional[int] = None
+
+    def _open_locked(self) -> None:
+        # Open file descriptions (and their flocks) are shared with a forked
+        # child, so every process opens the slot files itself.
+        if self._pid == os.getpid():
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._free = [open(self.directory / f"slot-{i:04d}", "ab") for i in range(self.limit)]
+        self._pid = os.getpid()
+
+    def try_acquire(self) -> Optional[BinaryIO]:
+        """A free host slot (an open, locked file), or None if all are held."""
+        with self._lock:
+            self._open_locked()
+            for _ in range(len(self._free)):
+                fh = self._free.pop(0)
+                try:
+                    fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    self._free.append(fh)  # held by another process; try it last next time
+                    continue
+                return fh
+        return None
+
+    def release(self, fh: BinaryIO) -> None:
+        fcntl.flock(fh, fcntl.LOCK_UN)
+        with self._lock:
+            if self._pid == os.getpid():
+                self._free.append(fh)
+
+
+class _Waiter:
+    """A queued caller: a thread (event) or a coroutine (future on its loop)."""
+
+    __slots__ = ("granted", "event", "loop", "future")
+
+    def __init__(self, event=None, loop=None, future=None) -> None:
+        self.granted = False
+        self.event = event
+        self.loop = loop
+        self.future = future
+
+    def wake(self) -> bool:
+        if self.event is not None:
+            self.event.set()
+            return True
+        try:
+            self.loop.call_soon_threadsafe(_resolve, self.future)
+        except RuntimeError:  # its event loop is closed
+            return False
+        return True
+
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class ConcurrencyLimiter:
+    """
+    At most `limit` upstream calls in flight in this process (0 = no cap)
+    and, with `host_slots`, at most its limit on the host. A caller over the
+    cap queues (FIFO, at most `max_queue` waiting) for at most `max_wait`
+    seconds, or less if its request deadline is nearer; otherwise it gets
+    UpstreamSaturated.
+    """
+
+    def __init__(
+        self, limit: int = 16, max_queue: int = 64, max_wait: float = 2.0, host_slots: Optional[HostSlots] = None,
+    ) -> None:
+        self.limit = limit
+        self.max_queue = max(0, max_queue)
+        self.max_wait = max_wait
+        self.host_slots = host_slots
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._waiters: Deque[_Waiter] = deque()
+        self._stats = {"admitted": 0, "queued": 0, "rejected": 0}
+
+    @classmethod
+    def from_settings(cls) -> "ConcurrencyLimiter":
+        host_limit = settings.EXTERNAL_API_MAX_IN_FLIGHT_HOST
+        return cls(
+            limit=settings.EXTERNAL_API_MAX_IN_FLIGHT,
+            max_queue=settings.EXTERNAL_API_QUEUE_MAX,
+            max_wait=settings.EXTERNAL_API_QUEUE_TIMEOUT,
+            host_slots=(
+                HostSlots(os.path.join(settings.SHARED_CACHE_DIR, "upstream-slots"), host_limit)
+                if host_limit > 0 and fcntl is not None else None
+            ),
+        )
+
+    def _saturated(self, reason: str) -> UpstreamSaturated:
+        metrics.ADMISSION_REJECTIONS.inc(reason=reason)
+        with self._lock:
+            self._stats["rejected"] += 1
+        return UpstreamSaturated("EV Advisor is busy, try again shortly", retry_after=1.0)
+
+    def _wait_budget(self) -> float:
+        left = resilience.remaining()
+        return self.max_wait if left is None else max(0.0, min(self.max_wait, left))
+
+    # -- per-worker slots -----------------------------------------------------
+
+    def _enter(self, wait: bool, make_waiter) -> Optional[_Waiter]:
+        """Take a slot now (returns None) or join the queue (returns the waiter)."""
+        with self._lock:
+            if self.limit <= 0 or (self._in_flight < self.limit and not self._waiters):
+                self._in_flight += 1
+                self._stats["admitted"] += 1
+                return None
+            full = not wait or len(self._waiters) >= self.max_queue
+            if not full:
+                waiter = make_waiter()
+                self._waiters.append(waiter)
+                self._stats["queued"] += 1
+                return waiter
+        raise self._saturated("queue_full" if wait else "busy")
+
+    def _leave(self, waiter: _Waiter) -> bool:
+        """Drop a waiter that stopped waiting; False if it was granted a slot meanwhile (now its own)."""
+        with self._lock:
+            if waiter.granted:
+                return False
+            self._waiters.remove(waiter)
+            return True
+
+    def _release_local(self) -> None:
+        with self._lock:
+            if self.limit > 0:
+                while self._waiters:
+                    waiter = self._waiters.popleft()
+                    waiter.granted = True
+                    if waiter.wake():
+                        self._stats["admitted"] += 1
+                        return  # the slot passes straight to the next in line
+            self._in_flight -= 1
+
+    # -- slots ----------------------------------------------------------------
+
+    def acquire(self, wait: bool = True) -> Optional[BinaryIO]:
+        """
+        Take a slot, waiting in the queue if `wait`; returns the host slot
+        (or None) to hand back to release(). Raises UpstreamSaturated.
+        """
+        budget = self._wait_budget()
+        t0 = time.monotonic()
+        event = threading.Event()
+        waiter = self._enter(wait, lambda: _Waiter(event=event))
+        if waiter is not None and not event.wait(budget) and self._leave(waiter):
+            raise self._saturated("timeout")
+        if self.host_slots is None:
+            return None
+        while True:
+            fh = self.host_slots.try_acquire()
+            if fh is not None:
+                return fh
+            left = budget - (time.monotonic() - t0)
+            if not wait or left <= 0:
+                self._release_local()
+                raise self._saturated("host")
+            time.sleep(min(_HOST_POLL_SECONDS, left))
+
+    async def aacquire(self, wait: bool = True) -> Optional[BinaryIO]:
+        """Async twin of acquire(); the event loop keeps running while this waits."""
+        budget = self._wait_budget()
+        t0 = time.monotonic()
+        loop = asyncio.get_running_loop()
+        waiter = self._enter(wait, lambda: _Waiter(loop=loop, future=loop.create_future()))
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter.future), budget)
+            except asyncio.TimeoutError:
+                if self._leave(waiter):
+                    raise self._saturated("timeout")
+            except asyncio.CancelledError:
+                if not self._leave(waiter):
+                    self._release_local()
+                raise
+        if self.host_slots is None:
+            return None
+        while True:
+            fh = self.host_slots.try_acquire()
+            if fh is not None:
+                return fh
+            left = budget - (time.monotonic() - t0)
+            if not wait or left <= 0:
+                self._release_local()
+                raise self._saturated("host")
+            try:
+                await asyncio.sleep(min(_HOST_POLL_SECONDS, left))
+            except asyncio.CancelledError:
+                self._release_local()
+                raise
+
+    def release(self, host_slot: Optional[BinaryIO]) -> None:
+        if host_slot is not None:
+            self.host_slots.release(host_slot)
+        self._release_local()
+
+    @contextlib.contextmanager
+    def slot(self, wait: bool = True) -> Iterator[None]:
+        host_slot = self.acquire(wait)
+        try:
+            yield
+        finally:
+            self.release(host_slot)
+
+    @contextlib.asynccontextmanager
+    async def aslot(self, wait: bool = True) -> AsyncIterator[None]:
+        host_slot = await self.aacquire(wait)
+        try:
+            yield
+        finally:
+            self.release(host_slot)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self._stats, "in_flight": self._in_flight, "waiting": len(self._waiters), "limit": self.limit,
+                "host_limit": self.host_slots.limit if self.host_slots is not None else None,
+            }
+
+
+class TokenBuckets:
+    """
+    Token buckets keyed by client: each refills at its `rate` per second up
+    to `burst`, and a request spends one token. Only the `max_keys` most
+    recently used buckets are kept; dropping one can only forgive a client.
+    """
+
+    def __init__(self, max_keys: int = 10000) -> None:
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._buckets: "OrderedDict[Hashable, Tuple[float, float]]" = OrderedDict()  # key -> (tokens, monotonic)
+
+    def take(self, limits: Sequence[Tuple[Hashable, float, float]]) -> Optional[Tuple[Hashable, float]]:
+        """
+        For (key, rate, burst) limits: spend a token from every bucket and
+        return None, or, if any is empty, spend none and return (key of the
+        emptiest bucket, seconds until it holds a token again).
+        """
+        now = time.monotonic()
+        refused: Optional[Tuple[Hashable, float]] = None
+        levels = []
+        with self._lock:
+            for key, rate, burst in limits:
+                held = self._buckets.get(key)
+                tokens = burst if held is None else min(burst, held[0] + (now - held[1]) * rate)
+                if tokens < 1.0:
+                    wait = (1.0 - tokens) / rate
+                    if refused is None or wait > refused[1]:
+                        refused = (key, wait)
+                levels.append((key, tokens))
+            if refused is not None:
+                return refused
+            for key, tokens in levels:
+                self._buckets[key] = (tokens - 1.0, now)
+                self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return None
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+def rate_limits(user, address: str) -> List[Tuple[Hashable, float, float]]:
+    """
+    The buckets an `/api/` request spends from (see RateLimitMiddleware); rate 0
+    disables a kind. Anonymous requests are keyed by `address`, the client
+    address the middleware trusts (see API_CLIENT_IP_HEADER).
+    """
+    limits = []
+    token_id = getattr(user, "token_id", None)
+    if token_id is not None and settings.API_RATE_LIMIT_TOKEN_RATE > 0:
+        limits.append((("token", token_id), settings.API_RATE_LIMIT_TOKEN_RATE, settings.API_RATE_LIMIT_TOKEN_BURST))
+    if user is not None and user.is_authenticated:
+        if settings.API_RATE_LIMIT_USER_RATE > 0:
+            limits.append((("user", user.pk), settings.API_RATE_LIMIT_USER_RATE, settings.API_RATE_LIMIT_USER_BURST))
+    elif settings.API_RATE_LIMIT_ANON_RATE > 0 and address:
+        limits.append((("addr", address), settings.API_RATE_LIMIT_ANON_RATE, settings.API_RATE_LIMIT_ANON_BURST))
+    return limits
+
+
+_limiter: Optional[ConcurrencyLimiter] = None
+_buckets: Optional[TokenBuckets] = None
+_pid: Optional[int] = None
+_singletons_lock = threading.Lock()
+
+
+def _singletons() -> Tuple[ConcurrencyLimiter, TokenBuckets]:
+    global _limiter, _buckets, _pid
+    pid = os.getpid()
+    if _limiter is not None and _pid == pid:
+        return _limiter, _buckets
+    with _singletons_lock:
+        if _limiter is None or _pid != pid:
+            _limiter, _buckets, _pid = ConcurrencyLimiter.from_settings(), TokenBuckets(), pid
+        return _limiter, _buckets
+
+
+def limiter() -> ConcurrencyLimiter:
+    """The process-wide upstream limiter, shared by the sync and async clients."""
+    return _singletons()[0]
+
+
+def buckets() -> TokenBuckets:
+    """The process-wide rate-limit buckets."""
+    return _singletons()[1]
+
+
+def reset() -> None:
+    """Drop the process-wide limiter and buckets (e.g. after settings change in tests)."""
+    global _limiter, _buckets, _pid
+    with _singletons_lock:
+        _limiter, _buckets, _pid = None, None, None
@@ -0,0 +1,191 @@
+"""
+Signed bearer tokens for the /api/ routes.
+
+Responsibility:
+- issue(): a token is `django.core.signing` output (HMAC with SECRET_KEY)
+  over {user id, username, staff flag, token id, expiry}; nothing is stored.
+- TokenVerifier.verify(): checks signature and expiry without touching the
+  database. Verified tokens are kept in an LRU (API_TOKEN_CACHE_SIZE), so a
+  repeat caller costs one dict lookup.
+- Revocation: revoked token ids live in RevokedApiToken; each worker keeps an
+  in-memory copy reloaded at most every API_TOKEN_REVOCATION_REFRESH seconds,
+  so a revocation takes effect everywhere within that interval.
+"""
+
+from __future__ import annotations
+
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+from django.core import signing
+
+SALT = "api_app.api-token"
+
+
+class InvalidToken(Exception):
+    """Bad signature, malformed, expired or revoked; views answer 401."""
+
+
+class TokenUser:
+    """
+    Stand-in for request.user on token-authenticated API calls, built from
+    the token's claims (no user lookup). Enough for is_authenticated /
+    is_staff checks such as staff_member_required.
+    """
+
+    is_active = True
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, claims: Dict[str, Any]) -> None:
+        self.pk = self.id = claims["uid"]
+        self.username = claims["usr"]
+        self.is_staff = bool(claims.get("stf"))
+        self.token_id = claims["jti"]
+        self.expires_at = claims["exp"]
+
+    def get_username(self) -> str:
+        return self.username
+
+    def __str__(self):
+        return self.username
+
+
+def issue(user, ttl: Optional[float] = None) -> str:
+    """Signed token for `user`, valid for `ttl` seconds (default API_TOKEN_TTL)."""
+    ttl = settings.API_TOKEN_TTL if ttl is None else ttl
+    claims = {
+        "uid": user.pk,
+        "usr": user.get_username(),
+        "stf": bool(user.is_staff),
+        "jti": secrets.token_urlsafe(12),
+        "exp": int(time.time() + ttl),
+    }
+    return signing.dumps(claims, salt=SALT)
+
+
+def unverified_claims(token: str) -> Dict[str, Any]:
+    """Claims of a correctly signed token, ignoring expiry and revocation."""
+    try:
+        claims = signing.loads(token, salt=SALT)
+    except signing.BadSignature:
+        raise InvalidToken("bad signature")
+    if not isinstance(claims, dict) or not {"uid", "usr", "jti", "exp"} <= claims.keys():
+        raise InvalidToken("malformed token")
+    return claims
+
+
+class TokenVerifier:
+    def __init__(self, cache_size: int = 10000, revocation_refresh: float = 30.0) -> None:
+        self.cache_size = max(0, cache_size)
+        self.revocation_refresh = revocation_refresh
+        self._lock = threading.Lock()
+        self._verified: "OrderedDict[str, TokenUser]" = OrderedDict()
+        self._revoked: frozenset = frozenset()
+        self._revoked_at = float("-inf")  # monotonic time of the last reload
+        self._hits = 0
+        self._misses = 0
+
+    @classmethod
+    def from_settings(cls) -> "TokenVerifier":
+        return cls(
+            cache_size=settings.API_TOKEN_CACHE_SIZE,
+            revocation_refresh=settings.API_TOKEN_REVOCATION_REFRESH,
+        )
+
+    def revocations_stale(self) -> bool:
+        return time.monotonic() - self._revoked_at >= self.revocation_refresh
+
+    def refresh_revocations(self) -> None:
+        """Reload revoked token ids (one query); callers check revocations_stale() first."""
+        from ..models import RevokedApiToken
+
+        now = datetime.now(timezone.utc)
+        revoked = frozenset(RevokedApiToken.objects.filter(expires_at__gt=now).values_list("jti", flat=True))
+        with self._lock:
+            self._revoked = revoked
+            self._revoked_at = time.monotonic()
+
+    def verify(self, token: str) -> TokenUser:
+        """TokenUser for a valid token, else InvalidToken. Never queries the database."""
+        with self._lock:
+            user = self._verified.get(token)
+            if user is not None:
+                self._verified.move_to_end(token)
+                self._hits += 1
+        if user is None:
+            user = TokenUser(unverified_claims(token))
+            with self._lock:
+                self._misses += 1
+                if self.cache_size:
+                    self._verified[token] = user
+                    if len(self._verified) > self.cache_size:
+                        self._verified.popitem(last=False)
+        if user.expires_at <= time.time():
+            self._forget(token)
+            raise InvalidToken("token expired")
+        if user.token_id in self._revoked:
+            self._forget(token)
+            raise InvalidToken("token revoked")
+        return user
+
+    def _forget(self, token: str) -> None:
+        with self._lock:
+            self._verified.pop(token, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._verified.clear()
+            self._revoked_at = float("-inf")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "cached": len(self._verified),
+                "hits": self._hits,
+                "misses": self._misses,
+                "revoked": len(self._revoked),
+            }
+
+
+_verifier: Optional[TokenVerifier] = None
+_verifier_lock = threading.Lock()
+
+
+def verifier() -> TokenVerifier:
+    """The process-wide verifier, created on first use."""
+    global _verifier
+    if _verifier is None:
+        with _verifier_lock:
+            if _verifier is None:
+                _verifier = TokenVerifier.from_settings()
+    return _verifier
+
+
+def reset_verifier() -> None:
+    """Drop the process-wide verifier (e.g. after settings change in tests)."""
+    global _verifier
+    with _verifier_lock:
+        _verifier = None
+
+
+def revoke(token: str) -> TokenUser:
+    """Record a token as revoked; every worker rejects it after its next reload."""
+    from ..models import RevokedApiToken
+
+    user = TokenUser(unverified_claims(token))
+    RevokedApiToken.objects.update_or_create(
+        jti=user.token_id,
+        defaults={
+            "username": user.username,
+            "expires_at": datetime.fromtimestamp(user.expires_at, timezone.utc),
+        },
+    )
+    if _verifier is not None:
+        _verifier.clear()
+    return user
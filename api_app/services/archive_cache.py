@@ -0,0 +1,279 @@
+"""
+Content-addressed disk cache for OCPP log archives.
+
+Responsibility:
+- Keep each downloaded archive once, as blobs/<sha256[:2]>/<sha256>, and
+  per charger a small ref file naming the blob and upstream's validators.
+  The same archive downloaded for several chargers (or again after a 200
+  with unchanged bytes) is stored once.
+- Serve a ref younger than OCPP_ARCHIVE_CACHE_FRESH without asking upstream;
+  older refs are revalidated with If-None-Match / If-Modified-Since, so an
+  unchanged archive costs a 304 and no body.
+- Bound the total size: after storing a blob, the least recently used
+  blobs (by mtime, bumped on every hit) are deleted until the cache is back
+  under OCPP_ARCHIVE_CACHE_MAX_BYTES. A ref whose blob was evicted is a miss.
+
+The cache lives on the host's disk (under SHARED_CACHE_DIR by default), so
+every worker shares it; a per-charger file lock (where fcntl exists) makes
+one worker download while the others wait for its result.
+
+Usage:
+    entry, fh = archive_cache.cache().open(client, charger_id)
+    # entry.path, entry.size, entry.etag ...; fh is an open binary file
+"""
+
+from __future__ import annotations
+
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterator, NamedTuple, Optional, Tuple
+
+from django.conf import settings
+
+from . import metrics
+from .ev_advisor import _clean_charger_id
+
+try:  # not on Windows: there, only threads of one process are serialized
+    import fcntl
+except ImportError:  # pragma: no cover - depends on the platform
+    fcntl = None
+
+log = logging.getLogger(__name__)
+
+
+class ArchiveEntry(NamedTuple):
+    sha256: str
+    path: Path
+    size: int
+    content_type: str
+    filename: Optional[str]
+    upstream_etag: Optional[str]
+    last_modified: Optional[str]
+    checked_at: float
+
+    @property
+    def etag(self) -> str:
+        """Strong ETag sent to clients: the content hash, whatever upstream sends."""
+        return f'"{self.sha256}"'
+
+
+def spool(upstream, directory: Path, chunk_size: int) -> Tuple[str, Path]:
+    """Stream an upstream body to a temporary file in `directory`; returns (sha256 hex, path)."""
+    digest = hashlib.sha256()
+    fd, name = tempfile.mkstemp(prefix=".download-", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            for chunk in upstream.iter_content(chunk_size=chunk_size):
+                digest.update(chunk)
+                fh.write(chunk)
+    except BaseException:
+        os.unlink(name)
+        raise
+    return digest.hexdigest(), Path(name)
+
+
+def _filename(content_disposition: str) -> Optional[str]:
+    if "filename=" not in content_disposition:
+        return None
+    return content_disposition.split("filename=", 1)[1].split(";", 1)[0].strip().strip('"') or None
+
+
+class ArchiveCache:
+    def __init__(self, directory, max_bytes: int, fresh_for: float = 60.0, chunk_size: int = 64 * 1024) -> None:
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.fresh_for = fresh_for
+        self.chunk_size = chunk_size
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls) -> "ArchiveCache":
+        return cls(
+            settings.OCPP_ARCHIVE_CACHE_DIR,
+            max_bytes=settings.OCPP_ARCHIVE_CACHE_MAX_BYTES,
+            fresh_for=settings.OCPP_ARCHIVE_CACHE_FRESH,
+            chunk_size=settings.EXTERNAL_API_STREAM_CHUNK_SIZE,
+        )
+
+    # -- layout -------------------------------------------------------------
+
+    def _blob(self, sha256: str) -> Path:
+        return self.directory / "blobs" / sha256[:2] / sha256
+
+    def _ref(self, cid: str) -> Path:
+        return self.directory / "refs" / f"{cid}.json"
+
+    def get(self, charger_id: str) -> Optional[ArchiveEntry]:
+        """The charger's cached archive, fresh or not (None if never fetched or evicted)."""
+        try:
+            with open(self._ref(_clean_charger_id(charger_id)), encoding="utf-8") as fh:
+                ref = json.load(fh)
+            path = self._blob(ref["sha256"])
+            size = path.stat().st_size
+        except (OSError, ValueError, KeyError):
+            return None
+        return ArchiveEntry(
+            ref["sha256"], path, size, ref.get("contentType") or "application/zip", ref.get("filename"),
+            ref.get("etag"), ref.get("lastModified"), ref.get("checkedAt", 0.0),
+        )
+
+    def _put_ref(self, cid: str, entry: ArchiveEntry) -> None:
+        ref = {
+            "sha256": entry.sha256, "contentType": entry.content_type, "filename": entry.filename,
+            "etag": entry.upstream_etag, "lastModified": entry.last_modified, "checkedAt": entry.checked_at,
+        }
+        path = self._ref(cid)
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}")
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(ref, fh)
+        os.replace(tmp, path)
+
+    @contextlib.contextmanager
+    def _locked(self, cid: str) -> Iterator[None]:
+        with self._locks_lock:
+            lock = self._locks.setdefault(cid, threading.Lock())
+        with lock:
+            if fcntl is None:
+                yield
+                return
+            with open(self.directory / "refs" / f".{cid}.lock", "a") as fh:
+                fcntl.flock(fh, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(fh, fcntl.LOCK_UN)
+
+    # -- fetching -------------------------------------------------------------
+
+    def _fresh(self, entry: Optional[ArchiveEntry]) -> bool:
+        return entry is not None and time.time() - entry.checked_at < self.fresh_for
+
+    def fetch(self, client, charger_id: str, refresh: bool = False) -> ArchiveEntry:
+        """
+        The charger's latest archive, on disk. `client` is an EVAdvisorClient;
+        errors are its download errors. `refresh` revalidates even a fresh ref.
+        """
+        cid = _clean_charger_id(charger_id)
+        entry = self.get(cid)
+        if not refresh and self._fresh(entry):
+            return self._hit(entry, "hit")
+        (self.directory / "refs").mkdir(parents=True, exist_ok=True)
+        with self._locked(cid):
+            seen, entry = entry, self.get(cid)
+            if self._fresh(entry) and (not refresh or entry != seen):
+                return self._hit(entry, "hit")  # another worker fetched it meanwhile
+            return self._download(client, cid, entry)
+
+    def open(self, client, charger_id: str, refresh: bool = False) -> Tuple[ArchiveEntry, BinaryIO]:
+        """fetch() and open the blob; refetches once if it was evicted in between."""
+        entry = self.fetch(client, charger_id, refresh)
+        try:
+            return entry, open(entry.path, "rb")
+        except FileNotFoundError:
+            entry = self.fetch(client, charger_id, refresh=True)
+            return entry, open(entry.path, "rb")
+
+    def _hit(self, entry: ArchiveEntry, event: str) -> ArchiveEntry:
+        try:
+            os.utime(entry.path)  # LRU: eviction removes the least recently used blobs first
+        except OSError:
+            pass
+        metrics.ARCHIVE_CACHE_EVENTS.inc(event=event)
+        return entry
+
+    def _download(self, client, cid: str, held: Optional[ArchiveEntry]) -> ArchiveEntry:
+        upstream = client.download_latest_ocpp_logs(
+            cid,
+            if_none_match=held.upstream_etag if held else None,
+            if_modified_since=held.last_modified if held else None,
+        )
+        try:
+            if upstream.status_code == 304 and held is not None:
+                entry = held._replace(checked_at=time.time())
+                self._put_ref(cid, entry)
+                return self._hit(entry, "revalidated")
+            if upstream.status_code != 200:
+                raise RuntimeError(f"Unexpected status: {upstream.status_code}")
+            blobs = self.directory / "blobs"
+            blobs.mkdir(parents=True, exist_ok=True)
+            sha256, tmp = spool(upstream, blobs, self.chunk_size)
+            headers = upstream.headers
+        finally:
+            upstream.close()
+
+        path = self._blob(sha256)
+        if path.exists():
+            tmp.unlink()  # same bytes as an archive already held
+            os.utime(path)
+        else:
+            path.parent.mkdir(exist_ok=True)
+            os.replace(tmp, path)
+        entry = ArchiveEntry(
+            sha256, path, path.stat().st_size, headers.get("Content-Type") or "application/zip",
+            _filename(headers.get("Content-Disposition", "")), headers.get("ETag"), headers.get("Last-Modified"),
+            time.time(),
+        )
+        self._put_ref(cid, entry)
+        metrics.ARCHIVE_CACHE_EVENTS.inc(event="miss")
+        self.evict(keep=path)
+        return entry
+
+    # -- size cap -------------------------------------------------------------
+
+    def evict(self, keep: Optional[Path] = None) -> int:
+        """Delete least recently used blobs until the total is under max_bytes; returns bytes freed."""
+        blobs = []
+        for shard in os.scandir(self.directory / "blobs"):
+            if shard.is_dir():
+                for blob in os.scandir(shard.path):
+                    if not blob.name.startswith("."):
+                        st = blob.stat()
+                        blobs.append((st.st_mtime, st.st_size, blob.path))
+        total = sum(size for _, size, _ in blobs)
+        freed = 0
+        for _, size, path in sorted(blobs):
+            if total - freed <= self.max_bytes:
+                break
+            if keep is not None and path == str(keep):
+                continue
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                continue
+            freed += size
+            metrics.ARCHIVE_CACHE_EVENTS.inc(event="evicted")
+        if freed:
+            log.info("OCPP archive cache: evicted %d bytes", freed)
+        return freed
+
+
+_cache: Optional[ArchiveCache] = None
+_cache_pid: Optional[int] = None
+_cache_lock = threading.Lock()
+
+
+def cache() -> ArchiveCache:
+    """The process-wide archive cache, created on first use."""
+    global _cache, _cache_pid
+    pid = os.getpid()
+    if _cache is not None and _cache_pid == pid:
+        return _cache
+    with _cache_lock:
+        if _cache is None or _cache_pid != pid:
+            _cache, _cache_pid = ArchiveCache.from_settings(), pid
+        return _cache
+
+
+def reset_cache() -> None:
+    """Drop the process-wide cache object (e.g. after settings change in tests); files are kept."""
+    global _cache, _cache_pid
+    with _cache_lock:
+        _cache, _cache_pid = None, None
@@ -0,0 +1,159 @@
+"""
+Charge-history helpers shared by the EV Advisor clients and views.
+
+Responsibility:
+- Parse the startDate/endDate bounds the API accepts (date or ISO datetime).
+- Split a long range into windows (day / week / month / N days) that can be
+  fetched concurrently.
+- Merge window results: de-duplicate sessions and keep them in start order.
+
+Upstream record fields are not formally specified; the helpers look for the
+usual names (see _ID_FIELDS / _START_FIELDS) and fall back gracefully.
+"""
+
+from __future__ import annotations
+
+import calendar
+import json
+from dataclasses import dataclass, field
+from datetime import datetime, time, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+from django.utils.dateparse import parse_date, parse_datetime
+
+_ID_FIELDS = ("transactionId", "id", "sessionId", "chargeId")
+_START_FIELDS = ("startTime", "startDate", "start", "startedAt", "timestampStart")
+
+_EPOCH_MAX = datetime.max.replace(tzinfo=timezone.utc)
+
+Window = Tuple[str, str]
+
+
+@dataclass
+class ChargeHistoryResult:
+    """
+    Merged result of a windowed fetch. `failures` holds the (window, error)
+    pairs that are missing from `records`; the caller decides how to report them.
+    """
+
+    records: List[Dict[str, Any]]
+    windows: List[Window] = field(default_factory=list)
+    failures: List[Tuple[Window, BaseException]] = field(default_factory=list)
+
+    @property
+    def partial(self) -> bool:
+        return bool(self.failures)
+
+
+def parse_bound(value: str) -> Tuple[datetime, bool]:
+    """
+    Parse a startDate/endDate value. Returns (aware UTC datetime, date_only).
+    Raises ValueError for anything that is neither a date nor a datetime.
+    """
+    value = (value or "").strip()
+    d = parse_date(value) if len(value) == 10 else None
+    if d is not None:
+        return datetime.combine(d, time.min, tzinfo=timezone.utc), True
+    dt = parse_datetime(value.replace(" ", "T", 1)) if value else None
+    if dt is None:
+        raise ValueError("startDate/endDate must be ISO date strings (e.g., 2025-12-05)")
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc), False
+
+
+def _format(dt: datetime, date_only: bool) -> str:
+    if date_only:
+        return dt.date().isoformat()
+    return dt.isoformat().replace("+00:00", "Z")
+
+
+def _step(dt: datetime, window: Union[str, int]) -> datetime:
+    if window == "month":
+        year, month = (dt.year + 1, 1) if dt.month == 12 else (dt.year, dt.month + 1)
+        day = min(dt.day, calendar.monthrange(year, month)[1])
+        return dt.replace(year=year, month=month, day=day)
+    days = {"day": 1, "week": 7}.get(window, window)
+    return dt + timedelta(days=int(days))
+
+
+def normalize_window(window: Union[str, int, None]) -> Union[str, int, None]:
+    """Accept 'day' | 'week' | 'month' | a positive number of days; None disables splitting."""
+    if window in (None, "", "none", 0, "0"):
+        return None
+    if window in ("day", "week", "month"):
+        return window
+    try:
+        days = int(window)
+    except (TypeError, ValueError):
+        raise ValueError("window must be day, week, month or a number of days")
+    if days <= 0:
+        raise ValueError("window must be day, week, month or a number of days")
+    return days
+
+
+def split_range(start_date: str, end_date: str, window: Union[str, int, None]) -> List[Window]:
+    """
+    Split [start_date, end_date] into consecutive windows, in order.
+
+    Date-only bounds are inclusive days, so windows do not overlap
+    (2025-01-01..2025-01-07, 2025-01-08..). Datetime bounds share their
+    edges; sessions on an edge are de-duplicated when merging.
+    """
+    window = normalize_window(window)
+    start, start_date_only = parse_bound(start_date)
+    end, end_date_only = parse_bound(end_date)
+    date_only = start_date_only and end_date_only
+    if window is None or end <= start:
+        return [(start_date, end_date)]
+
+    windows: List[Window] = []
+    cursor = start
+    while cursor <= end if date_only else cursor < end:
+        nxt = _step(cursor, window)
+        if date_only:
+            last = min(nxt - timedelta(days=1), end)
+            windows.append((_format(cursor, True), _format(last, True)))
+        else:
+            last = min(nxt, end)
+            windows.append((_format(cursor, False), _format(last, False)))
+        cursor = nxt
+    return windows
+
+
+def record_start(record: Dict[str, Any]) -> Optional[datetime]:
+    """Start time of a charge session, or None if the record has none we recognise."""
+    for name in _START_FIELDS:
+        value = record.get(name)
+        if isinstance(value, str):
+            try:
+                return parse_bound(value)[0]
+            except ValueError:
+                continue
+    return None
+
+
+def record_key(record: Dict[str, Any]) -> Any:
+    """Identity of a charge session for de-duplication across windows."""
+    for name in _ID_FIELDS:
+        value = record.get(name)
+        if value is not None:
+            return (name, value)
+    return json.dumps(record, sort_keys=True, default=str)
+
+
+def merge_records(chunks: Iterable[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """Concatenate window results, drop duplicates and sort by session start."""
+    seen = set()
+    merged: List[Dict[str, Any]] = []
+    for chunk in chunks:
+        for record in chunk or []:
+            key = record_key(record)
+            if key in seen:
+                continue
+            seen.add(key)
+            merged.append(record)
+    # Stable sort; sessions without a recognisable start keep their order at the end.
+    merged.sort(key=lambda r: record_start(r) or _EPOCH_MAX)
+    return merged
+
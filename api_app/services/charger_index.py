@@ -0,0 +1,304 @@
+"""
+Local serial -> chargerId index with prefix search.
+
+Responsibility:
+- Persist every serial lookup and charger record seen upstream in
+  ChargerIndexEntry (write-through from the lookup views and the
+  `charger_index` command).
+- Keep all live rows in memory per worker: a dict for exact lookups and a
+  sorted list of serials for prefix (typeahead) search, so neither touches
+  the database or upstream. Only mappings stored from a serial lookup
+  answer exact lookups; records seen by id feed prefix search only, so a
+  by-id lookup never changes a serial lookup's response.
+- Reload incrementally: at most every CHARGER_INDEX_RELOAD_INTERVAL seconds
+  a worker loads only the rows updated since its last load, so mappings
+  recorded by other workers (or the command) show up everywhere.
+
+Serials are matched case-insensitively. An exact lookup is answered locally
+only while upstream confirmed it within CHARGER_INDEX_MAX_AGE; older or
+unknown serials go upstream and the result is recorded.
+
+Usage:
+    index = charger_index.index()
+    if index.stale():
+        index.reload()
+    rep = index.exact("SN000123")        # Representation or None
+    items = index.search("SN0001", 20)   # charger records, serial order
+"""
+
+from __future__ import annotations
+
+import bisect
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .ev_advisor import Representation
+
+log = logging.getLogger(__name__)
+
+# Rows are reloaded from a little before the newest updated_at seen, so a row
+# committed late by a concurrent writer is not skipped.
+_RELOAD_OVERLAP = timedelta(seconds=2)
+
+
+def serial_key(serial: str) -> str:
+    return (serial or "").strip().upper()
+
+
+class ChargerIndex:
+    def __init__(self, max_age: float = 86400.0, reload_interval: float = 5.0) -> None:
+        self.max_age = max_age
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._records: Dict[str, Dict[str, Dict[str, Any]]] = {}  # serial key -> {chargerId: record}
+        self._refreshed: Dict[str, Dict[str, float]] = {}  # serial key -> {chargerId: epoch seconds}
+        self._looked_up: Dict[str, Set[str]] = {}  # serial key -> chargerIds stored by record_serial
+        self._keys: List[str] = []  # sorted serial keys, for prefix search
+        self._reps: Dict[str, Representation] = {}  # serialized exact answers, built on first use
+        self._loaded_until: Optional[datetime] = None
+        self._reloaded_at = float("-inf")  # monotonic
+        self._stats = {"hits": 0, "misses": 0, "expired": 0, "searches": 0, "reloads": 0, "rows_loaded": 0}
+
+    @classmethod
+    def from_settings(cls) -> "ChargerIndex":
+        return cls(max_age=settings.CHARGER_INDEX_MAX_AGE, reload_interval=settings.CHARGER_INDEX_RELOAD_INTERVAL)
+
+    # -- loading -----------------------------------------------------------
+
+    def stale(self) -> bool:
+        return time.monotonic() - self._reloaded_at >= self.reload_interval
+
+    def reload(self) -> int:
+        """Apply rows updated since the last reload (all rows the first time); returns how many."""
+        from ..models import ChargerIndexEntry
+
+        rows = ChargerIndexEntry.objects.order_by("updated_at")
+        if self._loaded_until is not None:
+            rows = rows.filter(updated_at__gte=self._loaded_until - _RELOAD_OVERLAP)
+        rows = list(rows)  # query outside the lock; readers never wait on the database
+        count = len(rows)
+        newest = rows[-1].updated_at if rows else self._loaded_until
+        with self._lock:
+            for row in rows:
+                if row.removed:
+                    self._forget_locked(row.serial_number, row.charger_id)
+                else:
+                    self._put_locked(
+                        row.serial_number, row.charger_id, row.data, row.refreshed_at.timestamp(), row.from_serial_lookup
+                    )
+            self._loaded_until = newest
+            self._reloaded_at = time.monotonic()
+            self._stats["reloads"] += 1
+            self._stats["rows_loaded"] += count
+        return count
+
+    def _put_locked(
+        self, serial: str, charger_id: str, record: Dict[str, Any], refreshed: float, looked_up: bool
+    ) -> None:
+        key = serial_key(serial)
+        if key not in self._records:
+            self._records[key] = {}
+            self._refreshed[key] = {}
+            self._looked_up[key] = set()
+            bisect.insort(self._keys, key)
+        self._records[key][charger_id] = record
+        self._refreshed[key][charger_id] = refreshed
+        if looked_up:
+            self._looked_up[key].add(charger_id)
+        else:
+            self._looked_up[key].discard(charger_id)
+        self._reps.pop(key, None)
+
+    def _forget_locked(self, serial: str, charger_id: str) -> None:
+        key = serial_key(serial)
+        records = self._records.get(key)
+        if records is None or charger_id not in records:
+            return
+        del records[charger_id]
+        del self._refreshed[key][charger_id]
+        self._looked_up[key].discard(charger_id)
+        self._reps.pop(key, None)
+        if not records:
+            del self._records[key], self._refreshed[key], self._looked_up[key]
+            i = bisect.bisect_left(self._keys, key)
+            if i < len(self._keys) and self._keys[i] == key:
+                del self._keys[i]
+
+    # -- reads (memory only) -------------------------------------------------
+
+    def exact(self, serial: str) -> Optional[Representation]:
+        """
+        The serial lookup answer (list of charger records) if the serial was
+        looked up and every mapping that lookup stored was confirmed upstream
+        within `max_age`, else None. Records seen only by id are not part of it.
+        """
+        key = serial_key(serial)
+        with self._lock:
+            looked_up = self._looked_up.get(key)
+            if not looked_up:
+                self._stats["misses"] += 1
+                return None
+            refreshed = self._refreshed[key]
+            if time.time() - min(refreshed[c] for c in looked_up) > self.max_age:
+                self._stats["expired"] += 1
+                return None
+            self._stats["hits"] += 1
+            rep = self._reps.get(key)
+            if rep is None:
+                records = self._records[key]
+                rep = Representation.of([records[c] for c in sorted(looked_up)]).with_variants()
+                self._reps[key] = rep
+            return rep
+
+    def search(self, prefix: str, limit: int) -> List[Dict[str, Any]]:
+        """Charger records whose serial starts with `prefix`, in serial order (at most `limit`)."""
+        key = serial_key(prefix)
+        out: List[Dict[str, Any]] = []
+        with self._lock:
+            self._stats["searches"] += 1
+            i = bisect.bisect_left(self._keys, key)
+            while i < len(self._keys) and len(out) < limit and self._keys[i].startswith(key):
+                records = self._records[self._keys[i]]
+                out.extend(records[c] for c in sorted(records))
+                i += 1
+        return out[:limit]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._stats, "serials": len(self._keys)}
+
+    # -- writes ---------------------------------------------------------------
+
+    def record_serial(self, serial: str, records: Iterable[Dict[str, Any]]) -> None:
+        """
+        Store an upstream serial lookup: its chargers become the only live
+        mappings for that serial (others are marked removed).
+        """
+        from ..models import ChargerIndexEntry
+
+        key = serial_key(serial)
+        found = {str(r["chargerId"]): r for r in records if isinstance(r, dict) and r.get("chargerId")}
+        now = timezone.now()
+        with transaction.atomic():
+            gone_rows = ChargerIndexEntry.objects.filter(serial_number=key, removed=False).exclude(charger_id__in=list(found))
+            gone = list(gone_rows.values_list("charger_id", flat=True))
+            gone_rows.update(removed=True, updated_at=now)
+            self._upsert(key, found, now)
+        with self._lock:
+            for charger_id in gone:
+                self._forget_locked(key, charger_id)
+            for charger_id, record in found.items():
+                self._put_locked(key, charger_id, record, now.timestamp(), True)
+
+    def needs_record(self, record: Any) -> bool:
+        """
+        Whether record_charger() would write: the record names its serial, the
+        mapping was not stored by a serial lookup, and the index does not
+        already hold it confirmed within half of `max_age` (so cached by-id
+        answers do not write on every request).
+        """
+        if not isinstance(record, dict) or not record.get("serialNumber") or not record.get("chargerId"):
+            return False
+        key, charger_id = serial_key(str(record["serialNumber"])), str(record["chargerId"])
+        with self._lock:
+            if charger_id in self._looked_up.get(key, ()):
+                return False  # the serial lookup's record stands until the serial is looked up again
+            held = self._records.get(key, {}).get(charger_id)
+            return held != record or time.time() - self._refreshed[key][charger_id] >= self.max_age / 2
+
+    def record_charger(self, record: Dict[str, Any]) -> bool:
+        """
+        Store a charger record from a by-id lookup (see needs_record) for
+        prefix search; returns whether it wrote. A live mapping stored by a
+        serial lookup (in any worker) is left as it is.
+        """
+        from ..models import ChargerIndexEntry
+
+        if not self.needs_record(record):
+            return False
+        key, charger_id = serial_key(str(record["serialNumber"])), str(record["chargerId"])
+        now = timezone.now()
+        with transaction.atomic():
+            updated = (
+                ChargerIndexEntry.objects.filter(serial_number=key, charger_id=charger_id)
+                .exclude(from_serial_lookup=True, removed=False)
+                .update(data=record, removed=False, from_serial_lookup=False, refreshed_at=now, updated_at=now)
+            )
+            if not updated:
+                ChargerIndexEntry.objects.bulk_create(
+                    [ChargerIndexEntry(serial_number=key, charger_id=charger_id, data=record, refreshed_at=now, updated_at=now)],
+                    ignore_conflicts=True,
+                )
+        with self._lock:
+            self._put_locked(key, charger_id, record, now.timestamp(), False)
+        return True
+
+    @staticmethod
+    def _upsert(serial: str, records: Dict[str, Dict[str, Any]], now: datetime) -> None:
+        from ..models import ChargerIndexEntry
+
+        if not records:
+            return
+        ChargerIndexEntry.objects.bulk_create(
+            [
+                ChargerIndexEntry(
+                    serial_number=serial_key(serial), charger_id=cid, data=record, removed=False,
+                    from_serial_lookup=True, refreshed_at=now, updated_at=now,
+                )
+                for cid, record in records.items()
+            ],
+            update_conflicts=True,
+            unique_fields=["serial_number", "charger_id"],
+            update_fields=["data", "removed", "from_serial_lookup", "refreshed_at", "updated_at"],
+        )
+
+    @staticmethod
+    def oldest_serials(older_than: float, limit: int) -> List[str]:
+        """Serials whose mapping was last confirmed more than `older_than` seconds ago, oldest first."""
+        from ..models import ChargerIndexEntry
+
+        cutoff = datetime.now(dt_timezone.utc) - timedelta(seconds=older_than)
+        rows = (
+            ChargerIndexEntry.objects.filter(removed=False, refreshed_at__lt=cutoff)
+            .order_by("refreshed_at")
+            .values_list("serial_number", flat=True)
+        )
+        serials: List[str] = []
+        for serial in rows.iterator():
+            if serial not in serials:
+                serials.append(serial)
+                if len(serials) >= limit:
+                    break
+        return serials
+
+
+_index: Optional[ChargerIndex] = None
+_index_pid: Optional[int] = None
+_index_lock = threading.Lock()
+
+
+def index() -> ChargerIndex:
+    """The process-wide index, created on first use (empty until its first reload())."""
+    global _index, _index_pid
+    pid = os.getpid()
+    if _index is not None and _index_pid == pid:
+        return _index
+    with _index_lock:
+        if _index is None or _index_pid != pid:
+            _index, _index_pid = ChargerIndex.from_settings(), pid
+        return _index
+
+
+def reset_index() -> None:
+    """Drop the process-wide index (e.g. after settings change in tests)."""
+    global _index, _index_pid
+    with _index_lock:
+        _index, _index_pid = None, None
@@ -0,0 +1,84 @@
+"""
+Content-Encoding for pre-serialized proxy responses.
+
+Responsibility:
+- compress(): gzip always; brotli ("br") when the optional `brotli` package
+  is installed.
+- variants(): the compressed copies kept next to a cached body, so a cache
+  hit is served without serializing or compressing anything. Bodies that
+  are not kept are compressed only for a response that asks for it.
+- choose(): the best encoding a client's Accept-Encoding allows.
+
+Bodies smaller than EXTERNAL_API_COMPRESS_MIN_BYTES are never compressed;
+headers would cost more than the bytes saved.
+"""
+
+from __future__ import annotations
+
+import gzip
+from typing import Dict, Iterable, Optional
+
+from django.conf import settings
+
+try:  # optional: pip install brotli
+    import brotli
+except ImportError:  # pragma: no cover - depends on the environment
+    brotli = None
+
+# Server preference when the client accepts several with equal q.
+PREFERENCE = ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "gzip":
+        # mtime=0: identical bodies give identical bytes (stable ETags, cacheable).
+        return gzip.compress(body, compresslevel=6, mtime=0)
+    if encoding == "br" and brotli is not None:
+        return brotli.compress(body, quality=5)
+    raise ValueError(f"Unsupported encoding: {encoding}")
+
+
+def variants(body: bytes, encodings: Iterable[str] = PREFERENCE) -> Dict[str, bytes]:
+    """Compressed copies of `body` in `encodings` worth keeping (none for small bodies)."""
+    if len(body) < settings.EXTERNAL_API_COMPRESS_MIN_BYTES:
+        return {}
+    out = {}
+    for encoding in encodings:
+        data = compress(body, encoding)
+        if len(data) < len(body):
+            out[encoding] = data
+    return out
+
+
+def _accepted(header: str) -> Dict[str, float]:
+    accepted = {}
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[name] = q
+    return accepted
+
+
+def choose(accept_encoding: str, available: Iterable[str]) -> Optional[str]:
+    """Encoding (from `available`) to answer with, or None for identity."""
+    if not accept_encoding:
+        return None
+    accepted = _accepted(accept_encoding)
+    best, best_q = None, 0.0
+    for encoding in PREFERENCE:
+        if encoding not in available:
+            continue
+        q = accepted.get(encoding, accepted.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
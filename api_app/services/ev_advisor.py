@@ -7,6 +7,19 @@ Responsibility:
 - Provide small, typed methods (one per endpoint).
 - Enforce security (timeouts, sanitized path variables).
 - Read configuration from Django settings (dotenv).
+- Share one pooled, keep-alive HTTP session per worker process.
+- Cache slow-changing lookups (per-endpoint TTL, stale-while-revalidate) in
+  a cache alias shared by all workers on the host.
+- Coalesce identical concurrent GETs into one upstream request (single-flight).
+- Revalidate held copies with If-None-Match / If-Modified-Since, so an
+  unchanged resource costs a 304 instead of a body and a JSON parse; tag
+  payloads with a strong ETag for conditional proxy responses.
+- Retry with jittered backoff under a retry budget; fail fast per endpoint
+  while upstream is unhealthy (circuit breaker, see resilience.py).
+- Fit attempt timeouts and retries into the calling request's deadline, and
+  optionally hedge slow GETs with a second copy (see resilience.py).
+- Take a slot from the process-wide concurrency limiter for every upstream
+  request, so a burst is refused fast instead of queuing (see admission.py).
 
 References:
 - Upstream endpoint spec: ccc/api/v1.0/chargerserial/:serialNumber (header: ApiKey)  # see project docs or Postman file
@@ -14,17 +27,658 @@ References:
 
 from __future__ import annotations
 
+import os
 import re
+import asyncio
+import contextlib
+import contextvars
+import hashlib
+import json
+import time
 import logging
-from typing import Any, Dict, List, Optional
+import threading
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, TimeoutError as FutureTimeout, wait
+from typing import Any, Awaitable, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
 
 import requests
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from .charge_history import ChargeHistoryResult, merge_records, split_range
+from . import encoding, metrics
+from .fanout import Outcome, iter_fan_out_ordered
+from . import admission, resilience
+from .admission import ConcurrencyLimiter, UpstreamSaturated
+from .resilience import (
+    Breakers, DeadlineExceeded, HedgePolicy, RetryBudget, RetryPolicy, UpstreamUnavailable, parse_retry_after,
+)
 
 log = logging.getLogger(__name__)
 
 # Strictly allow safe path characters to avoid path injection.
 _SERIAL_SAFE_RE = re.compile(r"^[A-Za-z0-9._\-]+$")
+# Minimal ISO date validation: YYYY-MM-DD or full ISO 8601
+_ISO_DATE_RE = re.compile(r"^\d{4}-\d{2}-\d{2}([T ][0-9:.\-+Z]*)?$")
+
+
+def _clean_serial(serial: str) -> str:
+    """Sanitize serial to a safe path segment (defense-in-depth)."""
+    s = (serial or "").strip()
+    if not s or not _SERIAL_SAFE_RE.match(s):
+        raise ValueError("Invalid serial number format")
+    return s
+
+
+def _clean_charger_id(charger_id: str) -> str:
+    cid = (charger_id or "").strip()
+    # UUIDs contain hex + dashes; keep simple sanity check.
+    if not cid or len(cid) < 8:
+        raise ValueError("Invalid chargerId format")
+    return cid
+
+
+def _history_params(start_date: str, end_date: str, id_tag: Optional[str]) -> Dict[str, str]:
+    """Validate basic inputs; defers business rules to upstream (e.g., start < end)."""
+    if not _ISO_DATE_RE.match(start_date or "") or not _ISO_DATE_RE.match(end_date or ""):
+        raise ValueError("startDate/endDate must be ISO date strings (e.g., 2025-12-05)")
+    params: Dict[str, str] = {"startDate": start_date, "endDate": end_date}
+    if id_tag:
+        params["idTag"] = id_tag
+    return params
+
+
+def _raise_for_status(
+    status: int,
+    text: str,
+    not_found: Optional[str] = None,
+    bad_request: Optional[str] = None,
+) -> None:
+    """
+    Map a non-success upstream status to the exceptions views translate to HTTP:
+    ValueError (400), PermissionError (403), FileNotFoundError (404),
+    RuntimeError (5xx or unexpected). Endpoints that do not document a 400 or
+    404 leave `bad_request` / `not_found` unset and get the generic error.
+    Shared by the sync and async clients.
+    """
+    if status == 400 and bad_request:
+        raise ValueError(bad_request)
+    elif status == 403:
+        raise PermissionError("Forbidden (invalid or missing ApiKey)")
+    elif status == 404 and not_found:
+        raise FileNotFoundError(not_found)
+    elif 500 <= status < 600:
+        raise RuntimeError(f"Upstream server error ({status})")
+    else:
+        raise RuntimeError(f"Unexpected status: {status} - {text[:200]}")
+
+
+def _json_array_body(content_type: str, body: bytes) -> bytes:
+    """
+    Upstream bytes passed through unparsed: check only that they are JSON and
+    look like an array (first and last non-blank bytes), not every record.
+    """
+    if "json" not in (content_type or "").lower():
+        raise RuntimeError(f"Unexpected content type: {content_type or 'none'}")
+    stripped = body.strip()
+    if not (stripped.startswith(b"[") and stripped.endswith(b"]")):
+        raise RuntimeError("Unexpected body: not a JSON array")
+    return stripped
+
+
+def body_etag(body: bytes) -> str:
+    """Strong ETag of a response body."""
+    return '"%s"' % hashlib.sha256(body).hexdigest()[:32]
+
+
+class Representation(NamedTuple):
+    """
+    A JSON payload from upstream, ready to send again: the parsed value (for
+    callers that embed it, e.g. snapshot and batch), the body bytes with
+    their strong ETag and compressed variants, and the validators upstream
+    sent (used to revalidate a held copy).
+
+    Variants are not built by of(): copies that are kept and served again
+    (cache entries, the charger index) build them once with with_variants();
+    any other payload is compressed only by a response that negotiates it.
+
+    In pass-through mode (EXTERNAL_API_PASSTHROUGH) the body is upstream's
+    bytes unchanged; otherwise the value serialized as JsonResponse would.
+    """
+
+    value: Any
+    etag: str
+    upstream_etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    body: Optional[bytes] = None
+    variants: Optional[Dict[str, bytes]] = None  # None: not built yet
+
+    @classmethod
+    def of(
+        cls,
+        value: Any,
+        upstream_etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+        body: Optional[bytes] = None,
+    ) -> "Representation":
+        if body is None:
+            body = json.dumps(value, cls=DjangoJSONEncoder).encode()
+        return cls(value, body_etag(body), upstream_etag, last_modified, body)
+
+    def with_variants(self, encodings: Iterable[str] = encoding.PREFERENCE) -> "Representation":
+        """This payload with compressed variants in `encodings` (itself if they are built already)."""
+        if self.variants is not None:
+            return self
+        return self._replace(variants=encoding.variants(self.body, encodings))
+
+    @property
+    def revalidatable(self) -> bool:
+        return bool(self.upstream_etag or self.last_modified)
+
+    def encoded(self, content_encoding: Optional[str]) -> Tuple[bytes, str]:
+        """(body, strong ETag) of the identity body or of a compressed variant."""
+        if content_encoding is None:
+            return self.body, self.etag
+        return self.variants[content_encoding], f'{self.etag[:-1]}-{content_encoding}"'
+
+
+def _current(value: Any) -> Representation:
+    """A cached payload as a Representation; entries from older releases hold the bare value or no body."""
+    if isinstance(value, Representation):
+        if value.body is not None:
+            return value
+        return Representation.of(value.value, value.upstream_etag, value.last_modified)
+    return Representation.of(value)
+
+
+def _conditional_headers(held: Optional[Representation]) -> Optional[Dict[str, str]]:
+    """If-None-Match / If-Modified-Since for revalidating `held` (None: plain GET)."""
+    if held is None or not held.revalidatable:
+        return None
+    headers = {}
+    if held.upstream_etag:
+        headers["If-None-Match"] = held.upstream_etag
+    if held.last_modified:
+        headers["If-Modified-Since"] = held.last_modified
+    return headers
+
+
+class PoolStats:
+    """
+    Thread-safe counters for connection checkouts from the urllib3 pools.
+
+    - hits: a live keep-alive connection was reused.
+    - misses: a new TCP (and TLS) connection had to be opened.
+    - idle_evictions: pools were dropped after sitting idle too long.
+
+    Also tracks connections out of the pools and when one was last checked
+    back in: the pools are idle only while none is out, measured from then.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.idle_evictions = 0
+        self._checked_out = 0
+        self._checked_in_at = time.monotonic()
+
+    def record_checkout(self, reused: bool) -> None:
+        metrics.POOL_CHECKOUTS.inc(reused="true" if reused else "false")
+        with self._lock:
+            self._checked_out += 1
+            if reused:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def record_checkin(self) -> None:
+        with self._lock:
+            self._checked_out = max(0, self._checked_out - 1)
+            self._checked_in_at = time.monotonic()
+
+    def claim_idle(self, timeout: float) -> Optional[float]:
+        """
+        Seconds the pools sat idle, if that is longer than `timeout` (else None).
+        A claim restarts the idle clock, so one caller evicts per idle spell.
+        """
+        now = time.monotonic()
+        with self._lock:
+            idle_for = now - self._checked_in_at
+            if self._checked_out or idle_for <= timeout:
+                return None
+            self._checked_in_at = now
+            self.idle_evictions += 1
+            return idle_for
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "idle_evictions": self.idle_evictions,
+                "hit_ratio": round(self.hits / total, 4) if total else None,
+            }
+
+
+def _counting_pool(base: type, stats: PoolStats) -> type:
+    """Build a urllib3 pool class that reports connection reuse to `stats`."""
+
+    class _CountingPool(base):
+        def _get_conn(self, timeout=None):
+            conn = super()._get_conn(timeout=timeout)
+            # A connection with a live socket is a keep-alive reuse; a fresh
+            # (or dropped and reset) connection has no socket yet.
+            stats.record_checkout(getattr(conn, "sock", None) is not None)
+            return conn
+
+        def _put_conn(self, conn):
+            stats.record_checkin()
+            super()._put_conn(conn)
+
+    _CountingPool.__name__ = f"Counting{base.__name__}"
+    return _CountingPool
+
+
+class _PooledAdapter(HTTPAdapter):
+    """HTTPAdapter whose per-host pools feed a shared PoolStats instance."""
+
+    def __init__(self, stats: PoolStats, **kwargs: Any) -> None:
+        self._stats = stats
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args: Any, **kwargs: Any) -> None:
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _counting_pool(HTTPConnectionPool, self._stats),
+            "https": _counting_pool(HTTPSConnectionPool, self._stats),
+        }
+
+
+def _off_loop(fn: Callable[..., Any], *args: Any) -> Awaitable[Any]:
+    """Run a blocking cache call on a worker thread (the async client's cache access)."""
+    return sync_to_async(fn, thread_sensitive=False)(*args)
+
+
+class ResponseCache:
+    """
+    Per-endpoint TTL cache for EV Advisor lookups, stored in a Django cache alias.
+
+    Each entry is an envelope {"found", "value", "fresh_until"}:
+    - found=True: a 200 payload (a Representation), fresh for the endpoint TTL.
+    - found=False: a cached 404 (message in "value"), fresh for `negative_ttl`.
+
+    Entries stay in the backend `stale_ttl` seconds past freshness. A read in
+    that window returns the stale value immediately and refreshes it on a
+    background thread (stale-while-revalidate). Only 200 and 404 are cached;
+    403/5xx/connectivity errors always go back to upstream.
+
+    Invalidation bumps a per-endpoint generation number (Django caches cannot
+    delete by prefix), or deletes a single key.
+
+    Endpoints without a TTL are never served from here, but their last
+    payload can be held (`remember`) so the client can revalidate it
+    upstream with a conditional GET (`peek`).
+    """
+
+    # Remember hard expiries of recently stored keys so that a backend miss
+    # before expiry can be reported as an eviction (bounded, per process).
+    _TRACKED_KEYS = 10000
+
+    def __init__(
+        self,
+        alias: str,
+        ttls: Dict[str, int],
+        negative_ttl: int = 30,
+        stale_ttl: int = 600,
+        prefix: str = "evadv",
+    ) -> None:
+        self.alias = alias
+        self.ttls = dict(ttls)
+        self.negative_ttl = negative_ttl
+        self.stale_ttl = max(0, stale_ttl)
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._refreshing: set = set()
+        self._tasks: set = set()
+        self._expiries: "OrderedDict[str, float]" = OrderedDict()
+        self._stats = {
+            "hits": 0,
+            "stale_hits": 0,
+            "negative_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "refreshes": 0,
+            "refresh_failures": 0,
+            "invalidations": 0,
+        }
+
+    @classmethod
+    def from_settings(cls) -> Optional["ResponseCache"]:
+        if not settings.EXTERNAL_API_CACHE_ENABLED:
+            return None
+        return cls(
+            alias=settings.EXTERNAL_API_CACHE_ALIAS,
+            ttls=settings.EXTERNAL_API_CACHE_TTLS,
+            negative_ttl=settings.EXTERNAL_API_CACHE_NEGATIVE_TTL,
+            stale_ttl=settings.EXTERNAL_API_CACHE_STALE_TTL,
+        )
+
+    @property
+    def backend(self):
+        return caches[self.alias]
+
+    def _count(self, name: str) -> None:
+        metrics.CACHE_EVENTS.inc(event=name)
+        with self._lock:
+            self._stats[name] += 1
+
+    def _generation(self, endpoint: str) -> int:
+        return self.backend.get(f"{self.prefix}:{endpoint}:gen", 0)
+
+    def _key(self, endpoint: str, key: str) -> str:
+        return f"{self.prefix}:{endpoint}:g{self._generation(endpoint)}:{key}"
+
+    def _store(self, cache_key: str, found: bool, value: Any, ttl: int) -> None:
+        hard_ttl = ttl + self.stale_ttl
+        now = time.time()
+        self.backend.set(
+            cache_key,
+            {"found": found, "value": value, "fresh_until": now + ttl},
+            timeout=hard_ttl,
+        )
+        with self._lock:
+            self._expiries[cache_key] = now + hard_ttl
+            self._expiries.move_to_end(cache_key)
+            while len(self._expiries) > self._TRACKED_KEYS:
+                self._expiries.popitem(last=False)
+
+    def _load(self, endpoint: str, cache_key: str, loader: Callable[[], Any]) -> Dict[str, Any]:
+        """Call upstream and store the outcome; 404 is cached as a negative entry."""
+        try:
+            value = loader()
+        except FileNotFoundError as nf:
+            return self._store_outcome(endpoint, cache_key, nf)
+        return self._store_outcome(endpoint, cache_key, value)
+
+    async def _aload(self, endpoint: str, cache_key: str, aloader: Callable[[], Awaitable[Any]]) -> Dict[str, Any]:
+        try:
+            outcome = await aloader()
+        except FileNotFoundError as nf:
+            outcome = nf
+        return await _off_loop(self._store_outcome, endpoint, cache_key, outcome)
+
+    def _store_outcome(self, endpoint: str, cache_key: str, outcome: Any) -> Dict[str, Any]:
+        if isinstance(outcome, FileNotFoundError):
+            self._store(cache_key, False, str(outcome), self.negative_ttl)
+            return {"found": False, "value": str(outcome)}
+        if isinstance(outcome, Representation):
+            outcome = outcome.with_variants()  # compressed once, served from every hit
+        self._store(cache_key, True, outcome, self.ttls[endpoint])
+        return {"found": True, "value": outcome}
+
+    def _claim_refresh(self, cache_key: str) -> bool:
+        """Return True if the caller should refresh `cache_key` (one refresher per key)."""
+        with self._lock:
+            if cache_key in self._refreshing:
+                return False
+            self._refreshing.add(cache_key)
+            return True
+
+    def _finish_refresh(self, cache_key: str, exc: Optional[BaseException]) -> None:
+        with self._lock:
+            self._refreshing.discard(cache_key)
+        self._count("refresh_failures" if exc else "refreshes")
+        if exc is not None:  # keep serving stale; next read retries
+            log.warning("EVAdvisor cache refresh failed for %s: %s", cache_key, exc)
+
+    def _refresh_in_background(self, endpoint: str, cache_key: str, loader: Callable[[], Any]) -> None:
+        if not self._claim_refresh(cache_key):
+            return
+
+        def run() -> None:
+            try:
+                self._load(endpoint, cache_key, loader)
+            except Exception as exc:
+                self._finish_refresh(cache_key, exc)
+            else:
+                self._finish_refresh(cache_key, None)
+
+        threading.Thread(target=run, name="evadv-cache-refresh", daemon=True).start()
+
+    def _refresh_in_task(self, endpoint: str, cache_key: str, aloader: Callable[[], Awaitable[Any]]) -> None:
+        if not self._claim_refresh(cache_key):
+            return
+
+        async def run() -> None:
+            try:
+                with resilience.no_deadline():  # outlives the request that noticed staleness
+                    await self._aload(endpoint, cache_key, aloader)
+            except Exception as exc:
+                self._finish_refresh(cache_key, exc)
+            else:
+                self._finish_refresh(cache_key, None)
+
+        task = asyncio.get_running_loop().create_task(run())
+        # Hold a reference until done; the loop only keeps weak references.
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    @staticmethod
+    def _unwrap(entry: Dict[str, Any]) -> Any:
+        if not entry["found"]:
+            raise FileNotFoundError(entry["value"])
+        return _current(entry["value"])
+
+    def peek(self, endpoint: str, key: str) -> Optional[Representation]:
+        """The held payload for (endpoint, key), fresh or stale; None if absent or a cached 404."""
+        entry = self.backend.get(self._key(endpoint, key))
+        if entry is None or not entry["found"]:
+            return None
+        return _current(entry["value"])
+
+    async def apeek(self, endpoint: str, key: str) -> Optional[Representation]:
+        """peek() on a worker thread: the backend may block (the shared SQLite cache does)."""
+        return await _off_loop(self.peek, endpoint, key)
+
+    def remember(self, endpoint: str, key: str, rep: Representation) -> None:
+        """
+        Hold the payload of an endpoint without a TTL for later revalidation
+        (kept `stale_ttl` seconds, never served without asking upstream).
+        Endpoints with a TTL are stored by get_or_load instead.
+        """
+        if endpoint not in self.ttls and rep.revalidatable:
+            self._store(self._key(endpoint, key), True, rep.with_variants(), 0)
+
+    async def aremember(self, endpoint: str, key: str, rep: Representation) -> None:
+        """remember() on a worker thread."""
+        if endpoint not in self.ttls and rep.revalidatable:
+            await _off_loop(self.remember, endpoint, key, rep)
+
+    def _lookup(self, endpoint: str, key: str) -> Tuple[str, Optional[Dict[str, Any]], bool]:
+        """Return (cache_key, entry or None, is_stale) and update counters."""
+        cache_key = self._key(endpoint, key)
+        entry = self.backend.get(cache_key)
+
+        if entry is None:
+            with self._lock:
+                expiry = self._expiries.pop(cache_key, None)
+            if expiry is not None and expiry > time.time():
+                self._count("evictions")
+            self._count("misses")
+            return cache_key, None, False
+
+        if entry["fresh_until"] <= time.time():
+            self._count("stale_hits")
+            return cache_key, entry, True
+        self._count("hits" if entry["found"] else "negative_hits")
+        return cache_key, entry, False
+
+    def get_or_load(self, endpoint: str, key: str, loader: Callable[[], Any]) -> Any:
+        """
+        Return the cached value for (endpoint, key), calling `loader` on a miss.
+        Raises FileNotFoundError for cached 404s, like the uncached call would.
+        """
+        if endpoint not in self.ttls:
+            return loader()
+        cache_key, entry, stale = self._lookup(endpoint, key)
+        if entry is None:
+            return self._unwrap(self._load(endpoint, cache_key, loader))
+        if stale:
+            self._refresh_in_background(endpoint, cache_key, loader)
+        return self._unwrap(entry)
+
+    async def aget_or_load(self, endpoint: str, key: str, aloader: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Async twin of get_or_load; stale entries are refreshed in an asyncio
+        task. Backend reads and writes run on worker threads, off the event loop.
+        """
+        if endpoint not in self.ttls:
+            return await aloader()
+        cache_key, entry, stale = await _off_loop(self._lookup, endpoint, key)
+        if entry is None:
+            return self._unwrap(await self._aload(endpoint, cache_key, aloader))
+        if stale:
+            self._refresh_in_task(endpoint, cache_key, aloader)
+        return self._unwrap(entry)
+
+    def invalidate(self, endpoint: str, key: Optional[str] = None) -> None:
+        """Drop one cached key, or every entry of `endpoint` when key is None."""
+        if key is not None:
+            self.backend.delete(self._key(endpoint, key))
+        else:
+            gen_key = f"{self.prefix}:{endpoint}:gen"
+            # add() is a no-op if the counter exists; incr() is atomic on
+            # backends that support it.
+            self.backend.add(gen_key, 0, timeout=None)
+            self.backend.incr(gen_key)
+        self._count("invalidations")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out = dict(self._stats)
+        lookups = out["hits"] + out["stale_hits"] + out["negative_hits"] + out["misses"]
+        out["hit_ratio"] = round((lookups - out["misses"]) / lookups, 4) if lookups else None
+        return out
+
+
+class _Call:
+    """One in-flight upstream request that followers wait on."""
+
+    __slots__ = ("done", "result", "error", "followers", "deadline")
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.followers = 0
+        self.deadline = resilience.SharedDeadline()
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls that share a key into a single execution.
+
+    The first caller for a key (the leader) starts the function; callers that
+    arrive while it is in flight block until it finishes and receive the same
+    result or exception. Nothing is remembered once the call completes, so
+    this never serves stale data.
+
+    The shared call runs under the latest deadline of the callers waiting on
+    it (resilience.SharedDeadline), and each caller waits only as long as its
+    own deadline allows (DeadlineExceeded after that). A leader with a
+    deadline hands the call to a pool thread so it can give up while the call
+    carries on for the others; once no caller is left, the call starts no
+    further attempt.
+    """
+
+    def __init__(self, workers: int = 32) -> None:
+        self._lock = threading.Lock()
+        self._calls: Dict[Any, _Call] = {}
+        self._workers = max(1, workers)
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self.executions = 0
+        self.coalesced = 0
+
+    def _detached(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix="evadv-flight")
+            return self._pool
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+
+    def _run(self, key: Any, call: _Call, fn: Callable[[], Any]) -> None:
+        try:
+            with resilience.shared_deadline(call.deadline):
+                call.result = fn()
+        except BaseException as exc:
+            call.error = exc
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def do(self, key: Any, fn: Callable[[], Any]) -> Any:
+        at = resilience.expires_at()
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.followers += 1
+                self.coalesced += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self.executions += 1
+                leader = True
+            call.deadline.join(at)
+
+        try:
+            if not leader:
+                metrics.COALESCED.inc()
+            elif at is None:
+                self._run(key, call, fn)  # this caller waits for it anyway: run on this thread
+            else:
+                try:
+                    self._detached().submit(self._run, key, call, fn)
+                except BaseException:
+                    self._run(key, call, fn)  # pool shut down: client closing
+            left = resilience.remaining()
+            if not call.done.wait(None if left is None else max(0.0, left)):
+                raise DeadlineExceeded("EV Advisor request deadline exceeded (waiting for a shared upstream call)")
+        finally:
+            call.deadline.leave(at)
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "executions": self.executions,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._calls),
+            }
+
+
+# Process-wide client (one per worker). Rebuilt after fork so pooled sockets
+# are never shared between a gunicorn master and its workers.
+_shared_client: Optional["EVAdvisorClient"] = None
+_shared_pid: Optional[int] = None
+_shared_lock = threading.Lock()
+
+
+def _close_answer(fut) -> None:
+    """Done-callback for the losing copy of a hedged GET: release its connection."""
+    if not fut.cancelled() and fut.exception() is None:
+        fut.result().close()
 
 
 class EVAdvisorClient:
@@ -32,8 +686,11 @@ class EVAdvisorClient:
     Thin HTTP client for EV Advisor.
 
     Usage:
-        client = EVAdvisorClient.from_settings()
+        client = EVAdvisorClient.shared()
         data = client.get_chargers_by_serial("ABC123")
+
+    Views should use `shared()` so every request in a worker reuses the same
+    keep-alive connection pool. `from_settings()` builds a private instance.
     """
 
     def __init__(
@@ -42,15 +699,46 @@ class EVAdvisorClient:
         api_key: str,
         timeout: int = 10,
         retries: int = 2,
-        session: Optional[requests.Session] = None
+        session: Optional[requests.Session] = None,
+        pool_connections: int = 4,
+        pool_maxsize: int = 16,
+        pool_idle_timeout: float = 60.0,
+        cache: Optional[ResponseCache] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+        retry_budget: Optional[RetryBudget] = None,
+        breakers: Optional[Breakers] = None,
+        hedging: Optional[HedgePolicy] = None,
+        limiter: Optional[ConcurrencyLimiter] = None,
     ) -> None:
         if not base_url or not api_key:
             raise ValueError("EVAdvisorClient requires base_url and api_key")
         self.base_url = base_url.rstrip("/")
         self.api_key = api_key
         self.timeout = timeout
-        self.retries = max(0, retries)
+        self.retry_policy = retry_policy or RetryPolicy(retries=retries)
+        self.retries = self.retry_policy.retries
+        self.retry_budget = retry_budget or RetryBudget()
+        self.breakers = breakers or Breakers()
+        self.hedging = hedging or HedgePolicy()
+        self.limiter = limiter
+        # Hedged GETs run both copies on threads while the caller waits for the first answer.
+        self._hedge_pool: Optional[ThreadPoolExecutor] = None
+        self._hedge_lock = threading.Lock()
+        self._hedge_workers = 2 * max(1, pool_maxsize)
+        self.pool_idle_timeout = pool_idle_timeout
+        self.cache = cache
+        self._inflight = SingleFlight(workers=2 * max(1, pool_maxsize))
+        self.pool_stats = PoolStats()
         self.session = session or requests.Session()
+        # Sized keep-alive pools: `pool_connections` distinct hosts, up to
+        # `pool_maxsize` sockets per host (i.e. concurrent threads per worker).
+        self._adapter = _PooledAdapter(
+            self.pool_stats,
+            pool_connections=max(1, pool_connections),
+            pool_maxsize=max(1, pool_maxsize),
+        )
+        self.session.mount("https://", self._adapter)
+        self.session.mount("http://", self._adapter)
         # Default headers: Accept JSON, ApiKey for upstream auth.
         self.session.headers.update({
             "Accept": "application/json",
@@ -64,37 +752,298 @@ class EVAdvisorClient:
             api_key=settings.EXTERNAL_API_KEY,
             timeout=settings.EXTERNAL_API_TIMEOUT,
             retries=settings.EXTERNAL_API_RETRIES,
+            pool_connections=settings.EXTERNAL_API_POOL_CONNECTIONS,
+            pool_maxsize=settings.EXTERNAL_API_POOL_MAXSIZE,
+            pool_idle_timeout=settings.EXTERNAL_API_POOL_IDLE_TIMEOUT,
+            cache=ResponseCache.from_settings(),
+            retry_policy=RetryPolicy.from_settings(),
+            retry_budget=RetryBudget(settings.EXTERNAL_API_RETRY_BUDGET_RATIO),
+            breakers=Breakers.from_settings(),
+            hedging=HedgePolicy.from_settings(),
+            limiter=admission.limiter(),
         )
 
+    @classmethod
+    def shared(cls) -> "EVAdvisorClient":
+        """
+        Return the process-wide client, creating it on first use.
+
+        The underlying `requests.Session` is safe to share between request
+        threads for plain GETs; urllib3 hands each thread its own connection.
+        """
+        global _shared_client, _shared_pid
+        pid = os.getpid()
+        client = _shared_client
+        if client is not None and _shared_pid == pid:
+            return client
+        with _shared_lock:
+            if _shared_client is None or _shared_pid != pid:
+                _shared_client = cls.from_settings()
+                _shared_pid = pid
+            return _shared_client
+
+    @classmethod
+    def reset_shared(cls) -> None:
+        """Drop the process-wide client (e.g. after settings change in tests)."""
+        global _shared_client, _shared_pid
+        with _shared_lock:
+            if _shared_client is not None:
+                _shared_client.close()
+            _shared_client = None
+            _shared_pid = None
+
+    def close(self) -> None:
+        if self._hedge_pool is not None:
+            self._hedge_pool.shutdown(wait=False)
+        self._inflight.close()
+        self.session.close()
+
+    def stats(self) -> Dict[str, Any]:
+        """Connection pool and response cache counters, for the upstream stats endpoint."""
+        return {
+            "pool": self.pool_stats.snapshot(),
+            "cache": self.cache.stats() if self.cache is not None else None,
+            "single_flight": self._inflight.stats(),
+            "retry_budget": self.retry_budget.stats(),
+            "breakers": self.breakers.stats(),
+            "hedging": self.hedging.stats(),
+            "admission": self.limiter.stats() if self.limiter is not None else None,
+        }
+
+    def _cached(self, endpoint: str, key: str, loader: Callable[[], Any]) -> Any:
+        if self.cache is None:
+            return loader()
+        return self.cache.get_or_load(endpoint, key, loader)
+
+    def invalidate(self, endpoint: str, key: Optional[str] = None) -> None:
+        """Explicitly drop cached lookups (see ResponseCache.invalidate)."""
+        if self.cache is not None:
+            self.cache.invalidate(endpoint, key)
+
+    def _evict_idle_connections(self) -> None:
+        """
+        Drop pooled sockets that sat unused longer than `pool_idle_timeout`,
+        counted from when the last connection was checked back in. Upstream
+        load balancers silently close idle keep-alives; reusing one would
+        cost a failed request plus a reconnect.
+        """
+        if not self.pool_idle_timeout:
+            return
+        idle_for = self.pool_stats.claim_idle(self.pool_idle_timeout)
+        if idle_for is not None:
+            self._adapter.poolmanager.clear()
+            log.debug("EVAdvisor pool idle for %.1fs; connections evicted", idle_for)
+
     def _safe_serial(self, serial: str) -> str:
         """Sanitize serial to a safe path segment (defense-in-depth)."""
-        s = (serial or "").strip()
-        if not s or not _SERIAL_SAFE_RE.match(s):
-            raise ValueError("Invalid serial number format")
-        return s
+        return _clean_serial(serial)
 
-    def _get(self, url: str) -> requests.Response:
+    def _get(
+        self,
+        url: str,
+        params: Optional[Dict[str, str]] = None,
+        endpoint: str = "default",
+        headers: Optional[Dict[str, str]] = None,
+    ) -> requests.Response:
+        """
+        GET through the retry policy and the `endpoint` circuit breaker (see _send).
+
+        Identical concurrent GETs (same URL, query parameters and headers) are
+        coalesced: only one goes upstream and every caller gets its response
+        or error. The shared response is fully read, so each caller may call .json().
+        """
+        key = (url, tuple(sorted((params or {}).items())), tuple(sorted((headers or {}).items())))
+        return self._inflight.do(key, lambda: self._send(endpoint, url, params=params, headers=headers))
+
+    def _get_representation(self, endpoint: str, key: str, url: str, not_found: Optional[str] = None) -> Representation:
+        """
+        GET a JSON lookup. A payload held in the response cache is revalidated
+        (If-None-Match / If-Modified-Since); on 304 it is returned as is,
+        without a body transfer or a JSON parse.
+        """
+        held = self.cache.peek(endpoint, key) if self.cache is not None else None
+        resp = self._get(url, endpoint=endpoint, headers=_conditional_headers(held))
+        if resp.status_code == 304 and held is not None:
+            metrics.UPSTREAM_NOT_MODIFIED.inc(endpoint=endpoint)
+            return held
+        if resp.status_code == 200:
+            rep = Representation.of(
+                resp.json(), resp.headers.get("ETag"), resp.headers.get("Last-Modified"),
+                body=resp.content if settings.EXTERNAL_API_PASSTHROUGH else None,
+            )
+            if self.cache is not None:
+                self.cache.remember(endpoint, key, rep)
+            return rep
+        _raise_for_status(resp.status_code, resp.text, not_found=not_found)
+
+    def _send(
+        self,
+        endpoint: str,
+        url: str,
+        params: Optional[Dict[str, str]] = None,
+        headers: Optional[Dict[str, str]] = None,
+        stream: bool = False,
+    ) -> requests.Response:
         """
-        Perform a GET with small retry loop for transient 5xx/connectivity issues.
-        Retries are conservative to avoid hammering upstream.
+        One logical GET: fail fast while the endpoint's circuit is open, else
+        try up to `retry_policy.attempts` times. Connection errors, timeouts and
+        retryable statuses (5xx, 429) are retried after a jittered backoff (or
+        Retry-After), as long as the retry budget and the request deadline
+        allow. Each attempt's timeout is shrunk to the time the deadline leaves.
+
+        Returns the last response, whatever its status (callers map errors);
+        raises RuntimeError if no response was obtained at all,
+        UpstreamUnavailable if the circuit is open, DeadlineExceeded if the
+        deadline ran out first, and UpstreamSaturated if no limiter slot
+        became free in time.
         """
-        last_exc: Optional[Exception] = None
-        for attempt in range(self.retries + 1):
+        breaker = self.breakers.get(endpoint)
+        try:
+            breaker.before_call()
+        except UpstreamUnavailable:
+            metrics.CIRCUIT_REJECTIONS.inc(endpoint=endpoint)
+            raise
+        self.retry_budget.deposit()
+        attempt = 0
+        healthy = abandoned = False
+        try:
+            while True:
+                self._evict_idle_connections()
+                resp, error, retry_after = None, None, None
+                timeout = resilience.attempt_timeout(self.timeout)
+                try:
+                    resp = self._attempt(endpoint, url, params, headers, stream, timeout)
+                except (requests.ConnectionError, requests.Timeout) as exc:
+                    error = exc
+                if resp is not None:
+                    if not self.retry_policy.should_retry_status(resp.status_code):
+                        healthy = True
+                        return resp
+                    retry_after = parse_retry_after(resp.headers.get("Retry-After"))
+
+                delay = self.retry_policy.delay(attempt, retry_after)
+                if delay is None or not resilience.fits(delay) or not self.retry_budget.withdraw():
+                    if resp is not None:
+                        return resp
+                    if isinstance(error, requests.Timeout) and timeout < self.timeout:
+                        raise DeadlineExceeded(f"EV Advisor request deadline exceeded: {error}")
+                    raise RuntimeError(f"EVAdvisor GET failed after {attempt + 1} attempts: {error}")
+                metrics.UPSTREAM_RETRIES.inc(endpoint=endpoint)
+                log.warning(
+                    "EVAdvisor %s attempt %s failed (%s); retrying in %.2fs",
+                    endpoint, attempt + 1, error or resp.status_code, delay,
+                )
+                if resp is not None:
+                    resp.close()
+                time.sleep(delay)
+                attempt += 1
+        except UpstreamUnavailable as exc:  # our own limits, not upstream's health
+            abandoned = True
+            if isinstance(exc, DeadlineExceeded):
+                metrics.DEADLINE_EXCEEDED.inc(endpoint=endpoint)
+            raise
+        finally:
+            if healthy:
+                breaker.record_success()
+            elif abandoned:
+                breaker.record_abandoned()
+            else:
+                breaker.record_failure()
+
+    def _get_once(
+        self, endpoint: str, url: str, params: Optional[Dict[str, str]], headers: Optional[Dict[str, str]],
+        stream: bool, timeout: float, wait: bool = True,
+    ) -> requests.Response:
+        """One upstream HTTP request, holding a limiter slot until its response (headers, if streamed) is in."""
+        with self.limiter.slot(wait) if self.limiter is not None else contextlib.nullcontext():
+            t0 = time.perf_counter()
             try:
-                resp = self.session.get(url, timeout=self.timeout)
-                return resp
-            except (requests.ConnectionError, requests.Timeout) as exc:
-                last_exc = exc
-                log.warning("EVAdvisor GET retry %s failed: %s", attempt + 1, exc)
-        # If we reach here, all attempts failed.
-        raise RuntimeError(f"EVAdvisor GET failed after {self.retries + 1} attempts: {last_exc}")
+                resp = self.session.get(url, params=params, headers=headers, timeout=timeout, stream=stream)
+            except (requests.ConnectionError, requests.Timeout):
+                metrics.UPSTREAM_REQUESTS.observe(time.perf_counter() - t0, endpoint=endpoint, status="error")
+                raise
+        elapsed = time.perf_counter() - t0
+        metrics.UPSTREAM_REQUESTS.observe(elapsed, endpoint=endpoint, status=resp.status_code)
+        self.hedging.observe(endpoint, elapsed)
+        return resp
 
-    def get_chargers_by_serial(self, serial: str) -> List[Dict[str, Any]]:
+    def _attempt(
+        self, endpoint: str, url: str, params: Optional[Dict[str, str]], headers: Optional[Dict[str, str]],
+        stream: bool, timeout: float,
+    ) -> requests.Response:
+        """
+        One attempt of _send. A non-streamed GET still unanswered after the
+        hedge delay gets a second copy (paid from the retry budget, and only
+        if a limiter slot is free at once); the first usable response wins
+        and the other is closed when it arrives.
+        """
+        delay = None if stream else self.hedging.delay(endpoint)
+        if delay is None or delay >= timeout or not resilience.fits(delay):
+            return self._get_once(endpoint, url, params, headers, stream, timeout)
+        pool = self._hedges()
+        # The primary may queue for a limiter slot, within the request's deadline.
+        primary = pool.submit(
+            contextvars.copy_context().run, self._get_once, endpoint, url, params, headers, False, timeout,
+        )
+        try:
+            return primary.result(timeout=delay)
+        except FutureTimeout:
+            pass
+        try:
+            hedge_timeout = resilience.attempt_timeout(timeout)
+        except DeadlineExceeded:
+            return primary.result()
+        if not self.retry_budget.withdraw():
+            return primary.result()
+        hedge = pool.submit(
+            contextvars.copy_context().run, self._get_once, endpoint, url, params, headers, False, hedge_timeout, False,
+        )
+        return self._first_answer(endpoint, {primary: "primary", hedge: "hedge"})
+
+    def _hedges(self) -> ThreadPoolExecutor:
+        with self._hedge_lock:
+            if self._hedge_pool is None:
+                self._hedge_pool = ThreadPoolExecutor(max_workers=self._hedge_workers, thread_name_prefix="evadv-hedge")
+            return self._hedge_pool
+
+    def _first_answer(self, endpoint: str, copies: Dict[Any, str]) -> requests.Response:
+        """The first response of a hedged pair with a final status, else the last answer (or error)."""
+        pending = set(copies)
+        last: Any = None
+        winner = "none"
+        while pending and winner == "none":
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                try:
+                    answer = fut.result()
+                except (requests.ConnectionError, requests.Timeout, UpstreamSaturated) as exc:
+                    if not isinstance(last, requests.Response):
+                        last = exc
+                    continue
+                if winner != "none":
+                    answer.close()  # both answered at once
+                    continue
+                if isinstance(last, requests.Response):
+                    last.close()
+                last = answer
+                if not self.retry_policy.should_retry_status(answer.status_code):
+                    winner = copies[fut]
+        for fut in pending:
+            fut.add_done_callback(_close_answer)
+        self.hedging.record(hedge_won=winner == "hedge")
+        metrics.UPSTREAM_HEDGES.inc(endpoint=endpoint, winner=winner)
+        if isinstance(last, requests.Response):
+            return last
+        raise last
+
+    @metrics.timed_call
+    def get_chargers_by_serial(self, serial: str, tagged: bool = False) -> List[Dict[str, Any]]:
         """
         Call EV Advisor: GET /ccc/api/v1.0/chargerserial/:serialNumber
 
         Returns:
-            List of charger records (JSON objects).
+            List of charger records (JSON objects); with tagged=True, a
+            Representation of it (payload plus strong ETag).
 
         Raises:
             ValueError: for invalid serial format.
@@ -103,109 +1052,77 @@ class EVAdvisorClient:
             RuntimeError: for 5xx or unexpected status codes.
         """
         safe_serial = self._safe_serial(serial)
-        url = f"{self.base_url}/ccc/api/v1.0/chargerserial/{safe_serial}"  # upstream path
-        resp = self._get(url)
+        rep = self._cached(
+            "chargers_by_serial", safe_serial, lambda: self._fetch_chargers_by_serial(safe_serial)
+        )
+        return rep if tagged else rep.value
 
-        if resp.status_code == 200:
-            # upstream returns JSON array
-            return resp.json()
-        elif resp.status_code == 403:
-            raise PermissionError("Forbidden (invalid or missing ApiKey)")
-        elif resp.status_code == 404:
-            raise FileNotFoundError("Charger not found")
-        elif 500 <= resp.status_code < 600:
-            raise RuntimeError(f"Upstream server error ({resp.status_code})")
-        else:
-            raise RuntimeError(f"Unexpected status: {resp.status_code} - {resp.text[:200]}")
+    def _fetch_chargers_by_serial(self, safe_serial: str) -> Representation:
+        url = f"{self.base_url}/ccc/api/v1.0/chargerserial/{safe_serial}"  # upstream path (JSON array)
+        return self._get_representation("chargers_by_serial", safe_serial, url, not_found="Charger not found")
 
 
-    def get_charger_by_id(self, charger_id: str) -> Dict[str, Any]:
+    @metrics.timed_call
+    def get_charger_by_id(self, charger_id: str, tagged: bool = False) -> Dict[str, Any]:
         """
         Call EV Advisor: GET /ccc/api/v1.0/{chargerId}
         Header: ApiKey
 
         Returns:
-            Charger record (JSON object).
+            Charger record (JSON object); with tagged=True, a Representation.
 
         Errors:
             PermissionError: 403
             FileNotFoundError: 404
             RuntimeError: 5xx or unexpected code
         """
-        cid = (charger_id or "").strip()
-        # UUIDs contain hex + dashes; keep simple sanity check.
-        if not cid or len(cid) < 8:
-            raise ValueError("Invalid chargerId format")
+        cid = _clean_charger_id(charger_id)
+        rep = self._cached("charger", cid, lambda: self._fetch_charger_by_id(cid))
+        return rep if tagged else rep.value
 
+    def _fetch_charger_by_id(self, cid: str) -> Representation:
         url = f"{self.base_url}/ccc/api/v1.0/{cid}"
-        resp = self._get(url)
-
-        if resp.status_code == 200:
-            return resp.json()  # upstream is a JSON object for this endpoint
-        elif resp.status_code == 403:
-            raise PermissionError("Forbidden (invalid or missing ApiKey)")
-        elif resp.status_code == 404:
-            raise FileNotFoundError("Charger not found")
-        elif 500 <= resp.status_code < 600:
-            raise RuntimeError(f"Upstream server error ({resp.status_code})")
-        else:
-            raise RuntimeError(f"Unexpected status: {resp.status_code} - {resp.text[:200]}")
+        return self._get_representation("charger", cid, url, not_found="Charger not found")
 
     
-    def get_capabilities(self, charger_id: str) -> Dict[str, Any]:
+    @metrics.timed_call
+    def get_capabilities(self, charger_id: str, tagged: bool = False) -> Dict[str, Any]:
         """
         EV Advisor: GET /controller/api/v1.0/charger/{chargerId}/capabilities
-        Returns a capabilities object (flags and limits).
+        Returns a capabilities object (flags and limits); with tagged=True, a Representation.
         """
-        cid = (charger_id or "").strip()
-        if not cid or len(cid) < 8:
-            raise ValueError("Invalid chargerId format")
+        cid = _clean_charger_id(charger_id)
+        rep = self._cached("capabilities", cid, lambda: self._fetch_capabilities(cid))
+        return rep if tagged else rep.value
 
+    def _fetch_capabilities(self, cid: str) -> Representation:
         url = f"{self.base_url}/controller/api/v1.0/charger/{cid}/capabilities"
-        resp = self._get(url)
-
-        if resp.status_code == 200:
-            return resp.json()
-        elif resp.status_code == 403:
-            raise PermissionError("Forbidden (invalid or missing ApiKey)")
-        elif resp.status_code == 500:
-            raise RuntimeError("Upstream server error (500)")
-        else:
-            raise RuntimeError(f"Unexpected status: {resp.status_code} - {resp.text[:200]}")
-        
+        return self._get_representation("capabilities", cid, url)
     
-    def get_cloud_status(self, charger_id: str) -> Dict[str, Any]:
+    @metrics.timed_call
+    def get_cloud_status(self, charger_id: str, tagged: bool = False) -> Dict[str, Any]:
         """
         EV Advisor: GET /controller/api/v1.0/charger/{chargerId}/cloudstatus
         Header: ApiKey
 
+        Not cached (status changes), but the last payload is held so the next
+        call is a conditional GET.
+
         Returns:
-            JSON object with cloud and charger status.
+            JSON object with cloud and charger status; with tagged=True, a Representation.
 
         Errors:
             PermissionError: 403
             FileNotFoundError: 404
             RuntimeError: 5xx or unexpected code
         """
-        cid = (charger_id or "").strip()
-        if not cid or len(cid) < 8:
-            raise ValueError("Invalid chargerId format")
-
+        cid = _clean_charger_id(charger_id)
         url = f"{self.base_url}/controller/api/v1.0/charger/{cid}/cloudstatus"
-        resp = self._get(url)
-
-        if resp.status_code == 200:
-            return resp.json()
-        elif resp.status_code == 403:
-            raise PermissionError("Forbidden (invalid or missing ApiKey)")
-        elif resp.status_code == 404:
-            raise FileNotFoundError("Charger not found")
-        elif 500 <= resp.status_code < 600:
-            raise RuntimeError(f"Upstream server error ({resp.status_code})")
-        else:
-            raise RuntimeError(f"Unexpected status: {resp.status_code} - {resp.text[:200]}")
+        rep = self._get_representation("cloudstatus", cid, url, not_found="Charger not found")
+        return rep if tagged else rep.value
 
     
+    @metrics.timed_call
     def get_charge_history(
             self,
             charger_id: str,
@@ -224,75 +1141,152 @@ class EVAdvisorClient:
 
             Validates basic inputs; defers business rules to upstream (e.g., start < end).
             """
-            cid = (charger_id or "").strip()
-            if not cid or len(cid) < 8:
-                raise ValueError("Invalid chargerId format")
-
-            # Minimal ISO date validation: YYYY-MM-DD or full ISO 8601
-            def _is_valid_date(s: str) -> bool:
-                return bool(re.match(r"^\d{4}-\d{2}-\d{2}([T ][0-9:.\-+Z]*)?$", s or ""))
-
-            if not _is_valid_date(start_date) or not _is_valid_date(end_date):
-                raise ValueError("startDate/endDate must be ISO date strings (e.g., 2025-12-05)")
-
+            cid = _clean_charger_id(charger_id)
+            params = _history_params(start_date, end_date, id_tag)
             url = f"{self.base_url}/controller/api/v1.0/charger/{cid}/charge/history"
-            params: Dict[str, str] = {"startDate": start_date, "endDate": end_date}
-            if id_tag:
-                params["idTag"] = id_tag
 
-            # Perform GET with params
-            try:
-                resp = self.session.get(url, params=params, timeout=self.timeout)
-            except (requests.ConnectionError, requests.Timeout) as exc:
-                raise RuntimeError(f"EVAdvisor GET failed: {exc}") from exc
+            resp = self._get(url, params=params, endpoint="charge_history")
 
             if resp.status_code == 200:
                 return resp.json()  # upstream returns an array
-            elif resp.status_code == 400:
-                raise ValueError("Bad Request (date range/format)")
-            elif resp.status_code == 403:
-                raise PermissionError("Forbidden (invalid or missing ApiKey)")
-            elif resp.status_code == 404:
-                raise FileNotFoundError("ChargerId not found")
-            elif 500 <= resp.status_code < 600:
-                raise RuntimeError(f"Upstream server error ({resp.status_code})")
-            else:
-                raise RuntimeError(f"Unexpected status: {resp.status_code} - {resp.text[:200]}")
-            
+            _raise_for_status(
+                resp.status_code, resp.text,
+                not_found="ChargerId not found", bad_request="Bad Request (date range/format)",
+            )
+
+    @metrics.timed_call
+    def get_charge_history_raw(
+        self,
+        charger_id: str,
+        start_date: str,
+        end_date: str,
+        id_tag: Optional[str] = None,
+    ) -> bytes:
+        """
+        Pass-through get_charge_history: upstream's JSON array as bytes, never
+        parsed or re-serialized, records in upstream's order. Same errors, plus
+        RuntimeError when the body is not a JSON array.
+        """
+        cid = _clean_charger_id(charger_id)
+        params = _history_params(start_date, end_date, id_tag)
+        url = f"{self.base_url}/controller/api/v1.0/charger/{cid}/charge/history"
+
+        resp = self._get(url, params=params, endpoint="charge_history")
+
+        if resp.status_code == 200:
+            return _json_array_body(resp.headers.get("Content-Type", ""), resp.content)
+        _raise_for_status(
+            resp.status_code, resp.text,
+            not_found="ChargerId not found", bad_request="Bad Request (date range/format)",
+        )
+
+    def iter_charge_history_windows(
+        self,
+        charger_id: str,
+        start_date: str,
+        end_date: str,
+        id_tag: Optional[str] = None,
+        window: Union[str, int, None] = None,
+        concurrency: Optional[int] = None,
+    ) -> Iterator[Outcome]:
+        """
+        Fetch [start_date, end_date] as windows (see get_charge_history_windowed)
+        and yield one Outcome per window, in window order: `item` is the
+        (startDate, endDate) window, `value` its records sorted by start.
+
+        Only `concurrency` windows are fetched ahead of the consumer, so
+        iterating a multi-year range holds a few windows in memory, not the range.
+        """
+        _clean_charger_id(charger_id)
+        _history_params(start_date, end_date, id_tag)
+        if window is None:
+            window = settings.EXTERNAL_API_HISTORY_WINDOW
+        windows = split_range(start_date, end_date, window)
+        limit = concurrency or settings.EXTERNAL_API_HISTORY_CONCURRENCY
+        fetch = lambda w: merge_records([self.get_charge_history(charger_id, w[0], w[1], id_tag)])
+        return iter_fan_out_ordered(fetch, windows, limit)
 
-    def download_latest_ocpp_logs(self, charger_id: str) -> requests.Response:
+    @metrics.timed_call
+    def get_charge_history_windowed(
+        self,
+        charger_id: str,
+        start_date: str,
+        end_date: str,
+        id_tag: Optional[str] = None,
+        window: Union[str, int, None] = None,
+        concurrency: Optional[int] = None,
+    ) -> ChargeHistoryResult:
+        """
+        Charge history for a long range, fetched as concurrent windows.
+
+        The range is split per `window` ('day' | 'week' | 'month' | N days;
+        default EXTERNAL_API_HISTORY_WINDOW), windows are fetched with at most
+        `concurrency` requests in flight, and the results are merged,
+        de-duplicated and ordered by session start.
+
+        A failing window does not fail the range: it is listed in
+        `result.failures`. Only if every window fails is the first error raised
+        (same exceptions as `get_charge_history`).
+        """
+        outcomes = list(self.iter_charge_history_windows(charger_id, start_date, end_date, id_tag, window, concurrency))
+        failures = [(o.item, o.error) for o in outcomes if not o.ok]
+        if len(failures) == len(outcomes):
+            raise failures[0][1]
+        for w, exc in failures:
+            log.warning("EVAdvisor charge history window %s..%s failed: %s", w[0], w[1], exc)
+        records = merge_records(o.value for o in outcomes if o.ok)
+        return ChargeHistoryResult(records, [o.item for o in outcomes], failures)
+
+    @metrics.timed_call
+    def download_latest_ocpp_logs(
+        self,
+        charger_id: str,
+        range_header: Optional[str] = None,
+        if_range: Optional[str] = None,
+        if_none_match: Optional[str] = None,
+        if_modified_since: Optional[str] = None,
+    ) -> requests.Response:
         """
         EV Advisor: GET /ccc/api/v1.0/charger/{chargerId}/logs/download-ocpp-logs
+        Optional headers forwarded upstream for resumable downloads:
+        - Range (e.g. "bytes=1048576-")
+        - If-Range (ETag or Last-Modified of the partial copy)
+        and for revalidating a held copy (services/archive_cache.py):
+        - If-None-Match / If-Modified-Since
+
         Returns:
-            The raw `requests.Response` so caller can stream binary content and headers.
+            The raw, unread `requests.Response` (stream=True) so the caller can
+            stream binary content and headers. Status is 200, 206 (partial),
+            304 (held copy still current; only with a validator) or 416 (range
+            not satisfiable). The caller must close it.
 
         Errors:
             ValueError (bad id), PermissionError (403), FileNotFoundError (404),
             RuntimeError (5xx or unexpected).
         """
-        cid = (charger_id or "").strip()
-        if not cid or len(cid) < 8:
-            raise ValueError("Invalid chargerId format")
-
+        cid = _clean_charger_id(charger_id)
         url = f"{self.base_url}/ccc/api/v1.0/charger/{cid}/logs/download-ocpp-logs"
+        headers: Dict[str, str] = {}
+        if range_header:
+            headers["Range"] = range_header
+            if if_range:
+                headers["If-Range"] = if_range
+        if if_none_match:
+            headers["If-None-Match"] = if_none_match
+        if if_modified_since:
+            headers["If-Modified-Since"] = if_modified_since
 
-        # Stream to avoid loading entire file into memory
-        try:
-            resp = self.session.get(url, timeout=self.timeout, stream=True)
-        except (requests.ConnectionError, requests.Timeout) as exc:
-            raise RuntimeError(f"EVAdvisor GET failed: {exc}") from exc
+        # Stream to avoid loading entire file into memory. Not coalesced: each
+        # caller needs its own body stream (and possibly its own Range).
+        resp = self._send("ocpp_logs", url, headers=headers, stream=True)
 
-        if resp.status_code == 200:
+        if resp.status_code == 304:
+            metrics.UPSTREAM_NOT_MODIFIED.inc(endpoint="ocpp_logs")
+        if resp.status_code in (200, 206, 304, 416):
             return resp
-        elif resp.status_code == 400:
-            # e.g., wrong input or upstream preconditions
-            raise ValueError("Bad Request")
-        elif resp.status_code == 403:
-            raise PermissionError("Forbidden (invalid or missing ApiKey)")
-        elif resp.status_code == 404:
-            raise FileNotFoundError("ChargerId not found / Ocpp Logs not found")
-        elif 500 <= resp.status_code < 600:
-            raise RuntimeError(f"Upstream server error ({resp.status_code})")
-        else:
-            raise RuntimeError(f"Unexpected status: {resp.status_code} - {resp.text[:200]}")
-    
+
+        # Error bodies are small; read what we need and release the connection.
+        status, detail = resp.status_code, resp.text[:200]
+        resp.close()
+        # 400: e.g., wrong input or upstream preconditions
+        _raise_for_status(status, detail, not_found="ChargerId not found / Ocpp Logs not found", bad_request="Bad Request")
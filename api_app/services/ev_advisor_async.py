@@ -0,0 +1,569 @@
+"""
+Async EV Advisor service client (asyncio / aiohttp).
+
+Responsibility:
+- Same endpoint methods, validation and error mapping as `EVAdvisorClient`,
+  for async views served under ASGI.
+- While a request waits on upstream the event loop serves other requests, so
+  one worker can hold thousands of slow upstream calls instead of one per thread.
+- Shares the response cache (same Django cache alias) with the sync client.
+
+aiohttp rather than httpx: at a few hundred concurrent upstream calls httpx
+spent tens of times more CPU per request, and CPU is what an async worker
+runs out of first.
+
+Usage:
+    client = AsyncEVAdvisorClient.shared()
+    data = await client.get_chargers_by_serial("ABC123")
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import json
+import logging
+import time
+import weakref
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Union
+
+import aiohttp
+from django.conf import settings
+
+from . import metrics
+from .charge_history import ChargeHistoryResult, merge_records, split_range
+from .ev_advisor import (
+    Representation,
+    ResponseCache,
+    _clean_charger_id,
+    _conditional_headers,
+    _clean_serial,
+    _history_params,
+    _json_array_body,
+    _raise_for_status,
+)
+from . import admission, resilience
+from .admission import ConcurrencyLimiter, UpstreamSaturated
+from .resilience import (
+    Breakers, DeadlineExceeded, HedgePolicy, RetryBudget, RetryPolicy, UpstreamUnavailable, parse_retry_after,
+)
+
+log = logging.getLogger(__name__)
+
+# aiohttp sessions (and their connection pools) are bound to the event loop that opened them, so the
+# shared client is per loop (uvicorn runs one loop per worker process).
+_shared_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncEVAdvisorClient]" = (
+    weakref.WeakKeyDictionary()
+)
+
+_TRANSPORT_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError)
+
+
+class UpstreamResponse:
+    """
+    Fully-read upstream response exposing the part of the `requests` interface
+    the endpoint methods use. Immutable, so one instance can be handed to
+    every coalesced caller.
+    """
+
+    __slots__ = ("status_code", "headers", "content")
+
+    def __init__(self, status_code: int, headers: Any, content: bytes) -> None:
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    @property
+    def text(self) -> str:
+        return self.content.decode("utf-8", errors="replace")
+
+    def json(self) -> Any:
+        return json.loads(self.content)
+
+
+class AsyncSingleFlight:
+    """
+    asyncio counterpart of `SingleFlight`: identical concurrent GETs share one task.
+
+    The shared call runs as its own task and every caller awaits it through
+    `shield()`, so a caller that goes away (client disconnect cancels the
+    view) does not cancel the upstream request the others are waiting on.
+    The task runs under the latest deadline of its waiters
+    (resilience.SharedDeadline), each caller waits only as long as its own
+    deadline allows, and the task is cancelled once no caller is left.
+    """
+
+    def __init__(self) -> None:
+        self._calls: Dict[Any, Tuple[asyncio.Task, resilience.SharedDeadline]] = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    async def do(self, key: Any, fn: Callable[[], Awaitable[Any]]) -> Any:
+        at = resilience.expires_at()
+        call = self._calls.get(key)
+        if call is None:
+            shared = resilience.SharedDeadline()
+            with resilience.shared_deadline(shared):  # the task copies this context
+                task = asyncio.ensure_future(fn())
+            call = self._calls[key] = (task, shared)
+            self.executions += 1
+            task.add_done_callback(lambda t: self._done(key, t))
+        else:
+            self.coalesced += 1
+            metrics.COALESCED.inc()
+        task, shared = call
+        shared.join(at)
+        try:
+            left = resilience.remaining()
+            if left is None:
+                return await asyncio.shield(task)
+            try:
+                return await asyncio.wait_for(asyncio.shield(task), max(0.0, left))
+            except asyncio.TimeoutError:
+                if task.done():
+                    return task.result()  # finished (or failed with its own timeout) just now
+                raise DeadlineExceeded(
+                    "EV Advisor request deadline exceeded (waiting for a shared upstream call)"
+                ) from None
+        finally:
+            if shared.leave(at) and not task.done():
+                # Nobody is waiting any more: stop the upstream request.
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+                task.cancel()
+
+    def _done(self, key: Any, task: asyncio.Task) -> None:
+        call = self._calls.get(key)
+        if call is not None and call[0] is task:
+            del self._calls[key]
+        if not task.cancelled():
+            # Mark the error retrieved even if every waiter was cancelled.
+            task.exception()
+
+    def stats(self) -> Dict[str, int]:
+        return {"executions": self.executions, "coalesced": self.coalesced, "in_flight": len(self._calls)}
+
+
+class AsyncEVAdvisorClient:
+    """
+    Thin async HTTP client for EV Advisor.
+
+    Mirrors `EVAdvisorClient`: same constructor settings, same methods (as
+    coroutines), same exceptions (ValueError / PermissionError /
+    FileNotFoundError / RuntimeError).
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        api_key: str,
+        timeout: int = 10,
+        retries: int = 2,
+        pool_idle_timeout: float = 60.0,
+        cache: Optional[ResponseCache] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+        retry_budget: Optional[RetryBudget] = None,
+        breakers: Optional[Breakers] = None,
+        hedging: Optional[HedgePolicy] = None,
+        limiter: Optional[ConcurrencyLimiter] = None,
+    ) -> None:
+        if not base_url or not api_key:
+            raise ValueError("AsyncEVAdvisorClient requires base_url and api_key")
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.timeout = timeout
+        self.retry_policy = retry_policy or RetryPolicy(retries=retries)
+        self.retries = self.retry_policy.retries
+        self.retry_budget = retry_budget or RetryBudget()
+        self.breakers = breakers or Breakers()
+        self.hedging = hedging or HedgePolicy()
+        self.limiter = limiter
+        self.cache = cache
+        self._inflight = AsyncSingleFlight()
+        self.http = aiohttp.ClientSession(
+            headers={"Accept": "application/json", "ApiKey": self.api_key},
+            # Same semantics as requests' timeout: per connect and per read,
+            # not for the whole (possibly long, streamed) body.
+            timeout=aiohttp.ClientTimeout(total=None, sock_connect=timeout, sock_read=timeout),
+            # No cap on concurrent connections: holding many slow upstream
+            # calls at once is the point of the async path.
+            connector=aiohttp.TCPConnector(limit=0, keepalive_timeout=pool_idle_timeout),
+        )
+
+    @classmethod
+    def from_settings(cls) -> "AsyncEVAdvisorClient":
+        return cls(
+            base_url=settings.EXTERNAL_API_BASE_URL,
+            api_key=settings.EXTERNAL_API_KEY,
+            timeout=settings.EXTERNAL_API_TIMEOUT,
+            retries=settings.EXTERNAL_API_RETRIES,
+            pool_idle_timeout=settings.EXTERNAL_API_POOL_IDLE_TIMEOUT,
+            cache=ResponseCache.from_settings(),
+            retry_policy=RetryPolicy.from_settings(),
+            retry_budget=RetryBudget(settings.EXTERNAL_API_RETRY_BUDGET_RATIO),
+            breakers=Breakers.from_settings(),
+            hedging=HedgePolicy.from_settings(),
+            limiter=admission.limiter(),
+        )
+
+    @classmethod
+    def shared(cls) -> "AsyncEVAdvisorClient":
+        """Return the client for the running event loop, creating it on first use."""
+        loop = asyncio.get_running_loop()
+        client = _shared_clients.get(loop)
+        if client is None:
+            client = _shared_clients[loop] = cls.from_settings()
+        return client
+
+    async def aclose(self) -> None:
+        await self.http.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "cache": self.cache.stats() if self.cache is not None else None,
+            "single_flight": self._inflight.stats(),
+            "retry_budget": self.retry_budget.stats(),
+            "breakers": self.breakers.stats(),
+            "hedging": self.hedging.stats(),
+            "admission": self.limiter.stats() if self.limiter is not None else None,
+        }
+
+    async def _cached(self, endpoint: str, key: str, aloader: Callable[[], Awaitable[Any]]) -> Any:
+        if self.cache is None:
+            return await aloader()
+        return await self.cache.aget_or_load(endpoint, key, aloader)
+
+    async def _get(
+        self,
+        url: str,
+        params: Optional[Dict[str, str]] = None,
+        endpoint: str = "default",
+        headers: Optional[Dict[str, str]] = None,
+    ) -> UpstreamResponse:
+        """GET with the same retry policy, circuit breaker and coalescing as the sync client."""
+        key = (url, tuple(sorted((params or {}).items())), tuple(sorted((headers or {}).items())))
+        return await self._inflight.do(key, lambda: self._send(endpoint, url, params=params, headers=headers))
+
+    async def _get_representation(
+        self, endpoint: str, key: str, url: str, not_found: Optional[str] = None
+    ) -> Representation:
+        """Conditional JSON GET (see EVAdvisorClient._get_representation)."""
+        held = await self.cache.apeek(endpoint, key) if self.cache is not None else None
+        resp = await self._get(url, endpoint=endpoint, headers=_conditional_headers(held))
+        if resp.status_code == 304 and held is not None:
+            metrics.UPSTREAM_NOT_MODIFIED.inc(endpoint=endpoint)
+            return held
+        if resp.status_code == 200:
+            rep = Representation.of(
+                resp.json(), resp.headers.get("ETag"), resp.headers.get("Last-Modified"),
+                body=resp.content if settings.EXTERNAL_API_PASSTHROUGH else None,
+            )
+            if self.cache is not None:
+                await self.cache.aremember(endpoint, key, rep)
+            return rep
+        _raise_for_status(resp.status_code, resp.text, not_found=not_found)
+
+    async def _send(
+        self,
+        endpoint: str,
+        url: str,
+        params: Optional[Dict[str, str]] = None,
+        headers: Optional[Dict[str, str]] = None,
+        stream: bool = False,
+    ) -> Any:
+        """
+        Async twin of EVAdvisorClient._send. Returns an UpstreamResponse, or
+        with `stream=True` the unread aiohttp.ClientResponse (caller releases it).
+        """
+        breaker = self.breakers.get(endpoint)
+        try:
+            breaker.before_call()
+        except UpstreamUnavailable:
+            metrics.CIRCUIT_REJECTIONS.inc(endpoint=endpoint)
+            raise
+        self.retry_budget.deposit()
+        attempt = 0
+        healthy = abandoned = False
+        try:
+            while True:
+                resp, error, retry_after = None, None, None
+                timeout = resilience.attempt_timeout(self.timeout)
+                try:
+                    resp = await self._attempt(endpoint, url, params, headers, stream, timeout)
+                except _TRANSPORT_ERRORS as exc:
+                    error = exc
+                else:
+                    if not isinstance(resp, UpstreamResponse):  # streamed, final status
+                        healthy = True
+                        return resp
+                    if not self.retry_policy.should_retry_status(resp.status_code):
+                        healthy = True
+                        return resp
+                    retry_after = parse_retry_after(resp.headers.get("Retry-After"))
+
+                delay = self.retry_policy.delay(attempt, retry_after)
+                if delay is None or not resilience.fits(delay) or not self.retry_budget.withdraw():
+                    if resp is not None:
+                        return resp
+                    if isinstance(error, asyncio.TimeoutError) and timeout < self.timeout:
+                        raise DeadlineExceeded(f"EV Advisor request deadline exceeded: {error!r}")
+                    raise RuntimeError(f"EVAdvisor GET failed after {attempt + 1} attempts: {error}")
+                metrics.UPSTREAM_RETRIES.inc(endpoint=endpoint)
+                log.warning(
+                    "EVAdvisor async %s attempt %s failed (%s); retrying in %.2fs",
+                    endpoint, attempt + 1, error or resp.status_code, delay,
+                )
+                await asyncio.sleep(delay)
+                attempt += 1
+        except UpstreamUnavailable as exc:  # our own limits, not upstream's health
+            abandoned = True
+            if isinstance(exc, DeadlineExceeded):
+                metrics.DEADLINE_EXCEEDED.inc(endpoint=endpoint)
+            raise
+        finally:
+            if healthy:
+                breaker.record_success()
+            elif abandoned:
+                breaker.record_abandoned()
+            else:
+                breaker.record_failure()
+
+    async def _get_once(
+        self, endpoint: str, url: str, params: Optional[Dict[str, str]], headers: Optional[Dict[str, str]],
+        stream: bool, timeout: float, wait: bool = True,
+    ) -> Any:
+        """See EVAdvisorClient._get_once."""
+        async with self.limiter.aslot(wait) if self.limiter is not None else contextlib.nullcontext():
+            t0 = time.perf_counter()
+            try:
+                raw = await self.http.get(
+                    url, params=params, headers=headers,
+                    timeout=aiohttp.ClientTimeout(total=None, sock_connect=timeout, sock_read=timeout),
+                )
+                elapsed = time.perf_counter() - t0
+                metrics.UPSTREAM_REQUESTS.observe(elapsed, endpoint=endpoint, status=raw.status)
+                self.hedging.observe(endpoint, elapsed)
+                if stream and not self.retry_policy.should_retry_status(raw.status):
+                    return raw
+                try:
+                    return UpstreamResponse(raw.status, raw.headers, await raw.read())
+                finally:
+                    raw.release()
+            except _TRANSPORT_ERRORS:
+                metrics.UPSTREAM_REQUESTS.observe(time.perf_counter() - t0, endpoint=endpoint, status="error")
+                raise
+
+    async def _attempt(
+        self, endpoint: str, url: str, params: Optional[Dict[str, str]], headers: Optional[Dict[str, str]],
+        stream: bool, timeout: float,
+    ) -> Any:
+        """One attempt of _send, hedged like EVAdvisorClient._attempt; the losing copy is cancelled."""
+        delay = None if stream else self.hedging.delay(endpoint)
+        if delay is None or delay >= timeout or not resilience.fits(delay):
+            return await self._get_once(endpoint, url, params, headers, stream, timeout)
+        primary = asyncio.ensure_future(self._get_once(endpoint, url, params, headers, False, timeout))
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done:
+            return primary.result()
+        try:
+            hedge_timeout = resilience.attempt_timeout(timeout)
+        except DeadlineExceeded:
+            return await primary
+        if not self.retry_budget.withdraw():
+            return await primary
+        hedge = asyncio.ensure_future(self._get_once(endpoint, url, params, headers, False, hedge_timeout, False))
+        return await self._first_answer(endpoint, {primary: "primary", hedge: "hedge"})
+
+    async def _first_answer(self, endpoint: str, copies: Dict[asyncio.Future, str]) -> UpstreamResponse:
+        """See EVAdvisorClient._first_answer."""
+        pending = set(copies)
+        last: Any = None
+        winner = "none"
+        try:
+            while pending and winner == "none":
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    try:
+                        answer = task.result()
+                    except _TRANSPORT_ERRORS + (UpstreamSaturated,) as exc:
+                        if not isinstance(last, UpstreamResponse):
+                            last = exc
+                        continue
+                    if winner == "none":
+                        last = answer
+                        if not self.retry_policy.should_retry_status(answer.status_code):
+                            winner = copies[task]
+        finally:
+            for task in pending:
+                task.cancel()
+        self.hedging.record(hedge_won=winner == "hedge")
+        metrics.UPSTREAM_HEDGES.inc(endpoint=endpoint, winner=winner)
+        if isinstance(last, UpstreamResponse):
+            return last
+        raise last
+
+    @metrics.timed_call
+    async def get_chargers_by_serial(self, serial: str, tagged: bool = False) -> List[Dict[str, Any]]:
+        """GET /ccc/api/v1.0/chargerserial/:serialNumber (see EVAdvisorClient)."""
+        safe_serial = _clean_serial(serial)
+
+        async def fetch() -> Representation:
+            url = f"{self.base_url}/ccc/api/v1.0/chargerserial/{safe_serial}"
+            return await self._get_representation("chargers_by_serial", safe_serial, url, not_found="Charger not found")
+
+        rep = await self._cached("chargers_by_serial", safe_serial, fetch)
+        return rep if tagged else rep.value
+
+    @metrics.timed_call
+    async def get_charger_by_id(self, charger_id: str, tagged: bool = False) -> Dict[str, Any]:
+        """GET /ccc/api/v1.0/{chargerId} (see EVAdvisorClient)."""
+        cid = _clean_charger_id(charger_id)
+
+        async def fetch() -> Representation:
+            url = f"{self.base_url}/ccc/api/v1.0/{cid}"
+            return await self._get_representation("charger", cid, url, not_found="Charger not found")
+
+        rep = await self._cached("charger", cid, fetch)
+        return rep if tagged else rep.value
+
+    @metrics.timed_call
+    async def get_capabilities(self, charger_id: str, tagged: bool = False) -> Dict[str, Any]:
+        """GET /controller/api/v1.0/charger/{chargerId}/capabilities (see EVAdvisorClient)."""
+        cid = _clean_charger_id(charger_id)
+
+        async def fetch() -> Representation:
+            url = f"{self.base_url}/controller/api/v1.0/charger/{cid}/capabilities"
+            return await self._get_representation("capabilities", cid, url)
+
+        rep = await self._cached("capabilities", cid, fetch)
+        return rep if tagged else rep.value
+
+    @metrics.timed_call
+    async def get_cloud_status(self, charger_id: str, tagged: bool = False) -> Dict[str, Any]:
+        """GET /controller/api/v1.0/charger/{chargerId}/cloudstatus (see EVAdvisorClient)."""
+        cid = _clean_charger_id(charger_id)
+        url = f"{self.base_url}/controller/api/v1.0/charger/{cid}/cloudstatus"
+        rep = await self._get_representation("cloudstatus", cid, url, not_found="Charger not found")
+        return rep if tagged else rep.value
+
+    @metrics.timed_call
+    async def get_charge_history(
+        self,
+        charger_id: str,
+        start_date: str,
+        end_date: str,
+        id_tag: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """GET /controller/api/v1.0/charger/{chargerId}/charge/history (see EVAdvisorClient)."""
+        cid = _clean_charger_id(charger_id)
+        params = _history_params(start_date, end_date, id_tag)
+        url = f"{self.base_url}/controller/api/v1.0/charger/{cid}/charge/history"
+        resp = await self._get(url, params=params, endpoint="charge_history")
+
+        if resp.status_code == 200:
+            return resp.json()
+        _raise_for_status(
+            resp.status_code, resp.text,
+            not_found="ChargerId not found", bad_request="Bad Request (date range/format)",
+        )
+
+    @metrics.timed_call
+    async def get_charge_history_raw(
+        self,
+        charger_id: str,
+        start_date: str,
+        end_date: str,
+        id_tag: Optional[str] = None,
+    ) -> bytes:
+        """Upstream's charge history bytes, unparsed (see EVAdvisorClient.get_charge_history_raw)."""
+        cid = _clean_charger_id(charger_id)
+        params = _history_params(start_date, end_date, id_tag)
+        url = f"{self.base_url}/controller/api/v1.0/charger/{cid}/charge/history"
+        resp = await self._get(url, params=params, endpoint="charge_history")
+
+        if resp.status_code == 200:
+            return _json_array_body(resp.headers.get("Content-Type", ""), resp.content)
+        _raise_for_status(
+            resp.status_code, resp.text,
+            not_found="ChargerId not found", bad_request="Bad Request (date range/format)",
+        )
+
+    @metrics.timed_call
+    async def get_charge_history_windowed(
+        self,
+        charger_id: str,
+        start_date: str,
+        end_date: str,
+        id_tag: Optional[str] = None,
+        window: Union[str, int, None] = None,
+        concurrency: Optional[int] = None,
+    ) -> ChargeHistoryResult:
+        """Windowed, concurrent charge history (see EVAdvisorClient.get_charge_history_windowed)."""
+        _clean_charger_id(charger_id)
+        _history_params(start_date, end_date, id_tag)
+        if window is None:
+            window = settings.EXTERNAL_API_HISTORY_WINDOW
+        windows = split_range(start_date, end_date, window)
+        sem = asyncio.Semaphore(concurrency or settings.EXTERNAL_API_HISTORY_CONCURRENCY)
+
+        async def fetch(w):
+            async with sem:
+                return await self.get_charge_history(charger_id, w[0], w[1], id_tag)
+
+        results = await asyncio.gather(*(fetch(w) for w in windows), return_exceptions=True)
+        failures = [(w, r) for w, r in zip(windows, results) if isinstance(r, Exception)]
+        if len(failures) == len(windows):
+            raise failures[0][1]
+        for w, exc in failures:
+            log.warning("EVAdvisor charge history window %s..%s failed: %s", w[0], w[1], exc)
+        records = merge_records(r for r in results if not isinstance(r, Exception))
+        return ChargeHistoryResult(records, windows, failures)
+
+    @metrics.timed_call
+    async def download_latest_ocpp_logs(
+        self,
+        charger_id: str,
+        range_header: Optional[str] = None,
+        if_range: Optional[str] = None,
+        if_none_match: Optional[str] = None,
+        if_modified_since: Optional[str] = None,
+    ) -> aiohttp.ClientResponse:
+        """
+        GET /ccc/api/v1.0/charger/{chargerId}/logs/download-ocpp-logs (see EVAdvisorClient).
+
+        Returns an unread `aiohttp.ClientResponse` (200, 206, 304 or 416); iterate
+        with `resp.content.iter_chunked()` and always `resp.release()`.
+        """
+        cid = _clean_charger_id(charger_id)
+        url = f"{self.base_url}/ccc/api/v1.0/charger/{cid}/logs/download-ocpp-logs"
+        headers: Dict[str, str] = {}
+        if range_header:
+            headers["Range"] = range_header
+            if if_range:
+                headers["If-Range"] = if_range
+        if if_none_match:
+            headers["If-None-Match"] = if_none_match
+        if if_modified_since:
+            headers["If-Modified-Since"] = if_modified_since
+
+        resp = await self._send("ocpp_logs", url, headers=headers, stream=True)
+        if isinstance(resp, UpstreamResponse):
+            # Retryable error status: the body was already read.
+            status, detail = resp.status_code, resp.text
+        elif resp.status in (200, 206, 304, 416):
+            if resp.status == 304:
+                metrics.UPSTREAM_NOT_MODIFIED.inc(endpoint="ocpp_logs")
+            return resp
+        else:
+            # Error bodies are small; read what we need and release the connection.
+            status = resp.status
+            try:
+                detail = (await resp.read()).decode("utf-8", errors="replace")
+            except _TRANSPORT_ERRORS:
+                detail = ""
+            finally:
+                resp.release()
+        _raise_for_status(
+            status, detail,
+            not_found="ChargerId not found / Ocpp Logs not found", bad_request="Bad Request",
+        )
@@ -0,0 +1,104 @@
+"""
+Bounded-concurrency fan-out for EV Advisor calls.
+
+Responsibility:
+- Run one blocking client call per item on a small, per-call thread pool.
+- Cap how many calls are in flight at once (protects upstream and the worker).
+- Report each item's result or exception (and its latency) as it completes,
+  so one failing item never fails the batch.
+
+`iter_fan_out_ordered` yields in input order and only keeps `max_workers`
+results ahead, for pipelines that must stay in constant memory (exports).
+
+Total wall time tracks the slowest call (times ceil(N / limit)), not the sum.
+Each call runs in a copy of the submitting thread's context, so the request
+deadline (resilience.deadline) applies to fanned-out calls too.
+"""
+
+from __future__ import annotations
+
+import contextvars
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import Any, Callable, Iterable, Iterator, Optional
+
+
+@dataclass
+class Outcome:
+    """Result of one fanned-out call: `value` on success, `error` otherwise."""
+
+    index: int
+    item: Any
+    value: Any = None
+    error: Optional[BaseException] = None
+    elapsed_ms: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def _submit(pool: ThreadPoolExecutor, index: int, item: Any, fn: Callable[[Any], Any]):
+    return pool.submit(contextvars.copy_context().run, _timed, index, item, fn)
+
+
+def _timed(index: int, item: Any, fn: Callable[[Any], Any]) -> Outcome:
+    t0 = time.perf_counter()
+    try:
+        value = fn(item)
+    except Exception as exc:
+        return Outcome(index, item, error=exc, elapsed_ms=(time.perf_counter() - t0) * 1000)
+    return Outcome(index, item, value=value, elapsed_ms=(time.perf_counter() - t0) * 1000)
+
+
+def iter_fan_out(fn: Callable[[Any], Any], items: Iterable[Any], max_workers: int) -> Iterator[Outcome]:
+    """
+    Call fn(item) for every item with at most `max_workers` in flight and
+    yield Outcomes in completion order. Closing the iterator early (e.g. the
+    client of a streamed response disconnects) cancels calls not yet started.
+    """
+    items = list(items)
+    if not items:
+        return
+    pool = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(items))), thread_name_prefix="evadv-fanout")
+    try:
+        futures = [_submit(pool, i, item, fn) for i, item in enumerate(items)]
+        for fut in as_completed(futures):
+            yield fut.result()
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def fan_out(fn: Callable[[Any], Any], items: Iterable[Any], max_workers: int) -> list:
+    """Like iter_fan_out, but wait for everything and return Outcomes in input order."""
+    return sorted(iter_fan_out(fn, items, max_workers), key=lambda o: o.index)
+
+
+def iter_fan_out_ordered(fn: Callable[[Any], Any], items: Iterable[Any], max_workers: int) -> Iterator[Outcome]:
+    """
+    Like iter_fan_out, but yield Outcomes in input order, and only submit an
+    item once an earlier one has been consumed: at most `max_workers` results
+    are ever pending, so a slow consumer bounds memory instead of buffering.
+    `items` may be a lazy iterable.
+    """
+    workers = max(1, max_workers)
+    queue = iter(enumerate(items))
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="evadv-fanout")
+    pending: deque = deque()
+
+    def submit_next() -> None:
+        nxt = next(queue, None)
+        if nxt is not None:
+            pending.append(_submit(pool, nxt[0], nxt[1], fn))
+
+    try:
+        for _ in range(workers):
+            submit_next()
+        while pending:
+            outcome = pending.popleft().result()
+            submit_next()
+            yield outcome
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
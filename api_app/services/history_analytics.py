@@ -0,0 +1,350 @@
+"""
+Charge-history aggregates (energy, plugged-in and idle time per day, week
+and idTag), computed server-side instead of in exported spreadsheets.
+
+Responsibility:
+- SessionColumns.from_records(): load records once into columns (start,
+  duration, idle time, energy, tag and charger codes). With NumPy,
+  timestamps in the usual fixed UTC shape are parsed column-wise
+  (_parse_fixed); only other shapes are parsed one by one.
+- summarize(): totals and group-bys over the columns. With NumPy, each
+  group-by is one np.unique + np.bincount per measure; without it the same
+  sums are accumulated in a single Python loop (same results, slower).
+
+Upstream record fields are not formally specified; like charge_history.py
+the loader looks for the usual names and falls back gracefully:
+- start: startTime / startDate / start / startedAt / timestampStart
+- end (unplugged): endTime / stopTime / endDate / end / stoppedAt
+- charging end: chargingEndTime / chargingEnd (idle = end - charging end)
+- energy: energyKwh / energy (kWh), energyWh (Wh) or meterStop - meterStart (Wh)
+Records without a recognisable start are counted as `skipped`.
+
+Days and ISO weeks (starting Monday) are UTC.
+"""
+
+from __future__ import annotations
+
+from array import array
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from .charge_history import _START_FIELDS
+
+try:  # optional: pip install numpy
+    import numpy as np
+except ImportError:  # pragma: no cover - depends on the environment
+    np = None
+
+_END_FIELDS = ("endTime", "stopTime", "endDate", "end", "stoppedAt", "timestampStop")
+_CHARGING_END_FIELDS = ("chargingEndTime", "chargingEnd")
+_KWH_FIELDS = ("energyKwh", "energy")
+
+GROUPS = ("day", "week", "tag", "charger")
+
+_DAY = 86400
+_EPOCH = date(1970, 1, 1)
+NAN = float("nan")
+
+
+def _field(records: Sequence[Dict[str, Any]], names: Sequence[str]) -> List[Any]:
+    """Per record, the value of the first of `names` it has (None if none)."""
+    values = [r.get(names[0]) for r in records]
+    for name in names[1:]:
+        missing = [i for i, v in enumerate(values) if v is None]
+        if not missing:
+            break
+        for i in missing:
+            values[i] = records[i].get(name)
+    return values
+
+
+def _timestamp(value: Any) -> float:
+    """Epoch seconds of an ISO date/datetime string (naive = UTC), NaN if it is not one."""
+    if not isinstance(value, str):
+        return NAN
+    try:
+        dt = datetime.fromisoformat(value)
+    except ValueError:
+        return NAN
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+_MONTH_DAYS = (0, 31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+
+
+def _parse_fixed(values: List[Any]):
+    """
+    Vectorized parse of "YYYY-MM-DD" and "YYYY-MM-DD[T ]HH:MM:SS[Z]" (UTC):
+    the strings become one array of code points and each field is read from
+    its columns. Returns epoch seconds, NaN where a value has another shape
+    (offsets, fractions, junk) and needs _timestamp().
+    """
+    text = np.array(values, dtype="U")  # None and other non-strings fail the shape checks
+    n, width = len(text), text.dtype.itemsize // 4
+    chars = np.zeros((21, n), dtype=np.int32)  # column-major: one contiguous row per character position
+    chars[:min(width, 21)] = text.view(np.uint32).reshape(n, width)[:, :21].T
+    length = np.count_nonzero(chars, axis=0)  # 21: longer than any fixed shape
+
+    def number(first: int, last: int):
+        digits = chars[first:last + 1] - 48
+        ok = ((digits >= 0) & (digits <= 9)).all(axis=0)
+        out = digits[0].astype(np.int64)
+        for row in digits[1:]:
+            out = out * 10 + row
+        return out, ok
+
+    (year, y_ok), (month, m_ok), (day, d_ok) = number(0, 3), number(5, 6), number(8, 9)
+    (hour, h_ok), (minute, mi_ok), (second, s_ok) = number(11, 12), number(14, 15), number(17, 18)
+    has_time = (
+        ((chars[10] == 84) | (chars[10] == 32)) & (chars[13] == 58) & (chars[16] == 58) & h_ok & mi_ok & s_ok
+        & ((length == 19) | ((length == 20) & (chars[19] == 90)))
+    )
+    ok = y_ok & m_ok & d_ok & (chars[4] == 45) & (chars[7] == 45) & ((length == 10) | has_time)
+    hour, minute, second = (np.where(has_time, f, 0) for f in (hour, minute, second))
+    leap = (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+    ok &= (month >= 1) & (month <= 12) & (day >= 1) & (hour < 24) & (minute < 60) & (second < 60)
+    ok &= day <= np.array(_MONTH_DAYS)[np.clip(month, 0, 12)] - ((month == 2) & ~leap)
+
+    # Days since 1970-01-01 from the civil date (H. Hinnant's days_from_civil).
+    y = year - (month <= 2)
+    era = y // 400
+    yoe = y - era * 400
+    doy = (153 * (month + np.where(month > 2, -3, 9)) + 2) // 5 + day - 1
+    days = era * 146097 + yoe * 365 + yoe // 4 - yoe // 100 + doy - 719468
+    seconds = (days * _DAY + hour * 3600 + minute * 60 + second).astype("float64")
+    seconds[~ok] = np.nan
+    return seconds
+
+
+def _timestamps(values: List[Any]):
+    """Epoch seconds (float, NaN when missing) of a column of ISO strings."""
+    if np is None:
+        return array("d", map(_timestamp, values))
+    out = _parse_fixed(values)
+    for i in np.flatnonzero(np.isnan(out)).tolist():
+        out[i] = _timestamp(values[i])
+    return out
+
+
+def _energy(record: Dict[str, Any]) -> float:
+    for name in _KWH_FIELDS:
+        value = record.get(name)
+        if isinstance(value, (int, float)):
+            return float(value)
+    value = record.get("energyWh")
+    if isinstance(value, (int, float)):
+        return value / 1000.0
+    start, stop = record.get("meterStart"), record.get("meterStop")
+    if isinstance(start, (int, float)) and isinstance(stop, (int, float)):
+        return (stop - start) / 1000.0
+    return NAN
+
+
+def _energies(records: Sequence[Dict[str, Any]]):
+    """kWh per record (NaN: unknown)."""
+    if np is None:
+        return array("d", map(_energy, records))
+    try:
+        out = np.array(_field(records, _KWH_FIELDS), dtype="float64")  # None -> NaN
+    except (TypeError, ValueError):
+        return np.array([_energy(r) for r in records], dtype="float64")
+    for i in np.flatnonzero(np.isnan(out)).tolist():
+        out[i] = _energy(records[i])
+    return out
+
+
+def _codes(values: List[Any]):
+    """(code per value, name per code); None and "" share one code, named None."""
+    names: Dict[Any, int] = {}
+    try:
+        codes = [names.setdefault(None if v == "" else v, len(names)) for v in values]
+    except TypeError:  # unhashable values
+        return _codes([None if v is None else str(v) for v in values])
+    return codes, [None if k is None else str(k) for k in names]
+
+
+@dataclass
+class SessionColumns:
+    """Charge sessions as columns; arrays are NumPy arrays when available, else array.array."""
+
+    start: Any  # epoch seconds
+    duration: Any  # seconds plugged in (NaN: no end)
+    idle: Any  # seconds plugged in after charging ended (NaN: unknown)
+    energy: Any  # kWh (NaN: unknown)
+    tag: Any  # index into tags
+    charger: Any  # index into chargers
+    tags: List[Optional[str]]
+    chargers: List[Optional[str]]
+    skipped: int = 0
+
+    def __len__(self) -> int:
+        return len(self.start)
+
+    @classmethod
+    def from_records(cls, records: Sequence[Dict[str, Any]], charger_id: Optional[str] = None) -> "SessionColumns":
+        records = [r for r in records if isinstance(r, dict)]
+        start = _timestamps(_field(records, _START_FIELDS))
+        if np is not None:
+            keep = np.flatnonzero(~np.isnan(start)).tolist()
+        else:
+            keep = [i for i, s in enumerate(start) if s == s]
+        skipped = len(records) - len(keep)
+        if skipped:
+            records = [records[i] for i in keep]
+            start = start[keep] if np is not None else array("d", (start[i] for i in keep))
+
+        end = _timestamps(_field(records, _END_FIELDS))
+        charging_end = _timestamps(_field(records, _CHARGING_END_FIELDS))
+        energy = _energies(records)
+        tag, tags = _codes([r.get("idTag") for r in records])
+        charger, chargers = _codes([r.get("chargerId", charger_id) for r in records])
+
+        if np is not None:
+            duration = end - start
+            idle = np.maximum(end - charging_end, 0.0)  # NaN stays NaN
+            columns = (start, duration, idle, energy, np.array(tag, dtype="int32"), np.array(charger, dtype="int32"))
+        else:
+            duration = array("d", (e - s for s, e in zip(start, end)))
+            idle = array("d", (max(e - c, 0.0) if e - c == e - c else NAN for e, c in zip(end, charging_end)))
+            columns = (start, duration, idle, energy, array("i", tag), array("i", charger))
+        return cls(*columns, tags=tags, chargers=chargers, skipped=skipped)
+
+
+_MEASURES = ("energy", "duration", "idle")
+
+
+def _group_numpy(keys, columns: SessionColumns):
+    """(sorted unique keys, {"sessions": counts, measure: (sums, counts of known values)})."""
+    uniq, inverse = np.unique(keys, return_inverse=True)
+    n = len(uniq)
+    out = {"sessions": np.bincount(inverse, minlength=n)}
+    for name in _MEASURES:
+        values = getattr(columns, name)
+        known = ~np.isnan(values)
+        out[name] = (
+            np.bincount(inverse, weights=np.where(known, values, 0.0), minlength=n),
+            np.bincount(inverse, weights=known, minlength=n),
+        )
+    return uniq.tolist(), {k: (v.tolist() if k == "sessions" else (v[0].tolist(), v[1].tolist())) for k, v in out.items()}
+
+
+def _group_python(keys, columns: SessionColumns):
+    acc: Dict[Any, List[float]] = {}
+    for key, energy, duration, idle in zip(keys, columns.energy, columns.duration, columns.idle):
+        a = acc.get(key)
+        if a is None:
+            a = acc[key] = [0, 0.0, 0, 0.0, 0, 0.0, 0]
+        a[0] += 1
+        for i, value in ((1, energy), (3, duration), (5, idle)):
+            if value == value:  # not NaN
+                a[i] += value
+                a[i + 1] += 1
+    uniq = sorted(acc)
+    out = {"sessions": [acc[k][0] for k in uniq]}
+    for i, name in ((1, "energy"), (3, "duration"), (5, "idle")):
+        out[name] = ([acc[k][i] for k in uniq], [acc[k][i + 1] for k in uniq])
+    return uniq, out
+
+
+def _rows(label: str, keys: List[Any], stats, name_of) -> List[Dict[str, Any]]:
+    rows = []
+    for i, key in enumerate(keys):
+        energy, energy_n = stats["energy"][0][i], stats["energy"][1][i]
+        duration, duration_n = stats["duration"][0][i], stats["duration"][1][i]
+        rows.append({
+            label: name_of(key),
+            "sessions": int(stats["sessions"][i]),
+            "energyKwh": round(energy, 3),
+            "durationSeconds": round(duration, 1),
+            "idleSeconds": round(stats["idle"][0][i], 1),
+            "avgEnergyKwh": round(energy / energy_n, 3) if energy_n else None,
+            "avgDurationSeconds": round(duration / duration_n, 1) if duration_n else None,
+        })
+    return rows
+
+
+def _percentiles(durations) -> Dict[str, Optional[float]]:
+    if np is not None:
+        known = durations[~np.isnan(durations)]
+        if not len(known):
+            return {"p50": None, "p90": None, "max": None}
+        p50, p90 = np.percentile(known, [50, 90])
+        return {"p50": round(float(p50), 1), "p90": round(float(p90), 1), "max": round(float(known.max()), 1)}
+    known = sorted(d for d in durations if d == d)
+    if not known:
+        return {"p50": None, "p90": None, "max": None}
+
+    def pct(q: float) -> float:  # linear interpolation, as np.percentile
+        pos = (len(known) - 1) * q
+        lo = int(pos)
+        hi = min(lo + 1, len(known) - 1)
+        return known[lo] + (known[hi] - known[lo]) * (pos - lo)
+
+    return {"p50": round(pct(0.5), 1), "p90": round(pct(0.9), 1), "max": round(known[-1], 1)}
+
+
+def summarize(columns: SessionColumns, groups: Iterable[str] = ("day", "week", "tag")) -> Dict[str, Any]:
+    """
+    Totals and per-group rows: {"totals": {...}, "byDay": [...], "byWeek": [...],
+    "byTag": [...], "byCharger": [...]} (only the requested groups), rows in key order.
+    """
+    group = _group_numpy if np is not None else _group_python
+    count = len(columns)
+    if np is not None:
+        days = (columns.start // _DAY).astype("int64")
+    else:
+        days = array("q", (int(s // _DAY) for s in columns.start))
+
+    _, totals = group([0] * count if np is None else np.zeros(count, dtype="int8"), columns)
+    if count:
+        total = _rows("all", [0], totals, lambda k: k)[0]
+        del total["all"]
+    else:
+        total = {"sessions": 0, "energyKwh": 0.0, "durationSeconds": 0.0, "idleSeconds": 0.0,
+                 "avgEnergyKwh": None, "avgDurationSeconds": None}
+    total["durationPercentiles"] = _percentiles(columns.duration)
+    total["skipped"] = columns.skipped
+    out: Dict[str, Any] = {"totals": total}
+
+    for name in groups:
+        if name == "day":
+            keys = days
+            label, name_of = "date", lambda d: (_EPOCH + timedelta(days=int(d))).isoformat()
+        elif name == "week":
+            # 1970-01-01 was a Thursday: shift by 3 days so weeks start on Monday.
+            keys = (days + 3) // 7 if np is not None else array("q", ((d + 3) // 7 for d in days))
+            label, name_of = "weekStart", lambda w: (_EPOCH + timedelta(days=int(w) * 7 - 3)).isoformat()
+        elif name == "tag":
+            keys = columns.tag
+            label, name_of = "idTag", lambda c: columns.tags[int(c)]
+        elif name == "charger":
+            keys = columns.charger
+            label, name_of = "chargerId", lambda c: columns.chargers[int(c)]
+        else:
+            raise ValueError(f"groupBy must be among {', '.join(GROUPS)}")
+        uniq, stats = group(keys, columns) if count else ([], None)
+        rows = _rows(label, uniq, stats, name_of) if count else []
+        if name in ("tag", "charger"):
+            rows.sort(key=lambda r: (r[label] is None, r[label] or ""))
+        out["by" + name.capitalize()] = rows
+    return out
+
+
+def analyze(records: Sequence[Dict[str, Any]], groups: Iterable[str] = ("day", "week", "tag"),
+            charger_id: Optional[str] = None) -> Dict[str, Any]:
+    """summarize() of charge-history records (chargerId defaults to `charger_id`)."""
+    return summarize(SessionColumns.from_records(records, charger_id), groups)
+
+
+def parse_groups(value: Optional[str]) -> List[str]:
+    """groupBy query value ("day,tag") -> list; default day, week and tag. Raises ValueError."""
+    if not value:
+        return ["day", "week", "tag"]
+    groups = [g.strip() for g in value.split(",") if g.strip()]
+    unknown = [g for g in groups if g not in GROUPS]
+    if unknown or not groups:
+        raise ValueError(f"groupBy must be among {', '.join(GROUPS)}")
+    return list(dict.fromkeys(groups))
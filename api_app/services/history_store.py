@@ -0,0 +1,247 @@
+"""
+Local, incrementally synced charge-history store.
+
+Responsibility:
+- Answer charge-history queries from the ChargeSession table first.
+- Fetch upstream only what is not mirrored yet: the span before
+  `synced_from` and everything after `synced_until` (the open / recent tail).
+- Advance the synced span only over settled time (older than
+  EXTERNAL_API_HISTORY_SETTLE_HOURS), so sessions that end late are still picked up.
+
+The synced span per charger is kept contiguous. A query that overlaps or
+touches it fetches only its own uncovered parts, which extend the span. A
+query detached from it is answered straight from upstream and stores
+nothing: filling the gap in between is the job of
+the `sync_charge_history` command, never of a request. Upstream is asked
+without idTag (full history) when syncing; idTag is filtered locally.
+
+Usage:
+    store = ChargeHistoryStore(EVAdvisorClient.shared())
+    result = store.query(charger_id, "2025-01-01", "2025-12-31")
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+from datetime import datetime, timedelta, timezone as dt_timezone
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from ..models import ChargeHistorySync, ChargeSession
+from .charge_history import ChargeHistoryResult, Window, parse_bound, record_key, record_start, split_range
+from .ev_advisor import EVAdvisorClient, _clean_charger_id, _history_params
+from .fanout import iter_fan_out_ordered
+
+log = logging.getLogger(__name__)
+
+Span = Tuple[datetime, datetime]
+
+
+@dataclass
+class SyncReport:
+    """What a sync pulled: number of records, windows asked and windows that failed."""
+
+    fetched: int = 0
+    windows: List[Window] = field(default_factory=list)
+    failures: List[Tuple[Window, BaseException]] = field(default_factory=list)
+
+    @property
+    def partial(self) -> bool:
+        return bool(self.failures)
+
+
+def _session_key(record: Dict[str, Any]) -> str:
+    key = record_key(record)
+    if isinstance(key, tuple):
+        return f"{key[0]}:{key[1]}"[:128]
+    return "sha1:" + hashlib.sha1(key.encode()).hexdigest()
+
+
+def _fmt(dt: datetime) -> str:
+    return dt.astimezone(dt_timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def _query_span(start_date: str, end_date: str) -> Span:
+    """[start, end) for a query; a date-only endDate includes that whole day."""
+    start, _ = parse_bound(start_date)
+    end, date_only = parse_bound(end_date)
+    if date_only:
+        end += timedelta(days=1)
+    return start, end
+
+
+class ChargeHistoryStore:
+    """Charge history served from the database, synced from `client` on demand."""
+
+    def __init__(self, client: EVAdvisorClient, settle_hours: Optional[int] = None) -> None:
+        self.client = client
+        if settle_hours is None:
+            settle_hours = settings.EXTERNAL_API_HISTORY_SETTLE_HOURS
+        self.settle = timedelta(hours=settle_hours)
+
+    def missing_spans(self, charger_id: str, start: datetime, end: datetime) -> List[Span]:
+        """Spans to fetch upstream to mirror [start, end), keeping the synced span contiguous (gaps included)."""
+        state = ChargeHistorySync.objects.filter(charger_id=charger_id).first()
+        if state is None:
+            return [(start, end)]
+        spans = []
+        if start < state.synced_from:
+            spans.append((start, state.synced_from))
+        if end > state.synced_until:
+            spans.append((state.synced_until, end))
+        return spans
+
+    def _save(self, charger_id: str, records: Iterable[Dict[str, Any]]) -> int:
+        """Upsert records; returns how many were stored."""
+        rows = []
+        for record in records:
+            start = record_start(record)
+            if start is None:
+                log.debug("charge history record without start time not stored: %s", record)
+                continue
+            rows.append(ChargeSession(
+                charger_id=charger_id,
+                session_key=_session_key(record),
+                start_time=start,
+                id_tag=str(record.get("idTag") or "")[:64],
+                data=record,
+                fetched_at=timezone.now(),
+            ))
+        if rows:
+            ChargeSession.objects.bulk_create(
+                rows,
+                batch_size=500,
+                update_conflicts=True,
+                unique_fields=["charger_id", "session_key"],
+                update_fields=["start_time", "id_tag", "data", "fetched_at"],
+            )
+        return len(rows)
+
+    def _advance(self, charger_id: str, span: Span) -> None:
+        """Extend the synced span by a fetched `span`, clipped to settled time."""
+        settled_until = min(span[1], timezone.now() - self.settle)
+        if settled_until <= span[0]:
+            return
+        with transaction.atomic():
+            state = ChargeHistorySync.objects.select_for_update().filter(charger_id=charger_id).first()
+            if state is None:
+                ChargeHistorySync.objects.create(
+                    charger_id=charger_id, synced_from=span[0], synced_until=settled_until,
+                )
+                return
+            # Only merge spans that touch the current one (a concurrent sync may have moved it).
+            if span[0] > state.synced_until or settled_until < state.synced_from:
+                return
+            state.synced_from = min(state.synced_from, span[0])
+            state.synced_until = max(state.synced_until, settled_until)
+            state.save()
+
+    def sync_many(
+        self,
+        charger_ids: Iterable[str],
+        start: datetime,
+        end: datetime,
+        concurrency: Optional[int] = None,
+    ) -> Dict[str, SyncReport]:
+        """
+        Pull whatever of [start, end) is not mirrored yet for each charger.
+
+        Missing spans are fetched as windows (EXTERNAL_API_HISTORY_WINDOW),
+        `concurrency` at a time across all chargers; each window is written as
+        it arrives, on the calling thread, so memory stays at a few windows and
+        only this thread touches the database. Errors are reported per window.
+        """
+        reports: Dict[str, SyncReport] = {}
+        tasks = []
+        for charger_id in charger_ids:
+            cid = _clean_charger_id(charger_id)
+            reports[cid] = SyncReport()
+            for span in self.missing_spans(cid, start, end):
+                for window in split_range(_fmt(span[0]), _fmt(span[1]), settings.EXTERNAL_API_HISTORY_WINDOW):
+                    tasks.append((cid, span, window))
+
+        failed_spans = set()
+        limit = concurrency or settings.EXTERNAL_API_HISTORY_CONCURRENCY
+        fetch = lambda t: self.client.get_charge_history(t[0], t[2][0], t[2][1])
+        for o in iter_fan_out_ordered(fetch, tasks, limit):
+            cid, span, window = o.item
+            report = reports[cid]
+            report.windows.append(window)
+            if o.ok:
+                report.fetched += self._save(cid, o.value)
+            else:
+                report.failures.append((window, o.error))
+                failed_spans.add((cid, span))
+        for cid, span in dict.fromkeys((t[0], t[1]) for t in tasks):
+            if (cid, span) not in failed_spans:
+                self._advance(cid, span)
+        return reports
+
+    def sync(self, charger_id: str, start: datetime, end: datetime) -> SyncReport:
+        """sync_many() for one charger."""
+        return next(iter(self.sync_many([charger_id], start, end).values()))
+
+    @staticmethod
+    def _detached(charger_id: str, start: datetime, end: datetime) -> bool:
+        """Whether [start, end) neither overlaps nor touches the charger's synced span (if it has one)."""
+        state = ChargeHistorySync.objects.filter(charger_id=charger_id).first()
+        return state is not None and (end < state.synced_from or start > state.synced_until)
+
+    def _prepare(self, charger_id: str, start_date: str, end_date: str, id_tag: Optional[str]):
+        cid = _clean_charger_id(charger_id)
+        _history_params(start_date, end_date, id_tag)
+        start, end = _query_span(start_date, end_date)
+        if self._detached(cid, start, end):
+            return None, self.client.get_charge_history_windowed(cid, start_date, end_date, id_tag)
+        report = self.sync(cid, start, end)
+        rows = ChargeSession.objects.filter(charger_id=cid, start_time__gte=start, start_time__lt=end)
+        if id_tag:
+            rows = rows.filter(id_tag=id_tag)
+        rows = rows.order_by("start_time", "id")
+        # 400/403/404 mean the query itself is wrong; outages only if nothing is stored.
+        for _, exc in report.failures:
+            if not isinstance(exc, RuntimeError):
+                raise exc
+        if report.failures and len(report.failures) == len(report.windows) and not rows.exists():
+            raise report.failures[0][1]
+        return report, rows
+
+    def query(
+        self,
+        charger_id: str,
+        start_date: str,
+        end_date: str,
+        id_tag: Optional[str] = None,
+    ) -> ChargeHistoryResult:
+        """
+        Charge history for [start_date, end_date], same inputs and errors as
+        `EVAdvisorClient.get_charge_history`. Upstream failures for part of the
+        range are reported in `failures`; if nothing could be fetched and
+        nothing was stored for the range, the first error is raised.
+        """
+        report, rows = self._prepare(charger_id, start_date, end_date, id_tag)
+        if report is None:
+            return rows  # fetched from upstream, not stored
+        return ChargeHistoryResult([r.data for r in rows], report.windows, report.failures)
+
+    def query_iter(
+        self,
+        charger_id: str,
+        start_date: str,
+        end_date: str,
+        id_tag: Optional[str] = None,
+    ) -> Tuple[SyncReport, Iterator[Dict[str, Any]]]:
+        """
+        Like query(), but syncs first and returns the records as a lazy,
+        server-side-chunked iterator (for exports of arbitrarily long ranges).
+        A range detached from the synced span is fetched from upstream in full first.
+        """
+        report, rows = self._prepare(charger_id, start_date, end_date, id_tag)
+        if report is None:
+            return SyncReport(len(rows.records), rows.windows, rows.failures), iter(rows.records)
+        return report, (r for r in rows.values_list("data", flat=True).iterator(chunk_size=2000))
@@ -0,0 +1,346 @@
+"""
+In-process metrics with Prometheus text exposition.
+
+Responsibility:
+- Counters and histograms (with labels) for the EV Advisor client and the
+  proxy views; cheap enough to update on every request (one lock, no I/O).
+- Render them in the Prometheus text format for `/metrics`.
+- Aggregate across worker processes: with METRICS_DIR set, every process
+  writes a snapshot of its own values to `<METRICS_DIR>/<pid>.json` (at most
+  once per METRICS_FLUSH_INTERVAL, and at exit); a scrape sums all snapshots,
+  so whichever gunicorn worker answers reports the totals. Snapshots of
+  exited workers are kept, so counters never go backwards. Clear the
+  directory when the service (not a worker) restarts.
+
+No prometheus_client dependency; only the subset of the format we emit.
+
+Usage:
+    UPSTREAM_RETRIES.inc(endpoint="charger")
+    PROXY_REQUESTS.observe(0.12, view="charger_by_id", method="GET", status="200")
+    text = render_all()
+"""
+
+from __future__ import annotations
+
+import asyncio
+import atexit
+import functools
+import glob
+import json
+import logging
+import math
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+
+log = logging.getLogger(__name__)
+
+# Seconds; upstream calls range from a few ms (cache/keep-alive) to the timeout.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, registry: "Registry", name: str, help: str, labelnames: Tuple[str, ...]) -> None:
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], Any] = {}
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def samples(self) -> List[list]:
+        return [[list(k), v] for k, v in self._values.items()]
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        key = self._key(labels)
+        with self.registry.lock:
+            self._values[key] = self._values.get(key, 0) + amount
+        self.registry.changed()
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram; stored per label set as [bucket counts..., +Inf, sum]."""
+
+    type = "histogram"
+
+    def __init__(self, registry, name, help, labelnames, buckets=DEFAULT_BUCKETS) -> None:
+        super().__init__(registry, name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self.registry.lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    row[i] += 1
+                    break
+            else:
+                row[len(self.buckets)] += 1
+            row[-1] += value
+        self.registry.changed()
+
+
+class Registry:
+    """All metrics of this process, plus the snapshot/aggregate/render logic."""
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.metrics: Dict[str, _Metric] = {}
+        self._next_flush = 0.0
+        self._flush_lock = threading.Lock()
+
+    def counter(self, name: str, help: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._register(Counter(self, name, help, tuple(labelnames)))
+
+    def histogram(self, name: str, help: str, labelnames: Iterable[str] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(self, name, help, tuple(labelnames), buckets))
+
+    def _register(self, metric: _Metric) -> Any:
+        existing = self.metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self.metrics[metric.name] = metric
+        return metric
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                m.name: {
+                    "type": m.type,
+                    "help": m.help,
+                    "labelnames": list(m.labelnames),
+                    "buckets": list(getattr(m, "buckets", [])),
+                    "samples": [[k, list(v) if isinstance(v, list) else v] for k, v in m.samples()],
+                }
+                for m in self.metrics.values()
+            }
+
+    # -- multi-process ---------------------------------------------------------
+
+    @staticmethod
+    def directory() -> str:
+        return getattr(settings, "METRICS_DIR", "") or ""
+
+    def changed(self) -> None:
+        """Called after every update: write this process's snapshot if it is due."""
+        if not self.directory() or time.monotonic() < self._next_flush:
+            return
+        self.flush()
+
+    def flush(self) -> None:
+        directory = self.directory()
+        if not directory:
+            return
+        if not self._flush_lock.acquire(blocking=False):
+            return  # another thread is writing; its snapshot is recent enough
+        try:
+            self._next_flush = time.monotonic() + settings.METRICS_FLUSH_INTERVAL
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f"{os.getpid()}.json")
+            tmp = f"{path}.tmp"
+            with open(tmp, "w", encoding="utf-8") as fh:
+                json.dump(self.snapshot(), fh, separators=(",", ":"))
+            os.replace(tmp, path)  # readers never see a half-written file
+        except OSError as exc:
+            log.warning("metrics: cannot write snapshot to %s: %s", directory, exc)
+        finally:
+            self._flush_lock.release()
+
+    def collect(self) -> List[Dict[str, Any]]:
+        """Snapshots to aggregate: every process's file, or just this process."""
+        directory = self.directory()
+        if not directory:
+            return [self.snapshot()]
+        self.flush()
+        snapshots = []
+        for path in glob.glob(os.path.join(directory, "*.json")):
+            try:
+                with open(path, encoding="utf-8") as fh:
+                    snapshots.append(json.load(fh))
+            except (OSError, ValueError) as exc:
+                log.warning("metrics: skipping unreadable snapshot %s: %s", path, exc)
+        return snapshots
+
+
+def aggregate(snapshots: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """Sum samples with the same metric name and label values across snapshots."""
+    merged: Dict[str, Any] = {}
+    for snap in snapshots:
+        for name, metric in snap.items():
+            target = merged.setdefault(name, {**metric, "samples": {}})
+            for labels, value in metric["samples"]:
+                key = tuple(labels)
+                prev = target["samples"].get(key)
+                if prev is None:
+                    target["samples"][key] = list(value) if isinstance(value, list) else value
+                elif isinstance(value, list):
+                    target["samples"][key] = [a + b for a, b in zip(prev, value)]
+                else:
+                    target["samples"][key] = prev + value
+    return merged
+
+
+def _fmt_labels(names: List[str], values: Iterable[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, v in pairs)
+    return "{" + ",".join(f'{n}="{v}"' for (n, _), v in zip(pairs, escaped)) + "}"
+
+
+def _fmt_value(value: float) -> str:
+    if isinstance(value, float) and math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(merged: Dict[str, Any]) -> str:
+    """Prometheus text exposition format (version 0.0.4)."""
+    lines: List[str] = []
+    for name in sorted(merged):
+        metric = merged[name]
+        labelnames = metric["labelnames"]
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        for labels, value in sorted(metric["samples"].items()):
+            if metric["type"] != "histogram":
+                lines.append(f"{name}{_fmt_labels(labelnames, labels)} {_fmt_value(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip(metric["buckets"] + [math.inf], value[:-1]):
+                cumulative += count
+                le = ("le", _fmt_value(float(bound)))
+                lines.append(f"{name}_bucket{_fmt_labels(labelnames, labels, le)} {cumulative}")
+            lines.append(f"{name}_sum{_fmt_labels(labelnames, labels)} {_fmt_value(float(value[-1]))}")
+            lines.append(f"{name}_count{_fmt_labels(labelnames, labels)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+atexit.register(REGISTRY.flush)
+
+
+def render_all() -> str:
+    return render(aggregate(REGISTRY.collect()))
+
+
+# -- EV Advisor client ---------------------------------------------------------
+
+CLIENT_CALLS = REGISTRY.histogram(
+    "evadvisor_client_call_seconds",
+    "EVAdvisorClient endpoint method latency (including cache, retries and coalescing).",
+    ("method", "outcome"),
+)
+UPSTREAM_REQUESTS = REGISTRY.histogram(
+    "evadvisor_upstream_request_seconds",
+    "Latency of single upstream HTTP attempts, to response headers.",
+    ("endpoint", "status"),
+)
+UPSTREAM_NOT_MODIFIED = REGISTRY.counter(
+    "evadvisor_upstream_not_modified_total", "Conditional GETs answered 304 (held copy reused).", ("endpoint",)
+)
+UPSTREAM_RETRIES = REGISTRY.counter(
+    "evadvisor_upstream_retries_total", "Upstream attempts that were retried.", ("endpoint",)
+)
+UPSTREAM_HEDGES = REGISTRY.counter(
+    "evadvisor_upstream_hedges_total", "Hedged GETs (a second copy sent), by which copy answered first.", ("endpoint", "winner")
+)
+DEADLINE_EXCEEDED = REGISTRY.counter(
+    "evadvisor_deadline_exceeded_total", "Calls given up because the request deadline ran out.", ("endpoint",)
+)
+ADMISSION_REJECTIONS = REGISTRY.counter(
+    "evadvisor_admission_rejections_total",
+    "Upstream calls refused by the concurrency limiter (503), by reason: queue_full, timeout, host, busy (hedges).",
+    ("reason",),
+)
+CIRCUIT_REJECTIONS = REGISTRY.counter(
+    "evadvisor_circuit_rejections_total", "Calls failed fast because the endpoint circuit was open.", ("endpoint",)
+)
+POOL_CHECKOUTS = REGISTRY.counter(
+    "evadvisor_pool_checkouts_total", "Upstream connection checkouts (reused=true is a keep-alive hit).", ("reused",)
+)
+CACHE_EVENTS = REGISTRY.counter(
+    "evadvisor_cache_events_total", "Response cache lookups and maintenance by event.", ("event",)
+)
+COALESCED = REGISTRY.counter(
+    "evadvisor_coalesced_requests_total", "Calls that shared an identical in-flight upstream GET."
+)
+
+STATUS_WATCH_POLLS = REGISTRY.counter(
+    "evadvisor_status_watch_polls_total",
+    "Cloud-status watch polls, by source (upstream call, or another worker's result).",
+    ("source",),
+)
+STATUS_WATCH_EVENTS = REGISTRY.counter(
+    "evadvisor_status_watch_events_total", "Cloud-status watch events pushed to viewers, by kind.", ("kind",)
+)
+
+ARCHIVE_CACHE_EVENTS = REGISTRY.counter(
+    "evadvisor_archive_cache_events_total",
+    "OCPP archive disk cache: hit, revalidated (304), miss (downloaded) and evicted blobs.",
+    ("event",),
+)
+
+# -- Proxy views ---------------------------------------------------------------
+
+PROXY_REQUESTS = REGISTRY.histogram(
+    "proxy_request_seconds",
+    "api_app proxy view latency, to response headers (streamed bodies not included).",
+    ("view", "method", "status"),
+)
+RATE_LIMITED = REGISTRY.counter(
+    "proxy_rate_limited_total", "api_app requests refused with 429, by the bucket that ran out (token, user, addr).", ("scope",)
+)
+PROXY_BYTES = REGISTRY.counter(
+    "proxy_streamed_bytes_total", "Bytes sent by streamed proxy responses (downloads, exports).", ("view",)
+)
+
+
+def timed_call(method: Callable) -> Callable:
+    """Record CLIENT_CALLS for a client method (sync or async); outcome is 'ok' or the exception class."""
+    name = method.__name__
+
+    if asyncio.iscoroutinefunction(method):
+        @functools.wraps(method)
+        async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+            t0 = time.perf_counter()
+            outcome = "ok"
+            try:
+                return await method(*args, **kwargs)
+            except BaseException as exc:
+                outcome = type(exc).__name__
+                raise
+            finally:
+                CLIENT_CALLS.observe(time.perf_counter() - t0, method=name, outcome=outcome)
+
+        return async_wrapper
+
+    @functools.wraps(method)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        t0 = time.perf_counter()
+        outcome = "ok"
+        try:
+            return method(*args, **kwargs)
+        except BaseException as exc:
+            outcome = type(exc).__name__
+            raise
+        finally:
+            CLIENT_CALLS.observe(time.perf_counter() - t0, method=name, outcome=outcome)
+
+    return wrapper
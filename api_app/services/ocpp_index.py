@@ -0,0 +1,467 @@
+"""
+On-disk index of the OCPP-J messages in a charger's log archive.
+
+Responsibility:
+- build(): stream the archive's log files line by line (zip members are
+  decompressed incrementally, never extracted), recognise OCPP-J frames
+  ([2, id, action, payload] / [3, id, payload] / [4, id, code, ...]) with a
+  header match instead of a JSON parse, and write:
+      messages.log   the frames, back to back
+      records.bin    one fixed-size record per frame, in timestamp order
+      by_action.bin  record numbers per action (each run in time order)
+      by_msgid.bin   (message-id hash << 32 | record number), sorted
+      meta.json      action names, postings offsets, counts
+  CallResult / CallError frames get the action of the Call they answer.
+- OcppIndex: memory-maps those files. query() binary-searches the time
+  window, walks one action's postings or looks a message id up by hash,
+  and parses only the frames it returns.
+- latest(): the index of a charger's current archive. Upstream is asked at
+  most every OCPP_INDEX_MAX_AGE seconds (through the archive disk cache when
+  OCPP_ARCHIVE_CACHE_ENABLED); an unchanged archive (same ETag or same
+  content hash) is never indexed twice.
+
+Log lines look like `<ISO timestamp> [recv|send] ... <frame>`; lines without
+a timestamp and a frame are counted as skipped.
+"""
+
+from __future__ import annotations
+
+import bisect
+import io
+import json
+import logging
+import mmap
+import os
+import re
+import shutil
+import struct
+import tempfile
+import threading
+import time
+import zipfile
+import zlib
+from array import array
+from collections import OrderedDict
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from django.conf import settings
+
+from . import archive_cache
+from .ev_advisor import _clean_charger_id
+
+log = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+
+# ts_ms, offset in messages.log, length, action number (0 = unknown), message type, direction, message-id hash
+_RECORD = struct.Struct("<qQIHBBI")
+
+MESSAGE_TYPES = {2: "Call", 3: "CallResult", 4: "CallError"}
+DIRECTIONS = {0: None, 1: "recv", 2: "send"}
+_DIRECTION_TOKENS = {b"recv": 1, b"received": 1, b"in": 1, b"rx": 1, b"send": 2, b"sent": 2, b"out": 2, b"tx": 2}
+
+_TIMESTAMP_RE = re.compile(rb"^\s*(\d{4}-\d\d-\d\d[T ]\d\d:\d\d:\d\d(?:\.\d+)?(?:Z|[+-]\d\d:?\d\d)?)\s+")
+_FRAME_RE = re.compile(rb'\[\s*([234])\s*,\s*"((?:[^"\\]|\\.)*)"\s*(?:,\s*"([A-Za-z0-9_]+)")?')
+
+# Message ids of Calls still waiting for their CallResult (for the result's action).
+_PENDING_CALLS = 65536
+
+
+def _msgid_hash(message_id: bytes) -> int:
+    return zlib.crc32(message_id)
+
+
+def _timestamp_ms(raw: bytes) -> Optional[int]:
+    try:
+        dt = datetime.fromisoformat(raw.decode().replace(" ", "T", 1))
+    except ValueError:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp() * 1000)
+
+
+def _iso(ts_ms: int) -> str:
+    return datetime.fromtimestamp(ts_ms / 1000, timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z")
+
+
+# -- building ----------------------------------------------------------------
+
+
+class _Builder:
+    def __init__(self, directory: Path) -> None:
+        self.directory = directory
+        self.messages = open(directory / "messages.log", "wb")
+        self.records = open(directory / "records.bin", "wb")
+        self.actions: Dict[bytes, int] = {}
+        self.pending: "OrderedDict[bytes, int]" = OrderedDict()
+        self.count = self.skipped = self.offset = 0
+        self.last_ts = None
+        self.first_ts = None
+        self.in_order = True
+
+    def feed(self, line: bytes) -> None:
+        m = _TIMESTAMP_RE.match(line)
+        frame = _FRAME_RE.search(line, m.end()) if m else None
+        ts = _timestamp_ms(m.group(1)) if frame else None
+        if ts is None:
+            self.skipped += 1
+            return
+        start, kind, message_id = frame.start(), int(frame.group(1)), frame.group(2)
+        direction = _DIRECTION_TOKENS.get(line[m.end():start].strip().split(b" ", 1)[0].lower(), 0)
+        if kind == 2 and frame.group(3):
+            action = self.actions.setdefault(frame.group(3), len(self.actions) + 1)
+            self.pending[message_id] = action
+            if len(self.pending) > _PENDING_CALLS:
+                self.pending.popitem(last=False)
+        else:
+            action = self.pending.pop(message_id, 0)
+
+        body = line[start:].rstrip()
+        self.messages.write(body)
+        self.records.write(_RECORD.pack(ts, self.offset, len(body), action, kind, direction, _msgid_hash(message_id)))
+        self.offset += len(body)
+        self.count += 1
+        if self.last_ts is not None and ts < self.last_ts:
+            self.in_order = False
+        self.last_ts = ts if self.last_ts is None else max(self.last_ts, ts)
+        self.first_ts = ts if self.first_ts is None else min(self.first_ts, ts)
+
+    def finish(self, source: Dict[str, Any]) -> Dict[str, Any]:
+        self.messages.close()
+        self.records.close()
+        if not self.in_order:
+            self._sort_records()
+        postings = self._write_postings()
+        meta = {
+            "version": FORMAT_VERSION,
+            "actions": [name.decode() for name, _ in sorted(self.actions.items(), key=lambda kv: kv[1])],
+            "postings": postings,
+            "messages": self.count,
+            "skipped": self.skipped,
+            "first": _iso(self.first_ts) if self.first_ts is not None else None,
+            "last": _iso(self.last_ts) if self.last_ts is not None else None,
+            "builtAt": _iso(int(time.time() * 1000)),
+            "source": source,
+        }
+        with open(self.directory / "meta.json", "w", encoding="utf-8") as fh:
+            json.dump(meta, fh)
+        return meta
+
+    def _sort_records(self) -> None:
+        """Logs are nearly always in time order; when not, sort the records (not the frames)."""
+        path = self.directory / "records.bin"
+        data = path.read_bytes()
+        records = sorted(_RECORD.iter_unpack(data), key=lambda r: (r[0], r[1]))
+        with open(path, "wb") as fh:
+            for record in records:
+                fh.write(_RECORD.pack(*record))
+
+    def _write_postings(self) -> Dict[str, List[int]]:
+        per_action: Dict[int, array] = {}
+        by_msgid = array("Q")
+        recno = 0
+        with open(self.directory / "records.bin", "rb") as fh:
+            for chunk in iter(lambda: fh.read(_RECORD.size * 4096), b""):
+                for record in _RECORD.iter_unpack(chunk):
+                    per_action.setdefault(record[3], array("I")).append(recno)
+                    by_msgid.append(record[6] << 32 | recno)
+                    recno += 1
+        names = {number: name.decode() for name, number in self.actions.items()}
+        postings, offset = {}, 0
+        with open(self.directory / "by_action.bin", "wb") as fh:
+            for number in sorted(per_action):
+                if number == 0:
+                    continue  # results whose Call is not in the log
+                per_action[number].tofile(fh)
+                postings[names[number]] = [offset, len(per_action[number])]
+                offset += len(per_action[number])
+        with open(self.directory / "by_msgid.bin", "wb") as fh:
+            array("Q", sorted(by_msgid)).tofile(fh)
+        return postings
+
+
+def _log_lines(archive: BinaryIO, max_bytes: int) -> Iterator[bytes]:
+    """Lines of every log file in a zip (in name order), or of the file itself if it is not a zip."""
+    read = 0
+    if zipfile.is_zipfile(archive):
+        with zipfile.ZipFile(archive) as zf:
+            for info in sorted(zf.infolist(), key=lambda i: i.filename):
+                if info.is_dir():
+                    continue
+                with zf.open(info) as member:
+                    for line in io.BufferedReader(member, buffer_size=1 << 20):
+                        read += len(line)
+                        if read > max_bytes:
+                            raise ValueError(f"OCPP log larger than {max_bytes} bytes uncompressed")
+                        yield line
+        return
+    archive.seek(0)
+    for line in archive:
+        read += len(line)
+        if read > max_bytes:
+            raise ValueError(f"OCPP log larger than {max_bytes} bytes")
+        yield line
+
+
+def build(
+    archive: Union[str, "os.PathLike[str]", BinaryIO],
+    target: Union[str, "os.PathLike[str]"],
+    source: Optional[Dict[str, Any]] = None,
+    max_bytes: Optional[int] = None,
+) -> None:
+    """
+    Index `archive` (a path or an open binary file) into directory `target`.
+    Built in a sibling temporary directory and renamed into place, so
+    readers (and other processes building the same archive) never see a
+    partial index.
+    """
+    if not hasattr(archive, "read"):
+        with open(archive, "rb") as fh:
+            return build(fh, target, source, max_bytes)
+    target = Path(target)
+    max_bytes = settings.OCPP_INDEX_MAX_BYTES if max_bytes is None else max_bytes
+    target.parent.mkdir(parents=True, exist_ok=True)
+    work = Path(tempfile.mkdtemp(prefix=".build-", dir=target.parent))
+    try:
+        builder = _Builder(work)
+        try:
+            for line in _log_lines(archive, max_bytes):
+                builder.feed(line)
+        finally:
+            builder.messages.close()
+            builder.records.close()
+        builder.finish(source or {})
+        try:
+            os.rename(work, target)
+        except OSError:
+            if not (target / "meta.json").exists():
+                raise
+            # Another process finished the same archive first; theirs is identical.
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+# -- reading -----------------------------------------------------------------
+
+
+def _map(path: Path):
+    with open(path, "rb") as fh:
+        if os.fstat(fh.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class _Column:
+    """Read-only sequence view of one field of the records, for bisect."""
+
+    def __init__(self, index: "OcppIndex", positions=None) -> None:
+        self.index = index
+        self.positions = positions
+
+    def __len__(self) -> int:
+        return len(self.positions) if self.positions is not None else self.index.count
+
+    def __getitem__(self, i: int) -> int:
+        recno = self.positions[i] if self.positions is not None else i
+        return self.index._record(recno)[0]
+
+
+class OcppIndex:
+    def __init__(self, directory: Path) -> None:
+        self.directory = Path(directory)
+        with open(self.directory / "meta.json", encoding="utf-8") as fh:
+            self.meta = json.load(fh)
+        self.actions = [None] + self.meta["actions"]
+        self._records = _map(self.directory / "records.bin")
+        self._messages = _map(self.directory / "messages.log")
+        self._by_action = _map(self.directory / "by_action.bin")
+        self._by_msgid = _map(self.directory / "by_msgid.bin")
+        self.count = len(self._records) // _RECORD.size
+
+    def close(self) -> None:
+        for mm in (self._records, self._messages, self._by_action, self._by_msgid):
+            if isinstance(mm, mmap.mmap):
+                mm.close()
+
+    def _record(self, recno: int) -> Tuple[int, ...]:
+        return _RECORD.unpack_from(self._records, recno * _RECORD.size)
+
+    def _candidates(self, start_ms, end_ms, action, message_id) -> Iterable[int]:
+        """Record numbers that may match, in time order, narrowed by the most selective key given."""
+        if message_id is not None:
+            keys = memoryview(self._by_msgid).cast("Q") if self._by_msgid else []
+            h = _msgid_hash(message_id.encode())
+            lo = bisect.bisect_left(keys, h << 32)
+            hi = bisect.bisect_right(keys, h << 32 | 0xFFFFFFFF)
+            return sorted(keys[i] & 0xFFFFFFFF for i in range(lo, hi))
+        if action is not None:
+            if action not in self.meta["postings"]:
+                return []
+            offset, length = self.meta["postings"][action]
+            positions = memoryview(self._by_action).cast("I")[offset:offset + length]
+        else:
+            positions = None
+        column = _Column(self, positions)
+        lo = bisect.bisect_left(column, start_ms) if start_ms is not None else 0
+        hi = bisect.bisect_right(column, end_ms) if end_ms is not None else len(column)
+        return (positions[i] for i in range(lo, hi)) if positions is not None else range(lo, hi)
+
+    def query(
+        self,
+        start_ms: Optional[int] = None,
+        end_ms: Optional[int] = None,
+        action: Optional[str] = None,
+        message_id: Optional[str] = None,
+        direction: Optional[str] = None,
+        limit: int = 500,
+    ) -> Tuple[List[Dict[str, Any]], bool]:
+        """Matching messages in time order (at most `limit`) and whether more matched."""
+        want_direction = {v: k for k, v in DIRECTIONS.items()}.get(direction) if direction else None
+        items: List[Dict[str, Any]] = []
+        for recno in self._candidates(start_ms, end_ms, action, message_id):
+            ts, offset, length, action_no, kind, dir_no, _ = self._record(recno)
+            if (start_ms is not None and ts < start_ms) or (end_ms is not None and ts > end_ms):
+                continue
+            if action is not None and self.actions[action_no] != action:
+                continue
+            if want_direction is not None and dir_no != want_direction:
+                continue
+            frame = bytes(self._messages[offset:offset + length])
+            header = _FRAME_RE.match(frame)
+            if message_id is not None and (header is None or header.group(2).decode() != message_id):
+                continue  # hash collision
+            if len(items) == limit:
+                return items, True
+            try:
+                body: Any = json.loads(frame)
+            except ValueError:
+                body = frame.decode("utf-8", errors="replace")
+            items.append({
+                "timestamp": _iso(ts),
+                "direction": DIRECTIONS.get(dir_no),
+                "messageType": MESSAGE_TYPES.get(kind),
+                "messageId": header.group(2).decode() if header else None,
+                "action": self.actions[action_no],
+                "frame": body,
+            })
+        return items, False
+
+    def summary(self) -> Dict[str, Any]:
+        keys = ("messages", "skipped", "first", "last", "builtAt", "source")
+        return {**{k: self.meta.get(k) for k in keys}, "actions": self.meta["actions"]}
+
+
+# -- latest archive per charger ------------------------------------------------
+
+_open_indexes: "OrderedDict[str, OcppIndex]" = OrderedDict()
+_open_lock = threading.Lock()
+_charger_locks: Dict[str, threading.Lock] = {}
+_OPEN_MAX = 16
+
+
+def _open(directory: Path) -> OcppIndex:
+    """A shared OcppIndex per directory (a few kept mapped, least recently used dropped).
+
+    Evicted indexes are not closed: a request may still be reading one (its
+    memoryviews pin the maps), so they are unmapped when the last reference goes.
+    """
+    key = str(directory)
+    with _open_lock:
+        index = _open_indexes.get(key)
+        if index is not None:
+            _open_indexes.move_to_end(key)
+            return index
+        index = _open_indexes[key] = OcppIndex(directory)
+        while len(_open_indexes) > _OPEN_MAX:
+            _open_indexes.popitem(last=False)
+        return index
+
+
+def _charger_lock(charger_id: str) -> threading.Lock:
+    with _open_lock:
+        return _charger_locks.setdefault(charger_id, threading.Lock())
+
+
+def _read_state(base: Path) -> Optional[Dict[str, Any]]:
+    try:
+        with open(base / "latest.json", encoding="utf-8") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_state(base: Path, state: Dict[str, Any]) -> None:
+    tmp = base / f".latest-{os.getpid()}-{threading.get_ident()}.json"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(state, fh)
+    os.replace(tmp, base / "latest.json")
+
+
+def _prune(base: Path, keep: int, current: str) -> None:
+    """Delete all but the `keep` most recently built indexes of a charger (never `current`)."""
+    built = sorted(
+        (p for p in base.iterdir() if p.is_dir() and not p.name.startswith(".")),
+        key=lambda p: p.stat().st_mtime,
+        reverse=True,
+    )
+    for old in built[max(1, keep):]:
+        if old.name != current:
+            shutil.rmtree(old, ignore_errors=True)
+
+
+def _download_unless_unchanged(client, cid: str, base: Path, state: Optional[Dict[str, Any]]):
+    """(key, etag, temporary archive path or None when upstream's ETag shows the indexed one is current)."""
+    upstream = client.download_latest_ocpp_logs(cid)
+    try:
+        if upstream.status_code != 200:
+            raise RuntimeError(f"Unexpected status: {upstream.status_code}")
+        etag = upstream.headers.get("ETag")
+        if state is not None and etag and etag == state.get("etag"):
+            return state["key"], etag, None
+        key, archive = archive_cache.spool(upstream, base, settings.EXTERNAL_API_STREAM_CHUNK_SIZE)
+        return key, etag, archive
+    finally:
+        upstream.close()
+
+
+def latest(client, charger_id: str, refresh: bool = False) -> OcppIndex:
+    """
+    The index of the charger's latest OCPP archive, downloading and indexing
+    it if upstream has a new one. `client` is an EVAdvisorClient; errors are
+    its download errors.
+    """
+    cid = _clean_charger_id(charger_id)
+    base = Path(settings.OCPP_INDEX_DIR) / cid
+    base.mkdir(parents=True, exist_ok=True)
+    with _charger_lock(cid):
+        state = _read_state(base)
+        current = base / state["key"] if state else None
+        if current is not None and not (current / "meta.json").exists():
+            state = current = None
+        if current is not None and not refresh and time.time() - state["checkedAt"] < settings.OCPP_INDEX_MAX_AGE:
+            return _open(current)
+
+        if settings.OCPP_ARCHIVE_CACHE_ENABLED:
+            # Opened right away: a blob evicted later stays readable through the open file.
+            entry, archive = archive_cache.cache().open(client, cid, refresh=refresh)
+            key, etag, path = entry.sha256, entry.upstream_etag, None
+        else:
+            key, etag, path = _download_unless_unchanged(client, cid, base, state)
+            archive = open(path, "rb") if path is not None else None
+        if archive is not None:
+            try:
+                if not (base / key / "meta.json").exists():
+                    started = time.perf_counter()
+                    size = os.fstat(archive.fileno()).st_size
+                    build(archive, base / key, source={"sha256": key, "etag": etag, "bytes": size})
+                    log.info("OCPP index for %s built in %.2fs", cid, time.perf_counter() - started)
+            finally:
+                archive.close()
+                if path is not None:
+                    path.unlink(missing_ok=True)
+        _write_state(base, {"key": key, "etag": etag, "checkedAt": time.time()})
+        _prune(base, settings.OCPP_INDEX_KEEP, key)
+        return _open(base / key)
@@ -0,0 +1,430 @@
+"""
+Retry policy, retry budget and circuit breaker for EV Advisor calls.
+
+Responsibility:
+- RetryPolicy: which failures are retried and how long to wait (exponential
+  backoff with full jitter, capped; honours Retry-After).
+- RetryBudget: retries may add at most a fraction of the normal request rate,
+  so a brownout is not multiplied by the retry count.
+- CircuitBreaker: per endpoint; after consecutive failures it fails fast
+  (UpstreamUnavailable -> 503) for a cooldown, then lets one probe through
+  (half-open) to detect recovery.
+- deadline(): an end-to-end time budget for the EV Advisor calls one proxy
+  request makes (set by UpstreamDeadlineMiddleware). Attempt timeouts and
+  retry backoff shrink to fit what is left; when nothing is left the call
+  fails with DeadlineExceeded (-> 504) instead of trying again.
+- SharedDeadline: the budget of one upstream call that several requests
+  wait on (single-flight): the latest of their deadlines, and spent once
+  the last of them has given up.
+- HedgePolicy: when an idempotent GET has not answered within the endpoint's
+  recent p95 latency, send a second copy and use whichever answers first.
+
+Shared by the sync and async clients; all state is guarded by plain locks
+held for a few instructions, so it is safe from threads and event loops alike.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import random
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, Iterator, List, Optional, Union
+
+from django.conf import settings
+
+
+class UpstreamUnavailable(RuntimeError):
+    """Upstream is known to be unhealthy (circuit open); views answer 503."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(UpstreamUnavailable):
+    """The request's time budget ran out before upstream answered; views answer 504."""
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP-date)."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+class RetryPolicy:
+    """
+    When and how long to retry an idempotent GET.
+
+    Retried: connection errors / timeouts and `retry_statuses`. Attempt n
+    (0-based) waits uniform(0, min(max_delay, base_delay * 2**n)) - "full
+    jitter", so clients that failed together do not retry together. A
+    Retry-After longer than `max_delay` means: do not retry, give up now.
+    """
+
+    def __init__(
+        self,
+        retries: int = 2,
+        base_delay: float = 0.2,
+        max_delay: float = 2.0,
+        retry_statuses=(429, 500, 502, 503, 504),
+    ) -> None:
+        self.retries = max(0, retries)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_statuses = frozenset(retry_statuses)
+
+    @classmethod
+    def from_settings(cls) -> "RetryPolicy":
+        return cls(
+            retries=settings.EXTERNAL_API_RETRIES,
+            base_delay=settings.EXTERNAL_API_RETRY_BACKOFF_BASE,
+            max_delay=settings.EXTERNAL_API_RETRY_BACKOFF_MAX,
+        )
+
+    @property
+    def attempts(self) -> int:
+        return self.retries + 1
+
+    def should_retry_status(self, status: int) -> bool:
+        return status in self.retry_statuses
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None) -> Optional[float]:
+        """Seconds to sleep before retry `attempt + 1`, or None to stop retrying."""
+        if attempt + 1 >= self.attempts:
+            return None
+        if retry_after is not None:
+            return retry_after if retry_after <= self.max_delay else None
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+
+class RetryBudget:
+    """
+    Token bucket limiting retries to `ratio` of first attempts (plus a small
+    reserve for quiet periods): each request deposits `ratio` tokens, each
+    retry spends one.
+    """
+
+    def __init__(self, ratio: float = 0.2, reserve: float = 10.0) -> None:
+        self.ratio = ratio
+        self.capacity = reserve
+        self._tokens = reserve
+        self._lock = threading.Lock()
+        self.spent = 0
+        self.denied = 0
+
+    def deposit(self) -> None:
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                self.spent += 1
+                return True
+            self.denied += 1
+            return False
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"tokens": round(self._tokens, 2), "spent": self.spent, "denied": self.denied}
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker for one upstream endpoint.
+
+    closed -> open after `failure_threshold` failures in a row; open rejects
+    calls for `cooldown` seconds; then half-open admits one probe: success
+    closes the circuit, failure re-opens it for another cooldown.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, cooldown: float = 30.0) -> None:
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown = cooldown
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.cooldown:
+                return self.HALF_OPEN
+            return self._state
+
+    def before_call(self) -> None:
+        """Raise UpstreamUnavailable unless a call may go upstream now."""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return
+            remaining = self.cooldown - (time.monotonic() - self._opened_at)
+            if self._state == self.OPEN and remaining <= 0:
+                self._state = self.HALF_OPEN
+            if self._state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return
+            self.rejected += 1
+        raise UpstreamUnavailable(
+            f"EV Advisor {self.name} temporarily unavailable", retry_after=max(1.0, remaining)
+        )
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+    def record_abandoned(self) -> None:
+        """The caller's deadline ended the call: no verdict on upstream, but free the probe slot."""
+        with self._lock:
+            self._probing = False
+
+    def stats(self) -> Dict[str, Any]:
+        state = self.state
+        with self._lock:
+            return {"state": state, "consecutive_failures": self._failures, "rejected": self.rejected}
+
+
+class Breakers:
+    """Lazily created CircuitBreaker per endpoint name."""
+
+    def __init__(self, failure_threshold: int = 5, cooldown: float = 30.0) -> None:
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls) -> "Breakers":
+        return cls(settings.EXTERNAL_API_BREAKER_FAILURES, settings.EXTERNAL_API_BREAKER_COOLDOWN)
+
+    def get(self, endpoint: str) -> CircuitBreaker:
+        with self._lock:
+            breaker = self._breakers.get(endpoint)
+            if breaker is None:
+                breaker = self._breakers[endpoint] = CircuitBreaker(endpoint, self.failure_threshold, self.cooldown)
+            return breaker
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            breakers = list(self._breakers.values())
+        return {b.name: b.stats() for b in breakers}
+
+
+# -- Deadlines -------------------------------------------------------------------
+
+# Shortest attempt worth starting: with less time left, fail now.
+MIN_ATTEMPT_SECONDS = 0.05
+
+# Monotonic time by which the current request's upstream calls must be done.
+# A ContextVar, so it follows the request into sync_to_async, tasks and
+# fan-out threads (fanout.py runs each call in a copy of the caller's context).
+_deadline: ContextVar[Union[None, float, "SharedDeadline"]] = ContextVar("evadvisor_deadline", default=None)
+
+
+class SharedDeadline:
+    """
+    The deadline of a call made on behalf of several waiters: the latest of
+    their deadlines (none if any waiter has none). Once every waiter has
+    left, it is spent, so the call starts no further attempt or retry.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._waiters: List[Optional[float]] = []
+        self._abandoned_at: Optional[float] = None
+
+    def join(self, at: Optional[float]) -> None:
+        """Add a waiter whose own deadline is `at` (monotonic; None: unbounded)."""
+        with self._lock:
+            self._waiters.append(at)
+            self._abandoned_at = None
+
+    def leave(self, at: Optional[float]) -> bool:
+        """Remove a waiter added with `at`; True if it was the last one."""
+        with self._lock:
+            self._waiters.remove(at)
+            if self._waiters:
+                return False
+            self._abandoned_at = time.monotonic()
+            return True
+
+    @property
+    def at(self) -> Optional[float]:
+        with self._lock:
+            if not self._waiters:
+                return self._abandoned_at
+            if None in self._waiters:
+                return None
+            return max(self._waiters)
+
+
+def expires_at() -> Optional[float]:
+    """The current deadline as a time.monotonic() value, or None without one."""
+    at = _deadline.get()
+    return at.at if isinstance(at, SharedDeadline) else at
+
+
+@contextlib.contextmanager
+def deadline(seconds: Optional[float]) -> Iterator[None]:
+    """
+    Bound every EV Advisor call made inside the block to `seconds` from now,
+    retries included. Nested deadlines can only shorten the budget; None or
+    a non-positive value leaves it unchanged.
+    """
+    if seconds is None or seconds <= 0:
+        yield
+        return
+    at = time.monotonic() + seconds
+    current = expires_at()
+    token = _deadline.set(at if current is None else min(current, at))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+@contextlib.contextmanager
+def shared_deadline(shared: SharedDeadline) -> Iterator[None]:
+    """Run the block under `shared`, which its waiters extend or give up while it runs."""
+    token = _deadline.set(shared)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+@contextlib.contextmanager
+def no_deadline() -> Iterator[None]:
+    """Detach background work (e.g. a cache refresh task) from the request that started it."""
+    token = _deadline.set(None)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left before the current deadline (negative once passed), or None without one."""
+    at = expires_at()
+    return None if at is None else at - time.monotonic()
+
+
+def attempt_timeout(timeout: float) -> float:
+    """`timeout` for one upstream attempt, shrunk to the time left; raises DeadlineExceeded if none is."""
+    left = remaining()
+    if left is None:
+        return timeout
+    if left < MIN_ATTEMPT_SECONDS:
+        raise DeadlineExceeded("EV Advisor request deadline exceeded")
+    return min(timeout, left)
+
+
+def fits(delay: float) -> bool:
+    """Whether waiting `delay` seconds still leaves time for another attempt."""
+    left = remaining()
+    return left is None or delay + MIN_ATTEMPT_SECONDS <= left
+
+
+# -- Hedging ---------------------------------------------------------------------
+
+class HedgePolicy:
+    """
+    When to hedge an idempotent GET: if it has not answered after the
+    endpoint's recent `percentile` latency (at least `min_delay`), a second
+    copy is sent and the first usable response wins. An endpoint is not
+    hedged until `min_samples` of its latencies are known. Clients pay for
+    each hedge from the retry budget, so hedging adds at most the budget's
+    ratio of extra upstream load.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        percentile: float = 95.0,
+        min_delay: float = 0.05,
+        min_samples: int = 20,
+        window: int = 200,
+    ) -> None:
+        self.enabled = enabled
+        self.percentile = min(100.0, max(0.0, percentile))
+        self.min_delay = min_delay
+        self.min_samples = max(1, min_samples)
+        self.window = max(self.min_samples, window)
+        self._samples: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+        self.sent = 0
+        self.won = 0
+
+    @classmethod
+    def from_settings(cls) -> "HedgePolicy":
+        return cls(
+            enabled=settings.EXTERNAL_API_HEDGE_ENABLED,
+            percentile=settings.EXTERNAL_API_HEDGE_PERCENTILE,
+            min_delay=settings.EXTERNAL_API_HEDGE_MIN_DELAY,
+            min_samples=settings.EXTERNAL_API_HEDGE_MIN_SAMPLES,
+        )
+
+    def observe(self, endpoint: str, seconds: float) -> None:
+        """Record the latency of one answered attempt."""
+        if not self.enabled:
+            return
+        with self._lock:
+            samples = self._samples.get(endpoint)
+            if samples is None:
+                samples = self._samples[endpoint] = deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def delay(self, endpoint: str) -> Optional[float]:
+        """Seconds to wait before hedging a GET to `endpoint`, or None to not hedge it."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            samples = self._samples.get(endpoint)
+            if samples is None or len(samples) < self.min_samples:
+                return None
+            ordered = sorted(samples)
+        rank = min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))
+        return max(self.min_delay, ordered[rank])
+
+    def record(self, hedge_won: bool) -> None:
+        with self._lock:
+            self.sent += 1
+            self.won += hedge_won
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            endpoints = list(self._samples)
+            counts = {"enabled": self.enabled, "sent": self.sent, "won": self.won}
+        delays = {e: self.delay(e) for e in endpoints}
+        return {**counts, "delays": {e: round(d, 4) for e, d in delays.items() if d is not None}}
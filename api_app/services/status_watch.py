@@ -0,0 +1,407 @@
+"""
+Background cloud-status poller behind the server-sent-events watch endpoint.
+
+Responsibility:
+- Watch list: chargers with at least one open stream, plus the ones pinned
+  by CLOUDSTATUS_WATCH_CHARGERS. At most CLOUDSTATUS_WATCH_MAX are watched
+  per worker; subscribing beyond that raises WatchListFull (the view answers 503).
+  Pinned chargers are polled from a worker's first request on, viewers or
+  not (see start_pinned()).
+- Polling: one daemon thread per worker process calls get_cloud_status for
+  every watched charger once per CLOUDSTATUS_POLL_INTERVAL (a few at a time),
+  so N viewers of a charger cost one upstream call per interval, not N.
+  With the shared "ev_advisor" cache, the workers on a host also share that
+  call: the first worker to claim a charger's interval polls and stores the
+  result; the others use it.
+- Diffs: the latest payload is kept in memory; each change is pushed to the
+  charger's subscribers as the top-level keys that changed or were removed.
+
+Events (see StatusEvent.sse()):
+    snapshot  {"chargerId", "status"}           first event, and after an error or overflow
+    change    {"chargerId", "changed", "removed"}
+    error     {"chargerId", "error", "status"}  sent once per distinct error
+
+A subscriber that falls more than CLOUDSTATUS_STREAM_QUEUE events behind is
+sent a fresh snapshot instead of the diffs it missed.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Set
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.signals import request_started
+
+from . import metrics
+from .ev_advisor import EVAdvisorClient, Representation
+from .fanout import iter_fan_out
+from .resilience import UpstreamUnavailable
+
+log = logging.getLogger(__name__)
+
+_SHARED_PREFIX = "cloudstatus-watch"
+
+
+class WatchListFull(Exception):
+    """This worker already watches CLOUDSTATUS_WATCH_MAX chargers."""
+
+
+class StatusEvent(NamedTuple):
+    kind: str  # "snapshot" | "change" | "error"
+    version: int
+    data: Dict[str, Any]
+
+    def sse(self) -> bytes:
+        """The event in text/event-stream framing."""
+        payload = json.dumps(self.data, cls=DjangoJSONEncoder, separators=(",", ":"))
+        return f"id: {self.version}\nevent: {self.kind}\ndata: {payload}\n\n".encode()
+
+
+def diff(old: Dict[str, Any], new: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Top-level keys of `new` that differ from `old`, and keys it dropped; None if equal."""
+    changed = {k: v for k, v in new.items() if k not in old or old[k] != v}
+    removed = [k for k in old if k not in new]
+    if not changed and not removed:
+        return None
+    return {"changed": changed, "removed": removed}
+
+
+def _error_payload(exc: BaseException) -> Dict[str, Any]:
+    """The JSON error and HTTP status the plain cloudstatus view would answer with."""
+    if isinstance(exc, FileNotFoundError):
+        status = 404
+    elif isinstance(exc, PermissionError):
+        status = 403
+    elif isinstance(exc, UpstreamUnavailable):
+        status = 503
+    else:
+        status = 502
+    return {"error": str(exc), "status": status}
+
+
+class Subscription:
+    """
+    One open stream. The poller thread delivers events; the response reads
+    them with get() (sync views) or aget() (async views, bound to `loop`).
+    """
+
+    def __init__(self, charger_id: str, size: int, loop: Optional[asyncio.AbstractEventLoop] = None) -> None:
+        self.charger_id = charger_id
+        self.loop = loop
+        self.overflowed = False
+        self._queue = asyncio.Queue(size) if loop is not None else queue.Queue(size)
+
+    def deliver(self, event: StatusEvent) -> None:
+        """Never blocks: called with the watcher's lock held."""
+        if self.loop is None:
+            self._put(event)
+        elif not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self._put, event)
+
+    def _put(self, event: StatusEvent) -> None:
+        try:
+            self._queue.put_nowait(event)
+        except (queue.Full, asyncio.QueueFull):
+            self.overflowed = True
+
+    def _drain(self) -> None:
+        while not self._queue.empty():
+            self._queue.get_nowait()
+
+    def get(self, timeout: float) -> Optional[StatusEvent]:
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    async def aget(self, timeout: float) -> Optional[StatusEvent]:
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class _State:
+    __slots__ = ("rep", "error", "version", "polled_at")
+
+    def __init__(self) -> None:
+        self.rep: Optional[Representation] = None
+        self.error: Optional[Dict[str, Any]] = None
+        self.version = 0
+        self.polled_at = float("-inf")  # monotonic
+
+
+class StatusWatcher:
+    def __init__(
+        self,
+        client: Optional[EVAdvisorClient] = None,
+        interval: float = 5.0,
+        concurrency: int = 8,
+        max_chargers: int = 500,
+        queue_size: int = 32,
+        pinned: Iterable[str] = (),
+        shared_cache=None,
+    ) -> None:
+        self.client = client
+        self.interval = interval
+        self.concurrency = concurrency
+        self.max_chargers = max_chargers
+        self.queue_size = queue_size
+        self.pinned = frozenset(pinned)
+        self.shared_cache = shared_cache
+        self._lock = threading.Lock()
+        self._subscribers: Dict[str, Set[Subscription]] = {}
+        self._states: Dict[str, _State] = {}
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = False
+        self._stats = {"polls": 0, "upstream_calls": 0, "shared_reads": 0, "events": 0, "overflows": 0}
+
+    @classmethod
+    def from_settings(cls) -> "StatusWatcher":
+        shared = caches[settings.EXTERNAL_API_CACHE_ALIAS] if settings.EXTERNAL_API_CACHE_ENABLED else None
+        return cls(
+            interval=settings.CLOUDSTATUS_POLL_INTERVAL,
+            concurrency=settings.CLOUDSTATUS_POLL_CONCURRENCY,
+            max_chargers=settings.CLOUDSTATUS_WATCH_MAX,
+            queue_size=settings.CLOUDSTATUS_STREAM_QUEUE,
+            pinned=settings.CLOUDSTATUS_WATCH_CHARGERS,
+            shared_cache=shared,
+        )
+
+    # -- subscribers -------------------------------------------------------
+
+    def subscribe(self, charger_id: str, loop: Optional[asyncio.AbstractEventLoop] = None) -> Subscription:
+        """
+        Register a stream for `charger_id` (adding it to the watch list) and
+        start the poller if needed. The current state, if any, is queued as
+        the first event; otherwise the first poll delivers it.
+        """
+        sub = Subscription(charger_id, self.queue_size, loop)
+        with self._lock:
+            if charger_id not in self._subscribers and charger_id not in self.pinned:
+                if len(self._watched_locked()) >= self.max_chargers:
+                    raise WatchListFull(f"Already watching {self.max_chargers} chargers")
+            self._subscribers.setdefault(charger_id, set()).add(sub)
+            state = self._states.get(charger_id)
+            if state is not None and state.version:
+                sub.deliver(self._current_event(charger_id, state))
+        if not self._ensure_running() and (state is None or not state.version):
+            self._wake.set()  # a new charger: poll now rather than at the next tick
+        return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        with self._lock:
+            subs = self._subscribers.get(sub.charger_id)
+            if subs is None:
+                return
+            subs.discard(sub)
+            if not subs:
+                del self._subscribers[sub.charger_id]
+                if sub.charger_id not in self.pinned:
+                    self._states.pop(sub.charger_id, None)
+
+    def resync(self, sub: Subscription) -> Optional[StatusEvent]:
+        """After an overflow: drop the queued diffs and return a fresh snapshot."""
+        with self._lock:
+            sub.overflowed = False
+            sub._drain()
+            self._stats["overflows"] += 1
+            state = self._states.get(sub.charger_id)
+            return self._current_event(sub.charger_id, state) if state is not None and state.version else None
+
+    def watched(self) -> List[str]:
+        with self._lock:
+            return sorted(self._watched_locked())
+
+    def _watched_locked(self) -> Set[str]:
+        return set(self._subscribers) | self.pinned
+
+    # -- reads -------------------------------------------------------------
+
+    def latest(self, charger_id: str) -> Optional[Representation]:
+        """The watched payload if it was polled successfully within the last interval."""
+        with self._lock:
+            state = self._states.get(charger_id)
+            if state is None or state.rep is None or state.error is not None:
+                return None
+            if time.monotonic() - state.polled_at > self.interval:
+                return None
+            return state.rep
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self._stats,
+                "watched": len(self._watched_locked()),
+                "subscribers": sum(len(s) for s in self._subscribers.values()),
+                "interval": self.interval,
+            }
+
+    # -- polling -----------------------------------------------------------
+
+    def _ensure_running(self) -> bool:
+        """Start the poller thread unless it runs; True if started (it polls right away)."""
+        with self._lock:
+            if self._stopped or self._thread is not None:
+                return False
+            self._thread = threading.Thread(target=self._run, name="evadv-status-watch", daemon=True)
+            self._thread.start()
+            return True
+
+    def stop(self) -> None:
+        """Forget every subscriber and let the poller thread exit."""
+        with self._lock:
+            self._stopped = True
+            self._subscribers.clear()
+            self.pinned = frozenset()
+        self._wake.set()
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                # Exit once nothing is watched; the next subscribe() starts a new thread.
+                if self._stopped or not self._watched_locked():
+                    self._thread = None
+                    return
+            started = time.monotonic()
+            try:
+                self.poll_once()
+            except Exception:  # never let the poller die; the next tick retries
+                log.exception("cloud status poll failed")
+            self._wake.wait(max(0.0, self.interval - (time.monotonic() - started)))
+            self._wake.clear()
+
+    def poll_once(self) -> None:
+        """Refresh every watched charger once (at most `concurrency` upstream calls at a time)."""
+        chargers = self.watched()
+        if not chargers:
+            return
+        for outcome in iter_fan_out(self._fetch, chargers, self.concurrency):
+            if not outcome.ok:  # e.g. the shared cache failed; upstream errors are results
+                log.warning("cloud status poll of %s failed: %s", outcome.item, outcome.error)
+            elif outcome.value is not None:
+                self._apply(outcome.item, *outcome.value)
+
+    def _fetch(self, charger_id: str):
+        """(Representation or None, error payload or None), or None if another worker's poll is pending."""
+        if self.shared_cache is None:
+            return self._poll_upstream(charger_id)
+        claim_key = f"{_SHARED_PREFIX}:claim:{charger_id}"
+        state_key = f"{_SHARED_PREFIX}:state:{charger_id}"
+        # The claim expires just before the next tick, so some worker polls every interval.
+        if self.shared_cache.add(claim_key, os.getpid(), timeout=max(self.interval * 0.9, 0.001)):
+            result = self._poll_upstream(charger_id)
+            self.shared_cache.set(state_key, result, timeout=self.interval * 3)
+            return result
+        with self._lock:
+            self._stats["shared_reads"] += 1
+        metrics.STATUS_WATCH_POLLS.inc(source="shared")
+        return self.shared_cache.get(state_key)
+
+    def _poll_upstream(self, charger_id: str):
+        with self._lock:
+            self._stats["upstream_calls"] += 1
+        metrics.STATUS_WATCH_POLLS.inc(source="upstream")
+        try:
+            client = self.client or EVAdvisorClient.shared()
+            return client.get_cloud_status(charger_id, tagged=True), None
+        except Exception as exc:
+            return None, _error_payload(exc)
+
+    def _apply(self, charger_id: str, rep: Optional[Representation], error: Optional[Dict[str, Any]]) -> None:
+        """Record a poll result and push an event to the charger's subscribers if anything changed."""
+        with self._lock:
+            if charger_id not in self._watched_locked():
+                return  # the last viewer left while polling
+            self._stats["polls"] += 1
+            state = self._states.setdefault(charger_id, _State())
+            state.polled_at = time.monotonic()
+            event = self._next_event(charger_id, state, rep, error)
+            if event is None:
+                return
+            self._stats["events"] += 1
+            metrics.STATUS_WATCH_EVENTS.inc(kind=event.kind)
+            for sub in self._subscribers.get(charger_id, ()):
+                sub.deliver(event)
+
+    @staticmethod
+    def _next_event(charger_id: str, state: _State, rep, error) -> Optional[StatusEvent]:
+        if error is not None:
+            if error == state.error:
+                return None
+            state.error = error
+            state.version += 1
+            return StatusEvent("error", state.version, {"chargerId": charger_id, **error})
+        if state.rep is not None and state.error is None:
+            if rep.etag == state.rep.etag:
+                state.rep = rep
+                return None
+            changes = diff(state.rep.value, rep.value) if isinstance(state.rep.value, dict) else None
+            state.rep = rep
+            state.version += 1
+            if changes is not None and isinstance(rep.value, dict):
+                return StatusEvent("change", state.version, {"chargerId": charger_id, **changes})
+            return StatusEvent("snapshot", state.version, {"chargerId": charger_id, "status": rep.value})
+        # First result, or recovery from an error: send everything.
+        state.rep, state.error = rep, None
+        state.version += 1
+        return StatusEvent("snapshot", state.version, {"chargerId": charger_id, "status": rep.value})
+
+    @staticmethod
+    def _current_event(charger_id: str, state: _State) -> StatusEvent:
+        if state.error is not None:
+            return StatusEvent("error", state.version, {"chargerId": charger_id, **state.error})
+        return StatusEvent("snapshot", state.version, {"chargerId": charger_id, "status": state.rep.value})
+
+
+_watcher: Optional[StatusWatcher] = None
+_watcher_pid: Optional[int] = None
+_watcher_lock = threading.Lock()
+
+
+def watcher() -> StatusWatcher:
+    """The process-wide watcher, created on first use (and again after fork: threads do not survive it)."""
+    global _watcher, _watcher_pid
+    pid = os.getpid()
+    if _watcher is not None and _watcher_pid == pid:
+        return _watcher
+    with _watcher_lock:
+        if _watcher is None or _watcher_pid != pid:
+            _watcher, _watcher_pid = StatusWatcher.from_settings(), pid
+            if _watcher.pinned:
+                _watcher._ensure_running()  # pinned chargers are polled without viewers
+        return _watcher
+
+
+def start_pinned(**kwargs) -> None:
+    """
+    request_started receiver (connected by ApiAppConfig.ready when chargers
+    are pinned): create this worker's watcher, which starts polling them.
+    Runs once per process: it disconnects itself.
+    """
+    request_started.disconnect(start_pinned)
+    watcher()
+
+
+def current() -> Optional[StatusWatcher]:
+    """The process-wide watcher if one is running, without creating it."""
+    return _watcher if _watcher_pid == os.getpid() else None
+
+
+def reset_watcher() -> None:
+    """Stop and drop the process-wide watcher (e.g. after settings change in tests)."""
+    global _watcher, _watcher_pid
+    with _watcher_lock:
+        if _watcher is not None:
+            _watcher.stop()
+        _watcher, _watcher_pid = None, None
@@ -0,0 +1,45 @@
+"""
+Low-write session engine (SESSION_ENGINE = "api_app.sessions").
+
+Sessions are read through the cache (cached_db) and their expiry is pushed
+forward at most once per SESSION_REFRESH_INTERVAL seconds, by
+SessionRefreshMiddleware calling `touch()`, instead of on every request
+(SESSION_SAVE_EVERY_REQUEST). The stored lifetime is padded by that interval,
+so a user who was active less than SESSION_COOKIE_AGE seconds ago is never
+logged out early; `get_idle_timeout()` is the unpadded value the browser-side
+countdown (static/js/session-timeout.js) uses.
+"""
+
+import time
+
+from django.conf import settings
+from django.contrib.sessions.backends.cached_db import SessionStore as CachedDBStore
+
+REFRESHED_KEY = "_refreshed_at"
+
+
+class SessionStore(CachedDBStore):
+    def get_session_cookie_age(self):
+        return settings.SESSION_COOKIE_AGE + settings.SESSION_REFRESH_INTERVAL
+
+    def get_idle_timeout(self) -> int:
+        """Seconds of inactivity after which the user is logged out."""
+        return settings.SESSION_COOKIE_AGE
+
+    def get_refresh_interval(self) -> int:
+        return settings.SESSION_REFRESH_INTERVAL
+
+    def touch(self) -> bool:
+        """
+        Mark the session for saving (which pushes its expiry forward) if that
+        last happened SESSION_REFRESH_INTERVAL or more seconds ago. Empty
+        sessions are left alone so anonymous visitors never create rows.
+        Returns whether a write was scheduled.
+        """
+        if self.is_empty():
+            return False
+        now = int(time.time())
+        if now - self.get(REFRESHED_KEY, 0) < settings.SESSION_REFRESH_INTERVAL:
+            return False
+        self[REFRESHED_KEY] = now
+        return True
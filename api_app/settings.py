@@ -33,15 +33,21 @@ INSTALLED_APPS = [
     'django.contrib.sessions', #session framework
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'api_app',  # charge-history store, management commands
 ]
 
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "api_app.middleware.ProxyMetricsMiddleware",  # /metrics: proxy latency, status, streamed bytes
     "django.contrib.sessions.middleware.SessionMiddleware",  # sessions
+    "api_app.middleware.SessionRefreshMiddleware",  # sliding expiry, written at most once per interval
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",            # CSRF
     "django.contrib.auth.middleware.AuthenticationMiddleware",  # auth
+    "api_app.middleware.ApiTokenAuthMiddleware",  # bearer tokens for /api/ (no DB round-trip)
+    "api_app.middleware.RateLimitMiddleware",  # per-user / per-token 429s for /api/, before any view work
+    "api_app.middleware.UpstreamDeadlineMiddleware",  # end-to-end budget for upstream calls of /api/ requests
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -73,7 +79,7 @@ WSGI_APPLICATION = 'api_app.wsgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': os.getenv("DJANGO_DB_PATH", "") or BASE_DIR / 'db.sqlite3',  # override for benchmarks / scratch copies
     }
 }
 
@@ -125,20 +131,34 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 
 
-# Use local memory cache
+# Caches shared by all workers on this host (SQLite in WAL mode; see api_app/shared_cache.py)
+SHARED_CACHE_DIR = os.getenv("SHARED_CACHE_DIR", "").strip() or BASE_DIR / ".cache"
 CACHES = {
+    # Also backs sessions (cached_db), so every worker must see the same entries.
     "default": {
-        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
-        "LOCATION": "dev-inproc-cache",
-    }
+        "BACKEND": "api_app.shared_cache.SQLiteCache",
+        "LOCATION": os.path.join(SHARED_CACHE_DIR, "default.sqlite3"),
+        "OPTIONS": {"MAX_ENTRIES": int(os.getenv("SHARED_CACHE_MAX_ENTRIES", "10000"))},
+    },
+    # EV Advisor response cache (see api_app/services/ev_advisor.py ResponseCache)
+    "ev_advisor": {
+        "BACKEND": "api_app.shared_cache.SQLiteCache",
+        "LOCATION": os.path.join(SHARED_CACHE_DIR, "ev-advisor.sqlite3"),
+        "OPTIONS": {
+            "MAX_ENTRIES": int(os.getenv("EXTERNAL_API_CACHE_MAX_ENTRIES", "5000")),
+            "MAX_BYTES": int(os.getenv("EXTERNAL_API_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),  # pickled payload size cap
+        },
+    },
 }
 
 
 #Session configuration (Django native)
-SESSION_ENGINE = "django.contrib.sessions.backends.db"
+SESSION_ENGINE = "api_app.sessions"  # cached_db reads; expiry refreshed by SessionRefreshMiddleware
 SESSION_EXPIRE_AT_BROWSER_CLOSE = True  # Logout when browser closes
 SESSION_COOKIE_AGE = int(os.getenv("SESSION_COOKIE_AGE", "1800"))  # 30 minutes default
-SESSION_SAVE_EVERY_REQUEST = True  # Update session on every request
+SESSION_SAVE_EVERY_REQUEST = False  # see SESSION_REFRESH_INTERVAL
+SESSION_REFRESH_INTERVAL = int(os.getenv("SESSION_REFRESH_INTERVAL", "60"))  # at most one expiry write per session per interval
+SESSION_NO_WRITE_PATHS = ("/api/", "/metrics")  # never refresh sessions here (proxy traffic)
 
 
 SESSION_COOKIE_SECURE = False  # Set to True in production with HTTPS
@@ -155,4 +175,94 @@ EXTERNAL_API_BASE_URL = os.getenv("EXTERNAL_API_BASE_URL", "").strip()
 EXTERNAL_API_KEY = os.getenv("EXTERNAL_API_KEY", "").strip()
 EXTERNAL_API_TIMEOUT = int(os.getenv("EXTERNAL_API_TIMEOUT", "10"))
 EXTERNAL_API_RETRIES = int(os.getenv("EXTERNAL_API_RETRIES", "2"))
-
+EXTERNAL_API_RETRY_BACKOFF_BASE = float(os.getenv("EXTERNAL_API_RETRY_BACKOFF_BASE", "0.2"))  # seconds, doubled per attempt (full jitter)
+EXTERNAL_API_RETRY_BACKOFF_MAX = float(os.getenv("EXTERNAL_API_RETRY_BACKOFF_MAX", "2.0"))  # cap; longer Retry-After means give up
+EXTERNAL_API_RETRY_BUDGET_RATIO = float(os.getenv("EXTERNAL_API_RETRY_BUDGET_RATIO", "0.2"))  # retries per request, on average
+EXTERNAL_API_BREAKER_FAILURES = int(os.getenv("EXTERNAL_API_BREAKER_FAILURES", "5"))  # consecutive failures that open a circuit
+EXTERNAL_API_BREAKER_COOLDOWN = float(os.getenv("EXTERNAL_API_BREAKER_COOLDOWN", "30"))  # seconds open before a half-open probe
+EXTERNAL_API_DEADLINE = float(os.getenv("EXTERNAL_API_DEADLINE", "15"))  # seconds per /api/ request for all upstream calls; 0 = none
+EXTERNAL_API_HEDGE_ENABLED = os.getenv("EXTERNAL_API_HEDGE_ENABLED", "False").lower() == "true"  # second copy of slow GETs
+EXTERNAL_API_HEDGE_PERCENTILE = float(os.getenv("EXTERNAL_API_HEDGE_PERCENTILE", "95"))  # hedge after this latency percentile
+EXTERNAL_API_HEDGE_MIN_DELAY = float(os.getenv("EXTERNAL_API_HEDGE_MIN_DELAY", "0.05"))  # seconds, lower bound of the hedge delay
+EXTERNAL_API_HEDGE_MIN_SAMPLES = int(os.getenv("EXTERNAL_API_HEDGE_MIN_SAMPLES", "20"))  # latencies needed before an endpoint is hedged
+# Admission control (see api_app/services/admission.py)
+EXTERNAL_API_MAX_IN_FLIGHT = int(os.getenv("EXTERNAL_API_MAX_IN_FLIGHT", "16"))  # upstream requests in flight per worker; 0 = no cap
+EXTERNAL_API_MAX_IN_FLIGHT_HOST = int(os.getenv("EXTERNAL_API_MAX_IN_FLIGHT_HOST", "64"))  # across all workers on the host; 0 = no cap
+EXTERNAL_API_QUEUE_MAX = int(os.getenv("EXTERNAL_API_QUEUE_MAX", "64"))  # calls waiting for a slot per worker; more get a 503
+EXTERNAL_API_QUEUE_TIMEOUT = float(os.getenv("EXTERNAL_API_QUEUE_TIMEOUT", "2"))  # seconds a call may wait for a slot
+# Keep-alive connection pool (one shared client per worker process)
+EXTERNAL_API_POOL_CONNECTIONS = int(os.getenv("EXTERNAL_API_POOL_CONNECTIONS", "4"))  # distinct upstream hosts kept pooled
+EXTERNAL_API_POOL_MAXSIZE = int(os.getenv("EXTERNAL_API_POOL_MAXSIZE", "16"))  # max connections per host
+EXTERNAL_API_POOL_IDLE_TIMEOUT = float(os.getenv("EXTERNAL_API_POOL_IDLE_TIMEOUT", "60"))  # seconds before idle sockets are dropped
+EXTERNAL_API_ASYNC_VIEWS = os.getenv("EXTERNAL_API_ASYNC_VIEWS", "False").lower() == "true"  # set when serving via ASGI
+EXTERNAL_API_STREAM_CHUNK_SIZE = int(os.getenv("EXTERNAL_API_STREAM_CHUNK_SIZE", str(64 * 1024)))  # bytes per chunk for proxied downloads
+EXTERNAL_API_BATCH_CONCURRENCY = int(os.getenv("EXTERNAL_API_BATCH_CONCURRENCY", "8"))  # max upstream calls in flight per batch
+EXTERNAL_API_BATCH_MAX_ITEMS = int(os.getenv("EXTERNAL_API_BATCH_MAX_ITEMS", "500"))
+EXTERNAL_API_HISTORY_WINDOW = os.getenv("EXTERNAL_API_HISTORY_WINDOW", "month")  # day | week | month | N days; "none" disables splitting
+EXTERNAL_API_HISTORY_CONCURRENCY = int(os.getenv("EXTERNAL_API_HISTORY_CONCURRENCY", "4"))  # windows fetched in parallel
+EXTERNAL_API_HISTORY_STORE_ENABLED = os.getenv("EXTERNAL_API_HISTORY_STORE_ENABLED", "True").lower() == "true"  # answer from the local DB copy
+EXTERNAL_API_HISTORY_SETTLE_HOURS = int(os.getenv("EXTERNAL_API_HISTORY_SETTLE_HOURS", "48"))  # sessions newer than this are always refetched
+# Response cache for slow-changing lookups (seconds)
+EXTERNAL_API_CACHE_ENABLED = os.getenv("EXTERNAL_API_CACHE_ENABLED", "True").lower() == "true"
+EXTERNAL_API_CACHE_ALIAS = "ev_advisor"
+EXTERNAL_API_CACHE_TTLS = {
+    "chargers_by_serial": int(os.getenv("EXTERNAL_API_CACHE_TTL_SERIAL", "300")),
+    "charger": int(os.getenv("EXTERNAL_API_CACHE_TTL_CHARGER", "300")),
+    "capabilities": int(os.getenv("EXTERNAL_API_CACHE_TTL_CAPABILITIES", "3600")),
+}
+EXTERNAL_API_CACHE_NEGATIVE_TTL = int(os.getenv("EXTERNAL_API_CACHE_NEGATIVE_TTL", "30"))  # cached 404s
+EXTERNAL_API_CACHE_STALE_TTL = int(os.getenv("EXTERNAL_API_CACHE_STALE_TTL", "600"))  # serve-stale window while refreshing
+# Response bodies (see api_app/services/encoding.py)
+EXTERNAL_API_PASSTHROUGH = os.getenv("EXTERNAL_API_PASSTHROUGH", "False").lower() == "true"  # send upstream's JSON bytes unchanged
+EXTERNAL_API_COMPRESS_MIN_BYTES = int(os.getenv("EXTERNAL_API_COMPRESS_MIN_BYTES", "1024"))  # smaller bodies are sent uncompressed
+# Local serial -> chargerId index (see api_app/services/charger_index.py)
+CHARGER_INDEX_ENABLED = os.getenv("CHARGER_INDEX_ENABLED", "True").lower() == "true"  # answer serial lookups locally
+CHARGER_INDEX_MAX_AGE = int(os.getenv("CHARGER_INDEX_MAX_AGE", str(24 * 3600)))  # seconds a mapping is trusted before re-asking upstream
+CHARGER_INDEX_RELOAD_INTERVAL = float(os.getenv("CHARGER_INDEX_RELOAD_INTERVAL", "5"))  # seconds between per-worker incremental reloads
+CHARGER_INDEX_SEARCH_LIMIT = int(os.getenv("CHARGER_INDEX_SEARCH_LIMIT", "20"))  # default typeahead results
+# OCPP archive disk cache: latest archive per charger, stored once by content hash (see api_app/services/archive_cache.py)
+OCPP_ARCHIVE_CACHE_ENABLED = os.getenv("OCPP_ARCHIVE_CACHE_ENABLED", "True").lower() == "true"  # serve repeat downloads from disk
+OCPP_ARCHIVE_CACHE_DIR = os.getenv("OCPP_ARCHIVE_CACHE_DIR", "").strip() or os.path.join(SHARED_CACHE_DIR, "ocpp-archives")
+OCPP_ARCHIVE_CACHE_MAX_BYTES = int(os.getenv("OCPP_ARCHIVE_CACHE_MAX_BYTES", str(5 * 1024 ** 3)))  # total blob bytes before LRU eviction
+OCPP_ARCHIVE_CACHE_FRESH = float(os.getenv("OCPP_ARCHIVE_CACHE_FRESH", "60"))  # seconds an archive is served without revalidating upstream
+# OCPP log index: the latest archive per charger, indexed on disk for message queries (see api_app/services/ocpp_index.py)
+OCPP_INDEX_DIR = os.getenv("OCPP_INDEX_DIR", "").strip() or os.path.join(SHARED_CACHE_DIR, "ocpp")  # shared by all workers on a host
+OCPP_INDEX_MAX_AGE = int(os.getenv("OCPP_INDEX_MAX_AGE", "300"))  # seconds before upstream is asked for a newer archive
+OCPP_INDEX_KEEP = int(os.getenv("OCPP_INDEX_KEEP", "2"))  # indexed archives kept per charger
+OCPP_INDEX_MAX_BYTES = int(os.getenv("OCPP_INDEX_MAX_BYTES", str(2 * 1024 ** 3)))  # uncompressed log bytes indexed per archive
+# Cloud-status watch: one background poll per charger feeds every SSE viewer (see api_app/services/status_watch.py)
+CLOUDSTATUS_POLL_INTERVAL = float(os.getenv("CLOUDSTATUS_POLL_INTERVAL", "5"))  # seconds between polls of a watched charger
+CLOUDSTATUS_POLL_CONCURRENCY = int(os.getenv("CLOUDSTATUS_POLL_CONCURRENCY", "8"))  # upstream polls in flight per worker
+CLOUDSTATUS_WATCH_MAX = int(os.getenv("CLOUDSTATUS_WATCH_MAX", "500"))  # chargers watched per worker; more streams get 503
+CLOUDSTATUS_WATCH_CHARGERS = tuple(  # chargerIds polled even without viewers (comma-separated)
+    c.strip().lower() for c in os.getenv("CLOUDSTATUS_WATCH_CHARGERS", "").split(",") if c.strip()
+)
+CLOUDSTATUS_STREAM_QUEUE = int(os.getenv("CLOUDSTATUS_STREAM_QUEUE", "32"))  # events a slow viewer may lag before a resync
+CLOUDSTATUS_STREAM_KEEPALIVE = float(os.getenv("CLOUDSTATUS_STREAM_KEEPALIVE", "15"))  # seconds between keep-alive comments
+CLOUDSTATUS_STREAM_MAX_AGE = float(os.getenv("CLOUDSTATUS_STREAM_MAX_AGE", "300"))  # seconds before a stream ends and the browser reconnects
+
+
+# Metrics (/metrics, Prometheus text format; see api_app/services/metrics.py)
+METRICS_DIR = os.getenv("METRICS_DIR", "").strip()  # shared dir for multi-worker aggregation; empty = this process only
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "1.0"))  # seconds between per-worker snapshots
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "").strip()  # if set, scrapes need "Authorization: Bearer <token>"
+
+
+# API authentication (bearer tokens for /api/; see api_app/services/api_tokens.py)
+API_AUTH_REQUIRED = os.getenv("API_AUTH_REQUIRED", "False").lower() == "true"  # reject /api/ calls without a token or session
+API_TOKEN_TTL = int(os.getenv("API_TOKEN_TTL", str(30 * 24 * 3600)))  # seconds a newly issued token is valid
+API_TOKEN_CACHE_SIZE = int(os.getenv("API_TOKEN_CACHE_SIZE", "10000"))  # verified tokens kept per worker (LRU)
+API_TOKEN_REVOCATION_REFRESH = float(os.getenv("API_TOKEN_REVOCATION_REFRESH", "30"))  # seconds between revocation-list reloads
+API_RATE_LIMIT_USER_RATE = float(os.getenv("API_RATE_LIMIT_USER_RATE", "20"))  # /api/ requests per second per signed-in user, per worker; 0 = off
+API_RATE_LIMIT_USER_BURST = float(os.getenv("API_RATE_LIMIT_USER_BURST", "60"))
+# Anonymous requests are limited per client address. Off by default: behind a
+# reverse proxy REMOTE_ADDR is the proxy, so every anonymous caller would share
+# one bucket. Enable it only when REMOTE_ADDR is the client, or set
+# API_CLIENT_IP_HEADER to the META key of a header the proxy overwrites with the
+# client address (e.g. HTTP_X_FORWARDED_FOR; its last entry is used). Never set
+# it without such a proxy in front: clients could pick their own bucket.
+API_RATE_LIMIT_ANON_RATE = float(os.getenv("API_RATE_LIMIT_ANON_RATE", "0"))  # per client address, per worker; 0 = off
+API_RATE_LIMIT_ANON_BURST = float(os.getenv("API_RATE_LIMIT_ANON_BURST", "60"))
+API_CLIENT_IP_HEADER = os.getenv("API_CLIENT_IP_HEADER", "").strip()
+API_RATE_LIMIT_TOKEN_RATE = float(os.getenv("API_RATE_LIMIT_TOKEN_RATE", "10"))  # per API token, per worker (on top of its user's); 0 = off
+API_RATE_LIMIT_TOKEN_BURST = float(os.getenv("API_RATE_LIMIT_TOKEN_BURST", "30"))
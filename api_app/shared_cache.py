@@ -0,0 +1,205 @@
+"""
+Host-local Django cache backend shared by all worker processes.
+
+    CACHES = {"ev_advisor": {
+        "BACKEND": "api_app.shared_cache.SQLiteCache",
+        "LOCATION": "/var/tmp/ac-resi/ev-advisor.sqlite3",
+        "TIMEOUT": 300,
+        "OPTIONS": {"MAX_ENTRIES": 5000, "MAX_BYTES": 64 * 1024 * 1024},
+    }}
+
+Entries live in one SQLite file in WAL mode, so readers never block each
+other or the single writer, and every gunicorn/uvicorn worker on the host
+sees the same entries (LocMemCache is private to each process). Needs no
+external service.
+
+Responsibility:
+- TTLs: each row stores its absolute expiry; expired rows read as misses and
+  are deleted when the cache is culled.
+- LRU: each row stores when it was last read. Reads only write that back
+  when it is older than ACCESS_RESOLUTION seconds, so hot keys do not turn
+  every read into a write.
+- Size cap: once the cache holds more than MAX_ENTRIES rows or MAX_BYTES of
+  pickled values, expired rows and then the least recently used ones are
+  deleted until it is back under CULL_TARGET (a fraction) of the cap. The
+  totals are checked after a write at most every CULL_INTERVAL seconds per
+  process, so the cap can be exceeded briefly.
+"""
+
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache_entry (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    expires REAL,
+    accessed REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS cache_entry_accessed ON cache_entry (accessed);
+CREATE INDEX IF NOT EXISTS cache_entry_expires ON cache_entry (expires);
+"""
+
+
+class SQLiteCache(BaseCache):
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get("OPTIONS", {})
+        self.path = os.fspath(location)
+        self.max_bytes = int(options.get("MAX_BYTES", 0))  # 0 = no byte cap
+        self.access_resolution = float(options.get("ACCESS_RESOLUTION", 1.0))
+        self.cull_interval = float(options.get("CULL_INTERVAL", 1.0))
+        self.cull_target = float(options.get("CULL_TARGET", 0.9))
+        self._local = threading.local()
+        self._next_cull = 0.0
+
+    # -- connection handling -------------------------------------------
+
+    def _connection(self) -> sqlite3.Connection:
+        """One connection per thread, reopened after fork (sockets/locks are not fork-safe)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")  # a cache may lose the last writes on power loss
+        conn.executescript(_SCHEMA)
+        self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def close(self, **kwargs):
+        # Called at the end of every request; connections are kept for reuse.
+        pass
+
+    # -- helpers ----------------------------------------------------------
+
+    def _read_row(self, conn, key: str, now: float):
+        row = conn.execute("SELECT value, expires, accessed FROM cache_entry WHERE key = ?", (key,)).fetchone()
+        if row is None or (row[1] is not None and row[1] <= now):
+            return None
+        if now - row[2] >= self.access_resolution:
+            conn.execute("UPDATE cache_entry SET accessed = ? WHERE key = ?", (now, key))
+        return row
+
+    def _write(self, conn, key: str, value, timeout, only_if_missing: bool = False) -> bool:
+        blob = pickle.dumps(value, self.pickle_protocol)
+        expires = self.get_backend_timeout(timeout)
+        now = time.time()
+        if only_if_missing:
+            # Replace only a missing or expired row.
+            cur = conn.execute(
+                "INSERT INTO cache_entry (key, value, size, expires, accessed) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value, size = excluded.size, "
+                "expires = excluded.expires, accessed = excluded.accessed "
+                "WHERE cache_entry.expires IS NOT NULL AND cache_entry.expires <= ?",
+                (key, blob, len(blob), expires, now, now),
+            )
+        else:
+            cur = conn.execute(
+                "INSERT INTO cache_entry (key, value, size, expires, accessed) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value, size = excluded.size, "
+                "expires = excluded.expires, accessed = excluded.accessed",
+                (key, blob, len(blob), expires, now),
+            )
+        return cur.rowcount > 0
+
+    def _maybe_cull(self) -> None:
+        now = time.monotonic()
+        if now < self._next_cull:
+            return
+        self._next_cull = now + self.cull_interval
+        conn = self._connection()
+        entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache_entry").fetchone()
+        if entries <= self._max_entries and (not self.max_bytes or size <= self.max_bytes):
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM cache_entry WHERE expires IS NOT NULL AND expires <= ?", (time.time(),))
+            entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache_entry").fetchone()
+            keep_entries = int(self._max_entries * self.cull_target)
+            keep_bytes = int(self.max_bytes * self.cull_target) if self.max_bytes else None
+            if entries > keep_entries or (keep_bytes is not None and size > keep_bytes):
+                # Least recently used first; stop once both caps are met again.
+                cutoff, dropped_entries, dropped_bytes = None, 0, 0
+                rows = conn.execute("SELECT accessed, size FROM cache_entry ORDER BY accessed").fetchall()
+                for accessed, row_size in rows:
+                    if entries - dropped_entries <= keep_entries and (
+                        keep_bytes is None or size - dropped_bytes <= keep_bytes
+                    ):
+                        break
+                    cutoff, dropped_entries, dropped_bytes = accessed, dropped_entries + 1, dropped_bytes + row_size
+                if cutoff is not None:
+                    conn.execute("DELETE FROM cache_entry WHERE accessed <= ?", (cutoff,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    # -- BaseCache API -----------------------------------------------------
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        row = self._read_row(self._connection(), key, time.time())
+        return default if row is None else pickle.loads(row[0])
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        self._write(self._connection(), key, value, timeout)
+        self._maybe_cull()
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        added = self._write(self._connection(), key, value, timeout, only_if_missing=True)
+        if added:
+            self._maybe_cull()
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        now = time.time()
+        cur = self._connection().execute(
+            "UPDATE cache_entry SET expires = ?, accessed = ? WHERE key = ? AND (expires IS NULL OR expires > ?)",
+            (self.get_backend_timeout(timeout), now, key, now),
+        )
+        return cur.rowcount > 0
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        cur = self._connection().execute("DELETE FROM cache_entry WHERE key = ?", (key,))
+        return cur.rowcount > 0
+
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self._read_row(self._connection(), key, time.time()) is not None
+
+    def incr(self, key, delta=1, version=None):
+        """Atomic across processes: the read and the write share one write transaction."""
+        key = self.make_and_validate_key(key, version=version)
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = self._read_row(conn, key, time.time())
+            if row is None:
+                raise ValueError("Key '%s' not found" % key)
+            value = pickle.loads(row[0]) + delta
+            blob = pickle.dumps(value, self.pickle_protocol)
+            conn.execute("UPDATE cache_entry SET value = ?, size = ? WHERE key = ?", (blob, len(blob), key))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return value
+
+    def clear(self):
+        self._connection().execute("DELETE FROM cache_entry")
@@ -0,0 +1,2002 @@
+import asyncio
+import gzip
+import io
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import zipfile
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from unittest import mock
+from urllib.parse import parse_qs, urlsplit
+
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.management import call_command
+from django.db import connection
+from django.http import FileResponse
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from .services.charge_history import split_range
+from .models import ChargeHistorySync, ChargeSession, ChargerIndexEntry
+from .services import (
+    admission, api_tokens, archive_cache, charger_index, encoding, history_analytics, metrics, ocpp_index, resilience, status_watch,
+)
+from .services.ev_advisor import EVAdvisorClient, Representation, ResponseCache
+from .services.resilience import Breakers, DeadlineExceeded, HedgePolicy, RetryBudget, RetryPolicy, UpstreamUnavailable
+from .sessions import REFRESHED_KEY
+from .shared_cache import SQLiteCache
+
+
+class StubEVAdvisor:
+    """
+    Minimal local stand-in for the EV Advisor API.
+
+    Every GET sleeps `delay` seconds, is counted per path, and answers with
+    `status` and a small JSON body (or `body`, sent as a zip download, when
+    given; with `etag`, a matching If-None-Match gets a 304). Paths containing `missing` get a 404. `responder(path)` may
+    return (status, payload[, headers]) to answer a path itself (a 304 is
+    sent without a body). With `drop=True` the connection is closed without a response
+    (the client sees a connection error).
+    """
+
+    def __init__(self, delay: float = 0.0, status: int = 200, drop: bool = False, body: bytes = None, missing: str = None,
+                 responder=None, etag: str = None):
+        self.delay = delay
+        self.etag = etag
+        self.responder = responder
+        self.status = status
+        self.missing = missing
+        self.drop = drop
+        self.body = body
+        self.request_headers = []
+        self.hits = {}
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                with stub._lock:
+                    stub.hits[self.path] = stub.hits.get(self.path, 0) + 1
+                    stub.request_headers.append(dict(self.headers))
+                time.sleep(stub.delay)
+                if stub.drop:
+                    self.close_connection = True
+                    return
+                status = 404 if stub.missing and stub.missing in self.path else stub.status
+                headers = {}
+                if stub.responder is not None:
+                    status, payload, *extra = stub.responder(self.path)
+                    headers = extra[0] if extra else {}
+                    body, content_type = json.dumps(payload).encode(), "application/json"
+                    if status == 304:
+                        body = b""
+                elif stub.body is not None:
+                    body, content_type = stub.body, "application/zip"
+                    if stub.etag:
+                        headers = {"ETag": stub.etag}
+                        if self.headers.get("If-None-Match") == stub.etag:
+                            status, body = 304, b""
+                else:
+                    body, content_type = json.dumps({"path": self.path}).encode(), "application/json"
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                try:
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # client stopped reading (e.g. a cut-short download)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def total_hits(self) -> int:
+        with self._lock:
+            return sum(self.hits.values())
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def run_concurrently(fn, n):
+    """Call fn() from n threads released together; return (results, errors)."""
+    barrier = threading.Barrier(n)
+    results, errors = [], []
+    lock = threading.Lock()
+
+    def worker():
+        barrier.wait()
+        try:
+            value = fn()
+            with lock:
+                results.append(value)
+        except Exception as exc:
+            with lock:
+                errors.append(exc)
+
+    threads = [threading.Thread(target=worker) for _ in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(timeout=10)
+    return results, errors
+
+
+class SingleFlightTests(SimpleTestCase):
+    charger_id = "0f8fad5b-d9cb-469f-a165-70867728950e"
+
+    def make_client(self, stub, retries=0):
+        client = EVAdvisorClient(stub.base_url, "test-key", timeout=5, retries=retries)
+        self.addCleanup(client.close)
+        return client
+
+    def make_stub(self, **kwargs):
+        stub = StubEVAdvisor(**kwargs)
+        self.addCleanup(stub.close)
+        return stub
+
+    def test_identical_concurrent_calls_share_one_upstream_request(self):
+        stub = self.make_stub(delay=0.3)
+        client = self.make_client(stub)
+
+        results, errors = run_concurrently(lambda: client.get_cloud_status(self.charger_id), 12)
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(results), 12)
+        self.assertEqual(stub.total_hits(), 1)
+        self.assertTrue(all(r == results[0] for r in results))
+        self.assertEqual(client.stats()["single_flight"]["coalesced"], 11)
+
+    def test_different_query_parameters_are_not_coalesced(self):
+        stub = self.make_stub(delay=0.3)
+        client = self.make_client(stub)
+        url = f"{stub.base_url}/controller/api/v1.0/charger/{self.charger_id}/charge/history"
+        counter = iter(range(100))
+        lock = threading.Lock()
+
+        def call():
+            with lock:
+                n = next(counter) % 2
+            return client._get(url, params={"startDate": f"2025-01-0{n + 1}", "endDate": "2025-02-01"})
+
+        results, errors = run_concurrently(call, 8)
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(results), 8)
+        self.assertEqual(stub.total_hits(), 2)
+
+    def test_upstream_error_is_delivered_to_every_waiter(self):
+        stub = self.make_stub(delay=0.3, drop=True)
+        client = self.make_client(stub, retries=0)
+
+        results, errors = run_concurrently(lambda: client.get_charger_by_id(self.charger_id), 6)
+
+        self.assertEqual(results, [])
+        self.assertEqual(len(errors), 6)
+        self.assertTrue(all(isinstance(e, RuntimeError) for e in errors))
+        self.assertEqual(stub.total_hits(), 1)
+
+    def test_sequential_calls_are_not_coalesced(self):
+        stub = self.make_stub()
+        client = self.make_client(stub)
+
+        client.get_cloud_status(self.charger_id)
+        client.get_cloud_status(self.charger_id)
+
+        self.assertEqual(stub.total_hits(), 2)
+
+
+class PoolStatsTests(SimpleTestCase):
+    charger_id = "0f8fad5b-d9cb-469f-a165-70867728950e"
+
+    def setUp(self):
+        self.stub = StubEVAdvisor()
+        self.addCleanup(self.stub.close)
+
+    def make_client(self, pool_idle_timeout=60.0):
+        client = EVAdvisorClient(self.stub.base_url, "test-key", timeout=5, retries=0, pool_idle_timeout=pool_idle_timeout)
+        self.addCleanup(client.close)
+        return client
+
+    def test_sequential_calls_reuse_the_keep_alive_connection(self):
+        client = self.make_client()
+        client.get_cloud_status(self.charger_id)
+        client.get_cloud_status(self.charger_id)
+
+        self.assertEqual(client.stats()["pool"], {"hits": 1, "misses": 1, "idle_evictions": 0, "hit_ratio": 0.5})
+
+    def test_idle_connections_are_evicted(self):
+        client = self.make_client(pool_idle_timeout=0.05)
+        client.get_cloud_status(self.charger_id)
+        time.sleep(0.1)
+        client.get_cloud_status(self.charger_id)
+        client.get_cloud_status(self.charger_id)
+
+        self.assertEqual(client.stats()["pool"], {"hits": 1, "misses": 2, "idle_evictions": 1, "hit_ratio": 0.3333})
+
+    def test_idle_time_counts_from_check_in_not_from_the_last_request(self):
+        slow = StubEVAdvisor(delay=0.2)
+        self.addCleanup(slow.close)
+        client = EVAdvisorClient(slow.base_url, "test-key", timeout=5, retries=0, pool_idle_timeout=0.1)
+        self.addCleanup(client.close)
+        client.get_cloud_status(self.charger_id)
+        client.get_cloud_status(self.charger_id)  # the previous request took 0.2s, but its socket is fresh
+
+        self.assertEqual(client.stats()["pool"], {"hits": 1, "misses": 1, "idle_evictions": 0, "hit_ratio": 0.5})
+
+
+class OcppLogsStreamingTests(SimpleTestCase):
+    charger_id = "0f8fad5b-d9cb-469f-a165-70867728950e"
+    archive = bytes(range(256)) * 1024  # 256 KiB
+
+    def setUp(self):
+        self.stub = StubEVAdvisor(body=self.archive)
+        self.addCleanup(self.stub.close)
+        overrides = override_settings(
+            EXTERNAL_API_BASE_URL=self.stub.base_url,
+            EXTERNAL_API_KEY="test-key",
+            EXTERNAL_API_STREAM_CHUNK_SIZE=4096,
+            OCPP_ARCHIVE_CACHE_ENABLED=False,
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        EVAdvisorClient.reset_shared()
+        self.addCleanup(EVAdvisorClient.reset_shared)
+
+    def url(self):
+        return f"/api/charger/{self.charger_id}/ocpp-logs/"
+
+    def test_archive_is_streamed(self):
+        resp = self.client.get(self.url())
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.streaming)
+        self.assertEqual(resp["Content-Length"], str(len(self.archive)))
+        self.assertEqual(resp["Accept-Ranges"], "bytes")
+        self.assertEqual(b"".join(resp.streaming_content), self.archive)
+
+    def test_range_is_forwarded_and_sliced_when_upstream_ignores_it(self):
+        resp = self.client.get(self.url(), HTTP_RANGE="bytes=1000-")
+
+        self.assertEqual(self.stub.request_headers[-1].get("Range"), "bytes=1000-")
+        self.assertEqual(resp.status_code, 206)
+        self.assertEqual(resp["Content-Range"], f"bytes 1000-{len(self.archive) - 1}/{len(self.archive)}")
+        self.assertEqual(b"".join(resp.streaming_content), self.archive[1000:])
+
+    def test_unsatisfiable_range(self):
+        resp = self.client.get(self.url(), HTTP_RANGE=f"bytes={len(self.archive)}-")
+
+        self.assertEqual(resp.status_code, 416)
+        self.assertEqual(resp["Content-Range"], f"bytes */{len(self.archive)}")
+
+
+class AsyncClientTests(SimpleTestCase):
+    charger_id = "0f8fad5b-d9cb-469f-a165-70867728950e"
+
+    def run_with_client(self, stub, coro_fn):
+        from .services.ev_advisor_async import AsyncEVAdvisorClient
+
+        async def main():
+            client = AsyncEVAdvisorClient(stub.base_url, "test-key", timeout=5, retries=0)
+            try:
+                return await coro_fn(client)
+            finally:
+                await client.aclose()
+
+        return asyncio.run(main())
+
+    def test_concurrent_identical_calls_are_coalesced(self):
+        stub = StubEVAdvisor(delay=0.2)
+        self.addCleanup(stub.close)
+
+        results = self.run_with_client(
+            stub, lambda c: asyncio.gather(*(c.get_cloud_status(self.charger_id) for _ in range(20)))
+        )
+
+        self.assertEqual(len(results), 20)
+        self.assertEqual(stub.total_hits(), 1)
+
+    def test_error_mapping_matches_sync_client(self):
+        stub = StubEVAdvisor(status=404)
+        self.addCleanup(stub.close)
+
+        with self.assertRaises(FileNotFoundError):
+            self.run_with_client(stub, lambda c: c.get_cloud_status(self.charger_id))
+        with self.assertRaises(ValueError):
+            self.run_with_client(stub, lambda c: c.get_cloud_status("bad"))
+
+
+class BatchLookupTests(SimpleTestCase):
+    def setUp(self):
+        self.stub = StubEVAdvisor(delay=0.2, missing="MISSING")
+        self.addCleanup(self.stub.close)
+        overrides = override_settings(
+            EXTERNAL_API_BASE_URL=self.stub.base_url,
+            EXTERNAL_API_KEY="test-key",
+            EXTERNAL_API_CACHE_ENABLED=False,
+            EXTERNAL_API_BATCH_CONCURRENCY=10,
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        EVAdvisorClient.reset_shared()
+        self.addCleanup(EVAdvisorClient.reset_shared)
+
+    def test_results_and_errors_per_item_in_input_order(self):
+        serials = [f"SN{i:03d}" for i in range(9)] + ["MISSING1", "bad serial!"]
+
+        t0 = time.monotonic()
+        resp = self.client.post("/api/chargers/batch/", {"serials": serials}, content_type="application/json")
+        elapsed = time.monotonic() - t0
+
+        self.assertEqual(resp.status_code, 200)
+        body = resp.json()
+        self.assertEqual([r["serial"] for r in body["results"]], serials)
+        self.assertEqual([r["status"] for r in body["results"]], [200] * 9 + [404, 400])
+        self.assertEqual((body["ok"], body["failed"]), (9, 2))
+        # 10 upstream calls of 0.2s with concurrency 10: one round, not ten.
+        self.assertLess(elapsed, 1.0)
+
+    def test_post_needs_no_csrf_token(self):
+        client = self.client_class(enforce_csrf_checks=True)
+        resp = client.post("/api/chargers/batch/", {"serials": ["SN1"]}, content_type="application/json")
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json()["ok"], 1)
+
+    def test_streamed_ndjson(self):
+        resp = self.client.get("/api/chargers/batch/?serial=SN1&serial=SN2&stream=1")
+
+        lines = [json.loads(line) for line in b"".join(resp.streaming_content).splitlines()]
+        self.assertEqual(sorted(r["serial"] for r in lines), ["SN1", "SN2"])
+
+    def test_requires_exactly_one_kind_of_id(self):
+        resp = self.client.get("/api/chargers/batch/")
+        self.assertEqual(resp.status_code, 400)
+
+
+class SnapshotTests(SimpleTestCase):
+    charger_id = "0f8fad5b-d9cb-469f-a165-70867728950e"
+
+    def setUp(self):
+        self.stub = StubEVAdvisor(delay=0.3, missing="cloudstatus")
+        self.addCleanup(self.stub.close)
+        overrides = override_settings(
+            EXTERNAL_API_BASE_URL=self.stub.base_url,
+            EXTERNAL_API_KEY="test-key",
+            EXTERNAL_API_CACHE_ENABLED=False,
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        EVAdvisorClient.reset_shared()
+        self.addCleanup(EVAdvisorClient.reset_shared)
+
+    def test_parts_fetched_concurrently_and_fail_independently(self):
+        t0 = time.monotonic()
+        resp = self.client.get(f"/api/charger/{self.charger_id}/snapshot/")
+        elapsed = time.monotonic() - t0
+
+        self.assertEqual(resp.status_code, 200)
+        body = resp.json()
+        self.assertEqual(body["info"]["status"], 200)
+        self.assertEqual(body["capabilities"]["status"], 200)
+        self.assertEqual(body["cloudStatus"]["status"], 404)
+        self.assertGreaterEqual(body["info"]["latencyMs"], 300)
+        self.assertLess(elapsed, 0.8)
+
+
+class WindowedChargeHistoryTests(SimpleTestCase):
+    charger_id = "0f8fad5b-d9cb-469f-a165-70867728950e"
+
+    @staticmethod
+    def respond(path):
+        # Each monthly window returns its own session and, newest first, the
+        # previous month's (as if it overlapped the boundary); February fails.
+        query = parse_qs(urlsplit(path).query)
+        month = int(query["startDate"][0][5:7])
+        if month == 2:
+            return 500, {"error": "boom"}
+        return 200, [
+            {"transactionId": m, "startTime": f"2025-{m:02d}-15T08:00:00Z"} for m in range(month, 0, -1)[:2]
+        ]
+
+    def setUp(self):
+        self.stub = StubEVAdvisor(delay=0.2, responder=self.respond)
+        self.addCleanup(self.stub.close)
+        overrides = override_settings(
+            EXTERNAL_API_BASE_URL=self.stub.base_url,
+            EXTERNAL_API_KEY="test-key",
+            EXTERNAL_API_HISTORY_WINDOW="month",
+            EXTERNAL_API_HISTORY_CONCURRENCY=4,
+            EXTERNAL_API_HISTORY_STORE_ENABLED=False,
+            EXTERNAL_API_RETRIES=0,
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        EVAdvisorClient.reset_shared()
+        self.addCleanup(EVAdvisorClient.reset_shared)
+
+    def test_split_range(self):
+        self.assertEqual(
+            split_range("2025-01-01", "2025-03-10", "month"),
+            [("2025-01-01", "2025-01-31"), ("2025-02-01", "2025-02-28"), ("2025-03-01", "2025-03-10")],
+        )
+        self.assertEqual(
+            split_range("2025-01-01T00:00:00Z", "2025-01-10T12:00:00Z", "week"),
+            [("2025-01-01T00:00:00Z", "2025-01-08T00:00:00Z"), ("2025-01-08T00:00:00Z", "2025-01-10T12:00:00Z")],
+        )
+        self.assertEqual(split_range("2025-01-01", "2025-01-05", "none"), [("2025-01-01", "2025-01-05")])
+
+    def test_windows_fetched_concurrently_merged_and_failures_reported(self):
+        t0 = time.monotonic()
+        resp = self.client.get(
+            f"/api/charger/{self.charger_id}/charge-history/",
+            {"startDate": "2025-01-01", "endDate": "2025-04-30", "envelope": "1"},
+        )
+        elapsed = time.monotonic() - t0
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertLess(elapsed, 0.6)
+        self.assertEqual(self.stub.total_hits(), 4)
+        body = resp.json()
+        self.assertEqual(body["windows"], 4)
+        # Ordered by start time; transaction 3 (March and April windows) kept once.
+        self.assertEqual([r["transactionId"] for r in body["items"]], [1, 2, 3, 4])
+        self.assertEqual(body["failedWindows"], [
+            {"startDate": "2025-02-01", "endDate": "2025-02-28", "status": 502, "error": body["failedWindows"][0]["error"]},
+        ])
+        self.assertEqual(resp["X-Charge-History-Failed-Windows"], "2025-02-01/2025-02-28")
+
+    def test_csv_export_streams_windows_in_order_and_reports_failures_last(self):
+        resp = self.client.get(
+            f"/api/charger/{self.charger_id}/charge-history/",
+            {"startDate": "2025-01-01", "endDate": "2025-04-30", "format": "csv"},
+        )
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.streaming)
+        lines = b"".join(resp.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], "transactionId,startTime")
+        self.assertEqual([line.split(",")[0] for line in lines[1:-1]], ["1", "2", "3", "4"])
+        self.assertEqual(lines[-1], "# failed windows: 2025-02-01/2025-02-28")
+
+    def test_every_window_failing_is_an_error(self):
+        self.stub.responder = lambda path: (500, {"error": "boom"})
+        resp = self.client.get(
+            f"/api/charger/{self.charger_id}/charge-history/",
+            {"startDate": "2025-01-01", "endDate": "2025-03-31"},
+        )
+        self.assertEqual(resp.status_code, 502)
+
+
+def daily_sessions(path):
+    """Stub responder: one session at 08:00 UTC on every day in [startDate, endDate)."""
+    query = parse_qs(urlsplit(path).query)
+    start = datetime.fromisoformat(query["startDate"][0].replace("Z", "+00:00"))
+    end = datetime.fromisoformat(query["endDate"][0].replace("Z", "+00:00"))
+    day = start.replace(hour=8, minute=0, second=0, microsecond=0)
+    day = day if day >= start else day + timedelta(days=1)
+    records = []
+    while day < end:
+        records.append({"transactionId": int(day.timestamp()), "idTag": f"TAG{day.day % 2}",
+                        "startTime": day.isoformat().replace("+00:00", "Z")})
+        day += timedelta(days=1)
+    return 200, records
+
+
+class ChargeHistoryStoreTests(TestCase):
+    charger_id = "0f8fad5b-d9cb-469f-a165-70867728950e"
+    url = f"/api/charger/{charger_id}/charge-history/"
+
+    def setUp(self):
+        self.stub = StubEVAdvisor(responder=daily_sessions)
+        self.addCleanup(self.stub.close)
+        overrides = override_settings(
+            EXTERNAL_API_BASE_URL=self.stub.base_url,
+            EXTERNAL_API_KEY="test-key",
+            EXTERNAL_API_HISTORY_WINDOW="month",
+            EXTERNAL_API_HISTORY_STORE_ENABLED=True,
+            EXTERNAL_API_HISTORY_SETTLE_HOURS=48,
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        EVAdvisorClient.reset_shared()
+        self.addCleanup(EVAdvisorClient.reset_shared)
+
+    def test_settled_range_is_served_locally_after_first_query(self):
+        resp = self.client.get(self.url, {"startDate": "2025-01-01", "endDate": "2025-02-28"})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(resp.json()), 59)
+        self.assertEqual(self.stub.total_hits(), 2)
+
+        resp = self.client.get(self.url, {"startDate": "2025-01-10", "endDate": "2025-01-19", "idTag": "TAG0"})
+        self.assertEqual([r["startTime"][:10] for r in resp.json()],
+                         ["2025-01-10", "2025-01-12", "2025-01-14", "2025-01-16", "2025-01-18"])
+        self.assertEqual(self.stub.total_hits(), 2)
+
+        # Extending the range fetches only what follows the synced span.
+        self.client.get(self.url, {"startDate": "2025-02-01", "endDate": "2025-03-31"})
+        self.assertEqual(self.stub.total_hits(), 3)
+        self.assertTrue(any("startDate=2025-03-01T00%3A00%3A00Z" in p for p in self.stub.hits))
+        self.assertEqual(ChargeSession.objects.filter(charger_id=self.charger_id).count(), 31 + 28 + 31)
+
+    def test_query_detached_from_the_synced_span_fetches_only_its_range(self):
+        self.client.get(self.url, {"startDate": "2025-01-01", "endDate": "2025-01-31"})
+        state = ChargeHistorySync.objects.get(charger_id=self.charger_id)
+        stored, hits = ChargeSession.objects.count(), self.stub.total_hits()
+
+        resp = self.client.get(self.url, {"startDate": "2025-06-01", "endDate": "2025-06-10"})
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.json())
+        self.assertEqual(self.stub.total_hits(), hits + 1)  # June only, not the February..May gap
+        self.assertTrue(any("startDate=2025-06-01" in p for p in self.stub.hits))
+        self.assertEqual(ChargeSession.objects.count(), stored)  # nothing written on the request path
+        self.assertEqual(ChargeHistorySync.objects.get(charger_id=self.charger_id).synced_until, state.synced_until)
+
+    def test_gzipped_ndjson_export(self):
+        resp = self.client.get(
+            self.url, {"startDate": "2024-01-01", "endDate": "2025-12-31", "format": "ndjson"},
+            HTTP_ACCEPT_ENCODING="gzip",
+        )
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp["Content-Encoding"], "gzip")
+        lines = gzip.decompress(b"".join(resp.streaming_content)).decode().splitlines()
+        self.assertEqual(len(lines), 731)
+        starts = [json.loads(line)["startTime"] for line in lines]
+        self.assertEqual(starts, sorted(starts))
+        self.assertEqual(resp["X-Charge-History-Windows"], "24")
+
+    def test_recent_tail_is_always_refetched(self):
+        today = datetime.now(timezone.utc).date()
+        params = {"startDate": (today - timedelta(days=10)).isoformat(), "endDate": today.isoformat()}
+        self.client.get(self.url, params)
+        state = ChargeHistorySync.objects.get(charger_id=self.charger_id)
+        self.assertLessEqual(state.synced_until, datetime.now(timezone.utc) - timedelta(hours=48))
+
+        hits = self.stub.total_hits()
+        resp = self.client.get(self.url, params)
+        self.assertEqual(len(resp.json()), 10 + (datetime.now(timezone.utc).hour >= 8))
+        self.assertGreater(self.stub.total_hits(), hits)
+
+    def test_management_command_backfills_many_chargers(self):
+        other = "1b4e28ba-2fa1-11d2-883f-0016d3cca427"
+        out = io.StringIO()
+        call_command("sync_charge_history", self.charger_id, other, "--since", "2025-06-01", stdout=out)
+        self.assertIn("Synced 2/2 chargers", out.getvalue())
+        self.assertEqual(ChargeHistorySync.objects.count(), 2)
+        hits = self.stub.total_hits()
+
+        call_command("sync_charge_history", self.charger_id, other, "--since", "2025-06-01", stdout=io.StringIO())
+        # Second run only asks for the unsettled tail.
+        self.assertEqual(self.stub.total_hits() - hits, 2)
+
+
+class RetryAndCircuitBreakerTests(SimpleTestCase):
+    charger_id = "0f8fad5b-d9cb-469f-a165-70867728950e"
+
+    def setUp(self):
+        self.statuses = []
+        self.stub = StubEVAdvisor(responder=self.respond)
+        self.addCleanup(self.stub.close)
+
+    def respond(self, path):
+        status = self.statuses.pop(0) if self.statuses else 200
+        return status, {"path": path}, ({"Retry-After": "30"} if status == 429 else {})
+
+    def make_client(self, **kwargs):
+        kwargs.setdefault("retry_policy", RetryPolicy(retries=2, base_delay=0.01, max_delay=0.05))
+        kwargs.setdefault("breakers", Breakers(failure_threshold=2, cooldown=0.3))
+        client = EVAdvisorClient(self.stub.base_url, "test-key", **kwargs)
+        self.addCleanup(client.close)
+        return client
+
+    def test_server_errors_are_retried_with_backoff(self):
+        self.statuses = [503, 500]
+        client = self.make_client()
+        self.assertIn("cloudstatus", client.get_cloud_status(self.charger_id)["path"])
+        self.assertEqual(self.stub.total_hits(), 3)
+
+    def test_long_retry_after_is_not_waited_for(self):
+        self.statuses = [429]
+        with self.assertRaises(RuntimeError):
+            self.make_client().get_cloud_status(self.charger_id)
+        self.assertEqual(self.stub.total_hits(), 1)
+
+    def test_retry_budget_caps_retries(self):
+        self.statuses = [503] * 10
+        client = self.make_client(retry_budget=RetryBudget(ratio=0, reserve=1), breakers=Breakers(100))
+        for _ in range(3):
+            with self.assertRaises(RuntimeError):
+                client.get_cloud_status(self.charger_id)
+        self.assertEqual(self.stub.total_hits(), 4)  # 3 first attempts + the one budgeted retry
+
+    def test_circuit_opens_fails_fast_and_recovers_through_half_open_probe(self):
+        self.statuses = [503] * 6
+        client = self.make_client(retry_policy=RetryPolicy(retries=0))
+        for _ in range(2):
+            with self.assertRaises(RuntimeError):
+                client.get_cloud_status(self.charger_id)
+        with self.assertRaises(UpstreamUnavailable):
+            client.get_cloud_status(self.charger_id)
+        self.assertEqual(self.stub.total_hits(), 2)
+        # Other endpoints have their own circuit.
+        self.statuses = []
+        client.get_capabilities(self.charger_id)
+
+        time.sleep(0.35)
+        client.get_cloud_status(self.charger_id)  # probe succeeds, circuit closes
+        self.assertEqual(client.stats()["breakers"]["cloudstatus"]["state"], "closed")
+
+    def test_open_circuit_is_a_503_with_retry_after(self):
+        self.statuses = [503] * 10
+        overrides = override_settings(
+            EXTERNAL_API_BASE_URL=self.stub.base_url,
+            EXTERNAL_API_KEY="test-key",
+            EXTERNAL_API_RETRIES=0,
+            EXTERNAL_API_BREAKER_FAILURES=1,
+            EXTERNAL_API_BREAKER_COOLDOWN=30,
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        EVAdvisorClient.reset_shared()
+        self.addCleanup(EVAdvisorClient.reset_shared)
+
+        self.assertEqual(self.client.get(f"/api/charger/{self.charger_id}/cloudstatus/").status_code, 502)
+        resp = self.client.get(f"/api/charger/{self.charger_id}/cloudstatus/")
+        self.assertEqual(resp.status_code, 503)
+        self.assertEqual(resp["Retry-After"], "30")
+
+
+
+class DeadlineAndHedgingTests(SimpleTestCase):
+    charger_id = "0f8fad5b-d9cb-469f-a165-70867728950e"
+
+    def setUp(self):
+        self.delays = []  # seconds to stall each request, in arrival order
+        self._lock = threading.Lock()
+        self.stub = StubEVAdvisor(responder=self.respond)
+        self.addCleanup(self.stub.close)
+
+    def respond(self, path):
+        with self._lock:
+            delay = self.delays.pop(0) if self.delays else 0.0
+        time.sleep(delay)
+        return 200, {"path": path}
+
+    def make_client(self, **kwargs):
+        kwargs.setdefault("retry_policy", RetryPolicy(retries=2, base_delay=0.01, max_delay=0.05))
+        client = EVAdvisorClient(self.stub.base_url, "test-key", timeout=5, **kwargs)
+        self.addCleanup(client.close)
+        return client
+
+    def hedging(self):
+        policy = HedgePolicy(enabled=True, min_delay=0.05, min_samples=1)
+        policy.observe("cloudstatus", 0.01)
+        return policy
+
+    def test_attempts_shrink_to_the_deadline(self):
+        self.delays = [1.0, 1.0, 1.0]
+        client = self.make_client()
+        t0 = time.monotonic()
+        with resilience.deadline(0.3), self.assertRaises(DeadlineExceeded):
+            client.get_cloud_status(self.charger_id)
+        self.assertLess(time.monotonic() - t0, 0.8)
+        self.assertEqual(self.stub.total_hits(), 1)
+        # Running out of time says nothing about upstream's health.
+        self.assertEqual(client.stats()["breakers"]["cloudstatus"]["consecutive_failures"], 0)
+
+    def test_coalesced_callers_keep_their_own_deadlines(self):
+        self.delays = [0.5, 0.5]
+        client = self.make_client()
+        outcomes = {}
+
+        def call(name, budget):
+            with resilience.deadline(budget):
+                t0 = time.monotonic()
+                try:
+                    outcomes[name] = client.get_cloud_status(self.charger_id)["path"]
+                except DeadlineExceeded as exc:
+                    outcomes[name] = exc
+                outcomes[f"{name}_seconds"] = time.monotonic() - t0
+
+        # The patient caller leads the shared call; the impatient one joins and gives up.
+        patient = threading.Thread(target=call, args=("patient", 5))
+        patient.start()
+        time.sleep(0.05)
+        call("impatient", 0.1)
+        patient.join()
+        self.assertIsInstance(outcomes["impatient"], DeadlineExceeded)
+        self.assertLess(outcomes["impatient_seconds"], 0.4)
+        self.assertIn("cloudstatus", outcomes["patient"])
+        self.assertEqual(self.stub.total_hits(), 1)
+
+        # The impatient caller leads: its attempt times out, and the call retries under the patient one's deadline.
+        self.delays = [0.5, 0.0]
+        impatient = threading.Thread(target=call, args=("impatient", 0.1))
+        impatient.start()
+        time.sleep(0.05)
+        call("patient", 5)
+        impatient.join()
+        self.assertIsInstance(outcomes["impatient"], DeadlineExceeded)
+        self.assertIn("cloudstatus", outcomes["patient"])
+
+        from .services.ev_advisor_async import AsyncEVAdvisorClient
+
+        self.delays = [0.5]
+
+        async def main():
+            aclient = AsyncEVAdvisorClient(self.stub.base_url, "test-key", timeout=5, retries=0)
+
+            async def acall(budget):
+                with resilience.deadline(budget):
+                    return await aclient.get_cloud_status(self.charger_id)
+
+            try:
+                return await asyncio.gather(acall(5), acall(0.1), return_exceptions=True)
+            finally:
+                await aclient.aclose()
+
+        hits = self.stub.total_hits()
+        patient, impatient = asyncio.run(main())
+        self.assertIsInstance(impatient, DeadlineExceeded)
+        self.assertIn("cloudstatus", patient["path"])
+        self.assertEqual(self.stub.total_hits(), hits + 1)
+
+    def test_abandoned_shared_call_starts_no_attempt_after_the_last_deadline(self):
+        arrivals = []
+
+        def respond(path):
+            arrivals.append(time.monotonic())
+            time.sleep(0.3)
+            return 503, {"error": "busy"}
+
+        self.stub.responder = respond
+        client = self.make_client()
+        t0 = time.monotonic()
+        with resilience.deadline(0.5), self.assertRaises(DeadlineExceeded):
+            client.get_cloud_status(self.charger_id)
+        time.sleep(0.8)  # the shared call outlives its only caller
+        self.assertTrue(arrivals)
+        self.assertTrue(all(t < t0 + 0.5 for t in arrivals), [round(t - t0, 2) for t in arrivals])
+
+        from .services.ev_advisor_async import AsyncEVAdvisorClient
+
+        async def main():
+            aclient = AsyncEVAdvisorClient(
+                self.stub.base_url, "test-key", timeout=5,
+                retry_policy=RetryPolicy(retries=2, base_delay=0.01, max_delay=0.05),
+            )
+            try:
+                with resilience.deadline(0.5), self.assertRaises(DeadlineExceeded):
+                    await aclient.get_cloud_status(self.charger_id)
+                await asyncio.sleep(0.8)
+            finally:
+                await aclient.aclose()
+
+        arrivals.clear()
+        t0 = time.monotonic()
+        asyncio.run(main())
+        self.assertTrue(arrivals)
+        self.assertTrue(all(t < t0 + 0.5 for t in arrivals), [round(t - t0, 2) for t in arrivals])
+
+    def test_request_deadline_is_a_504_and_clients_can_shorten_it(self):
+        self.delays = [1.0]
+        with override_settings(
+            EXTERNAL_API_BASE_URL=self.stub.base_url, EXTERNAL_API_KEY="test-key", EXTERNAL_API_DEADLINE=15,
+            EXTERNAL_API_CACHE_ENABLED=False,
+        ):
+            EVAdvisorClient.reset_shared()
+            self.addCleanup(EVAdvisorClient.reset_shared)
+            t0 = time.monotonic()
+            resp = self.client.get(f"/api/charger/{self.charger_id}/cloudstatus/", HTTP_X_REQUEST_TIMEOUT="0.2")
+        self.assertEqual(resp.status_code, 504)
+        self.assertLess(time.monotonic() - t0, 0.8)
+
+    def test_slow_get_is_hedged_and_first_answer_wins(self):
+        self.delays = [1.0]  # the first copy stalls, the hedge answers at once
+        client = self.make_client(hedging=self.hedging())
+        t0 = time.monotonic()
+        self.assertIn("cloudstatus", client.get_cloud_status(self.charger_id)["path"])
+        self.assertLess(time.monotonic() - t0, 0.8)
+        self.assertEqual(self.stub.total_hits(), 2)
+        self.assertEqual((client.stats()["hedging"]["sent"], client.stats()["hedging"]["won"]), (1, 1))
+
+        # Endpoints without latency history are not hedged; without retry budget nothing is.
+        client.get_capabilities(self.charger_id)
+        self.assertEqual(self.stub.total_hits(), 3)
+        self.delays = [0.3]
+        self.make_client(hedging=self.hedging(), retry_budget=RetryBudget(ratio=0, reserve=0)).get_cloud_status(
+            self.charger_id
+        )
+        self.assertEqual(self.stub.total_hits(), 4)
+
+    def test_async_client_hedges_and_honours_the_deadline(self):
+        from .services.ev_advisor_async import AsyncEVAdvisorClient
+
+        async def main():
+            client = AsyncEVAdvisorClient(self.stub.base_url, "test-key", timeout=5, retries=2, hedging=self.hedging())
+            try:
+                t0 = time.monotonic()
+                body = await client.get_cloud_status(self.charger_id)
+                hedged_in = time.monotonic() - t0
+                with resilience.deadline(0.3):
+                    with self.assertRaises(DeadlineExceeded):
+                        await client.get_capabilities(self.charger_id)
+                return body, hedged_in, client.stats()["hedging"]
+            finally:
+                await client.aclose()
+
+        self.delays = [1.0, 0.0, 1.0]
+        body, hedged_in, stats = asyncio.run(main())
+        self.assertIn("cloudstatus", body["path"])
+        self.assertLess(hedged_in, 0.8)
+        self.assertEqual((stats["sent"], stats["won"]), (1, 1))
+
+
+class AdmissionControlTests(SimpleTestCase):
+    charger_id = "0f8fad5b-d9cb-469f-a165-70867728950e"
+
+    def hold(self, limiter, release: threading.Event):
+        """Occupy one limiter slot on another thread until `release` is set."""
+        held = threading.Event()
+
+        def run():
+            with limiter.slot():
+                held.set()
+                release.wait(5)
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(release.set)
+        held.wait(5)
+
+    def test_callers_queue_fifo_and_overflow_fails_fast(self):
+        limiter = admission.ConcurrencyLimiter(limit=1, max_queue=1, max_wait=2.0)
+        release = threading.Event()
+        self.hold(limiter, release)
+
+        order = []
+        waiter = threading.Thread(target=lambda: (limiter.acquire(), order.append("queued"), limiter.release(None)))
+        waiter.start()
+        time.sleep(0.05)
+        t0 = time.monotonic()
+        with self.assertRaises(admission.UpstreamSaturated) as ctx:
+            limiter.acquire()  # the queue (of one) is full
+        self.assertLess(time.monotonic() - t0, 0.1)
+        self.assertEqual(ctx.exception.retry_after, 1.0)
+        release.set()
+        waiter.join(5)
+        self.assertEqual(order, ["queued"])
+        self.assertEqual(limiter.stats()["in_flight"], 0)
+
+    def test_wait_is_bounded_by_the_request_deadline(self):
+        limiter = admission.ConcurrencyLimiter(limit=1, max_queue=8, max_wait=5.0)
+        self.hold(limiter, threading.Event())
+        t0 = time.monotonic()
+        with resilience.deadline(0.2), self.assertRaises(admission.UpstreamSaturated):
+            limiter.acquire()
+        self.assertLess(time.monotonic() - t0, 1.0)
+        self.assertEqual(limiter.stats()["waiting"], 0)
+
+    def test_async_waiters_share_the_queue_with_threads(self):
+        limiter = admission.ConcurrencyLimiter(limit=1, max_queue=8, max_wait=5.0)
+        release = threading.Event()
+        self.hold(limiter, release)
+
+        async def main():
+            threading.Timer(0.1, release.set).start()
+            t0 = time.monotonic()
+            async with limiter.aslot():
+                return time.monotonic() - t0
+
+        self.assertGreaterEqual(asyncio.run(main()), 0.05)
+        self.assertEqual(limiter.stats()["in_flight"], 0)
+
+    def test_host_slots_are_shared_between_processes(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        # Two HostSlots open the files separately, like two worker processes.
+        mine, theirs = admission.HostSlots(tmp.name, 1), admission.HostSlots(tmp.name, 1)
+        held = theirs.try_acquire()
+        self.assertIsNotNone(held)
+        limiter = admission.ConcurrencyLimiter(limit=4, max_wait=0.1, host_slots=mine)
+        with self.assertRaises(admission.UpstreamSaturated):
+            limiter.acquire()
+        self.assertEqual(limiter.stats()["in_flight"], 0)
+        theirs.release(held)
+        with limiter.slot():
+            self.assertIsNone(theirs.try_acquire())
+
+    def test_saturated_upstream_is_a_503_and_does_not_trip_the_breaker(self):
+        stub = StubEVAdvisor(delay=0.5)
+        self.addCleanup(stub.close)
+        overrides = override_settings(
+            EXTERNAL_API_BASE_URL=stub.base_url, EXTERNAL_API_KEY="test-key", EXTERNAL_API_CACHE_ENABLED=False,
+            EXTERNAL_API_MAX_IN_FLIGHT=1, EXTERNAL_API_MAX_IN_FLIGHT_HOST=0, EXTERNAL_API_QUEUE_MAX=0,
+            EXTERNAL_API_BREAKER_FAILURES=1,
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        admission.reset()
+        self.addCleanup(admission.reset)
+        EVAdvisorClient.reset_shared()
+        self.addCleanup(EVAdvisorClient.reset_shared)
+
+        busy = threading.Thread(target=EVAdvisorClient.shared().get_capabilities, args=(self.charger_id,))
+        busy.start()
+        self.addCleanup(busy.join)
+        time.sleep(0.1)
+        resp = self.client.get(f"/api/charger/{self.charger_id}/cloudstatus/")
+        self.assertEqual(resp.status_code, 503)
+        self.assertEqual(resp["Retry-After"], "1")
+        self.assertEqual(stub.total_hits(), 1)
+        busy.join()
+        self.assertEqual(self.client.get(f"/api/charger/{self.charger_id}/cloudstatus/").status_code, 200)
+
+
+@override_settings(
+    EXTERNAL_API_BASE_URL="http://127.0.0.1:9", EXTERNAL_API_KEY="test-key", API_TOKEN_REVOCATION_REFRESH=3600,
+    API_RATE_LIMIT_USER_RATE=1, API_RATE_LIMIT_USER_BURST=3, API_RATE_LIMIT_TOKEN_RATE=1, API_RATE_LIMIT_TOKEN_BURST=2,
+    API_RATE_LIMIT_ANON_RATE=1, API_RATE_LIMIT_ANON_BURST=3,
+)
+class RateLimitTests(TestCase):
+    url = "/api/upstream/stats/"
+
+    def setUp(self):
+        self.user = User.objects.create_user("robot", password="pw", is_staff=True)
+        api_tokens.reset_verifier()
+        self.addCleanup(api_tokens.reset_verifier)
+        EVAdvisorClient.reset_shared()
+        self.addCleanup(EVAdvisorClient.reset_shared)
+        admission.reset()
+        self.addCleanup(admission.reset)
+
+    def get(self, token=None, addr="10.0.0.1", **headers):
+        if token:
+            headers["HTTP_AUTHORIZATION"] = f"Bearer {token}"
+        return self.client.get(self.url, REMOTE_ADDR=addr, **headers)
+
+    def test_token_and_user_buckets(self):
+        first, second = api_tokens.issue(self.user), api_tokens.issue(self.user)
+        self.assertEqual([self.get(first).status_code for _ in range(3)], [200, 200, 429])
+        resp = self.get(first)
+        self.assertEqual(resp.status_code, 429)
+        self.assertEqual(resp["Retry-After"], "1")
+        # Another token of the same user has its own bucket, but shares the user's.
+        self.assertEqual([self.get(second).status_code for _ in range(2)], [200, 429])
+
+    def test_anonymous_clients_are_limited_per_address(self):
+        statuses = [self.get().status_code for _ in range(4)]
+        self.assertEqual(statuses[-1], 429)
+        self.assertNotIn(429, statuses[:3])
+        self.assertNotEqual(self.get(addr="10.0.0.2").status_code, 429)
+
+    def test_anonymous_limit_can_be_off(self):
+        with self.settings(API_RATE_LIMIT_ANON_RATE=0):
+            self.assertNotIn(429, [self.get().status_code for _ in range(5)])
+
+    def test_trusted_proxy_header_names_the_client(self):
+        with self.settings(API_CLIENT_IP_HEADER="HTTP_X_FORWARDED_FOR"):
+            statuses = [self.get(HTTP_X_FORWARDED_FOR="6.6.6.6, 192.0.2.1").status_code for _ in range(4)]
+            self.assertEqual(statuses[-1], 429)
+            self.assertNotEqual(self.get(HTTP_X_FORWARDED_FOR="192.0.2.2").status_code, 429)  # same proxy, other client
+
+def metric_value(text, sample):
+    """Value of one exposition line, e.g. 'proxy_request_seconds_count{view="x",...}'."""
+    m = re.search(r"^" + re.escape(sample) + r" (\S+)$", text, re.M)
+    return float(m.group(1)) if m else 0.0
+
+
+class MetricsTests(SimpleTestCase):
+    charger_id = "0f8fad5b-d9cb-469f-a165-70867728950e"
+
+    def setUp(self):
+        self.stub = StubEVAdvisor(body=b"Z" * 1000)
+        self.addCleanup(self.stub.close)
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        overrides = override_settings(
+            EXTERNAL_API_BASE_URL=self.stub.base_url,
+            EXTERNAL_API_KEY="test-key",
+            METRICS_DIR=self.dir.name,
+            METRICS_TOKEN="",
+            OCPP_ARCHIVE_CACHE_ENABLED=False,
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        EVAdvisorClient.reset_shared()
+        self.addCleanup(EVAdvisorClient.reset_shared)
+
+    def test_proxy_and_upstream_metrics_exposed(self):
+        ocpp = f'proxy_streamed_bytes_total{{view="charger_ocpp_logs_latest"}}'
+        upstream = 'evadvisor_upstream_request_seconds_count{endpoint="ocpp_logs",status="200"}'
+        before = metrics.render_all()
+
+        resp = self.client.get(f"/api/charger/{self.charger_id}/ocpp-logs/")
+        b"".join(resp.streaming_content)
+        text = self.client.get("/metrics").content.decode()
+
+        self.assertIn("# TYPE proxy_request_seconds histogram", text)
+        self.assertEqual(metric_value(text, ocpp) - metric_value(before, ocpp), 1000)
+        self.assertEqual(metric_value(text, upstream) - metric_value(before, upstream), 1)
+        self.assertIn('proxy_request_seconds_bucket{view="charger_ocpp_logs_latest",method="GET",status="200",le="+Inf"}', text)
+
+    def test_cache_events_are_exported(self):
+        events = ("misses", "hits", "evictions", "invalidations")
+        sample = 'evadvisor_cache_events_total{{event="{}"}}'.format
+        before = metrics.render_all()
+        with self.settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+                                   "ev_advisor": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                                                  "LOCATION": "metrics-ev"}}):
+            cache = ResponseCache("ev_advisor", {"charger": 60})
+            cache.get_or_load("charger", "a", lambda: 1)
+            cache.get_or_load("charger", "a", lambda: 1)
+            cache.backend.delete(cache._key("charger", "a"))
+            cache.get_or_load("charger", "a", lambda: 1)
+            cache.invalidate("charger")
+
+        text = self.client.get("/metrics").content.decode()
+        deltas = {e: metric_value(text, sample(e)) - metric_value(before, sample(e)) for e in events}
+        self.assertEqual(deltas, {"misses": 2, "hits": 1, "evictions": 1, "invalidations": 1})
+        self.assertEqual(deltas["misses"], cache.stats()["misses"])
+
+    def test_snapshots_of_all_workers_are_summed(self):
+        sample = 'evadvisor_upstream_retries_total{endpoint="charger"}'
+        own = metric_value(metrics.render_all(), sample)
+        other = {"evadvisor_upstream_retries_total": {
+            "type": "counter", "help": "h", "labelnames": ["endpoint"], "buckets": [],
+            "samples": [[["charger"], 5]],
+        }}
+        with open(os.path.join(self.dir.name, "999999.json"), "w") as fh:
+            json.dump(other, fh)
+
+        text = self.client.get("/metrics").content.decode()
+        self.assertEqual(metric_value(text, sample), own + 5)
+        self.assertTrue(os.path.exists(os.path.join(self.dir.name, f"{os.getpid()}.json")))
+
+    def test_token_required_when_configured(self):
+        with self.settings(METRICS_TOKEN="s3cret"):
+            self.assertEqual(self.client.get("/metrics").status_code, 401)
+            resp = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer s3cret")
+            self.assertEqual(resp.status_code, 200)
+
+
+@override_settings(
+    EXTERNAL_API_BASE_URL="http://127.0.0.1:9", EXTERNAL_API_KEY="test-key", METRICS_TOKEN="",
+    SESSION_COOKIE_AGE=1800, SESSION_REFRESH_INTERVAL=60,
+)
+class SessionRefreshTests(TestCase):
+    keepalive = "/accounts/session/keepalive/"
+
+    def setUp(self):
+        User.objects.create_user("alice", password="pw", is_staff=True)
+        self.client.login(username="alice", password="pw")
+        EVAdvisorClient.reset_shared()
+        self.addCleanup(EVAdvisorClient.reset_shared)
+
+    def session_writes(self, path, status=200) -> int:
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.client.get(path).status_code, status)
+        return sum(1 for q in ctx.captured_queries
+                   if q["sql"].startswith(("UPDATE", "INSERT")) and "django_session" in q["sql"])
+
+    def test_expiry_is_written_at_most_once_per_interval(self):
+        self.assertEqual(self.session_writes(self.keepalive), 1)
+        self.assertEqual(self.session_writes(self.keepalive), 0)
+        self.assertEqual(self.session_writes(self.keepalive), 0)
+
+        session = self.client.session
+        session[REFRESHED_KEY] -= 61
+        session.save()
+        self.assertEqual(self.session_writes(self.keepalive), 1)
+
+    def test_api_routes_never_write_the_session(self):
+        session = self.client.session
+        session[REFRESHED_KEY] = 0
+        session.save()
+        self.assertEqual(self.session_writes("/api/upstream/stats/"), 0)
+        self.assertEqual(self.session_writes("/metrics"), 0)
+        self.assertEqual(self.session_writes(self.keepalive), 1)
+
+    def test_stored_expiry_covers_the_idle_timeout(self):
+        resp = self.client.get(self.keepalive)
+        self.assertEqual(resp.json()["idle_timeout"], 1800)
+        left = (Session.objects.get().expire_date - datetime.now(timezone.utc)).total_seconds()
+        self.assertGreater(left, 1800 + 59)
+
+    def test_anonymous_requests_create_no_sessions(self):
+        self.client.logout()
+        self.assertEqual(self.session_writes(self.keepalive, status=401), 0)
+        self.assertFalse(Session.objects.exists())
+
+
+@override_settings(
+    EXTERNAL_API_BASE_URL="http://127.0.0.1:9", EXTERNAL_API_KEY="test-key", API_AUTH_REQUIRED=True,
+    API_TOKEN_REVOCATION_REFRESH=3600,
+)
+class ApiTokenAuthTests(TestCase):
+    url = "/api/upstream/stats/"
+
+    def setUp(self):
+        self.user = User.objects.create_user("robot", password="pw", is_staff=True)
+        self.token = api_tokens.issue(self.user)
+        api_tokens.reset_verifier()
+        self.addCleanup(api_tokens.reset_verifier)
+        EVAdvisorClient.reset_shared()
+        self.addCleanup(EVAdvisorClient.reset_shared)
+
+    def get(self, token=None):
+        headers = {"HTTP_AUTHORIZATION": f"Bearer {token}"} if token else {}
+        return self.client.get(self.url, **headers)
+
+    def test_valid_token_is_verified_without_queries(self):
+        self.assertEqual(self.get(self.token).status_code, 200)  # loads the revocation list once
+        with self.assertNumQueries(0):
+            for _ in range(3):
+                self.assertEqual(self.get(self.token).status_code, 200)
+        self.assertEqual(api_tokens.verifier().stats()["hits"], 3)
+
+    def test_missing_bad_or_expired_tokens_are_rejected(self):
+        self.assertEqual(self.get().status_code, 401)
+        resp = self.get(self.token[:-2] + "xx")
+        self.assertEqual(resp.status_code, 401)
+        self.assertIn("invalid_token", resp["WWW-Authenticate"])
+        self.assertEqual(self.get(api_tokens.issue(self.user, ttl=-1)).status_code, 401)
+
+    def test_revoked_token_is_rejected(self):
+        self.assertEqual(self.get(self.token).status_code, 200)
+        call_command("api_token", "revoke", self.token, stdout=io.StringIO())
+        self.assertEqual(self.get(self.token).status_code, 401)
+        self.assertEqual(self.get(api_tokens.issue(self.user)).status_code, 200)
+
+    def test_session_login_still_works(self):
+        self.client.login(username="robot", password="pw")
+        self.assertEqual(self.get().status_code, 200)
+
+    def test_token_requests_skip_csrf(self):
+        client = self.client_class(enforce_csrf_checks=True)
+        resp = client.post("/api/upstream/cache/invalidate/", {"endpoint": "charger", "key": "x"},
+                           HTTP_AUTHORIZATION=f"Bearer {self.token}")
+        self.assertEqual(resp.status_code, 200)
+
+
+class SQLiteCacheTests(SimpleTestCase):
+    def make_cache(self, **options):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        options.setdefault("CULL_INTERVAL", 0)
+        return SQLiteCache(os.path.join(self.dir.name, "c.sqlite3"), {"OPTIONS": options})
+
+    def test_basic_operations_and_ttl(self):
+        cache = self.make_cache()
+        cache.set("a", {"x": 1}, timeout=60)
+        self.assertEqual(cache.get("a"), {"x": 1})
+        self.assertFalse(cache.add("a", "other"))
+        self.assertTrue(cache.add("b", 1))
+        self.assertEqual(cache.incr("b", 5), 6)
+        self.assertTrue(cache.delete("a"))
+        self.assertIsNone(cache.get("a"))
+
+        cache.set("gone", 1, timeout=0)
+        self.assertIsNone(cache.get("gone"))
+        self.assertTrue(cache.add("gone", 2))  # an expired row does not block add()
+        self.assertEqual(cache.get("gone"), 2)
+
+    def test_entries_are_visible_to_other_processes(self):
+        cache = self.make_cache()
+        cache.set("shared", "value")
+        pid = os.fork()
+        if pid == 0:  # child: a fresh connection on the same file
+            ok = cache.get("shared") == "value" and cache.add("n", 0) and cache.incr("n") == 1
+            os._exit(0 if ok else 1)
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(os.waitstatus_to_exitcode(status), 0)
+        self.assertEqual(cache.get("n"), 1)
+
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = self.make_cache(MAX_ENTRIES=10, ACCESS_RESOLUTION=0, CULL_TARGET=0.5)
+        for i in range(10):
+            cache.set(f"k{i}", i)
+        cache.get("k0")  # now the most recently used
+        cache.set("k10", 10)
+
+        kept = [k for k in (f"k{i}" for i in range(11)) if cache.has_key(k)]
+        self.assertEqual(len(kept), 5)
+        self.assertIn("k0", kept)
+        self.assertIn("k10", kept)
+        self.assertNotIn("k1", kept)
+
+    def test_byte_cap(self):
+        cache = self.make_cache(MAX_BYTES=10_000, CULL_TARGET=1.0)
+        for i in range(20):
+            cache.set(f"k{i}", b"x" * 1000)
+        self.assertLess(sum(cache.has_key(f"k{i}") for i in range(20)), 10)
+        self.assertTrue(cache.has_key("k19"))
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "rc"},
+                            "ev_advisor": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "rc-ev"}})
+class ResponseCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.now = 1_000_000.0
+        clock = mock.patch("time.time", side_effect=lambda: self.now)
+        clock.start()
+        self.addCleanup(clock.stop)
+        self.calls = []
+
+    def make_cache(self, stale_ttl=30):
+        cache = ResponseCache("ev_advisor", {"charger": 60, "capabilities": 60}, negative_ttl=5, stale_ttl=stale_ttl)
+        cache.backend.clear()
+        return cache
+
+    def loader(self, value, gate=None):
+        def load():
+            self.calls.append(value)
+            if gate is not None:
+                gate.wait(5)
+            if isinstance(value, Exception):
+                raise value
+            return value
+        return load
+
+    def wait_for(self, cache, counter, expected=1):
+        for _ in range(500):
+            if cache.stats()[counter] >= expected:
+                return
+            time.sleep(0.01)
+        self.fail(f"{counter} never reached {expected}")
+
+    def test_entries_are_fresh_for_the_endpoint_ttl(self):
+        cache = self.make_cache(stale_ttl=0)
+        self.assertEqual(cache.get_or_load("charger", "a", self.loader({"v": 1})).value, {"v": 1})
+        self.now += 59
+        self.assertEqual(cache.get_or_load("charger", "a", self.loader({"v": 2})).value, {"v": 1})
+        self.now += 2
+        self.assertEqual(cache.get_or_load("charger", "a", self.loader({"v": 3})).value, {"v": 3})
+        self.assertEqual(self.calls, [{"v": 1}, {"v": 3}])
+        self.assertEqual(cache.get_or_load("status", "a", self.loader({"v": 4})), {"v": 4})  # no TTL: never cached
+        self.assertIsNone(cache.peek("status", "a"))
+
+    def test_404s_are_cached_for_the_shorter_negative_ttl(self):
+        cache = self.make_cache(stale_ttl=0)
+        missing = FileNotFoundError("no such charger")
+        with self.assertRaisesRegex(FileNotFoundError, "no such charger"):
+            cache.get_or_load("charger", "gone", self.loader(missing))
+        cache.get_or_load("charger", "here", self.loader({"v": 1}))
+        self.now += 4
+        with self.assertRaises(FileNotFoundError):
+            cache.get_or_load("charger", "gone", self.loader(missing))
+        self.now += 2  # past the negative TTL, well within the endpoint TTL
+        self.assertEqual(cache.get_or_load("charger", "gone", self.loader({"v": 2})).value, {"v": 2})
+        self.assertEqual(cache.get_or_load("charger", "here", self.loader({"v": 3})).value, {"v": 1})
+        self.assertEqual(self.calls, [missing, {"v": 1}, {"v": 2}])
+
+    def test_stale_entry_is_served_while_one_background_refresh_runs(self):
+        cache = self.make_cache()
+        cache.get_or_load("charger", "a", self.loader({"v": 1}))
+        self.now += 61
+        gate = threading.Event()
+        for _ in range(3):
+            self.assertEqual(cache.get_or_load("charger", "a", self.loader({"v": 2}, gate)).value, {"v": 1})
+        gate.set()
+        self.wait_for(cache, "refreshes")
+        self.assertEqual(cache.get_or_load("charger", "a", self.loader({"v": 3})).value, {"v": 2})
+        self.assertEqual(self.calls, [{"v": 1}, {"v": 2}])
+
+        self.now += 61 + 31  # past the serve-stale window: a plain miss
+        self.assertEqual(cache.get_or_load("charger", "a", self.loader({"v": 4})).value, {"v": 4})
+
+    def test_invalidate_one_key_or_a_whole_endpoint(self):
+        cache = self.make_cache()
+        for endpoint, key in (("charger", "a"), ("charger", "b"), ("capabilities", "a")):
+            cache.get_or_load(endpoint, key, self.loader(1))
+        self.calls.clear()
+
+        cache.invalidate("charger", "a")
+        self.assertEqual(cache.get_or_load("charger", "a", self.loader(2)).value, 2)
+        self.assertEqual(cache.get_or_load("charger", "b", self.loader(2)).value, 1)
+        cache.invalidate("charger")
+        self.assertEqual(cache.get_or_load("charger", "a", self.loader(3)).value, 3)
+        self.assertEqual(cache.get_or_load("charger", "b", self.loader(3)).value, 3)
+        self.assertEqual(cache.get_or_load("capabilities", "a", self.loader(3)).value, 1)
+        self.assertEqual(self.calls, [2, 3, 3])
+
+    def test_async_access_keeps_the_backend_off_the_event_loop(self):
+        from django.core.cache.backends.locmem import LocMemCache
+
+        cache = self.make_cache()
+        threads = []
+
+        def spy(original):
+            def call(backend, *args, **kwargs):
+                threads.append(threading.get_ident())
+                return original(backend, *args, **kwargs)
+            return call
+
+        async def load():
+            return {"v": 1}
+
+        async def main():
+            first = await cache.aget_or_load("charger", "a", load)
+            again = await cache.aget_or_load("charger", "a", load)
+            await cache.aremember("status", "a", Representation.of({"v": 2}, '"e1"'))
+            return threading.get_ident(), first, again, await cache.apeek("status", "a")
+
+        with mock.patch.object(LocMemCache, "get", spy(LocMemCache.get)), \
+                mock.patch.object(LocMemCache, "set", spy(LocMemCache.set)):
+            loop_thread, first, again, held = asyncio.run(main())
+        self.assertEqual((first.value, again.value, held.value), ({"v": 1}, {"v": 1}, {"v": 2}))
+        self.assertTrue(threads)
+        self.assertNotIn(loop_thread, threads)
+
+    def test_stats_count_every_outcome(self):
+        cache = self.make_cache()
+        cache.get_or_load("charger", "a", self.loader(1))  # miss
+        cache.get_or_load("charger", "a", self.loader(1))  # hit
+        with self.assertRaises(FileNotFoundError):
+            cache.get_or_load("charger", "gone", self.loader(FileNotFoundError("gone")))  # miss
+        with self.assertRaises(FileNotFoundError):
+            cache.get_or_load("charger", "gone", self.loader(FileNotFoundError("gone")))  # negative hit
+        cache.backend.delete(cache._key("charger", "a"))
+        cache.get_or_load("charger", "a", self.loader(1))  # miss, dropped before expiry: an eviction
+        self.now += 61
+        with self.assertLogs("api_app.services.ev_advisor", "WARNING"):
+            cache.get_or_load("charger", "a", self.loader(RuntimeError("upstream down")))  # stale hit
+            self.wait_for(cache, "refresh_failures")
+        cache.get_or_load("charger", "a", self.loader(2))  # stale hit
+        self.wait_for(cache, "refreshes")
+        cache.invalidate("charger")
+
+        self.assertEqual(cache.stats(), {
+            "hits": 1, "stale_hits": 2, "negative_hits": 1, "misses": 3, "evictions": 1,
+            "refreshes": 1, "refresh_failures": 1, "invalidations": 1, "hit_ratio": round(4 / 7, 4),
+        })
+
+
+class ConditionalRequestTests(SimpleTestCase):
+    charger_id = "0f8fad5b-d9cb-469f-a165-70867728950e"
+
+    def respond(self, path):
+        etag = f'"v{self.version}"'
+        if self.stub.request_headers[-1].get("If-None-Match") == etag:
+            return 304, None, {"ETag": etag}
+        return 200, {"chargerId": self.charger_id, "version": self.version, **self.extra}, {"ETag": etag}
+
+    def setUp(self):
+        self.version = 1
+        self.extra = {}
+        self.stub = StubEVAdvisor(responder=self.respond)
+        self.addCleanup(self.stub.close)
+        overrides = override_settings(
+            EXTERNAL_API_BASE_URL=self.stub.base_url,
+            EXTERNAL_API_KEY="test-key",
+            EXTERNAL_API_CACHE_ENABLED=True,
+            CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "cond"},
+                    "ev_advisor": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "cond-ev"}},
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        EVAdvisorClient.reset_shared()
+        self.addCleanup(EVAdvisorClient.reset_shared)
+
+    def test_cloudstatus_is_revalidated_upstream_and_answers_304(self):
+        url = f"/api/charger/{self.charger_id}/cloudstatus/"
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+        self.assertTrue(first["ETag"].startswith('"'))
+
+        second = self.client.get(url, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second.content, b"")
+        self.assertEqual(second["ETag"], first["ETag"])
+        self.assertEqual(self.stub.request_headers[-1].get("If-None-Match"), '"v1"')
+
+        self.version = 2
+        third = self.client.get(url, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(third.status_code, 200)
+        self.assertEqual(third.json()["version"], 2)
+        self.assertNotEqual(third["ETag"], first["ETag"])
+
+    def test_cached_capabilities_answer_304_without_upstream(self):
+        url = f"/api/charger/{self.charger_id}/capabilities/"
+        etag = self.client.get(url)["ETag"]
+        resp = self.client.get(url, HTTP_IF_NONE_MATCH=f'W/"other", {etag}')
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(self.stub.total_hits(), 1)
+
+
+    def test_cached_gzip_variant_has_its_own_etag(self):
+        url = "/api/charger/9d2f6a3e-4b1c-4c55-9f5e-2a7d8e1b0c43/capabilities/"  # not cached by other tests
+        self.extra = {"connectors": [{"id": n, "type": "Type2", "maxCurrent": 32} for n in range(50)]}
+        with override_settings(EXTERNAL_API_COMPRESS_MIN_BYTES=256):
+            plain = self.client.get(url, HTTP_ACCEPT_ENCODING="identity")
+            packed = self.client.get(url, HTTP_ACCEPT_ENCODING="gzip;q=0.5, deflate")
+            self.assertNotIn("Content-Encoding", plain)
+            self.assertEqual(packed["Content-Encoding"], "gzip")
+            self.assertIn("Accept-Encoding", packed["Vary"])
+            self.assertEqual(gzip.decompress(packed.content), plain.content)
+            self.assertNotEqual(packed["ETag"], plain["ETag"])
+
+            again = self.client.get(url, HTTP_ACCEPT_ENCODING="gzip", HTTP_IF_NONE_MATCH=packed["ETag"])
+            self.assertEqual(again.status_code, 304)
+            stale = self.client.get(url, HTTP_ACCEPT_ENCODING="gzip", HTTP_IF_NONE_MATCH=plain["ETag"])
+            self.assertEqual(stale.status_code, 200)
+        self.assertEqual(self.stub.total_hits(), 1)
+
+    def test_uncached_payload_is_compressed_only_when_asked(self):
+        url = f"/api/charger/{self.charger_id}/capabilities/"
+        self.extra = {"connectors": [{"id": n, "type": "Type2", "maxCurrent": 32} for n in range(50)]}
+        self.assertFalse(Representation.of(self.extra).variants)
+        with override_settings(EXTERNAL_API_CACHE_ENABLED=False, EXTERNAL_API_COMPRESS_MIN_BYTES=256), \
+                mock.patch.object(encoding, "compress", wraps=encoding.compress) as compress:
+            plain = self.client.get(url, HTTP_ACCEPT_ENCODING="identity")
+            self.assertEqual(compress.call_count, 0)
+            self.assertIn("Accept-Encoding", plain["Vary"])
+            packed = self.client.get(url, HTTP_ACCEPT_ENCODING="gzip")
+            self.assertEqual([c.args[1] for c in compress.call_args_list], ["gzip"])
+        self.assertEqual(packed["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(packed.content), plain.content)
+        self.assertEqual(self.stub.total_hits(), 2)
+
+
+class PassthroughTests(SimpleTestCase):
+    charger_id = "0f8fad5b-d9cb-469f-a165-70867728950e"
+
+    @staticmethod
+    def respond(path):
+        if "/charge/history" in path:
+            # Newest first: pass-through keeps upstream's order, the merged path sorts.
+            return 200, [{"transactionId": n, "startTime": f"2025-01-{n:02d}T08:00:00Z"} for n in range(20, 0, -1)]
+        return 200, {"chargerId": "0f8fad5b-d9cb-469f-a165-70867728950e", "model": "X"}
+
+    def setUp(self):
+        self.stub = StubEVAdvisor(responder=self.respond)
+        self.addCleanup(self.stub.close)
+        overrides = override_settings(
+            EXTERNAL_API_BASE_URL=self.stub.base_url,
+            EXTERNAL_API_KEY="test-key",
+            EXTERNAL_API_PASSTHROUGH=True,
+            EXTERNAL_API_COMPRESS_MIN_BYTES=256,
+            EXTERNAL_API_HISTORY_WINDOW="month",
+            EXTERNAL_API_HISTORY_STORE_ENABLED=False,
+            CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "pass"},
+                    "ev_advisor": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "pass-ev"}},
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        EVAdvisorClient.reset_shared()
+        self.addCleanup(EVAdvisorClient.reset_shared)
+
+    def history_url(self, end="2025-01-31", extra=""):
+        return f"/api/charger/{self.charger_id}/charge-history/?startDate=2025-01-01&endDate={end}{extra}"
+
+    def test_single_window_history_is_upstream_bytes(self):
+        upstream = json.dumps(self.respond("/charge/history")[1]).encode()
+        resp = self.client.get(self.history_url(), HTTP_ACCEPT_ENCODING="identity")
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.content, upstream)
+        self.assertEqual(resp["Content-Type"], "application/json")
+        self.assertEqual(resp["X-Charge-History-Windows"], "1")
+
+        packed = self.client.get(self.history_url(), HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(packed["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(packed.content), upstream)
+
+    def test_multi_window_and_envelope_are_merged(self):
+        resp = self.client.get(self.history_url(end="2025-02-28"))
+        self.assertEqual(resp["X-Charge-History-Windows"], "2")
+        self.assertEqual([r["transactionId"] for r in resp.json()], list(range(1, 21)))
+        resp = self.client.get(self.history_url(extra="&envelope=1"))
+        self.assertEqual(resp.json()["windows"], 1)
+
+    def test_non_array_history_is_rejected(self):
+        self.stub.responder = lambda path: (200, {"unexpected": True})
+        resp = self.client.get(self.history_url())
+        self.assertEqual(resp.status_code, 502)
+
+    def test_lookup_sends_upstream_bytes(self):
+        resp = self.client.get(f"/api/charger/{self.charger_id}/capabilities/")
+        self.assertEqual(resp.content, json.dumps(self.respond("/capabilities")[1]).encode())
+        self.assertTrue(resp["ETag"].startswith('"'))
+
+
+class StatusWatchTests(SimpleTestCase):
+    charger_id = "0f8fad5b-d9cb-469f-a165-70867728950e"
+
+    def respond(self, path):
+        if self.status != 200:
+            return self.status, {"error": "gone"}
+        return 200, {"chargerId": self.charger_id, "online": self.online, "firmware": "1.2"}
+
+    def setUp(self):
+        self.status, self.online = 200, True
+        self.stub = StubEVAdvisor(responder=self.respond)
+        self.addCleanup(self.stub.close)
+        overrides = override_settings(
+            EXTERNAL_API_BASE_URL=self.stub.base_url,
+            EXTERNAL_API_KEY="test-key",
+            EXTERNAL_API_RETRIES=0,
+            EXTERNAL_API_CACHE_ENABLED=False,
+            CLOUDSTATUS_POLL_INTERVAL=60,
+            CLOUDSTATUS_STREAM_KEEPALIVE=0.1,
+            CLOUDSTATUS_STREAM_MAX_AGE=1,
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        EVAdvisorClient.reset_shared()
+        self.addCleanup(EVAdvisorClient.reset_shared)
+        status_watch.reset_watcher()
+        self.addCleanup(status_watch.reset_watcher)
+
+    def watcher(self, **kwargs):
+        watcher = status_watch.StatusWatcher(interval=60, **kwargs)
+        self.addCleanup(watcher.stop)
+        return watcher
+
+    def test_viewers_share_one_poll_and_receive_diffs(self):
+        watcher = self.watcher()
+        subs = [watcher.subscribe(self.charger_id) for _ in range(3)]
+        for sub in subs:
+            event = sub.get(timeout=5)
+            self.assertEqual(event.kind, "snapshot")
+            self.assertEqual(event.data["status"]["online"], True)
+
+        self.online = False
+        watcher.poll_once()
+        for sub in subs:
+            event = sub.get(timeout=1)
+            self.assertEqual(event.kind, "change")
+            self.assertEqual(event.data, {"chargerId": self.charger_id, "changed": {"online": False}, "removed": []})
+        watcher.poll_once()  # unchanged: no event
+        self.assertIsNone(subs[0].get(timeout=0.1))
+        self.assertEqual(self.stub.total_hits(), 3)
+
+        self.status = 404
+        watcher.poll_once()
+        self.assertEqual(subs[0].get(timeout=1).data["status"], 404)
+        self.status = 200
+        watcher.poll_once()
+        self.assertEqual(subs[0].get(timeout=1).kind, "snapshot")
+
+        for sub in subs:
+            watcher.unsubscribe(sub)
+        self.assertEqual(watcher.watched(), [])
+
+    def test_pinned_chargers_are_polled_without_viewers(self):
+        from django.core.signals import request_started
+
+        with self.settings(CLOUDSTATUS_WATCH_CHARGERS=(self.charger_id,), METRICS_TOKEN=""):
+            request_started.connect(status_watch.start_pinned)  # as ApiAppConfig.ready does when chargers are pinned
+            self.addCleanup(request_started.disconnect, status_watch.start_pinned)
+            self.client.get("/metrics")  # any request
+            watcher = status_watch.current()
+            self.assertIsNotNone(watcher)
+            for _ in range(500):
+                if watcher.latest(self.charger_id) is not None:
+                    break
+                time.sleep(0.01)
+            self.assertIs(watcher.latest(self.charger_id).value["online"], True)
+            self.assertEqual(watcher.stats()["subscribers"], 0)
+            self.assertFalse(request_started.disconnect(status_watch.start_pinned))  # ran once, then let go
+
+    def test_workers_share_a_poll_through_the_cache(self):
+        from django.core.cache.backends.locmem import LocMemCache
+
+        cache = LocMemCache("status-watch", {})
+        workers = [self.watcher(pinned=[self.charger_id], shared_cache=cache) for _ in range(2)]
+        for worker in workers:
+            worker.poll_once()
+        self.assertEqual(self.stub.total_hits(), 1)
+        for worker in workers:
+            self.assertIs(worker.latest(self.charger_id).value["online"], True)
+
+    def test_slow_viewer_is_resynced(self):
+        watcher = self.watcher(queue_size=1)
+        sub = watcher.subscribe(self.charger_id)
+        self.assertEqual(sub.get(timeout=5).kind, "snapshot")
+        for online in (False, True, False):
+            self.online = online
+            watcher.poll_once()
+        self.assertTrue(sub.overflowed)
+        event = watcher.resync(sub)
+        self.assertEqual(event.kind, "snapshot")
+        self.assertIs(event.data["status"]["online"], False)
+        self.assertIsNone(sub.get(timeout=0.05))
+
+    def test_stream_endpoint_sends_events_and_unsubscribes(self):
+        resp = self.client.get(f"/api/charger/{self.charger_id}/cloudstatus/stream/")
+        self.assertEqual(resp["Content-Type"], "text/event-stream")
+        body = b"".join(resp.streaming_content).decode()
+        self.assertTrue(body.startswith("retry: "))
+        self.assertIn("event: snapshot\n", body)
+        self.assertIn(": keepalive", body)
+        self.assertEqual(status_watch.current().watched(), [])
+
+    def test_watch_list_is_bounded(self):
+        with override_settings(CLOUDSTATUS_WATCH_MAX=0):
+            resp = self.client.get(f"/api/charger/{self.charger_id}/cloudstatus/stream/")
+        self.assertEqual(resp.status_code, 503)
+
+
+class ChargerIndexTests(TestCase):
+    @staticmethod
+    def respond(path):
+        serial = path.rsplit("/", 1)[1]
+        if "/chargerserial/" not in path:  # by id: the charger's current record, with more fields
+            return 200, {"chargerId": serial, "serialNumber": "SN000123", "model": "AC-RESI", "firmware": "2.1"}
+        if serial.startswith("MISSING"):
+            return 404, {"error": "not found"}
+        return 200, [{"chargerId": f"0000-{serial.lower()}", "serialNumber": serial, "model": "AC-RESI"}]
+
+    def setUp(self):
+        self.stub = StubEVAdvisor(responder=self.respond)
+        self.addCleanup(self.stub.close)
+        overrides = override_settings(
+            EXTERNAL_API_BASE_URL=self.stub.base_url,
+            EXTERNAL_API_KEY="test-key",
+            EXTERNAL_API_CACHE_ENABLED=False,
+            CHARGER_INDEX_ENABLED=True,
+            CHARGER_INDEX_RELOAD_INTERVAL=0,
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        EVAdvisorClient.reset_shared()
+        self.addCleanup(EVAdvisorClient.reset_shared)
+        charger_index.reset_index()
+        self.addCleanup(charger_index.reset_index)
+
+    def test_exact_lookup_is_answered_locally_after_first_miss(self):
+        first = self.client.get("/api/charger-lookup/SN000123/")
+        self.assertEqual(first.status_code, 200)
+        again = self.client.get("/api/charger-lookup/sn000123/")
+        self.assertEqual(again.json(), first.json())
+        self.assertEqual(self.stub.total_hits(), 1)
+        self.assertEqual(ChargerIndexEntry.objects.get().serial_number, "SN000123")
+
+        with override_settings(CHARGER_INDEX_MAX_AGE=0):
+            charger_index.reset_index()
+            self.client.get("/api/charger-lookup/SN000123/")
+        self.assertEqual(self.stub.total_hits(), 2)
+
+    def test_batch_and_search_are_looked_up_as_serials(self):
+        for serial in ("batch", "search"):
+            resp = self.client.get(f"/api/charger-lookup/{serial}/")
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(resp.json()[0]["serialNumber"], serial)
+
+    def test_by_id_lookups_do_not_change_serial_answers(self):
+        first = self.client.get("/api/charger-lookup/SN000123/").json()
+        by_id = self.client.get(f"/api/charger-lookup/id/{first[0]['chargerId']}/")
+        self.assertEqual(by_id.json()["firmware"], "2.1")
+        self.client.get("/api/charger-lookup/id/0000-other/")  # another charger reporting the same serial
+        self.assertEqual(self.client.get("/api/charger-lookup/SN000123/").json(), first)
+        self.assertEqual(self.stub.total_hits(), 3)
+        self.assertEqual(len(self.client.get("/api/chargers/search/?q=SN000123").json()["items"]), 2)
+
+        fresh = charger_index.ChargerIndex()  # another worker, loading the rows
+        fresh.reload()
+        self.assertEqual(json.loads(fresh.exact("SN000123").body), first)
+        self.assertIsNone(fresh.exact("SN000999"))
+
+    def test_prefix_search_is_served_from_the_index(self):
+        index = charger_index.ChargerIndex()
+        for serial in ("SN0002", "SN0001", "SN0100", "XY0001"):
+            index.record_serial(serial, self.respond(f"/chargerserial/{serial}")[1])
+        resp = self.client.get("/api/chargers/search/?q=sn00&limit=2")
+        self.assertEqual(resp.json()["source"], "index")
+        self.assertEqual([r["serialNumber"] for r in resp.json()["items"]], ["SN0001", "SN0002"])
+        self.assertEqual(self.stub.total_hits(), 0)
+
+        resp = self.client.get("/api/chargers/search/?q=SN7777")
+        self.assertEqual(resp.json()["source"], "upstream")
+        self.assertEqual(len(resp.json()["items"]), 1)
+        self.assertEqual(self.client.get("/api/chargers/search/?q=SN77").json()["source"], "index")
+        self.assertEqual(self.client.get("/api/chargers/search/?q=MISSING1").json()["items"], [])
+
+    def test_reload_applies_other_workers_changes(self):
+        writer, reader = charger_index.ChargerIndex(reload_interval=0), charger_index.ChargerIndex(reload_interval=0)
+        reader.reload()
+        writer.record_serial("SN0001", self.respond("/chargerserial/SN0001")[1])
+        writer.record_charger({"chargerId": "0000-other", "serialNumber": "SN0002"})
+        self.assertEqual(reader.reload(), 2)
+        self.assertIsNotNone(reader.exact("SN0001"))
+        self.assertEqual(len(reader.search("SN", 10)), 2)
+
+        writer.record_serial("SN0001", [])
+        reader.reload()
+        self.assertIsNone(reader.exact("SN0001"))
+        self.assertEqual([r["serialNumber"] for r in reader.search("SN", 10)], ["SN0002"])
+        self.assertFalse(writer.record_charger({"chargerId": "0000-other", "serialNumber": "SN0002"}))
+
+    def test_refresh_command_drops_unknown_serials(self):
+        call_command("charger_index", "add", "SN0001", "MISSING1", stdout=io.StringIO(), stderr=io.StringIO())
+        ChargerIndexEntry.objects.create(
+            serial_number="MISSING2", charger_id="0000-gone", data={}, refreshed_at=datetime(2020, 1, 1, tzinfo=timezone.utc),
+        )
+        out = io.StringIO()
+        call_command("charger_index", "refresh", stdout=out)
+        self.assertIn("Indexed 0, dropped 1", out.getvalue())
+        self.assertTrue(ChargerIndexEntry.objects.get(serial_number="MISSING2").removed)
+        self.assertFalse(ChargerIndexEntry.objects.get(serial_number="SN0001").removed)
+
+
+def ocpp_archive(*members) -> bytes:
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+        for i, lines in enumerate(members):
+            zf.writestr(f"ocpp-{i}.log", "\n".join(lines) + "\n")
+    return buf.getvalue()
+
+
+class OcppIndexTests(SimpleTestCase):
+    charger_id = "0f8fad5b-d9cb-469f-a165-70867728950e"
+    lines = (
+        '2025-12-05T10:00:00Z recv CP-1 [2,"a1","BootNotification",{"chargePointModel":"AC"}]',
+        '2025-12-05T10:00:00.500Z send CP-1 [3,"a1",{"status":"Accepted"}]',
+        "2025-12-05T10:00:01Z connecting websocket",
+        '2025-12-05T10:05:00Z recv CP-1 [2,"s1","StatusNotification",{"connectorId":1,"status":"Charging"}]',
+        '2025-12-05T10:05:00.100Z send CP-1 [3,"s1",{}]',
+    )
+    later = (
+        '2025-12-05T11:00:00Z recv CP-1 [2,"s2","StatusNotification",{"connectorId":1,"status":"Available"}]',
+        '2025-12-05T10:30:00Z recv CP-1 [2,"h1","Heartbeat",{}]',
+        '2025-12-05T11:00:00.200Z send CP-1 [4,"s2","InternalError","boom",{}]',
+    )
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.archive = ocpp_archive(self.lines, self.later)
+        self.stub = StubEVAdvisor(body=self.archive)
+        self.addCleanup(self.stub.close)
+        overrides = override_settings(
+            EXTERNAL_API_BASE_URL=self.stub.base_url,
+            EXTERNAL_API_KEY="test-key",
+            OCPP_INDEX_DIR=self.dir.name,
+            OCPP_INDEX_MAX_AGE=300,
+            OCPP_ARCHIVE_CACHE_DIR=os.path.join(self.dir.name, "archives"),
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        EVAdvisorClient.reset_shared()
+        self.addCleanup(EVAdvisorClient.reset_shared)
+        archive_cache.reset_cache()
+        self.addCleanup(archive_cache.reset_cache)
+
+    def build(self):
+        source = os.path.join(self.dir.name, "logs.zip")
+        with open(source, "wb") as fh:
+            fh.write(self.archive)
+        target = os.path.join(self.dir.name, "built")
+        ocpp_index.build(source, target)
+        index = ocpp_index.OcppIndex(target)
+        self.addCleanup(index.close)
+        return index
+
+    def test_query_by_action_and_time_window(self):
+        index = self.build()
+        self.assertEqual(index.meta["messages"], 7)
+        self.assertEqual(index.meta["skipped"], 1)
+
+        items, truncated = index.query(action="StatusNotification")
+        self.assertFalse(truncated)
+        self.assertEqual([(i["messageId"], i["messageType"]) for i in items],
+                         [("s1", "Call"), ("s1", "CallResult"), ("s2", "Call"), ("s2", "CallError")])
+        self.assertEqual(items[0]["frame"][3], {"connectorId": 1, "status": "Charging"})
+
+        start = int(datetime(2025, 12, 5, 10, 1, tzinfo=timezone.utc).timestamp() * 1000)
+        end = int(datetime(2025, 12, 5, 10, 59, tzinfo=timezone.utc).timestamp() * 1000)
+        items, _ = index.query(start_ms=start, end_ms=end)
+        self.assertEqual([i["messageId"] for i in items], ["s1", "s1", "h1"])  # records are in time order
+        items, truncated = index.query(action="StatusNotification", start_ms=start, direction="recv", limit=1)
+        self.assertEqual([i["timestamp"] for i in items], ["2025-12-05T10:05:00.000Z"])
+        self.assertTrue(truncated)
+
+    def test_query_by_message_id(self):
+        index = self.build()
+        items, _ = index.query(message_id="a1")
+        self.assertEqual([(i["direction"], i["action"]) for i in items], [("recv", "BootNotification"), ("send", "BootNotification")])
+        self.assertEqual(index.query(message_id="nope"), ([], False))
+        self.assertEqual(index.query(action="Authorize"), ([], False))
+
+    def test_evicting_an_index_does_not_break_its_readers(self):
+        source = os.path.join(self.dir.name, "logs.zip")
+        with open(source, "wb") as fh:
+            fh.write(self.archive)
+        for name in ("a", "b"):
+            ocpp_index.build(source, os.path.join(self.dir.name, name))
+        with mock.patch.object(ocpp_index, "_OPEN_MAX", 1), \
+                mock.patch.object(ocpp_index, "_open_indexes", type(ocpp_index._open_indexes)()):
+            index = ocpp_index._open(Path(self.dir.name, "a"))
+            pending = index._candidates(None, None, "StatusNotification", None)  # holds a memoryview
+            ocpp_index._open(Path(self.dir.name, "b"))  # evicts "a" mid-read
+            self.assertEqual(len([index._record(recno) for recno in pending]), 4)
+            self.assertEqual(len(index.query(message_id="s2")[0]), 2)
+
+    def test_endpoint_indexes_the_archive_once(self):
+        url = f"/api/charger/{self.charger_id}/ocpp-logs/messages/"
+        resp = self.client.get(url, {"action": "StatusNotification", "from": "2025-12-05T10:30:00Z", "to": "2025-12-05"})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual([i["messageType"] for i in resp.json()["items"]], ["Call", "CallError"])
+        self.assertEqual(resp.json()["archive"]["messages"], 7)
+
+        self.client.get(url, {"messageId": "h1"})
+        self.assertEqual(self.stub.total_hits(), 1)
+        built = sorted(os.listdir(os.path.join(self.dir.name, self.charger_id)))
+        self.client.get(url, {"refresh": "1"})  # same archive: downloaded again, not re-indexed
+        self.assertEqual(self.stub.total_hits(), 2)
+        self.assertEqual(sorted(os.listdir(os.path.join(self.dir.name, self.charger_id))), built)
+
+        self.assertEqual(self.client.get(url, {"direction": "up"}).status_code, 400)
+        self.assertEqual(self.client.get(url, {"from": "yesterday"}).status_code, 400)
+
+
+class ArchiveCacheTests(SimpleTestCase):
+    charger_id = "0f8fad5b-d9cb-469f-a165-70867728950e"
+    other_id = "7c9e6679-7425-40de-944b-e07fc1f90ae7"
+    archive = bytes(range(256)) * 64  # 16 KiB
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.stub = StubEVAdvisor(body=self.archive, etag='"v1"')
+        self.addCleanup(self.stub.close)
+        overrides = override_settings(
+            EXTERNAL_API_BASE_URL=self.stub.base_url,
+            EXTERNAL_API_KEY="test-key",
+            OCPP_ARCHIVE_CACHE_ENABLED=True,
+            OCPP_ARCHIVE_CACHE_DIR=self.dir.name,
+            OCPP_ARCHIVE_CACHE_FRESH=300,
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        EVAdvisorClient.reset_shared()
+        self.addCleanup(EVAdvisorClient.reset_shared)
+        archive_cache.reset_cache()
+        self.addCleanup(archive_cache.reset_cache)
+
+    def url(self, charger_id=None):
+        return f"/api/charger/{charger_id or self.charger_id}/ocpp-logs/"
+
+    def blobs(self):
+        return [name for _, _, names in os.walk(os.path.join(self.dir.name, "blobs")) for name in names]
+
+    def test_repeat_downloads_are_served_from_disk(self):
+        first = self.client.get(self.url())
+        self.assertEqual(b"".join(first.streaming_content), self.archive)
+        again = self.client.get(self.url())
+        self.assertIsInstance(again, FileResponse)  # sent with sendfile() under gunicorn
+        self.assertEqual(b"".join(again.streaming_content), self.archive)
+        self.assertEqual(again["ETag"], first["ETag"])
+        self.assertEqual(self.stub.total_hits(), 1)
+
+        self.client.get(self.url(self.other_id))  # same bytes for another charger: stored once
+        self.assertEqual(len(self.blobs()), 1)
+        self.assertEqual(self.client.get(self.url(), HTTP_IF_NONE_MATCH=first["ETag"]).status_code, 304)
+
+    def test_stale_archive_is_revalidated_without_a_body(self):
+        self.client.get(self.url())
+        with override_settings(OCPP_ARCHIVE_CACHE_FRESH=0):
+            archive_cache.reset_cache()
+            resp = self.client.get(self.url())
+        self.assertEqual(b"".join(resp.streaming_content), self.archive)
+        self.assertEqual(self.stub.total_hits(), 2)
+        self.assertEqual(self.stub.request_headers[-1].get("If-None-Match"), '"v1"')
+
+    def test_ranges_are_cut_from_the_cached_file(self):
+        self.client.get(self.url())
+        tail = self.client.get(self.url(), HTTP_RANGE="bytes=1000-")
+        self.assertEqual(tail.status_code, 206)
+        self.assertEqual(tail["Content-Range"], f"bytes 1000-{len(self.archive) - 1}/{len(self.archive)}")
+        self.assertEqual(b"".join(tail.streaming_content), self.archive[1000:])
+
+        part = self.client.get(self.url(), HTTP_RANGE="bytes=10-19")
+        self.assertEqual((part.status_code, part["Content-Length"]), (206, "10"))
+        self.assertEqual(b"".join(part.streaming_content), self.archive[10:20])
+        stale = self.client.get(self.url(), HTTP_RANGE="bytes=10-19", HTTP_IF_RANGE='"old"')
+        self.assertEqual(stale.status_code, 200)
+        stale.close()
+        self.assertEqual(self.client.get(self.url(), HTTP_RANGE=f"bytes={len(self.archive)}-").status_code, 416)
+        self.assertEqual(self.stub.total_hits(), 1)
+
+    def test_least_recently_used_blobs_are_evicted(self):
+        cache = archive_cache.ArchiveCache(self.dir.name, max_bytes=len(self.archive) + 100)
+        client = EVAdvisorClient.shared()
+        first = cache.fetch(client, self.charger_id)
+        self.stub.body = self.archive[::-1]
+        second = cache.fetch(client, self.other_id)
+
+        self.assertNotEqual(first.sha256, second.sha256)
+        self.assertIsNone(cache.get(self.charger_id))
+        self.assertEqual(self.blobs(), [second.sha256])
+        self.assertEqual(cache.fetch(client, self.charger_id).sha256, second.sha256)  # refetched after eviction
+
+
+class HistoryAnalyticsTests(SimpleTestCase):
+    charger_id = "0f8fad5b-d9cb-469f-a165-70867728950e"
+    records = [
+        # Monday 2025-01-06: 1 h plugged in, charging ended after 40 min.
+        {"transactionId": 1, "idTag": "A", "startTime": "2025-01-06T08:00:00Z", "endTime": "2025-01-06T09:00:00Z",
+         "chargingEndTime": "2025-01-06T08:40:00Z", "energyKwh": 7.5},
+        # Same day in another notation, energy in Wh from meter values.
+        {"transactionId": 2, "idTag": "B", "startTime": "2025-01-06T20:30:00+01:00", "stopTime": "2025-01-06 20:00:00",
+         "meterStart": 1000, "meterStop": 3500},
+        # Sunday 2025-01-12 (same ISO week); no end yet, energy in Wh.
+        {"transactionId": 3, "idTag": "A", "startTime": "2025-01-12T23:59:59.500Z", "energyWh": 1250},
+        # Leap day, next week; no tag.
+        {"transactionId": 4, "startTime": "2024-02-29T10:00:00Z", "endTime": "2024-02-29T10:30:00Z", "energyKwh": 2},
+        {"transactionId": 5, "startTime": "2025-02-29T10:00:00Z"},  # not a date: skipped
+        {"transactionId": 6},
+    ]
+
+    def test_aggregates(self):
+        body = history_analytics.analyze(self.records, history_analytics.GROUPS, charger_id="c1")
+        totals = body["totals"]
+        self.assertEqual((totals["sessions"], totals["skipped"]), (4, 2))
+        self.assertEqual(totals["energyKwh"], 7.5 + 2.5 + 1.25 + 2)
+        self.assertEqual(totals["durationSeconds"], 3600 + 1800 + 1800)
+        self.assertEqual(totals["idleSeconds"], 1200)
+        self.assertEqual(totals["avgDurationSeconds"], 2400)
+        self.assertEqual(totals["durationPercentiles"], {"p50": 1800.0, "p90": 3240.0, "max": 3600.0})
+
+        self.assertEqual([(r["date"], r["sessions"], r["energyKwh"]) for r in body["byDay"]],
+                         [("2024-02-29", 1, 2.0), ("2025-01-06", 2, 10.0), ("2025-01-12", 1, 1.25)])
+        self.assertEqual([(r["weekStart"], r["sessions"]) for r in body["byWeek"]],
+                         [("2024-02-26", 1), ("2025-01-06", 3)])
+        self.assertEqual([(r["idTag"], r["sessions"], r["avgDurationSeconds"]) for r in body["byTag"]],
+                         [("A", 2, 3600.0), ("B", 1, 1800.0), (None, 1, 1800.0)])
+        self.assertEqual(body["byCharger"][0]["chargerId"], "c1")
+
+    def test_missing_and_empty_tags_are_one_group(self):
+        records = [
+            {"transactionId": 1, "idTag": None, "startTime": "2025-01-06T08:00:00Z"},
+            {"transactionId": 2, "idTag": "", "startTime": "2025-01-06T09:00:00Z"},
+            {"transactionId": 3, "startTime": "2025-01-06T10:00:00Z"},
+            {"transactionId": 4, "idTag": "A", "startTime": "2025-01-06T11:00:00Z"},
+        ]
+        for np in (history_analytics.np, None):
+            with mock.patch.object(history_analytics, "np", np):
+                body = history_analytics.analyze(records, ["tag"])
+            self.assertEqual([(r["idTag"], r["sessions"]) for r in body["byTag"]], [("A", 1), (None, 3)])
+
+    def test_numpy_and_fallback_agree(self):
+        records = self.records + [
+            {"transactionId": 100 + i, "idTag": f"T{i % 3}", "startTime": f"2025-03-{1 + i % 28:02d}T{i % 24:02d}:15:00Z",
+             "endTime": f"2025-03-{1 + i % 28:02d}T{i % 24:02d}:59:00Z", "energyKwh": i / 7}
+            for i in range(500)
+        ]
+        vectorized = history_analytics.analyze(records, history_analytics.GROUPS)
+        with mock.patch.object(history_analytics, "np", None):
+            fallback = history_analytics.analyze(records, history_analytics.GROUPS)
+        self.assertEqual(vectorized, fallback)
+        self.assertEqual(history_analytics.analyze([])["totals"]["sessions"], 0)
+
+    def test_endpoint(self):
+        stub = StubEVAdvisor(responder=lambda path: (200, self.records))
+        self.addCleanup(stub.close)
+        with override_settings(
+            EXTERNAL_API_BASE_URL=stub.base_url, EXTERNAL_API_KEY="test-key", EXTERNAL_API_HISTORY_STORE_ENABLED=False,
+        ):
+            EVAdvisorClient.reset_shared()
+            self.addCleanup(EVAdvisorClient.reset_shared)
+            url = f"/api/charger/{self.charger_id}/charge-history/analytics/"
+            resp = self.client.get(url, {"startDate": "2025-01-01", "endDate": "2025-01-31", "groupBy": "tag"})
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(sorted(resp.json()), ["byTag", "failedWindows", "totals", "windows"])
+            self.assertEqual(resp.json()["totals"]["sessions"], 4)
+            bad = self.client.get(url, {"startDate": "2025-01-01", "endDate": "2025-01-31", "groupBy": "month"})
+            self.assertEqual(bad.status_code, 400)
@@ -1,8 +1,16 @@
 from django.contrib import admin
 from django.urls import path, include
 from django.views.generic import RedirectView
+from django.conf import settings
 from .import views 
 
+# Under ASGI, serve the EV Advisor proxies with the async views (same URLs).
+# Imported lazily: only the async client needs aiohttp.
+if settings.EXTERNAL_API_ASYNC_VIEWS:
+    from . import async_views as proxy
+else:
+    proxy = views
+
 urlpatterns = [
     path('', RedirectView.as_view(url='accounts/login/', permanent=False), name='root'),
     path('admin/', admin.site.urls),
@@ -10,20 +18,37 @@ urlpatterns = [
     path('accounts/', include('accounts_app.urls')),
     
     # --- Testable proxy endpoint --
-    path('api/charger-lookup/<str:serial>/', views.charger_lookup_by_serial, name='charger_lookup_by_serial'),
+    path('api/charger-lookup/<str:serial>/', proxy.charger_lookup_by_serial, name='charger_lookup_by_serial'),
     
     #Charger by chargerID
-    path('api/charger-lookup/id/<str:charger_id>/', views.charger_by_id, name='charger_by_id'),
+    path('api/charger-lookup/id/<str:charger_id>/', proxy.charger_by_id, name='charger_by_id'),
+    
+    #Batch lookup (serials or chargerIds) and serial typeahead; outside charger-lookup/ so no serial is shadowed
+    path('api/chargers/batch/', views.charger_lookup_batch, name='charger_lookup_batch'),
+    path('api/chargers/search/', views.charger_lookup_search, name='charger_lookup_search'),
     
     #Capabilities
-    path('api/charger/<uuid:charger_id>/capabilities/', views.charger_capabilities, name='charger_capabilities'),
+    path('api/charger/<uuid:charger_id>/capabilities/', proxy.charger_capabilities, name='charger_capabilities'),
     
     #Cloud status
-    path('api/charger/<uuid:charger_id>/cloudstatus/', views.charger_cloudstatus, name='charger_cloudstatus'),
+    path('api/charger/<uuid:charger_id>/cloudstatus/', proxy.charger_cloudstatus, name='charger_cloudstatus'),
+    path('api/charger/<uuid:charger_id>/cloudstatus/stream/', proxy.charger_cloudstatus_stream, name='charger_cloudstatus_stream'),
+    
+    #Snapshot: info + capabilities + cloud status in one call
+    path('api/charger/<uuid:charger_id>/snapshot/', proxy.charger_snapshot, name='charger_snapshot'),
     
     #Charge history #FIXME: I am able to get 200 but empty arrays perhaps because there is no data?
-    path('api/charger/<uuid:charger_id>/charge-history/', views.charger_charge_history, name='charger_charge_history'),
+    path('api/charger/<uuid:charger_id>/charge-history/', proxy.charger_charge_history, name='charger_charge_history'),
+    path('api/charger/<uuid:charger_id>/charge-history/analytics/', proxy.charger_charge_history_analytics, name='charger_charge_history_analytics'),
     
     #OCPP-logs latest
-    path('api/charger/<uuid:charger_id>/ocpp-logs/', views.charger_ocpp_logs_latest, name='charger_ocpp_logs_latest'),
+    path('api/charger/<uuid:charger_id>/ocpp-logs/', proxy.charger_ocpp_logs_latest, name='charger_ocpp_logs_latest'),
+    path('api/charger/<uuid:charger_id>/ocpp-logs/messages/', proxy.charger_ocpp_messages, name='charger_ocpp_messages'),
+    
+    #Upstream client stats (staff only)
+    path('api/upstream/stats/', views.upstream_stats, name='upstream_stats'),
+    path('api/upstream/cache/invalidate/', views.upstream_cache_invalidate, name='upstream_cache_invalidate'),
+
+    #Prometheus scrape (all workers)
+    path('metrics', views.metrics_view, name='metrics'),
 ]
\ No newline at end of file
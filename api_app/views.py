@@ -1,59 +1,545 @@
 
-from django.http import JsonResponse, HttpResponse
-from django.views.decorators.http import require_GET
+from django.http import JsonResponse, HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST, require_http_methods
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
+from .services import archive_cache, charger_index, encoding, history_analytics, metrics, ocpp_index, status_watch
+from .services.charge_history import parse_bound, record_key, split_range
 from .services.ev_advisor import EVAdvisorClient
+from .services.history_store import ChargeHistoryStore
+from .services.resilience import DeadlineExceeded, UpstreamUnavailable
+from .services.fanout import iter_fan_out, fan_out
+import csv
+import hmac
+import io
+import json
 import logging
-from django.http import StreamingHttpResponse, JsonResponse
+import math
+import re
+import time
+import zlib
+from django.conf import settings
+from django.db import DatabaseError
+from django.http import FileResponse, StreamingHttpResponse, JsonResponse
 
 log = logging.getLogger(__name__)
 
 
+def _unavailable_response(exc: UpstreamUnavailable) -> JsonResponse:
+    """
+    503 while an upstream circuit is open; Retry-After tells clients when to
+    come back. 504 when the request's deadline ran out waiting on upstream.
+    """
+    resp = JsonResponse({"error": str(exc)}, status=504 if isinstance(exc, DeadlineExceeded) else 503)
+    if exc.retry_after:
+        resp["Retry-After"] = str(math.ceil(exc.retry_after))
+    return resp
+
+
+
+def _json_bytes(body: bytes, content_encoding=None) -> HttpResponse:
+    """200 with an already serialized (and maybe compressed) JSON body."""
+    resp = HttpResponse(body, content_type="application/json")
+    if content_encoding:
+        resp["Content-Encoding"] = content_encoding
+    return resp
+
+
+def _conditional_json(request, rep) -> HttpResponse:
+    """
+    200 with a Representation's pre-serialized body, or the gzip/br variant
+    the client accepts, and that variant's strong ETag; 304 without a body
+    when If-None-Match already names it. no-cache: pollers revalidate every
+    time, and an unchanged resource costs a 304.
+
+    Cached payloads carry their variants; any other payload is compressed
+    here, in the one encoding chosen, and only when the client accepts one.
+    """
+    accept = request.headers.get("Accept-Encoding", "")
+    if rep.variants is None:
+        chosen = encoding.choose(accept, encoding.PREFERENCE)
+        vary = len(rep.body) >= settings.EXTERNAL_API_COMPRESS_MIN_BYTES
+        rep = rep.with_variants((chosen,) if chosen else ())
+    else:
+        vary = bool(rep.variants)
+    content_encoding = encoding.choose(accept, rep.variants)
+    body, etag = rep.encoded(content_encoding)
+    if etag in parse_etags(request.headers.get("If-None-Match", "")):
+        resp = HttpResponseNotModified()
+    else:
+        resp = _json_bytes(body, content_encoding)
+    resp["ETag"] = etag
+    resp["Cache-Control"] = "private, no-cache"
+    if vary:
+        patch_vary_headers(resp, ("Accept-Encoding",))
+    return resp
+
+
 
 #OCPP LOGS LATEST
 
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def _parse_byte_range(header: str, total: int):
+    """
+    Parse a single-range `Range` header against a body of `total` bytes.
+    Returns (start, end) inclusive, None if the header should be ignored
+    (absent, malformed or multi-range), or "unsatisfiable".
+    """
+    m = _RANGE_RE.match((header or "").strip())
+    if not m or (not m.group(1) and not m.group(2)):
+        return None
+    if m.group(1):
+        start = int(m.group(1))
+        end = int(m.group(2)) if m.group(2) else total - 1
+    else:
+        # Suffix range: last N bytes
+        start, end = max(0, total - int(m.group(2))), total - 1
+    if start >= total or end < start:
+        return "unsatisfiable"
+    return start, min(end, total - 1)
+
+
+def _slice_chunk(chunk: bytes, pos: int, start: int, end=None) -> bytes:
+    """Return the part of `chunk` (at body offset `pos`) inside [start, end]."""
+    lo = max(0, start - pos)
+    hi = len(chunk) if end is None else min(len(chunk), end + 1 - pos)
+    return chunk[lo:hi] if hi > lo else b""
+
+
+def _stream_upstream(upstream, chunk_size: int, start: int = 0, end=None):
+    """
+    Yield the upstream body chunk by chunk (bounded memory per download),
+    optionally only bytes [start, end]. The upstream connection is always
+    released: when the body is exhausted, or when Django closes the response
+    early (client disconnect closes this generator).
+    """
+    try:
+        pos = 0
+        for chunk in upstream.iter_content(chunk_size=chunk_size):
+            piece = _slice_chunk(chunk, pos, start, end)
+            if piece:
+                yield piece
+            pos += len(chunk)
+            if end is not None and pos > end:
+                break
+    finally:
+        upstream.close()
+
+
+def _plan_ocpp_download(status: int, headers, range_header, if_range, charger_id) -> dict:
+    """
+    Decide how to relay an upstream OCPP logs response (sync and async views).
+    Returns a dict with the status, headers to send and the byte slice
+    [start, end] to forward. Status 416 means: send no body.
+    """
+    if status == 416:
+        return {"status": 416, "headers": {"Content-Range": headers.get("Content-Range")}}
+
+    filename = None
+    cd = headers.get("Content-Disposition", "")
+    if "filename=" in cd:
+        try:
+            filename = cd.split("filename=", 1)[1].strip().strip('"')
+        except Exception:
+            filename = None
+    if not filename:
+        filename = f"ocpp-logs-{charger_id}-latest.zip"
 
+    length = headers.get("Content-Length")
+    content_range = headers.get("Content-Range") if status == 206 else None
+    start, end = 0, None
+
+    # Upstream ignored Range: serve the slice ourselves when we know the size
+    # and the client's If-Range validator (if any) still matches.
+    if status == 200 and range_header and length and length.isdigit():
+        validators = {headers.get("ETag"), headers.get("Last-Modified")} - {None}
+        if not if_range or if_range in validators:
+            total = int(length)
+            rng = _parse_byte_range(range_header, total)
+            if rng == "unsatisfiable":
+                return {"status": 416, "headers": {"Content-Range": f"bytes */{total}"}}
+            if rng is not None:
+                start, end = rng
+                status = 206
+                length = str(end - start + 1)
+                content_range = f"bytes {start}-{end}/{total}"
+
+    return {
+        "status": status,
+        "content_type": headers.get("Content-Type", "application/octet-stream"),
+        "start": start,
+        "end": end,
+        "headers": {
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            "Content-Length": length,
+            "Content-Range": content_range,
+            "ETag": headers.get("ETag"),
+            "Last-Modified": headers.get("Last-Modified"),
+            "Accept-Ranges": "bytes",
+            "Cache-Control": "no-cache",
+            # Do NOT set Connection header (WSGI forbids hop-by-hop headers)
+        },
+    }
+
+
+def _apply_headers(resp, headers: dict):
+    for name, value in headers.items():
+        if value:
+            resp[name] = value
+    return resp
+
+
+def _read_slice(fh, start: int, end: int, chunk_size: int):
+    """Yield bytes [start, end] of an open file, then close it."""
+    try:
+        fh.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = fh.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        fh.close()
+
+
+def _cached_archive_response(request, entry, fh, charger_id) -> HttpResponse:
+    """
+    Serve an archive from the disk cache (sync and async views). Whole files
+    and open-ended ranges go out as a FileResponse, so a WSGI server with
+    wsgi.file_wrapper (gunicorn) sends them with sendfile(); a bounded range
+    is read in chunks. Takes ownership of `fh`.
+    """
+    headers = {
+        "Content-Disposition": f'attachment; filename="{entry.filename or f"ocpp-logs-{charger_id}-latest.zip"}"',
+        "ETag": entry.etag,
+        "Last-Modified": entry.last_modified,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "no-cache",
+    }
+    if entry.etag in parse_etags(request.headers.get("If-None-Match", "")):
+        fh.close()
+        return _apply_headers(HttpResponseNotModified(), headers)
+
+    rng = None
+    if_range = request.headers.get("If-Range")
+    if not if_range or if_range in (entry.etag, entry.last_modified):
+        rng = _parse_byte_range(request.headers.get("Range"), entry.size)
+    if rng == "unsatisfiable":
+        fh.close()
+        return _apply_headers(HttpResponse(status=416), {"Content-Range": f"bytes */{entry.size}"})
+    if rng is None:
+        resp = FileResponse(fh, content_type=entry.content_type)
+    elif rng[1] == entry.size - 1:
+        fh.seek(rng[0])
+        resp = FileResponse(fh, status=206, content_type=entry.content_type)
+    else:
+        resp = StreamingHttpResponse(
+            _read_slice(fh, rng[0], rng[1], settings.EXTERNAL_API_STREAM_CHUNK_SIZE),
+            status=206,
+            content_type=entry.content_type,
+        )
+        resp["Content-Length"] = str(rng[1] - rng[0] + 1)
+    if rng is not None:
+        headers["Content-Range"] = f"bytes {rng[0]}-{rng[1]}/{entry.size}"
+    return _apply_headers(resp, headers)
 
 
 @require_GET
 def charger_ocpp_logs_latest(request, charger_id: str):
-    client = EVAdvisorClient.from_settings()
+    """
+    Proxy: latest OCPP logs archive, streamed without buffering.
+    With OCPP_ARCHIVE_CACHE_ENABLED the archive is served from the
+    content-addressed disk cache (services/archive_cache.py), revalidated
+    upstream once it is older than OCPP_ARCHIVE_CACHE_FRESH.
+    Supports resumable downloads: a single `Range` (plus optional `If-Range`)
+    is forwarded upstream; if upstream ignores it but reports the length,
+    the requested slice is cut from the stream here.
+    """
+    range_header = request.headers.get("Range")
+    if_range = request.headers.get("If-Range")
+
+    client = EVAdvisorClient.shared()
+    cached = None
     try:
-        upstream = client.download_latest_ocpp_logs(str(charger_id))
+        if settings.OCPP_ARCHIVE_CACHE_ENABLED:
+            cached = archive_cache.cache().open(client, str(charger_id))
+        else:
+            upstream = client.download_latest_ocpp_logs(str(charger_id), range_header=range_header, if_range=if_range)
+    except ValueError as ve:
+        return JsonResponse({"error": str(ve)}, status=400)
+    except PermissionError as pe:
+        return JsonResponse({"error": str(pe)}, status=403)
+    except FileNotFoundError as nf:
+        return JsonResponse({"error": str(nf)}, status=404)
+    except UpstreamUnavailable as ua:
+        return _unavailable_response(ua)
+    except RuntimeError as re:
+        return JsonResponse({"error": str(re)}, status=502)
+    if cached is not None:
+        return _cached_archive_response(request, *cached, charger_id)
+
+    try:
+        plan = _plan_ocpp_download(upstream.status_code, upstream.headers, range_header, if_range, charger_id)
+        if plan["status"] == 416:
+            upstream.close()
+            return _apply_headers(HttpResponse(status=416), plan["headers"])
+
+        resp = StreamingHttpResponse(
+            _stream_upstream(upstream, settings.EXTERNAL_API_STREAM_CHUNK_SIZE, plan["start"], plan["end"]),
+            status=plan["status"],
+            content_type=plan["content_type"],
+        )
+    except Exception:
+        upstream.close()
+        raise
+    return _apply_headers(resp, plan["headers"])
+
 
-        content_type = upstream.headers.get("Content-Type", "application/octet-stream")
+_OCPP_QUERY_MAX = 5000
 
-        filename = None
-        cd = upstream.headers.get("Content-Disposition", "")
-        if "filename=" in cd:
+
+def _ocpp_query_params(params) -> dict:
+    """
+    Validate the OCPP message query (sync and async views). `to` given as a
+    date includes that whole day. Raises ValueError with a client message.
+    """
+    out = {"action": params.get("action") or None, "message_id": params.get("messageId") or None}
+    direction = params.get("direction") or None
+    if direction not in (None, "recv", "send"):
+        raise ValueError("direction must be recv or send")
+    out["direction"] = direction
+    for name, key in (("from", "start_ms"), ("to", "end_ms")):
+        out[key] = None
+        if params.get(name):
             try:
-                filename = cd.split("filename=", 1)[1].strip().strip('"')
-            except Exception:
-                filename = None
-        if not filename:
-            filename = f"ocpp-logs-{charger_id}-latest.zip"
-
-        body = upstream.content
-        resp = HttpResponse(body, content_type=content_type)
-        resp["Content-Disposition"] = f'attachment; filename="{filename}"'
-        resp["Content-Length"] = str(len(body))
-        resp["Cache-Control"] = "no-cache"
-        # Do NOT set Connection header (WSGI forbids hop-by-hop headers)
-        return resp
+                dt, date_only = parse_bound(params[name])
+            except ValueError:
+                raise ValueError(f"{name} must be an ISO date or datetime")
+            out[key] = int(dt.timestamp() * 1000) + (86400 * 1000 - 1 if date_only and name == "to" else 0)
+    try:
+        out["limit"] = min(_OCPP_QUERY_MAX, max(1, int(params.get("limit") or 500)))
+    except ValueError:
+        raise ValueError("limit must be an integer")
+    return out
+
+
+def _ocpp_messages(client, charger_id: str, query: dict, refresh: bool) -> dict:
+    index = ocpp_index.latest(client, charger_id, refresh=refresh)
+    items, truncated = index.query(**query)
+    return {"items": items, "truncated": truncated, "archive": index.summary()}
 
+
+@require_GET
+def charger_ocpp_messages(request, charger_id: str):
+    """
+    OCPP messages from the charger's latest log archive, answered from an
+    on-disk index (the archive is downloaded and indexed once per change).
+    Query params (all optional):
+    - action: e.g. StatusNotification (CallResults/CallErrors carry their Call's action)
+    - messageId: one exchange
+    - direction: recv | send
+    - from / to: ISO date or datetime bounds (inclusive)
+    - limit: default 500, at most 5000
+    - refresh=1: ask upstream for a newer archive now
+
+    Returns {"items": [...], "truncated": bool, "archive": {...}}.
+    """
+    try:
+        query = _ocpp_query_params(request.GET)
+    except ValueError as ve:
+        return JsonResponse({"error": str(ve)}, status=400)
+    refresh = request.GET.get("refresh") in ("1", "true")
+    try:
+        body = _ocpp_messages(EVAdvisorClient.shared(), str(charger_id), query, refresh)
     except ValueError as ve:
         return JsonResponse({"error": str(ve)}, status=400)
     except PermissionError as pe:
         return JsonResponse({"error": str(pe)}, status=403)
     except FileNotFoundError as nf:
         return JsonResponse({"error": str(nf)}, status=404)
+    except UpstreamUnavailable as ua:
+        return _unavailable_response(ua)
     except RuntimeError as re:
         return JsonResponse({"error": str(re)}, status=502)
+    return JsonResponse(body, status=200)
 
 
 
 #Charge history
 
+def _failed_windows(failures) -> list:
+    return [
+        {"startDate": w[0], "endDate": w[1], "status": _error_status(exc), "error": str(exc)}
+        for w, exc in failures
+    ]
+
+
+def _history_headers(resp, windows: int, failed: list):
+    resp["X-Charge-History-Windows"] = str(windows)
+    if failed:
+        resp["X-Charge-History-Failed-Windows"] = ",".join(f"{f['startDate']}/{f['endDate']}" for f in failed)
+    return resp
+
+
+def _charge_history_response(result, envelope: bool = False) -> JsonResponse:
+    """
+    Serialize a ChargeHistoryResult. The body stays a plain list unless
+    `envelope` is requested; windows that failed are always reported in
+    X-Charge-History-* headers so a partial range is never silent.
+    """
+    failed = _failed_windows(result.failures)
+    if envelope:
+        body = {"items": result.records, "windows": len(result.windows), "failedWindows": failed}
+        resp = JsonResponse(body, status=200)
+    else:
+        resp = JsonResponse(result.records, safe=False, status=200)
+    return _history_headers(resp, len(result.windows), failed)
+
+
+def _passes_through_history(start_date, end_date, window, envelope: bool) -> bool:
+    """
+    Whether pass-through (EXTERNAL_API_PASSTHROUGH) can answer with
+    upstream's bytes: a plain list, not from the local store, and one
+    upstream call covering the range. Several windows have to be parsed to
+    be merged and de-duplicated.
+    """
+    if not settings.EXTERNAL_API_PASSTHROUGH or envelope:
+        return False
+    if settings.EXTERNAL_API_HISTORY_STORE_ENABLED and window is None:
+        return False
+    return len(split_range(start_date, end_date, window or settings.EXTERNAL_API_HISTORY_WINDOW)) == 1
+
+
+def _charge_history_bytes_response(request, body: bytes) -> HttpResponse:
+    """A passed-through charge history body, compressed per Accept-Encoding when worth it."""
+    content_encoding = None
+    if len(body) >= settings.EXTERNAL_API_COMPRESS_MIN_BYTES:
+        content_encoding = encoding.choose(request.headers.get("Accept-Encoding", ""), encoding.PREFERENCE)
+    resp = _json_bytes(encoding.compress(body, content_encoding) if content_encoding else body, content_encoding)
+    patch_vary_headers(resp, ("Accept-Encoding",))
+    return _history_headers(resp, 1, [])
+
+
+def _charge_history(charger_id, start_date, end_date, id_tag, window):
+    """From the local store when enabled (no per-request window override), else upstream."""
+    client = EVAdvisorClient.shared()
+    if settings.EXTERNAL_API_HISTORY_STORE_ENABLED and window is None:
+        return ChargeHistoryStore(client).query(charger_id, start_date, end_date, id_tag)
+    return client.get_charge_history_windowed(charger_id, start_date, end_date, id_tag, window=window)
+
+
+_EXPORT_CONTENT_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+
+
+def _ndjson_lines(records, failures):
+    for record in records:
+        yield json.dumps(record, separators=(",", ":")) + "\n"
+    if failures:
+        yield json.dumps({"failedWindows": _failed_windows(failures)}) + "\n"
+
+
+def _csv_lines(records, failures):
+    """
+    CSV with the first record's fields as columns; fields only later records
+    have are dropped (the stream never looks ahead). Nested values are JSON.
+    """
+    buf = io.StringIO()
+    writer = None
+    for record in records:
+        if writer is None:
+            writer = csv.DictWriter(buf, fieldnames=list(record), extrasaction="ignore")
+            writer.writeheader()
+        writer.writerow({k: json.dumps(v) if isinstance(v, (dict, list)) else v for k, v in record.items()})
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    if failures:
+        yield "# failed windows: " + ", ".join(f"{f['startDate']}/{f['endDate']}" for f in _failed_windows(failures)) + "\n"
+
+
+def _encode_batched(lines, size: int):
+    """Join small lines into ~`size`-byte chunks (one write per chunk, not per record)."""
+    batch, length = [], 0
+    for line in lines:
+        data = line.encode("utf-8")
+        batch.append(data)
+        length += len(data)
+        if length >= size:
+            yield b"".join(batch)
+            batch, length = [], 0
+    if batch:
+        yield b"".join(batch)
+
+
+def _gzip_chunks(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # gzip container
+    for chunk in chunks:
+        out = compressor.compress(chunk)
+        if out:
+            yield out
+    yield compressor.flush()
+
+
+def _upstream_records(outcomes, failures: list):
+    """
+    Records of window Outcomes (in window order) with sessions repeated on a
+    window edge dropped; failed windows are appended to `failures`.
+    """
+    previous = set()
+    for o in outcomes:
+        if not o.ok:
+            log.warning("charge history export: window %s..%s failed: %s", o.item[0], o.item[1], o.error)
+            failures.append((o.item, o.error))
+            continue
+        keys = set()
+        for record in o.value:
+            key = record_key(record)
+            keys.add(key)
+            if key not in previous:
+                yield record
+        previous = keys
+
+
+def _charge_history_export(request, charger_id, start_date, end_date, id_tag, window, fmt):
+    """
+    Streamed export: records are serialized as they are read (from the local
+    store, in DB chunks, or from upstream, a few windows ahead), so memory does
+    not grow with the range. Gzip-compressed when the client accepts it.
+
+    With the store, failed windows are known up front and sent in headers;
+    when streaming from upstream they can only be reported at the end of the
+    body (a final {"failedWindows": [...]} line / "# failed windows" line).
+    """
+    client = EVAdvisorClient.shared()
+    failures: list = []
+    if settings.EXTERNAL_API_HISTORY_STORE_ENABLED and window is None:
+        report, records = ChargeHistoryStore(client).query_iter(charger_id, start_date, end_date, id_tag)
+        failed, windows = _failed_windows(report.failures), len(report.windows)
+    else:
+        outcomes = client.iter_charge_history_windows(charger_id, start_date, end_date, id_tag, window=window)
+        records = _upstream_records(outcomes, failures)
+        failed, windows = [], None
+
+    lines = (_ndjson_lines if fmt == "ndjson" else _csv_lines)(records, failures)
+    chunks = _encode_batched(lines, settings.EXTERNAL_API_STREAM_CHUNK_SIZE)
+    use_gzip = "gzip" in request.headers.get("Accept-Encoding", "")
+    resp = StreamingHttpResponse(_gzip_chunks(chunks) if use_gzip else chunks, content_type=_EXPORT_CONTENT_TYPES[fmt])
+    resp["Content-Disposition"] = f'attachment; filename="charge-history-{charger_id}.{fmt}"'
+    resp["Vary"] = "Accept-Encoding"
+    if use_gzip:
+        resp["Content-Encoding"] = "gzip"
+    if windows is not None:
+        _history_headers(resp, windows, failed)
+    return resp
+
+
 @require_GET
 def charger_charge_history(request, charger_id: str):
     """
@@ -62,15 +548,34 @@ def charger_charge_history(request, charger_id: str):
     - startDate (required)
     - endDate (required)
     - idTag (optional)
+    - window (optional): day | week | month | N days; long ranges are fetched
+      as concurrent windows (default EXTERNAL_API_HISTORY_WINDOW). Giving it
+      bypasses the local store (EXTERNAL_API_HISTORY_STORE_ENABLED).
+    - envelope=1 (optional): {"items", "windows", "failedWindows"} instead of a list
+    - format=ndjson|csv (optional): streamed export instead of one JSON body
+      (gzip with Accept-Encoding: gzip)
+
+    With EXTERNAL_API_PASSTHROUGH, a range fetched in one upstream call is
+    sent as upstream's bytes (gzip/br per Accept-Encoding), unparsed and in
+    upstream's record order.
     """
     start_date = request.GET.get("startDate", "")
     end_date = request.GET.get("endDate", "")
     id_tag = request.GET.get("idTag", None)
+    window = request.GET.get("window") or None
+    envelope = request.GET.get("envelope") in ("1", "true")
+    fmt = request.GET.get("format")
+    if fmt and fmt not in _EXPORT_CONTENT_TYPES:
+        return JsonResponse({"error": "format must be ndjson or csv"}, status=400)
 
-    client = EVAdvisorClient.from_settings()
     try:
-        data = client.get_charge_history(str(charger_id), start_date, end_date, id_tag)
-        return JsonResponse(data, safe=False, status=200)
+        if fmt:
+            return _charge_history_export(request, str(charger_id), start_date, end_date, id_tag, window, fmt)
+        if _passes_through_history(start_date, end_date, window, envelope):
+            body = EVAdvisorClient.shared().get_charge_history_raw(str(charger_id), start_date, end_date, id_tag)
+            return _charge_history_bytes_response(request, body)
+        result = _charge_history(str(charger_id), start_date, end_date, id_tag, window)
+        return _charge_history_response(result, envelope)
     except ValueError as ve:
         # Includes upstream 400 mapping and our own input validation errors
         return JsonResponse({"error": str(ve)}, status=400)
@@ -78,44 +583,145 @@ def charger_charge_history(request, charger_id: str):
         return JsonResponse({"error": str(pe)}, status=403)
     except FileNotFoundError as nf:
         return JsonResponse({"error": str(nf)}, status=404)
+    except UpstreamUnavailable as ua:
+        return _unavailable_response(ua)
     except RuntimeError as re:
         return JsonResponse({"error": str(re)}, status=502)
 
 
 
+def _charge_history_analytics_response(charger_id: str, result, groups) -> JsonResponse:
+    body = history_analytics.analyze(result.records, groups, charger_id=charger_id)
+    failed = _failed_windows(result.failures)
+    body["windows"], body["failedWindows"] = len(result.windows), failed
+    return _history_headers(JsonResponse(body, status=200), len(result.windows), failed)
+
+
+@require_GET
+def charger_charge_history_analytics(request, charger_id: str):
+    """
+    Aggregates of a charger's charge history, computed here instead of in a
+    spreadsheet (see services/history_analytics.py).
+    Query params: startDate, endDate, idTag, window as for charge-history, plus
+    - groupBy (optional): comma-separated day, week, tag, charger (default day,week,tag)
+
+    Returns {"totals": {...}, "byDay": [...], "byWeek": [...], "byTag": [...],
+    "windows": n, "failedWindows": [...]}; each row has sessions, energyKwh,
+    durationSeconds (plugged in), idleSeconds (plugged in, not charging) and averages.
+    """
+    start_date = request.GET.get("startDate", "")
+    end_date = request.GET.get("endDate", "")
+    id_tag = request.GET.get("idTag", None)
+    window = request.GET.get("window") or None
+    try:
+        groups = history_analytics.parse_groups(request.GET.get("groupBy"))
+        result = _charge_history(str(charger_id), start_date, end_date, id_tag, window)
+    except ValueError as ve:
+        return JsonResponse({"error": str(ve)}, status=400)
+    except PermissionError as pe:
+        return JsonResponse({"error": str(pe)}, status=403)
+    except FileNotFoundError as nf:
+        return JsonResponse({"error": str(nf)}, status=404)
+    except UpstreamUnavailable as ua:
+        return _unavailable_response(ua)
+    except RuntimeError as re:
+        return JsonResponse({"error": str(re)}, status=502)
+    return _charge_history_analytics_response(str(charger_id), result, groups)
+
+
 #Cloud Status
 #@login_required(login_url='login')
 @require_GET
 def charger_cloudstatus(request, charger_id: str):
     """
     Proxy: Cloud/Charger status for a chargerId.
+    Answered from the status watcher when the charger is watched and was
+    polled within the last interval.
     """
-    client = EVAdvisorClient.from_settings()
+    client = EVAdvisorClient.shared()
     try:
-        data = client.get_cloud_status(str(charger_id))
-        return JsonResponse(data, safe=False, status=200)
+        rep = _watched_status(str(charger_id)) or client.get_cloud_status(str(charger_id), tagged=True)
+        return _conditional_json(request, rep)
     except ValueError as ve:
         return JsonResponse({"error": str(ve)}, status=400)
     except PermissionError as pe:
         return JsonResponse({"error": str(pe)}, status=403)
     except FileNotFoundError as nf:
         return JsonResponse({"error": str(nf)}, status=404)
+    except UpstreamUnavailable as ua:
+        return _unavailable_response(ua)
     except RuntimeError as re:
         return JsonResponse({"error": str(re)}, status=502)
 
 
 
+def _watched_status(charger_id: str):
+    watcher = status_watch.current()
+    return watcher.latest(charger_id) if watcher is not None else None
+
+
+_SSE_RETRY_MS = 3000  # how long EventSource waits before reconnecting
+
+
+def _event_stream_response(content) -> StreamingHttpResponse:
+    resp = StreamingHttpResponse(content, content_type="text/event-stream")
+    resp["Cache-Control"] = "no-cache"
+    resp["X-Accel-Buffering"] = "no"  # nginx: do not buffer events
+    return resp
+
+
+def _status_events(watcher, sub):
+    """
+    Events for one subscription as they arrive, with keep-alive comments in
+    between. Ends after CLOUDSTATUS_STREAM_MAX_AGE so a sync worker thread is
+    not held forever; EventSource reconnects by itself.
+    """
+    deadline = time.monotonic() + settings.CLOUDSTATUS_STREAM_MAX_AGE
+    try:
+        yield f"retry: {_SSE_RETRY_MS}\n\n".encode()
+        while (remaining := deadline - time.monotonic()) > 0:
+            event = sub.get(timeout=min(settings.CLOUDSTATUS_STREAM_KEEPALIVE, remaining))
+            if sub.overflowed:
+                event = watcher.resync(sub)
+            yield event.sse() if event is not None else b": keepalive\n\n"
+    finally:
+        watcher.unsubscribe(sub)
+
+
+@require_GET
+def charger_cloudstatus_stream(request, charger_id: str):
+    """
+    Server-sent events for a chargerId's cloud status: a `snapshot` event,
+    then `change` events with the keys that changed, and `error` events
+    (see services/status_watch.py). All viewers of a charger share one
+    background upstream poll per CLOUDSTATUS_POLL_INTERVAL.
+
+    Each open stream holds a worker thread under WSGI; prefer the async
+    views (ASGI) for many viewers.
+    """
+    watcher = status_watch.watcher()
+    try:
+        sub = watcher.subscribe(str(charger_id))
+    except status_watch.WatchListFull as full:
+        resp = JsonResponse({"error": str(full)}, status=503)
+        resp["Retry-After"] = str(math.ceil(settings.CLOUDSTATUS_STREAM_MAX_AGE))
+        return resp
+    return _event_stream_response(_status_events(watcher, sub))
+
+
 #@login_required(login_url='login')
 @require_GET
 def charger_capabilities(request, charger_id: str):
-    client = EVAdvisorClient.from_settings()
+    client = EVAdvisorClient.shared()
     try:
-        data = client.get_capabilities(str(charger_id))
-        return JsonResponse(data, safe=False, status=200)
+        rep = client.get_capabilities(str(charger_id), tagged=True)
+        return _conditional_json(request, rep)
     except ValueError as ve:
         return JsonResponse({"error": str(ve)}, status=400)
     except PermissionError as pe:
         return JsonResponse({"error": str(pe)}, status=403)
+    except UpstreamUnavailable as ua:
+        return _unavailable_response(ua)
     except RuntimeError as re:
         return JsonResponse({"error": str(re)}, status=502)
 
@@ -130,22 +736,53 @@ def charger_by_id(request, charger_id: str):
     user = request.user
     log.info("charger_by_id: user=%s charger_id=%s", user.get_username(), charger_id)
 
-    client = EVAdvisorClient.from_settings()
+    client = EVAdvisorClient.shared()
     try:
-        data = client.get_charger_by_id(charger_id)
-        return JsonResponse(data, safe=False, status=200)
+        rep = client.get_charger_by_id(charger_id, tagged=True)
+        _record_in_index("record_charger", rep.value)
+        return _conditional_json(request, rep)
     except ValueError as ve:
         return JsonResponse({"error": str(ve)}, status=400)
     except PermissionError as pe:
         return JsonResponse({"error": str(pe)}, status=403)
     except FileNotFoundError as nf:
         return JsonResponse({"error": str(nf)}, status=404)
+    except UpstreamUnavailable as ua:
+        return _unavailable_response(ua)
     except RuntimeError as re:
         return JsonResponse({"error": str(re)}, status=502)
     
     
 
 
+def _loaded_index():
+    """The worker's charger index with recent rows applied, or None when CHARGER_INDEX_ENABLED is off."""
+    if not settings.CHARGER_INDEX_ENABLED:
+        return None
+    index = charger_index.index()
+    if index.stale():
+        try:
+            index.reload()
+        except DatabaseError as exc:  # keep answering from what is loaded
+            log.warning("charger index reload failed: %s", exc)
+    return index
+
+
+def _serial_from_index(serial: str):
+    index = _loaded_index()
+    return index.exact(serial) if index is not None else None
+
+
+def _record_in_index(method: str, *args) -> None:
+    """Write an upstream answer through to the charger index; a failed write never fails the request."""
+    try:
+        index = _loaded_index()
+        if index is not None:
+            getattr(index, method)(*args)
+    except DatabaseError as exc:
+        log.warning("charger index %s failed: %s", method, exc)
+
+
 #@login_required(login_url='login')
 @require_GET
 def charger_lookup_by_serial(request, serial: str):
@@ -153,23 +790,259 @@ def charger_lookup_by_serial(request, serial: str):
     Authenticated proxy endpoint for EV Advisor serial lookup.
     - Requires user to be logged in (session-based).
     - Adds a minimal audit log entry (who called, serial).
+    - Answered from the local charger index when it knows the serial
+      (services/charger_index.py); otherwise upstream, and the answer is indexed.
     """
     user = request.user
     log.info("charger_lookup_by_serial: user=%s serial=%s", user.get_username(), serial)
 
-    client = EVAdvisorClient.from_settings()
+    client = EVAdvisorClient.shared()
     try:
-        data = client.get_chargers_by_serial(serial)
-        return JsonResponse(data, safe=False, status=200)
+        rep = _serial_from_index(serial)
+        if rep is None:
+            rep = client.get_chargers_by_serial(serial, tagged=True)
+            _record_in_index("record_serial", serial, rep.value)
+        return _conditional_json(request, rep)
     except ValueError as ve:
         return JsonResponse({"error": str(ve)}, status=400)
     except PermissionError as pe:
         return JsonResponse({"error": str(pe)}, status=403)
     except FileNotFoundError as nf:
         return JsonResponse({"error": str(nf)}, status=404)
+    except UpstreamUnavailable as ua:
+        return _unavailable_response(ua)
     except RuntimeError as re:
         return JsonResponse({"error": str(re)}, status=502)
 
 
 
+@require_GET
+def charger_lookup_search(request):
+    """
+    Typeahead over serials, from the local charger index.
+    Query params:
+    - q (required): serial prefix (case-insensitive)
+    - limit (optional): max records, default CHARGER_INDEX_SEARCH_LIMIT (at most 100)
 
+    Returns {"items": [charger records in serial order], "source": "index" | "upstream"}.
+    When nothing indexed matches and q is a valid serial, it is looked up
+    upstream (exact match) and indexed.
+    """
+    q = (request.GET.get("q") or "").strip()
+    if not q:
+        return JsonResponse({"error": "q is required"}, status=400)
+    try:
+        limit = min(100, max(1, int(request.GET.get("limit") or settings.CHARGER_INDEX_SEARCH_LIMIT)))
+    except ValueError:
+        return JsonResponse({"error": "limit must be an integer"}, status=400)
+    if not settings.CHARGER_INDEX_ENABLED:
+        return JsonResponse({"error": "Charger index is disabled"}, status=404)
+
+    items = _loaded_index().search(q, limit)
+    if items:
+        return JsonResponse({"items": items, "source": "index"}, status=200)
+    try:
+        records = EVAdvisorClient.shared().get_chargers_by_serial(q)
+    except (ValueError, FileNotFoundError):
+        records = []  # not a serial, or unknown upstream: simply no matches
+    except PermissionError as pe:
+        return JsonResponse({"error": str(pe)}, status=403)
+    except UpstreamUnavailable as ua:
+        return _unavailable_response(ua)
+    except RuntimeError as re:
+        return JsonResponse({"error": str(re)}, status=502)
+    if records:
+        _record_in_index("record_serial", q, records)
+    return JsonResponse({"items": records[:limit], "source": "upstream"}, status=200)
+
+
+
+#Snapshot (info + capabilities + cloud status in one round-trip)
+
+_SNAPSHOT_PARTS = ("info", "capabilities", "cloudStatus")
+
+
+def _snapshot_response(charger_id, outcomes) -> JsonResponse:
+    """
+    Merge per-part Outcomes (see services.fanout) into one response. Each part
+    reports its own status and upstream latency; the response is 200 if any
+    part succeeded, otherwise it carries the info part's error status.
+    """
+    body = {"chargerId": str(charger_id)}
+    for o in outcomes:
+        part = {"status": 200 if o.ok else _error_status(o.error), "latencyMs": round(o.elapsed_ms, 1)}
+        if o.ok:
+            part["data"] = o.value
+        else:
+            part["error"] = str(o.error) if part["status"] != 500 else "Internal error"
+            if part["status"] == 500:
+                log.error("charger_snapshot: %s part failed", o.item, exc_info=o.error)
+        body[o.item] = part
+    status = 200
+    if all(not o.ok for o in outcomes):
+        status = body["info"]["status"]
+    return JsonResponse(body, status=status)
+
+
+#@login_required(login_url='login')
+@require_GET
+def charger_snapshot(request, charger_id: str):
+    """
+    Aggregated proxy: charger info, capabilities and cloud status fetched
+    concurrently, so a page load costs one upstream latency instead of three.
+    A failing part does not fail the others.
+    """
+    client = EVAdvisorClient.shared()
+    cid = str(charger_id)
+    calls = {
+        "info": client.get_charger_by_id,
+        "capabilities": client.get_capabilities,
+        "cloudStatus": client.get_cloud_status,
+    }
+    outcomes = fan_out(lambda part: calls[part](cid), _SNAPSHOT_PARTS, len(_SNAPSHOT_PARTS))
+    return _snapshot_response(cid, outcomes)
+
+
+
+#Batch lookup
+
+def _error_status(exc: BaseException) -> int:
+    """HTTP status for a client exception (same mapping as the single-item views)."""
+    if isinstance(exc, ValueError):
+        return 400
+    if isinstance(exc, PermissionError):
+        return 403
+    if isinstance(exc, FileNotFoundError):
+        return 404
+    if isinstance(exc, DeadlineExceeded):
+        return 504
+    if isinstance(exc, UpstreamUnavailable):
+        return 503
+    if isinstance(exc, RuntimeError):
+        return 502
+    return 500
+
+
+def _outcome_json(outcome, key: str) -> dict:
+    if outcome.ok:
+        return {key: outcome.item, "status": 200, "data": outcome.value, "elapsedMs": round(outcome.elapsed_ms, 1)}
+    status = _error_status(outcome.error)
+    if status == 500:
+        log.error("charger_lookup_batch: %s=%s failed", key, outcome.item, exc_info=outcome.error)
+    error = str(outcome.error) if status != 500 else "Internal error"
+    return {key: outcome.item, "status": status, "error": error, "elapsedMs": round(outcome.elapsed_ms, 1)}
+
+
+@csrf_exempt
+@require_http_methods(["GET", "POST"])
+def charger_lookup_batch(request):
+    """
+    Batch proxy for serial / chargerId lookups with bounded-concurrency fan-out.
+
+    GET  ?serial=A&serial=B...   or   ?chargerId=X&chargerId=Y...
+    POST {"serials": [...]}      or   {"chargerIds": [...]}   (JSON, for long lists)
+    Optional: concurrency (capped by EXTERNAL_API_BATCH_CONCURRENCY),
+              stream=1 to receive NDJSON lines as each item completes.
+
+    Response: {"results": [...], "ok": n, "failed": n} in input order; every
+    item carries its own status and data or error.
+
+    POST is a read, not a state change, so it is CSRF-exempt: fleet tools
+    without a session can use it (authentication is still enforced by
+    ApiTokenAuthMiddleware).
+    """
+    if request.method == "GET":
+        serials = request.GET.getlist("serial")
+        charger_ids = request.GET.getlist("chargerId")
+        concurrency = request.GET.get("concurrency")
+    else:
+        try:
+            body = json.loads(request.body or b"{}")
+        except ValueError:
+            return JsonResponse({"error": "Body must be JSON"}, status=400)
+        if not isinstance(body, dict):
+            return JsonResponse({"error": "Body must be a JSON object"}, status=400)
+        serials = body.get("serials") or []
+        charger_ids = body.get("chargerIds") or []
+        concurrency = body.get("concurrency")
+
+    if bool(serials) == bool(charger_ids):
+        return JsonResponse({"error": "Provide either serials or chargerIds"}, status=400)
+    items = serials or charger_ids
+    if not isinstance(items, list) or not all(isinstance(i, str) for i in items):
+        return JsonResponse({"error": "serials/chargerIds must be a list of strings"}, status=400)
+    if len(items) > settings.EXTERNAL_API_BATCH_MAX_ITEMS:
+        return JsonResponse({"error": f"At most {settings.EXTERNAL_API_BATCH_MAX_ITEMS} items per batch"}, status=400)
+
+    limit = settings.EXTERNAL_API_BATCH_CONCURRENCY
+    try:
+        if concurrency is not None:
+            limit = max(1, min(limit, int(concurrency)))
+    except (TypeError, ValueError):
+        return JsonResponse({"error": "concurrency must be an integer"}, status=400)
+
+    user = request.user
+    key = "serial" if serials else "chargerId"
+    log.info("charger_lookup_batch: user=%s %s count=%s", user.get_username(), key, len(items))
+
+    client = EVAdvisorClient.shared()
+    fn = client.get_chargers_by_serial if serials else client.get_charger_by_id
+
+    if request.GET.get("stream") in ("1", "true"):
+        lines = (json.dumps(_outcome_json(o, key)) + "\n" for o in iter_fan_out(fn, items, limit))
+        return StreamingHttpResponse(lines, content_type="application/x-ndjson")
+
+    results = [_outcome_json(o, key) for o in fan_out(fn, items, limit)]
+    ok = sum(1 for r in results if r["status"] == 200)
+    return JsonResponse({"results": results, "ok": ok, "failed": len(results) - ok}, status=200)
+
+
+
+#Upstream client stats (operators)
+@staff_member_required
+@require_GET
+def upstream_stats(request):
+    """
+    Pool, cache, retry-budget and circuit-breaker counters for this worker's
+    shared EVAdvisorClient, and its cloud-status watcher's. A healthy keep-alive setup shows pool hits growing
+    much faster than misses.
+    """
+    client = EVAdvisorClient.shared()
+    watcher = status_watch.current()
+    return JsonResponse({**client.stats(), "status_watch": watcher.stats() if watcher else None}, status=200)
+
+
+@staff_member_required
+@require_POST
+def upstream_cache_invalidate(request):
+    """
+    Drop cached EV Advisor lookups for every worker on this host (the
+    response cache is the shared "ev_advisor" SQLite alias).
+    Form fields:
+    - endpoint (required): chargers_by_serial | charger | capabilities
+    - key (optional): serial or chargerId; omit to clear the whole endpoint
+    """
+    endpoint = request.POST.get("endpoint", "")
+    key = request.POST.get("key") or None
+    if endpoint not in settings.EXTERNAL_API_CACHE_TTLS:
+        return JsonResponse({"error": "Unknown cache endpoint"}, status=400)
+
+    client = EVAdvisorClient.shared()
+    client.invalidate(endpoint, key)
+    log.info("upstream_cache_invalidate: user=%s endpoint=%s key=%s", request.user.get_username(), endpoint, key)
+    return JsonResponse({"invalidated": endpoint, "key": key}, status=200)
+
+
+
+#Metrics (Prometheus scrape)
+@require_GET
+def metrics_view(request):
+    """
+    EV Advisor client and proxy metrics in the Prometheus text format,
+    summed over all workers sharing METRICS_DIR. Not session-protected so a
+    scraper can reach it; set METRICS_TOKEN to require a bearer token.
+    """
+    token = settings.METRICS_TOKEN
+    if token and not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}"):
+        return HttpResponse("Unauthorized\n", status=401, content_type="text/plain")
+    return HttpResponse(metrics.render_all(), content_type="text/plain; version=0.0.4; charset=utf-8")
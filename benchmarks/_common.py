@@ -0,0 +1,203 @@
+"""
+Shared helpers for the benchmark scripts: process management and a small
+closed-loop HTTP load generator with latency percentiles.
+"""
+
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+import aiohttp
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_stub(*args: str) -> "tuple[subprocess.Popen, str]":
+    """Start benchmarks.stub_ev_advisor in a subprocess; return (proc, base_url)."""
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.stub_ev_advisor", "--port", "0", *args],
+        cwd=REPO_ROOT,
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    line = proc.stdout.readline().strip()
+    if not line.startswith("listening "):
+        proc.kill()
+        raise RuntimeError(f"stub failed to start: {line!r}")
+    return proc, line.split(" ", 1)[1]
+
+
+def django_env(stub_url: str, **overrides: str) -> dict:
+    env = dict(os.environ)
+    env.update({
+        "DJANGO_SETTINGS_MODULE": "api_app.settings",
+        "DJANGO_SECRET_KEY": "benchmark-only",
+        "DJANGO_ALLOWED_HOSTS": "127.0.0.1,localhost",
+        "EXTERNAL_API_BASE_URL": stub_url,
+        "EXTERNAL_API_KEY": "benchmark",
+    })
+    env.update(overrides)
+    return env
+
+
+def start_server(cmd: "list[str]", env: dict, port: int, ready_path: str = "/accounts/login/") -> subprocess.Popen:
+    """Start an app server and wait until it answers HTTP."""
+    proc = subprocess.Popen(cmd, cwd=REPO_ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"server exited early: {' '.join(cmd)}")
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}{ready_path}", timeout=1).close()
+            return proc
+        except urllib.error.HTTPError:
+            return proc  # answering, even if with an error status
+        except OSError:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError(f"server did not become ready: {' '.join(cmd)}")
+
+
+def stop(proc: subprocess.Popen) -> None:
+    proc.terminate()
+    try:
+        proc.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+
+def percentile(sorted_values: "list[float]", pct: float) -> float:
+    if not sorted_values:
+        return float("nan")
+    k = min(len(sorted_values) - 1, max(0, int(round(pct / 100 * (len(sorted_values) - 1)))))
+    return sorted_values[k]
+
+
+def peak_rss_mb(pid: int) -> float:
+    """Peak resident set size (VmHWM) of a process, in MB (Linux only)."""
+    try:
+        with open(f"/proc/{pid}/status") as fh:
+            for line in fh:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return float("nan")
+
+
+def process_tree(pid: int) -> "list[int]":
+    """pid and all its descendants (Linux /proc), e.g. a gunicorn master and its workers."""
+    children: "dict[int, list[int]]" = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as fh:
+                # Field 4 is the parent pid; the command name (field 2) may contain spaces.
+                ppid = int(fh.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    out, todo = [], [pid]
+    while todo:
+        p = todo.pop()
+        out.append(p)
+        todo.extend(children.get(p, []))
+    return out
+
+
+def tree_peak_rss_mb(pid: int) -> "tuple[float, float]":
+    """(largest single-process peak RSS, sum of peaks) over a process tree, in MB."""
+    peaks = [v for v in (peak_rss_mb(p) for p in process_tree(pid)) if v == v]
+    return (max(peaks), sum(peaks)) if peaks else (float("nan"), float("nan"))
+
+
+def tree_cpu_seconds(pid: int) -> float:
+    """User + system CPU time consumed so far by a process tree, in seconds (Linux /proc)."""
+    ticks = 0
+    for p in process_tree(pid):
+        try:
+            with open(f"/proc/{p}/stat") as fh:
+                # Fields 14 and 15 (utime, stime), counted after the command name.
+                fields = fh.read().rsplit(")", 1)[1].split()
+            ticks += int(fields[11]) + int(fields[12])
+        except (OSError, IndexError, ValueError):
+            continue
+    return ticks / os.sysconf("SC_CLK_TCK")
+
+
+def migrate(env: dict) -> None:
+    """Create the schema in the database named by env["DJANGO_DB_PATH"]."""
+    subprocess.run(
+        [sys.executable, "manage.py", "migrate", "--noinput", "-v", "0"],
+        cwd=REPO_ROOT, env=env, check=True,
+    )
+
+
+async def _drive(url_for, concurrency: int, duration: float, timeout: float, headers=None):
+    latencies, statuses, errors = [], {}, 0
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    deadline = time.monotonic() + duration
+
+    async with aiohttp.ClientSession(
+        connector=connector, timeout=aiohttp.ClientTimeout(total=timeout), headers=headers, auto_decompress=False,
+    ) as client:
+        async def worker(wid: int):
+            nonlocal errors
+            i = 0
+            while time.monotonic() < deadline:
+                t0 = time.perf_counter()
+                try:
+                    async with client.get(url_for(wid, i)) as resp:
+                        await resp.read()
+                        statuses[resp.status] = statuses.get(resp.status, 0) + 1
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    errors += 1
+                latencies.append(time.perf_counter() - t0)
+                i += 1
+
+        started = time.monotonic()
+        await asyncio.gather(*(worker(w) for w in range(concurrency)))
+        elapsed = time.monotonic() - started
+    return latencies, statuses, errors, elapsed
+
+
+def run_load(url_for, concurrency: int, duration: float, timeout: float = 60.0, headers=None) -> dict:
+    """
+    Closed loop: `concurrency` clients each send the next request as soon as
+    the previous one finishes, for `duration` seconds. `url_for(worker, i)`
+    returns the URL of a worker's i-th request. `headers` are sent with
+    every request; compressed bodies are read as-is, not decompressed.
+    """
+    latencies, statuses, errors, elapsed = asyncio.run(_drive(url_for, concurrency, duration, timeout, headers))
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "statuses": statuses,
+        "errors": errors,
+    }
+
+
+def format_row(label: str, result: dict) -> str:
+    ok = result["statuses"].get(200, 0)
+    return (
+        f"{label:<28} {result['rps']:>9.1f} req/s  p50 {result['p50_ms']:>8.1f} ms  "
+        f"p95 {result['p95_ms']:>8.1f} ms  p99 {result['p99_ms']:>8.1f} ms  "
+        f"ok {ok}/{result['requests']}  errors {result['errors']}"
+    )
@@ -0,0 +1,79 @@
+"""
+CPU cost of the charge-history analytics: vectorized (numpy) vs stdlib.
+
+Generates a fleet's sessions with benchmarks.stub_ev_advisor.charge_history
+(in process, no servers), then times, for each implementation, turning the
+records into columns (SessionColumns.from_records) and the group-bys
+(summarize) separately, and checks that both produce the same result.
+
+    python -m benchmarks.analytics --chargers 40 --sessions-per-day 20 --days 365
+
+The numpy rows are skipped when numpy is not installed.
+"""
+
+import argparse
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "api_app.settings")
+os.environ.setdefault("DJANGO_SECRET_KEY", "benchmark")
+
+import django  # noqa: E402
+
+django.setup()
+
+from api_app.services import history_analytics  # noqa: E402
+
+from .stub_ev_advisor import charge_history  # noqa: E402
+
+
+def fleet(chargers: int, per_day: int, days: int):
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    end = start + timedelta(days=days)
+    records = []
+    for i in range(chargers):
+        records.extend(charge_history(f"charger-{i:04d}", start, end, per_day))
+    return records
+
+
+def timed(records, groups, repeat: int):
+    best_load = best_summary = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        columns = history_analytics.SessionColumns.from_records(records)
+        t1 = time.perf_counter()
+        result = history_analytics.summarize(columns, groups)
+        t2 = time.perf_counter()
+        best_load, best_summary = min(best_load, t1 - t0), min(best_summary, t2 - t1)
+    return result, best_load, best_summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chargers", type=int, default=40)
+    parser.add_argument("--sessions-per-day", type=int, default=20, help="per charger")
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--repeat", type=int, default=3, help="best of N")
+    args = parser.parse_args()
+
+    records = fleet(args.chargers, args.sessions_per_day, args.days)
+    groups = history_analytics.GROUPS
+    print(f"{len(records)} sessions, groups {','.join(groups)}", flush=True)
+
+    results = {}
+    if history_analytics.np is not None:
+        results["numpy"] = timed(records, groups, args.repeat)
+    with mock.patch.object(history_analytics, "np", None):
+        results["stdlib"] = timed(records, groups, args.repeat)
+    for name, (_, load, summary) in results.items():
+        print(f"{name:<8} load {load * 1000:>8.1f} ms  summarize {summary * 1000:>8.1f} ms"
+              f"  total {(load + summary) * 1000:>8.1f} ms", flush=True)
+    if len(results) == 2:
+        same = results["numpy"][0] == results["stdlib"][0]
+        print("results identical" if same else "RESULTS DIFFER")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Compare WSGI (sync views, gunicorn gthread) with ASGI (async views, uvicorn)
+against a deliberately slow local upstream stub.
+
+Each request asks for the cloud status of a distinct charger so neither the
+response cache nor request coalescing hides upstream latency. With the
+upstream taking `--latency` seconds, a WSGI worker tops out at roughly
+threads / latency req/s; one ASGI worker keeps all in-flight calls on its
+event loop and scales with concurrency instead.
+
+Requires gunicorn, uvicorn and aiohttp:
+    python -m benchmarks.asgi_vs_wsgi --latency 0.5 --concurrency 50 200 1000
+"""
+
+import argparse
+import sys
+import uuid
+
+from ._common import django_env, format_row, free_port, run_load, start_server, start_stub, stop
+
+
+def bench(label, cmd, env, port, concurrency, duration):
+    proc = start_server(cmd, env, port)
+    try:
+        ids = [str(uuid.uuid4()) for _ in range(4096)]
+        url_for = lambda w, i: f"http://127.0.0.1:{port}/api/charger/{ids[(w * 7919 + i) % len(ids)]}/cloudstatus/"
+        for c in concurrency:
+            print(format_row(f"{label} c={c}", run_load(url_for, c, duration)), flush=True)
+    finally:
+        stop(proc)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=0.5, help="upstream latency in seconds")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[50, 200, 1000])
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per measurement")
+    parser.add_argument("--wsgi-threads", type=int, default=32, help="gunicorn --threads (one worker)")
+    args = parser.parse_args()
+
+    stub, stub_url = start_stub("--latency", str(args.latency), "--ocpp-zip-mb", "0")
+    try:
+        # Measure upstream round-trips, not the response cache.
+        env = django_env(stub_url, EXTERNAL_API_CACHE_ENABLED="false", EXTERNAL_API_POOL_MAXSIZE="1024")
+
+        port = free_port()
+        bench(
+            f"WSGI gthread x{args.wsgi_threads}",
+            [sys.executable, "-m", "gunicorn", "api_app.wsgi:application", "-w", "1",
+             "-k", "gthread", "--threads", str(args.wsgi_threads), "-b", f"127.0.0.1:{port}",
+             "--backlog", "4096", "--timeout", "120"],
+            env, port, args.concurrency, args.duration,
+        )
+
+        port = free_port()
+        bench(
+            "ASGI uvicorn (async views)",
+            [sys.executable, "-m", "uvicorn", "api_app.asgi:application", "--workers", "1",
+             "--host", "127.0.0.1", "--port", str(port), "--backlog", "4096", "--no-access-log"],
+            dict(env, EXTERNAL_API_ASYNC_VIEWS="true"), port, args.concurrency, args.duration,
+        )
+    finally:
+        stop(stub)
+
+
+if __name__ == "__main__":
+    main()
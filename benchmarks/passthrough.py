@@ -0,0 +1,88 @@
+"""
+CPU cost of serializing proxied JSON: EXTERNAL_API_PASSTHROUGH off vs on.
+
+Starts benchmarks.stub_ev_advisor with large charge-history payloads, then
+runs the app server twice (pass-through off, then on) against the same
+routes and reports throughput, latency and the server's CPU time per
+request (utime + stime of the whole process tree, from /proc). The local
+history store is disabled and ranges are fetched in one window, so every
+charge-history request proxies one large upstream body.
+
+    python -m benchmarks.passthrough --sessions-per-day 200
+    python -m benchmarks.passthrough --gzip   # clients send Accept-Encoding: gzip
+
+Requires gunicorn and aiohttp; Linux only (/proc).
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import uuid
+
+from ._common import django_env, format_row, free_port, migrate, run_load, start_server, start_stub, stop, tree_cpu_seconds
+
+HISTORY_RANGE = "startDate=2025-01-01&endDate=2025-03-31&window=none"
+
+ROUTES = {
+    "charge_history": lambda ids, w, i: f"/api/charger/{ids[(w + i) % 8]}/charge-history/?{HISTORY_RANGE}",
+    "charger_by_id": lambda ids, w, i: f"/api/charger-lookup/id/{ids[(w * 7919 + i) % len(ids)]}/",
+}
+
+
+def bench(args, env, ids, passthrough: bool) -> None:
+    env = dict(env, EXTERNAL_API_PASSTHROUGH="true" if passthrough else "false")
+    port = free_port()
+    proc = start_server(
+        [sys.executable, "-m", "gunicorn", "api_app.wsgi:application", "-w", str(args.workers),
+         "-k", "gthread", "--threads", str(args.threads), "-b", f"127.0.0.1:{port}", "--timeout", "120"],
+        env, port,
+    )
+    label = "passthrough" if passthrough else "serialize"
+    try:
+        for name in args.routes:
+            path_for = ROUTES[name]
+            url_for = lambda w, i: f"http://127.0.0.1:{port}{path_for(ids, w, i)}"
+            run_load(url_for, args.concurrency, 1.0, headers=args.headers)  # warm caches and pools
+            cpu_before = tree_cpu_seconds(proc.pid)
+            result = run_load(url_for, args.concurrency, args.duration, headers=args.headers)
+            cpu_ms = (tree_cpu_seconds(proc.pid) - cpu_before) * 1000
+            per_request = cpu_ms / result["requests"] if result["requests"] else float("nan")
+            print(f"{format_row(f'{label} {name}', result)}  cpu {per_request:>6.2f} ms/req", flush=True)
+    finally:
+        stop(proc)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions-per-day", type=int, default=200, help="charge-history payload size")
+    parser.add_argument("--latency", type=float, default=0.0, help="upstream latency in seconds")
+    parser.add_argument("--routes", nargs="+", choices=sorted(ROUTES), default=list(ROUTES))
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per measurement")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--gzip", action="store_true", help="clients accept gzip")
+    args = parser.parse_args()
+    args.headers = {"Accept-Encoding": "gzip"} if args.gzip else {"Accept-Encoding": "identity"}
+
+    stub_proc, stub_url = start_stub("--latency", str(args.latency), "--sessions-per-day", str(args.sessions_per_day))
+    try:
+        with tempfile.TemporaryDirectory(prefix="evadv-bench-") as tmp:
+            env = django_env(
+                stub_url,
+                DJANGO_DB_PATH=os.path.join(tmp, "bench.sqlite3"),
+                METRICS_DIR=os.path.join(tmp, "metrics"),
+                SHARED_CACHE_DIR=os.path.join(tmp, "cache"),
+                EXTERNAL_API_HISTORY_STORE_ENABLED="false",
+            )
+            migrate(env)
+            ids = [str(uuid.uuid4()) for _ in range(256)]
+            for passthrough in (False, True):
+                bench(args, env, ids, passthrough)
+    finally:
+        stop(stub_proc)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+Per-route load and latency benchmark against the local EV Advisor stub.
+
+Starts benchmarks.stub_ev_advisor with the given latency / error rate /
+payload sizes, then, for every /api/... route, starts a fresh app server
+(so peak RSS belongs to that route), drives it at each concurrency level
+and reports throughput, p50/p95/p99 and the server's peak RSS. The
+database is a throw-away migrated SQLite file, never db.sqlite3.
+
+Run before a release and compare with the previous release's numbers:
+    python -m benchmarks.routes --json > before.json
+    ... upgrade ...
+    python -m benchmarks.routes --baseline before.json --max-regression 15
+
+With --baseline, exits 1 if any route/concurrency lost more than
+--max-regression percent of its throughput or grew its p95 by as much.
+
+Requires gunicorn (--server wsgi) or uvicorn (--server asgi) and aiohttp.
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import uuid
+
+from ._common import (
+    django_env, format_row, free_port, migrate, run_load, start_server, start_stub, stop, tree_peak_rss_mb,
+)
+
+HISTORY_RANGE = "startDate=2025-01-01&endDate=2025-12-31"
+
+# name -> url_for(ids, worker, i) path; ids is a pool of charger UUIDs.
+ROUTES = {
+    "lookup_serial": lambda ids, w, i: f"/api/charger-lookup/SN{(w * 7919 + i) % len(ids):06d}/",
+    "charger_by_id": lambda ids, w, i: f"/api/charger-lookup/id/{ids[(w * 7919 + i) % len(ids)]}/",
+    "capabilities": lambda ids, w, i: f"/api/charger/{ids[(w * 7919 + i) % len(ids)]}/capabilities/",
+    "cloudstatus": lambda ids, w, i: f"/api/charger/{ids[(w * 7919 + i) % len(ids)]}/cloudstatus/",
+    "snapshot": lambda ids, w, i: f"/api/charger/{ids[(w * 7919 + i) % len(ids)]}/snapshot/",
+    "batch": lambda ids, w, i: "/api/chargers/batch/?" + "&".join(
+        f"serial=SN{(w * 7919 + i + k) % len(ids):06d}" for k in range(20)
+    ),
+    "charge_history": lambda ids, w, i: f"/api/charger/{ids[(w + i) % 8]}/charge-history/?{HISTORY_RANGE}",
+    "charge_history_ndjson": lambda ids, w, i: (
+        f"/api/charger/{ids[(w + i) % 8]}/charge-history/?{HISTORY_RANGE}&format=ndjson"
+    ),
+    "ocpp_logs": lambda ids, w, i: f"/api/charger/{ids[(w * 7919 + i) % len(ids)]}/ocpp-logs/",
+    "metrics": lambda ids, w, i: "/metrics",
+}
+
+
+def server_cmd(args, port: int) -> "list[str]":
+    if args.server == "asgi":
+        return [sys.executable, "-m", "uvicorn", "api_app.asgi:application", "--workers", str(args.workers),
+                "--host", "127.0.0.1", "--port", str(port), "--backlog", "4096", "--no-access-log"]
+    return [sys.executable, "-m", "gunicorn", "api_app.wsgi:application", "-w", str(args.workers),
+            "-k", "gthread", "--threads", str(args.threads), "-b", f"127.0.0.1:{port}",
+            "--backlog", "4096", "--timeout", "120"]
+
+
+def bench_route(name, args, env, ids) -> "list[dict]":
+    port = free_port()
+    proc = start_server(server_cmd(args, port), env, port)
+    rows = []
+    try:
+        path_for = ROUTES[name]
+        url_for = lambda w, i: f"http://127.0.0.1:{port}{path_for(ids, w, i)}"
+        for c in args.concurrency:
+            result = run_load(url_for, c, args.duration)
+            result["peak_rss_mb"], result["peak_rss_total_mb"] = tree_peak_rss_mb(proc.pid)
+            result.update(route=name, concurrency=c)
+            rows.append(result)
+            if not args.json:
+                print(f"{format_row(f'{name} c={c}', result)}  rss {result['peak_rss_mb']:>6.1f} MB "
+                      f"(all workers {result['peak_rss_total_mb']:.1f})", flush=True)
+    finally:
+        stop(proc)
+    return rows
+
+
+def regressions(rows: "list[dict]", baseline: "list[dict]", max_pct: float) -> "list[str]":
+    """Human-readable lines for every route/concurrency worse than the baseline by more than max_pct."""
+    before = {(r["route"], r["concurrency"]): r for r in baseline}
+    found = []
+    for row in rows:
+        old = before.get((row["route"], row["concurrency"]))
+        if old is None:
+            continue
+        label = f"{row['route']} c={row['concurrency']}"
+        if old["rps"] and row["rps"] < old["rps"] * (1 - max_pct / 100):
+            found.append(f"{label}: throughput {old['rps']:.1f} -> {row['rps']:.1f} req/s")
+        if old["p95_ms"] and row["p95_ms"] > old["p95_ms"] * (1 + max_pct / 100):
+            found.append(f"{label}: p95 {old['p95_ms']:.1f} -> {row['p95_ms']:.1f} ms")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    stub = parser.add_argument_group("upstream stub")
+    stub.add_argument("--latency", type=float, default=0.05, help="upstream latency in seconds")
+    stub.add_argument("--jitter", type=float, default=0.0, help="extra uniform random latency in seconds")
+    stub.add_argument("--error-rate", type=float, default=0.0, help="fraction of upstream calls answered 503")
+    stub.add_argument("--sessions-per-day", type=int, default=4, help="charge-history payload size")
+    stub.add_argument("--ocpp-zip-mb", type=float, default=5.0, help="OCPP log archive size")
+    load = parser.add_argument_group("load")
+    load.add_argument("--routes", nargs="+", choices=sorted(ROUTES), default=list(ROUTES))
+    load.add_argument("--concurrency", type=int, nargs="+", default=[10, 50, 200])
+    load.add_argument("--duration", type=float, default=10.0, help="seconds per measurement")
+    load.add_argument("--chargers", type=int, default=4096, help="distinct charger ids to spread requests over")
+    load.add_argument("--no-cache", action="store_true", help="disable the response cache (measure upstream calls)")
+    server = parser.add_argument_group("app server")
+    server.add_argument("--server", choices=("wsgi", "asgi"), default="wsgi")
+    server.add_argument("--workers", type=int, default=1)
+    server.add_argument("--threads", type=int, default=32, help="gunicorn --threads per worker (wsgi)")
+    out = parser.add_argument_group("output")
+    out.add_argument("--json", action="store_true", help="print results as JSON (input for --baseline)")
+    out.add_argument("--baseline", help="JSON results of an earlier run to compare with")
+    out.add_argument("--max-regression", type=float, default=10.0, help="allowed slowdown in percent")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as fh:
+            baseline = json.load(fh)["results"]
+
+    stub_proc, stub_url = start_stub(
+        "--latency", str(args.latency), "--jitter", str(args.jitter), "--error-rate", str(args.error_rate),
+        "--sessions-per-day", str(args.sessions_per_day), "--ocpp-zip-mb", str(args.ocpp_zip_mb),
+    )
+    rows = []
+    try:
+        with tempfile.TemporaryDirectory(prefix="evadv-bench-") as tmp:
+            env = django_env(
+                stub_url,
+                DJANGO_DB_PATH=os.path.join(tmp, "bench.sqlite3"),
+                METRICS_DIR=os.path.join(tmp, "metrics"),
+                SHARED_CACHE_DIR=os.path.join(tmp, "cache"),
+                EXTERNAL_API_POOL_MAXSIZE="1024",
+                EXTERNAL_API_ASYNC_VIEWS="true" if args.server == "asgi" else "false",
+            )
+            if args.no_cache:
+                env["EXTERNAL_API_CACHE_ENABLED"] = "false"
+            migrate(env)
+            ids = [str(uuid.uuid4()) for _ in range(max(8, args.chargers))]
+            for name in args.routes:
+                rows.extend(bench_route(name, args, env, ids))
+    finally:
+        stop(stub_proc)
+
+    if args.json:
+        print(json.dumps({"args": vars(args), "results": rows}, indent=2))
+    if baseline is not None:
+        found = regressions(rows, baseline, args.max_regression)
+        for line in found:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        if found:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+"""
+Local stub of the EV Advisor API for benchmarks.
+
+An asyncio HTTP/1.1 server (keep-alive, no dependencies) that mimics the
+upstream endpoints used by `EVAdvisorClient`, with knobs for latency, error
+rate and payload size:
+
+    GET /ccc/api/v1.0/chargerserial/{serial}
+    GET /ccc/api/v1.0/{chargerId}
+    GET /controller/api/v1.0/charger/{chargerId}/capabilities
+    GET /controller/api/v1.0/charger/{chargerId}/cloudstatus
+    GET /controller/api/v1.0/charger/{chargerId}/charge/history?startDate=&endDate=[&idTag=]
+    GET /ccc/api/v1.0/charger/{chargerId}/logs/download-ocpp-logs
+
+Charge history is generated deterministically from the requested range
+(`--sessions-per-day` sessions per day, stable transactionIds), so windowed
+fetches of the same range return the same records. The OCPP archive is a zip
+of OCPP-J log lines, built once at startup (`--ocpp-zip-mb`). Lookups and the
+archive carry ETags and answer If-None-Match with 304.
+
+Run standalone:
+    python -m benchmarks.stub_ev_advisor --port 8765 --latency 0.2 --error-rate 0.01
+"""
+
+import argparse
+import asyncio
+import hashlib
+import io
+import json
+import random
+import re
+import zipfile
+from datetime import datetime, timedelta, timezone
+from urllib.parse import parse_qs, urlsplit
+
+_HISTORY_RE = re.compile(r"^/controller/api/v1\.0/charger/([^/]+)/charge/history$")
+_CAPS_RE = re.compile(r"^/controller/api/v1\.0/charger/([^/]+)/capabilities$")
+_STATUS_RE = re.compile(r"^/controller/api/v1\.0/charger/([^/]+)/cloudstatus$")
+_OCPP_RE = re.compile(r"^/ccc/api/v1\.0/charger/([^/]+)/logs/download-ocpp-logs$")
+_SERIAL_RE = re.compile(r"^/ccc/api/v1\.0/chargerserial/([^/]+)$")
+_CHARGER_RE = re.compile(r"^/ccc/api/v1\.0/([^/]+)$")
+
+_ACTIONS = ["Heartbeat", "StatusNotification", "MeterValues", "StartTransaction", "StopTransaction"]
+
+
+def _parse_date(value: str) -> datetime:
+    dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+def charger_id_for_serial(serial: str) -> str:
+    """Stable fake UUID for a serial, so lookups by serial and by id agree."""
+    h = hashlib.md5(serial.encode()).hexdigest()
+    return f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:32]}"
+
+
+def build_ocpp_zip(size_mb: float, charger_id: str = "stub") -> bytes:
+    """Zip with one OCPP-J log file of roughly `size_mb` MB (uncompressed)."""
+    rng = random.Random(42)
+    t = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    target = int(size_mb * 1024 * 1024)
+    lines, size, n = [], 0, 0
+    while size < target:
+        n += 1
+        t += timedelta(seconds=rng.randint(1, 30))
+        action = rng.choice(_ACTIONS)
+        msg_id = f"{n:08d}"
+        call = json.dumps([2, msg_id, action, {"connectorId": 1, "status": rng.choice(["Available", "Charging"])}])
+        result = json.dumps([3, msg_id, {}])
+        for direction, frame in (("recv", call), ("send", result)):
+            line = f"{t.isoformat().replace('+00:00', 'Z')} {direction} {charger_id} {frame}\n"
+            lines.append(line)
+            size += len(line)
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("ocpp.log", "".join(lines))
+    return buf.getvalue()
+
+
+class StubConfig:
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, sessions_per_day=4, ocpp_zip_mb=1.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.sessions_per_day = sessions_per_day
+        self.ocpp_zip = build_ocpp_zip(ocpp_zip_mb) if ocpp_zip_mb else b""
+        self.ocpp_etag = '"%s"' % hashlib.sha256(self.ocpp_zip).hexdigest()[:32]
+        self.requests = 0
+
+
+def charge_history(charger_id: str, start: datetime, end: datetime, per_day: int, id_tag=None):
+    """Deterministic sessions in [start, end): `per_day` per day, 45 min each."""
+    if per_day <= 0:
+        return []
+    step = timedelta(days=1) / per_day
+    epoch = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    k = max(0, int((start - epoch) / step))
+    out = []
+    while True:
+        t0 = epoch + k * step
+        if t0 >= end:
+            break
+        if t0 >= start:
+            tag = f"TAG{k % 7:03d}"
+            if not id_tag or id_tag == tag:
+                energy = round(3 + (k * 7919 % 200) / 10, 3)
+                out.append({
+                    "transactionId": k,
+                    "chargerId": charger_id,
+                    "idTag": tag,
+                    "startTime": t0.isoformat().replace("+00:00", "Z"),
+                    "endTime": (t0 + timedelta(minutes=45)).isoformat().replace("+00:00", "Z"),
+                    "chargingEndTime": (t0 + timedelta(minutes=30 + k % 15)).isoformat().replace("+00:00", "Z"),
+                    "energyKwh": energy,
+                    "stopReason": "EVDisconnected",
+                })
+        k += 1
+    return out
+
+
+def _json(body, headers: dict):
+    """JSON lookup response with an ETag; 304 when If-None-Match names it."""
+    data = json.dumps(body).encode()
+    etag = '"%s"' % hashlib.md5(data).hexdigest()
+    if headers.get("if-none-match") == etag:
+        return 304, "application/json", b"", {"ETag": etag}
+    return 200, "application/json", data, {"ETag": etag}
+
+
+def route(cfg: StubConfig, method: str, target: str, headers: dict):
+    """Return (status, content_type, body bytes, extra headers)."""
+    if method != "GET":
+        return 405, "application/json", b'{"error":"method"}', {}
+    if headers.get("apikey") is None:
+        return 403, "application/json", b'{"error":"Forbidden"}', {}
+    if cfg.error_rate and random.random() < cfg.error_rate:
+        return 503, "application/json", b'{"error":"unavailable"}', {}
+
+    parts = urlsplit(target)
+    path, query = parts.path, parse_qs(parts.query)
+
+    m = _OCPP_RE.match(path)
+    if m:
+        if headers.get("if-none-match") == cfg.ocpp_etag:
+            return 304, "application/zip", b"", {"ETag": cfg.ocpp_etag}
+        return 200, "application/zip", cfg.ocpp_zip, {
+            "ETag": cfg.ocpp_etag,
+            "Content-Disposition": 'attachment; filename="ocpp-logs.zip"',
+        }
+    m = _HISTORY_RE.match(path)
+    if m:
+        try:
+            start = _parse_date(query["startDate"][0])
+            end = _parse_date(query["endDate"][0])
+        except (KeyError, ValueError):
+            return 400, "application/json", b'{"error":"Bad Request"}', {}
+        if len(query["endDate"][0]) == 10:
+            end += timedelta(days=1)  # date-only endDate is inclusive
+        id_tag = query.get("idTag", [None])[0]
+        body = charge_history(m.group(1), start, end, cfg.sessions_per_day, id_tag)
+        return 200, "application/json", json.dumps(body).encode(), {}
+    m = _CAPS_RE.match(path)
+    if m:
+        body = {"chargerId": m.group(1), "maxCurrent": 32, "phases": 3, "smartCharging": True, "ocppVersion": "1.6"}
+        return _json(body, headers)
+    m = _STATUS_RE.match(path)
+    if m:
+        body = {"chargerId": m.group(1), "cloudConnected": True, "status": "Available", "lastSeen": "2025-01-01T00:00:00Z"}
+        return _json(body, headers)
+    m = _SERIAL_RE.match(path)
+    if m:
+        serial = m.group(1)
+        if serial.startswith("MISSING"):
+            return 404, "application/json", b'{"error":"not found"}', {}
+        body = [{"chargerId": charger_id_for_serial(serial), "serialNumber": serial, "model": "AC-RESI"}]
+        return _json(body, headers)
+    m = _CHARGER_RE.match(path)
+    if m:
+        body = {"chargerId": m.group(1), "serialNumber": "SN-" + m.group(1)[:8], "model": "AC-RESI", "firmware": "1.2.3"}
+        return _json(body, headers)
+    return 404, "application/json", b'{"error":"not found"}', {}
+
+
+async def _handle(cfg: StubConfig, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                break
+            method, target, _ = request_line.decode("latin-1").split(" ", 2)
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+
+            cfg.requests += 1
+            delay = cfg.latency + (random.uniform(0, cfg.jitter) if cfg.jitter else 0)
+            if delay:
+                await asyncio.sleep(delay)
+
+            status, ctype, body, extra = route(cfg, method, target, headers)
+            head = [f"HTTP/1.1 {status} X", f"Content-Type: {ctype}", f"Content-Length: {len(body)}"]
+            head += [f"{k}: {v}" for k, v in extra.items()]
+            writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1"))
+            # Large bodies are written in slices so the stub itself stays responsive.
+            view = memoryview(body)
+            for i in range(0, len(body), 256 * 1024):
+                writer.write(view[i:i + 256 * 1024])
+                await writer.drain()
+            await writer.drain()
+            if headers.get("connection", "").lower() == "close":
+                break
+    except (ConnectionError, ValueError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(cfg: StubConfig, host: str = "127.0.0.1", port: int = 0):
+    server = await asyncio.start_server(lambda r, w: _handle(cfg, r, w), host, port, backlog=4096)
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra uniform random latency, seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 503")
+    parser.add_argument("--sessions-per-day", type=int, default=4, help="charge history density")
+    parser.add_argument("--ocpp-zip-mb", type=float, default=1.0, help="uncompressed size of the OCPP log")
+    args = parser.parse_args()
+
+    cfg = StubConfig(args.latency, args.jitter, args.error_rate, args.sessions_per_day, args.ocpp_zip_mb)
+
+    async def run():
+        server = await serve(cfg, args.host, args.port)
+        port = server.sockets[0].getsockname()[1]
+        # First line of output is machine-readable for the benchmark drivers.
+        print(f"listening http://{args.host}:{port}", flush=True)
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,12 @@ console.log('Session timeout script loaded');
 const SESSION_TIMEOUT_SECONDS = parseInt(document.querySelector('meta[name="session-timeout"]').getAttribute('content')) || 300;
 const SESSION_TIMEOUT_MS = SESSION_TIMEOUT_SECONDS * 1000;
 
+// The server only extends the session on page loads and keep-alive pings (API calls
+// do not), at most once per refresh interval, so ping on activity at that rate.
+const SESSION_REFRESH_MS = (parseInt(document.querySelector('meta[name="session-refresh-interval"]')?.getAttribute('content')) || 60) * 1000;
+const SESSION_KEEPALIVE_URL = document.querySelector('meta[name="session-keepalive-url"]')?.getAttribute('content');
+let lastKeepalive = Date.now();  // this page load refreshed the session
+
 let logoutTimer;
 let countdownInterval;
 
@@ -109,8 +115,22 @@ function showWarningPopup() {
   });
 }
 
+function keepSessionAlive() {
+  if (!SESSION_KEEPALIVE_URL || Date.now() - lastKeepalive < SESSION_REFRESH_MS) {
+    return;
+  }
+  lastKeepalive = Date.now();
+  fetch(SESSION_KEEPALIVE_URL, { credentials: 'same-origin' }).then((resp) => {
+    if (resp.status === 401) {
+      console.log('Session expired on the server, redirecting to login');
+      window.location.href = '/accounts/login/';
+    }
+  }).catch(() => {});
+}
+
 function resetLogoutTimer() {
   clearTimeout(logoutTimer);
+  keepSessionAlive();
   hideCountdownDisplay();
   console.log('⏳ Session timer reset - next logout in ' + SESSION_TIMEOUT_SECONDS + ' seconds');
   